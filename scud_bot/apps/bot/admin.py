@@ -2,57 +2,85 @@ from django.contrib import admin
 from django.urls import reverse
 from django.utils.html import format_html
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
 from django.urls import path
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Transaction, Employee, Terminal
+from django.contrib import messages
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect
+from .models import (Transaction, Employee, Terminal, ImportCheckpoint, PunchTrace, SkudSource, ReportJob, Visit,
+                     Anomaly, TerminalSubscription, WebhookSubscription, WebhookDeadLetter, Broadcast,
+                     BroadcastDelivery)
+from .services.anomalies import rule_title
+from .services.broadcast import create_broadcast, enqueue_broadcast
+from .services.linker import TransactionLinker
+from .services.onsite import onsite_snapshot
+from .services.lookup_cache import publish_invalidation
+from .services.presence import present
+from .services.reports import ReportParamsError, describe, download_name, request_report
+
+
+def _count_subquery(queryset, group_field):
+    """COUNT(*) коррелированным подзапросом (0, если строк нет)"""
+    counted = queryset.order_by().values(group_field).annotate(c=Count('*')).values('c')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
 
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
     list_display = ['emp_code', 'name', 'telegram_username',
-                    'send_notifications', 'auto_logout', 'transaction_count_link',
+                    'send_notifications', 'notification_mode', 'auto_logout', 'transaction_count_link',
                     'last_seen', 'status', 'unlinked_count']
-    list_filter = ['send_notifications', 'auto_logout']
+    list_filter = ['send_notifications', 'notification_mode', 'auto_logout', 'is_manager']
     search_fields = ['name', 'emp_code', 'telegram_username']
-    actions = ['enable_notifications', 'disable_notifications', 'link_transactions',
-               'enable_auto_logout', 'disable_auto_logout']
+    actions = ['enable_notifications', 'disable_notifications', 'digest_mode', 'instant_mode',
+               'link_transactions', 'enable_auto_logout', 'disable_auto_logout', 'history_report',
+               'broadcast_message']
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+
+        # Колонки списка считаем подзапросами в одном запросе, а не по запросу на строку
+        own = Transaction.objects.filter(employee=OuterRef('pk'))
+        week_ago = timezone.now() - timedelta(days=7)
+
+        return qs.annotate(
+            transaction_total=_count_subquery(own, 'employee'),
+            last_punch_time=Subquery(own.order_by('-punch_time').values('punch_time')[:1]),
+            is_recent=Exists(own.filter(punch_time__gte=week_ago)),
+            unlinked_total=_count_subquery(
+                Transaction.objects.filter(emp_code=OuterRef('emp_code'), employee__isnull=True),
+                'emp_code',
+            ),
+        )
 
     def transaction_count_link(self, obj):
-        count = Transaction.objects.filter(employee=obj).count()
         url = f'/admin/bot/transaction/?employee__id__exact={obj.id}'
-        return format_html('<a href="{}">{} записей</a>', url, count)
+        return format_html('<a href="{}">{} записей</a>', url, obj.transaction_total)
 
     transaction_count_link.short_description = 'Записи'
+    transaction_count_link.admin_order_field = 'transaction_total'
 
     def last_seen(self, obj):
-        last_transaction = Transaction.objects.filter(
-            employee=obj
-        ).order_by('-punch_time').first()
-
-        if last_transaction:
+        if obj.last_punch_time:
             # Конвертируем из UTC в московское время
-            local_time = timezone.localtime(last_transaction.punch_time)
+            local_time = timezone.localtime(obj.last_punch_time)
             return local_time.strftime('%d.%m.%Y %H:%M')
         return 'Никогда'
 
     last_seen.short_description = 'Последний проход'
+    last_seen.admin_order_field = 'last_punch_time'
 
     def status(self, obj):
         if not obj.can_receive_notifications:
             return 'Не настроен'
 
-        # Проверяем активность за последние 7 дней
-        week_ago = timezone.now() - timedelta(days=7)
-        recent = Transaction.objects.filter(
-            employee=obj,
-            punch_time__gte=week_ago
-        ).exists()
-
-        if recent:
+        # Активность за последние 7 дней
+        if obj.is_recent:
             return 'Активен'
         return 'Неактивен'
 
@@ -60,13 +88,7 @@ class EmployeeAdmin(admin.ModelAdmin):
 
     def unlinked_count(self, obj):
         """Количество непривязанных записей этого сотрудника"""
-        # Используем lazy import
-        Transaction = obj._meta.apps.get_model('bot', 'Transaction')
-
-        count = Transaction.objects.filter(
-            emp_code=obj.emp_code,
-            employee__isnull=True
-        ).count()
+        count = obj.unlinked_total
 
         if count > 0:
             url = f'/admin/bot/transaction/?emp_code={obj.emp_code}&employee__isnull=1'
@@ -77,54 +99,111 @@ class EmployeeAdmin(admin.ModelAdmin):
         return '✓ Все привязаны'
 
     unlinked_count.short_description = 'Непривязанные'
+    unlinked_count.admin_order_field = 'unlinked_total'
+
+    def _bulk_update(self, queryset, **fields):
+        """queryset.update() не шлет сигналов - сбрасываем кэш процессов вручную"""
+        emp_codes = list(queryset.values_list('emp_code', flat=True))
+        updated = queryset.update(**fields)
+        publish_invalidation('employee', emp_codes)
+        return updated
 
     def enable_notifications(self, request, queryset):
-        updated = queryset.update(send_notifications=True)
+        updated = self._bulk_update(queryset, send_notifications=True)
         self.message_user(request, f"Уведомления включены для {updated} сотрудников")
 
     enable_notifications.short_description = "Включить уведомления"
 
     def disable_notifications(self, request, queryset):
-        updated = queryset.update(send_notifications=False)
+        updated = self._bulk_update(queryset, send_notifications=False)
         self.message_user(request, f"Уведомления выключены для {updated} сотрудников")
 
     disable_notifications.short_description = "Выключить уведомления"
 
+    def digest_mode(self, request, queryset):
+        updated = self._bulk_update(queryset, notification_mode=Employee.NOTIFY_DIGEST)
+        self.message_user(request, f"Сводка за день вместо уведомлений для {updated} сотрудников")
+
+    digest_mode.short_description = "Уведомления: сводка за день"
+
+    def instant_mode(self, request, queryset):
+        updated = self._bulk_update(queryset, notification_mode=Employee.NOTIFY_INSTANT)
+        self.message_user(request, f"Уведомления о каждом проходе для {updated} сотрудников")
+
+    instant_mode.short_description = "Уведомления: о каждом проходе"
+
     def link_transactions(self, request, queryset):
-        for employee in queryset:
-            linked = employee.link_existing_transactions()
-            self.message_user(
-                request,
-                f"Для {employee.name} привязано {linked} записей"
-            )
+        emp_codes = list(queryset.values_list('emp_code', flat=True).distinct())
+        linked = TransactionLinker().link(emp_codes)
+        self.message_user(
+            request,
+            f"Для {len(emp_codes)} сотрудников привязано {linked} записей"
+        )
 
     link_transactions.short_description = "Привязать записи проходов"
 
     def enable_auto_logout(self, request, queryset):
-        updated = queryset.update(auto_logout=True)
+        updated = self._bulk_update(queryset, auto_logout=True)
         self.message_user(request, f"Автовыход включен для {updated} сотрудников")
 
     enable_auto_logout.short_description = "Включить автовыход"
 
     def disable_auto_logout(self, request, queryset):
-        updated = queryset.update(auto_logout=False)
+        updated = self._bulk_update(queryset, auto_logout=False)
         self.message_user(request, f"Автовыход выключен для {updated} сотрудников")
 
     disable_auto_logout.short_description = "Выключить автовыход"
 
+    def history_report(self, request, queryset):
+        month = timezone.localdate().strftime('%Y-%m')
+        for emp_code in queryset.values_list('emp_code', flat=True):
+            request_report(ReportJob.KIND_EMPLOYEE_HISTORY, {'emp_code': emp_code, 'month': month},
+                           user=request.user)
+        self.message_user(request, f"Заказана история за {month} для {queryset.count()} сотрудников")
+        return redirect('admin:bot_reportjob_changelist')
+
+    history_report.short_description = "История проходов за месяц (CSV)"
+
+    def broadcast_message(self, request, queryset):
+        """Рассылка выбранным: сначала страница с текстом, по кнопке - рассылка в очередь"""
+        recipients = queryset.filter(telegram_id__isnull=False)
+
+        if request.POST.get('confirm'):
+            text = request.POST.get('text', '').strip()
+            if text:
+                broadcast = create_broadcast(text, recipients, audience=f"выбрано в админке: {queryset.count()}",
+                                             user=request.user)
+                enqueue_broadcast(broadcast)
+                self.message_user(request, f"{broadcast} поставлена в очередь: получателей {broadcast.total}")
+                return redirect('admin:bot_broadcast_changelist')
+            messages.error(request, "Введите текст сообщения")
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Рассылка сотрудникам',
+            'selected': queryset.values_list('pk', flat=True),
+            'total': queryset.count(),
+            'recipients': recipients.count(),
+            'text': request.POST.get('text', ''),
+        }
+        return render(request, 'admin/broadcast.html', context)
+
+    broadcast_message.short_description = "Отправить сообщение в Telegram"
+
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['employee_link', 'terminal', 'punch_time',
                     'punch_state_display', 'verify_type_display']
-    list_filter = ['punch_state', 'terminal', 'employee', 'punch_time']
+    list_filter = ['source', 'punch_state', 'terminal', 'employee', 'punch_time']
     search_fields = ['emp_code', 'employee__name']
     date_hierarchy = 'punch_time'
-    readonly_fields = ['skud_id', 'emp_code', 'created_at']
+    readonly_fields = ['source', 'skud_id', 'emp_code', 'created_at']
+    list_select_related = ['employee', 'terminal']
 
     fieldsets = [
         ('Основная информация', {
-            'fields': ['skud_id', 'employee', 'emp_code', 'terminal']
+            'fields': ['source', 'skud_id', 'employee', 'emp_code', 'terminal']
         }),
         ('Детали прохода', {
             'fields': ['punch_time', 'punch_state', 'verify_type']
@@ -173,67 +252,67 @@ class TerminalAdmin(admin.ModelAdmin):
         'terminal_alias',
         'terminal_sn',
         'area_alias',
+        'source',
         'is_monitored',
         'currently_on_site_count',
         'transaction_count'
     ]
-    list_filter = ['is_monitored', 'area_alias']
+    list_filter = ['source', 'is_monitored', 'area_alias']
     search_fields = ['terminal_alias', 'terminal_sn', 'area_alias']
+    list_select_related = ['source']
+    actions = ['occupancy_report']
 
-    def transaction_count(self, obj):
-        count = Transaction.objects.filter(terminal=obj).count()
-        url = f'/admin/bot/transaction/?terminal__id__exact={obj.id}'
-        return format_html('<a href="{}">{}</a>', url, count)
-
-    transaction_count.short_description = 'Всего записей'
-
-    def get_on_site_info(self, terminal):
-        """Возвращает список сотрудников на пункте (простая логика)"""
-        from django.utils import timezone
-        from datetime import datetime, time
-
-        today = timezone.now().date()
-        today_start = timezone.make_aware(datetime.combine(today, time.min))
-        today_end = timezone.make_aware(datetime.combine(today, time.max))
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
 
-        # Получаем все события за сегодня
-        events_today = Transaction.objects.filter(
-            terminal=terminal,
-            punch_time__range=[today_start, today_end]
+        # Счетчики для всех терминалов страницы - одним запросом
+        return qs.annotate(
+            transaction_total=_count_subquery(Transaction.objects.filter(terminal=OuterRef('pk')), 'terminal'),
         )
 
-        # Находим последнее событие для каждого сотрудника
-        on_site_list = []
-        processed_codes = set()
+    def get_changelist_instance(self, request):
+        """Число людей на пункте - из снимка /onsite, как и список по ссылке"""
+        changelist = super().get_changelist_instance(request)
+        counts = {item['id']: len(item['people']) for item in onsite_snapshot()['terminals']}
+        for terminal in changelist.result_list:
+            terminal.on_site_total = counts.get(terminal.id, 0)
+        return changelist
 
-        # Сортируем по времени убывания чтобы взять последние записи
-        for event in events_today.order_by('-punch_time'):
-            emp_code = event.emp_code
+    def transaction_count(self, obj):
+        url = f'/admin/bot/transaction/?terminal__id__exact={obj.id}'
+        return format_html('<a href="{}">{}</a>', url, obj.transaction_total)
 
-            if emp_code in processed_codes:
-                continue
+    transaction_count.short_description = 'Всего записей'
+    transaction_count.admin_order_field = 'transaction_total'
 
-            processed_codes.add(emp_code)
+    def occupancy_report(self, request, queryset):
+        for terminal_id in queryset.values_list('id', flat=True):
+            request_report(ReportJob.KIND_TERMINAL_OCCUPANCY, {'terminal': terminal_id}, user=request.user)
+        self.message_user(request, f"Заказана загруженность за 30 дней для {queryset.count()} терминалов")
+        return redirect('admin:bot_reportjob_changelist')
 
-            # Если последнее событие - вход, сотрудник на пункте
-            if event.is_entry:
-                on_site_list.append({
-                    'emp_code': emp_code,
-                    'entry_time': event.punch_time,
-                    'employee': event.employee,
-                    'transaction': event
-                })
+    occupancy_report.short_description = "Загруженность за 30 дней (CSV)"
 
-        return on_site_list
+    def get_on_site_info(self, terminal):
+        """Возвращает список сотрудников на пункте - из того же снимка, что и /onsite в боте"""
+        people = next((item['people'] for item in onsite_snapshot()['terminals'] if item['id'] == terminal.id), [])
+        employees = {
+            employee.emp_code: employee
+            for employee in Employee.objects.filter(emp_code__in=[emp_code for emp_code, _, _ in people])
+        }
 
-    def _get_on_site_count(self, terminal):
-        """Подсчитать сколько человек на пункте"""
-        on_site_list = self.get_on_site_info(terminal)
-        return len(on_site_list)
+        return [
+            {
+                'emp_code': emp_code,
+                'entry_time': datetime.fromisoformat(entered_at),
+                'employee': employees.get(emp_code),
+            }
+            for emp_code, _, entered_at in people
+        ]
 
     def currently_on_site_count(self, obj):
         """Количество сотрудников на пункте - кликабельное число"""
-        count = self._get_on_site_count(obj)
+        count = obj.on_site_total
 
         if count == 0:
             return format_html('<span style="color: gray;">0</span>')
@@ -272,7 +351,6 @@ class TerminalAdmin(admin.ModelAdmin):
                 'emp_code': item['emp_code'],
                 'entry_time': local_entry_time,
                 'employee': item['employee'],
-                'transaction': item['transaction']
             })
 
         context = {
@@ -284,6 +362,507 @@ class TerminalAdmin(admin.ModelAdmin):
 
         return render(request, 'admin/terminal_on_site.html', context)
 
+
+@admin.register(SkudSource)
+class SkudSourceAdmin(admin.ModelAdmin):
+    list_display = ['code', 'name', 'base_url', 'is_enabled', 'last_id',
+                    'terminal_count', 'updated_at']
+    list_filter = ['is_enabled']
+    search_fields = ['code', 'name', 'base_url']
+    readonly_fields = ['last_id', 'updated_at']
+
+    fieldsets = [
+        ('Сервер', {
+            'fields': ['code', 'name', 'base_url', 'is_enabled']
+        }),
+        ('Доступ', {
+            'fields': ['username', 'password', 'session_cookie'],
+            'description': 'Без логина монитор входит под случайным сотрудником из пула',
+        }),
+        ('Опрос', {
+            'fields': ['last_id', 'updated_at']
+        }),
+    ]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(terminal_total=Count('terminals'))
+
+    def terminal_count(self, obj):
+        url = f'/admin/bot/terminal/?source__id__exact={obj.id}'
+        return format_html('<a href="{}">{}</a>', url, obj.terminal_total)
+
+    terminal_count.short_description = "Терминалов"
+    terminal_count.admin_order_field = 'terminal_total'
+
+
+@admin.register(Visit)
+class VisitAdmin(admin.ModelAdmin):
+    """Визиты для табеля (собираются из записей проходов, вручную не правятся)"""
+    list_display = ['emp_code', 'terminal', 'started_display', 'ended_display',
+                    'duration_display', 'status']
+    list_filter = ['status', 'terminal']
+    search_fields = ['=emp_code']
+    date_hierarchy = 'started_at'
+    list_select_related = ['terminal']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def started_display(self, obj):
+        return timezone.localtime(obj.started_at).strftime('%d.%m.%Y %H:%M')
+
+    started_display.short_description = 'Начало'
+    started_display.admin_order_field = 'started_at'
+
+    def ended_display(self, obj):
+        if not obj.ended_at or obj.status == Visit.STATUS_NO_ENTRY:
+            return '-'
+        return timezone.localtime(obj.ended_at).strftime('%d.%m.%Y %H:%M')
+
+    ended_display.short_description = 'Конец'
+
+    def duration_display(self, obj):
+        if not obj.is_complete:
+            return '-'
+        hours, rest = divmod(obj.duration, 3600)
+        return f"{hours} ч {rest // 60:02d} мин"
+
+    duration_display.short_description = 'Длительность'
+    duration_display.admin_order_field = 'duration'
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                'presence/',
+                self.admin_site.admin_view(self.presence_view),
+                name='bot_visit_presence',
+            ),
+        ]
+        return custom_urls + urls
+
+    def presence_view(self, request):
+        """Кто был на пункте в момент или за интервал (по терминалу или зоне)"""
+        params = request.GET
+        results = None
+        error = None
+
+        def moment(value):
+            return timezone.make_aware(datetime.strptime(value, '%Y-%m-%dT%H:%M'))
+
+        try:
+            terminal = int(params['terminal']) if params.get('terminal') else None
+            if params.get('date_from') and params.get('date_to'):
+                start, end = moment(params['date_from']), moment(params['date_to'])
+            elif params.get('at'):
+                start, end = moment(params['at']), None
+            else:
+                start = None
+            if start is not None:
+                results = present(start, end, terminal=terminal, area=params.get('area') or None)
+        except ValueError as e:
+            error = f"Неверный параметр: {e}"
+
+        context = {
+            'terminals': Terminal.objects.select_related('source').order_by('terminal_alias'),
+            'areas': Terminal.objects.order_by('area_alias').values_list('area_alias', flat=True).distinct(),
+            'params': params,
+            'selected_terminal': params.get('terminal', ''),
+            'now': timezone.localtime().strftime('%Y-%m-%dT%H:%M'),
+            'results': results,
+            'error': error,
+        }
+        return render(request, 'admin/presence.html', context)
+
+
+@admin.register(Anomaly)
+class AnomalyAdmin(admin.ModelAdmin):
+    """Аномалии, найденные монитором при приеме отметок"""
+    list_display = ['punch_time_display', 'rule_display', 'emp_code', 'employee', 'terminal',
+                    'message', 'is_reviewed']
+    list_filter = ['is_reviewed', 'rule', 'terminal']
+    search_fields = ['=emp_code', 'employee__name']
+    date_hierarchy = 'punch_time'
+    list_select_related = ['employee', 'terminal']
+    actions = ['mark_reviewed']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def punch_time_display(self, obj):
+        return timezone.localtime(obj.punch_time).strftime('%d.%m.%Y %H:%M:%S')
+
+    punch_time_display.short_description = 'Время отметки'
+    punch_time_display.admin_order_field = 'punch_time'
+
+    def rule_display(self, obj):
+        return rule_title(obj.rule)
+
+    rule_display.short_description = 'Правило'
+    rule_display.admin_order_field = 'rule'
+
+    def mark_reviewed(self, request, queryset):
+        updated = queryset.update(is_reviewed=True)
+        self.message_user(request, f"Отмечено разобранными: {updated}")
+
+    mark_reviewed.short_description = "Отметить разобранными"
+
+
+@admin.register(TerminalSubscription)
+class TerminalSubscriptionAdmin(admin.ModelAdmin):
+    """Ленты проходов для руководителей (монитор перечитывает их сам)"""
+    list_display = ['name', 'chat_id', 'events', 'areas', 'terminal_list', 'is_active', 'updated_at']
+    list_filter = ['is_active', 'events']
+    search_fields = ['name', '=chat_id', 'areas']
+    filter_horizontal = ['terminals']
+    readonly_fields = ['updated_at']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('terminals')
+
+    def terminal_list(self, obj):
+        return ', '.join(terminal.terminal_alias for terminal in obj.terminals.all()) or '-'
+
+    terminal_list.short_description = 'Терминалы'
+
+
+@admin.register(WebhookSubscription)
+class WebhookSubscriptionAdmin(admin.ModelAdmin):
+    """Получатели событий отметок (доставляет run_webhooks, изменения подхватываются сами)"""
+    list_display = ['name', 'url', 'is_active', 'filters_display', 'batch_size',
+                    'max_concurrency', 'dead_letter_count', 'updated_at']
+    list_filter = ['is_active']
+    search_fields = ['name', 'url']
+    filter_horizontal = ['terminals']
+    readonly_fields = ['updated_at']
+
+    fieldsets = [
+        ('Получатель', {
+            'fields': ['name', 'url', 'secret', 'is_active'],
+            'description': 'Подпись: X-SCUD-Signature = sha256=HMAC(секрет, "<X-SCUD-Timestamp>.<тело>")',
+        }),
+        ('Фильтры', {
+            'fields': ['terminals', 'areas', 'emp_codes'],
+            'description': 'Пустой фильтр - все события',
+        }),
+        ('Доставка', {
+            'fields': ['batch_size', 'max_concurrency', 'updated_at']
+        }),
+    ]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            dead_letter_total=Count('dead_letters', distinct=True),
+            terminal_total=Count('terminals', distinct=True),
+        )
+
+    def filters_display(self, obj):
+        parts = []
+        if obj.terminal_total:
+            parts.append(f"терминалов: {obj.terminal_total}")
+        if obj.areas:
+            parts.append(f"зоны: {obj.areas}")
+        if obj.emp_codes:
+            parts.append(f"сотрудников: {len(obj.emp_code_list)}")
+        return ', '.join(parts) or 'все события'
+
+    filters_display.short_description = 'Фильтры'
+
+    def dead_letter_count(self, obj):
+        if not obj.dead_letter_total:
+            return 0
+        url = f'/admin/bot/webhookdeadletter/?subscription__id__exact={obj.id}'
+        return format_html('<a href="{}">{}</a>', url, obj.dead_letter_total)
+
+    dead_letter_count.short_description = 'Недоставлено'
+    dead_letter_count.admin_order_field = 'dead_letter_total'
+
+
+@admin.register(WebhookDeadLetter)
+class WebhookDeadLetterAdmin(admin.ModelAdmin):
+    """Пачки событий, не доставленные после всех попыток"""
+    list_display = ['created_at', 'subscription', 'events', 'attempts', 'status_code', 'error_short', 'updated_at']
+    list_filter = ['subscription']
+    list_select_related = ['subscription']
+    actions = ['redeliver']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def error_short(self, obj):
+        return obj.error[:100]
+
+    error_short.short_description = 'Ошибка'
+
+    def redeliver(self, request, queryset):
+        from .tasks import redeliver_webhooks
+
+        ids = list(queryset.values_list('id', flat=True))
+        redeliver_webhooks.delay(ids)
+        self.message_user(request, f"Повторная отправка поставлена в очередь: {len(ids)} пачек")
+
+    redeliver.short_description = "Отправить повторно"
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    """Рассылки: ход отправки, остановка и продолжение прерванных"""
+    list_display = ['id', 'text_short', 'audience', 'status_display', 'progress', 'requested_by',
+                    'created_at', 'finished_at']
+    list_filter = ['status']
+    list_select_related = ['requested_by']
+    readonly_fields = ['text', 'audience', 'status', 'total', 'sent', 'failed', 'error', 'requested_by',
+                       'created_at', 'started_at', 'finished_at', 'updated_at']
+    actions = ['resume', 'cancel']
+
+    def has_add_permission(self, request):
+        return False
+
+    def text_short(self, obj):
+        return obj.text[:80]
+
+    text_short.short_description = 'Текст'
+
+    def status_display(self, obj):
+        colors = {
+            Broadcast.STATUS_PENDING: '#6c757d',
+            Broadcast.STATUS_RUNNING: '#417690',
+            Broadcast.STATUS_DONE: 'green',
+            Broadcast.STATUS_FAILED: 'red',
+            Broadcast.STATUS_CANCELLED: '#6c757d',
+        }
+        return format_html('<span style="color: {};" title="{}">{}</span>',
+                           colors[obj.status], obj.error, obj.get_status_display())
+
+    status_display.short_description = 'Статус'
+    status_display.admin_order_field = 'status'
+
+    def progress(self, obj):
+        url = f'/admin/bot/broadcastdelivery/?broadcast__id__exact={obj.id}'
+        return format_html('<a href="{}">{} из {}</a>, ошибок {}', url, obj.sent, obj.total, obj.failed)
+
+    progress.short_description = 'Отправлено'
+
+    def resume(self, request, queryset):
+        resumable = queryset.filter(status__in=[Broadcast.STATUS_FAILED, Broadcast.STATUS_CANCELLED])
+        count = 0
+        for broadcast in resumable:
+            # Остановленную возвращаем в очередь - иначе ее не возьмет ни один процесс
+            Broadcast.objects.filter(pk=broadcast.pk, status=broadcast.status).update(
+                status=Broadcast.STATUS_PENDING, updated_at=timezone.now(),
+            )
+            enqueue_broadcast(broadcast)
+            count += 1
+        self.message_user(request, f"Продолжение поставлено в очередь: {count}")
+
+    resume.short_description = "Продолжить (неотправленным)"
+
+    def cancel(self, request, queryset):
+        cancelled = queryset.filter(
+            status__in=[Broadcast.STATUS_PENDING, Broadcast.STATUS_RUNNING]
+        ).update(status=Broadcast.STATUS_CANCELLED, updated_at=timezone.now())
+        self.message_user(request, f"Остановлено рассылок: {cancelled}")
+
+    cancel.short_description = "Остановить"
+
+
+@admin.register(BroadcastDelivery)
+class BroadcastDeliveryAdmin(admin.ModelAdmin):
+    """Получатели рассылок и статус каждого сообщения"""
+    list_display = ['broadcast', 'employee', 'chat_id', 'status', 'attempts', 'error', 'sent_at']
+    list_filter = ['status', 'broadcast']
+    search_fields = ['=chat_id', 'employee__name', 'employee__emp_code']
+    list_select_related = ['broadcast', 'employee']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    """Фоновые отчеты: заказ, статус и скачивание готовых файлов"""
+    list_display = ['id', 'kind', 'params_display', 'status_display', 'rows',
+                    'duration_display', 'requested_by', 'created_at', 'download_link']
+    list_filter = ['kind', 'status']
+    list_select_related = ['requested_by']
+    actions = ['rebuild']
+    change_list_template = 'admin/bot/reportjob/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        # Пока есть незавершенные отчеты - страница обновляется сама
+        extra_context['has_active'] = ReportJob.objects.filter(
+            status__in=[ReportJob.STATUS_PENDING, ReportJob.STATUS_RUNNING]
+        ).exists()
+        return super().changelist_view(request, extra_context)
+
+    def params_display(self, obj):
+        return describe(obj.kind, obj.params)
+
+    params_display.short_description = 'Параметры'
+
+    def status_display(self, obj):
+        colors = {
+            ReportJob.STATUS_PENDING: '#6c757d',
+            ReportJob.STATUS_RUNNING: '#417690',
+            ReportJob.STATUS_DONE: 'green',
+            ReportJob.STATUS_FAILED: 'red',
+        }
+        return format_html('<span style="color: {};" title="{}">{}</span>',
+                           colors[obj.status], obj.error, obj.get_status_display())
+
+    status_display.short_description = 'Статус'
+    status_display.admin_order_field = 'status'
+
+    def duration_display(self, obj):
+        if obj.duration is None:
+            return '-'
+        return f"{obj.duration:.1f} с"
+
+    duration_display.short_description = 'Время'
+
+    def download_link(self, obj):
+        if obj.status != ReportJob.STATUS_DONE:
+            return '-'
+        url = reverse('admin:bot_reportjob_download', args=[obj.pk])
+        return format_html('<a href="{}">Скачать</a>', url)
+
+    download_link.short_description = 'Файл'
+
+    def rebuild(self, request, queryset):
+        for job in queryset:
+            request_report(job.kind, job.params, user=request.user, force=True)
+        self.message_user(request, f"Поставлено на перестроение: {queryset.count()}")
+
+    rebuild.short_description = "Построить заново"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                'request/',
+                self.admin_site.admin_view(self.request_view),
+                name='bot_reportjob_request',
+            ),
+            path(
+                '<int:object_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='bot_reportjob_download',
+            ),
+        ]
+        return custom_urls + urls
+
+    def request_view(self, request):
+        if request.method == 'POST':
+            kind = request.POST.get('kind')
+            try:
+                job, created = request_report(kind, request.POST.dict(), user=request.user)
+            except ReportParamsError as e:
+                messages.error(request, str(e))
+            else:
+                if created:
+                    self.message_user(request, f"{job} поставлен в очередь")
+                else:
+                    self.message_user(request, f"Есть готовый или строящийся {job} с теми же параметрами")
+                return redirect('admin:bot_reportjob_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Заказать отчет',
+            'kinds': ReportJob.KIND_CHOICES,
+            'sources': SkudSource.objects.order_by('code'),
+            'terminals': Terminal.objects.select_related('source').order_by('terminal_alias'),
+            'month': timezone.localdate().strftime('%Y-%m'),
+            'data': request.POST,
+        }
+        return render(request, 'admin/report_request.html', context)
+
+    def download_view(self, request, object_id):
+        job = get_object_or_404(ReportJob, pk=object_id, status=ReportJob.STATUS_DONE)
+        try:
+            handle = job.file.open('rb')
+        except (FileNotFoundError, ValueError):
+            raise Http404("Файл отчета удален")
+        return FileResponse(handle, as_attachment=True, filename=download_name(job))
+
+
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['file_path', 'source', 'offset', 'total', 'max_skud_id',
+                    'imported', 'skipped', 'errors', 'is_completed', 'updated_at']
+    list_filter = ['is_completed', 'source']
+    search_fields = ['file_path']
+    readonly_fields = ['source', 'file_size', 'total', 'max_skud_id', 'imported',
+                       'skipped', 'errors', 'updated_at']
+
+
+@admin.register(PunchTrace)
+class PunchTraceAdmin(admin.ModelAdmin):
+    """Самые медленные отметки из последних (кольцевой буфер трассировок)"""
+    list_display = ['skud_id', 'emp_code', 'terminal_id', 'punch_time_display',
+                    'total_ms_display', 'fetch_ms', 'lookup_ms', 'insert_ms',
+                    'enqueue_ms', 'queue_ms', 'telegram_ms', 'punch_to_delivery']
+    list_filter = ['source', 'terminal_id']
+    search_fields = ['emp_code', '=skud_id']
+    date_hierarchy = 'created_at'
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        # Сквозное время: до доставки в Telegram, если уведомление было, иначе - в мониторе
+        return qs.annotate(total_ms=Coalesce(F('delivery_ms'), F('ingest_ms'))).order_by(
+            F('total_ms').desc(nulls_last=True)
+        )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def punch_time_display(self, obj):
+        if not obj.punch_time:
+            return '-'
+        return timezone.localtime(obj.punch_time).strftime('%d.%m.%Y %H:%M:%S')
+
+    punch_time_display.short_description = 'Время отметки'
+    punch_time_display.admin_order_field = 'punch_time'
+
+    def total_ms_display(self, obj):
+        if obj.total_ms is None:
+            return '-'
+        color = 'red' if obj.total_ms > 10000 else 'inherit'
+        return format_html('<b style="color: {};">{} мс</b>', color, round(obj.total_ms))
+
+    total_ms_display.short_description = 'Всего'
+    total_ms_display.admin_order_field = 'total_ms'
+
+    def punch_to_delivery(self, obj):
+        """Насколько поздно пришло уведомление относительно самой отметки"""
+        if not obj.delivered_at or not obj.punch_time:
+            return '-'
+        return f"{(obj.delivered_at - obj.punch_time).total_seconds():.1f} с"
+
+    punch_to_delivery.short_description = 'От отметки до доставки'
+
+
 # Статистика в админке
 @staff_member_required
 def admin_stats(request):
@@ -1,67 +1,43 @@
-import json
-import datetime
-import requests
-from django.http import JsonResponse, HttpResponse
+import time
+from datetime import datetime
+
+from django.http import FileResponse, JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.utils import timezone
 import logging
 
-from .services.autologger import AutoLogger
+from .models import OccupancyBucket, ReportJob, SkudSource
+from .services.metrics import metrics, render_prometheus
+from .services.occupancy import occupancy_series
+from .services.presence import present
+from .services.reports import ReportParamsError, download_name, request_report
+from .services.skud_api import fetch_scud_data
 
 logger = logging.getLogger(__name__)
 
 
-def _fetch_scud_data(url, params, session_cookie, max_retries=2):
-    """ Утилита для запросов к СКУД с автополучением куки """
-    for attempt in range(max_retries):
-        try:
-            cookies = {'sessionid': session_cookie}
-
-            response = requests.get(
-                url,
-                params=params,
-                cookies=cookies,
-                timeout=30
-            )
-
-            # успех
-            if response.status_code == 200:
-                return response
-
-            # сессия умерла - обновляем куку
-            if response.status_code == 401 and attempt < max_retries - 1:
-                logger.info("Сессия истекла, получаем новую куку...")
-
-                base_url = settings.SKUD_CONFIG['BASE_URL']
-                autologger = AutoLogger(base_url=base_url)
-                new_cookie = autologger.get_new_cookie()
-
-                if new_cookie:
-                    session_cookie = new_cookie
-                    logger.info("Кука обновлена")
-                    continue
-                else:
-                    raise Exception("Не удалось получить новую куку")
-
-            # другие ошибки - сразу падаем
-            response.raise_for_status()
-
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                logger.warning(f"Ошибка запроса, пробуем снова: {e}")
-                continue
-            raise
-
-    raise Exception("Все попытки запроса исчерпаны")
+def _get_source(request):
+    """ Сервер СКУД из ?source=<код>, по умолчанию - основной """
+    code = request.GET.get('source')
+    if code:
+        return SkudSource.objects.filter(code=code).first()
+    return SkudSource.get_default()
 
 
 @csrf_exempt
 def json_report(request):
     """ API для получения JSON отчета из СКУД системы """
     try:
-        base_url = settings.SKUD_CONFIG['BASE_URL']
-        session_cookie = settings.SKUD_CONFIG['SESSION_COOKIE']
+        source = _get_source(request)
+        if source is None:
+            return JsonResponse({
+                'error': 'Сервер СКУД не найден',
+                'code': 404
+            }, status=404)
+
+        base_url = source.base_url
+        session_cookie = source.session_cookie
 
         if not session_cookie:
             return JsonResponse({
@@ -76,7 +52,7 @@ def json_report(request):
             'ordering': request.GET.get('ordering', '-id'),
         }
 
-        response = _fetch_scud_data(url, params, session_cookie)
+        response = fetch_scud_data(source, url, params)
         data = response.json()
 
         return JsonResponse({
@@ -96,124 +72,188 @@ def json_report(request):
 
 @csrf_exempt
 def download_backup(request):
-    """ Скачать полный бэкап как файл с фильтрацией по датам на нашей стороне """
-    try:
-        base_url = settings.SKUD_CONFIG['BASE_URL']
-        session_cookie = settings.SKUD_CONFIG['SESSION_COOKIE']
+    """ Скачать полный бэкап как файл с фильтрацией по датам на нашей стороне
 
-        if not session_cookie:
-            return HttpResponse('Кука не настроена', status=500)
+    Бэкап строится в фоне (ReportJob), запрос ждет его до DOWNLOAD_WAIT секунд
+    и отдает файл, как и раньше. Готовый файл с теми же параметрами отдается
+    сразу, без повторной выгрузки из СКУД. Если построение не уложилось в
+    ожидание - 202 с номером задачи, клиент повторяет тот же запрос.
+    """
+    try:
+        source = _get_source(request)
+        if source is None:
+            return HttpResponse('Сервер СКУД не найден', status=404)
 
-        url = f"{base_url}/iclock/api/transactions/"
-        params = {
-            'format': 'json',
-            'page_size': 80000,
-            'ordering': '-id',
-        }
+        try:
+            job, created = request_report(ReportJob.KIND_BACKUP, {
+                'source': source.code,
+                'date_from': request.GET.get('date__gte'),
+                'date_to': request.GET.get('date__lte'),
+            }, user=request.user)
+        except ReportParamsError as e:
+            logger.warning(f"download_backup: {e}")
+            return HttpResponse(str(e), status=400)
+
+        deadline = time.monotonic() + settings.REPORTS_CONFIG['DOWNLOAD_WAIT']
+        job.refresh_from_db()
+        while job.is_active and time.monotonic() < deadline:
+            time.sleep(0.5)
+            job.refresh_from_db()
+
+        if job.status == ReportJob.STATUS_DONE:
+            return FileResponse(
+                job.file.open('rb'),
+                as_attachment=True,
+                filename=download_name(job),
+                content_type='application/octet-stream',
+            )
 
-        response = _fetch_scud_data(url, params, session_cookie, max_retries=3)
-        data = response.json()
+        if job.status == ReportJob.STATUS_FAILED:
+            return JsonResponse({
+                'error': job.error,
+                'job_id': job.id,
+                'code': 500
+            }, status=500)
 
-        # Получаем все транзакции
-        all_transactions = data.get('data', [])
-
-        # Получаем параметры фильтрации
-        date_gte = request.GET.get('date__gte')
-        date_lte = request.GET.get('date__lte')
-
-        # Если есть параметры фильтрации - фильтруем
-        if date_gte or date_lte:
-            from datetime import datetime
-
-            # Преобразуем строки дат в datetime объекты для сравнения
-            start_date = None
-            end_date = None
-
-            if date_gte:
-                try:
-                    start_date = datetime.strptime(date_gte, '%Y-%m-%d')
-                except ValueError:
-                    logger.warning(f"Неверный формат даты date__gte: {date_gte}")
-                    return HttpResponse('Неверный формат даты date__gte. Используйте YYYY-MM-DD', status=400)
-
-            if date_lte:
-                try:
-                    end_date = datetime.strptime(date_lte, '%Y-%m-%d')
-                except ValueError:
-                    logger.warning(f"Неверный формат даты date__lte: {date_lte}")
-                    return HttpResponse('Неверный формат даты date__lte. Используйте YYYY-MM-DD', status=400)
-
-            # Фильтруем транзакции
-            filtered_transactions = []
-
-            for transaction in all_transactions:
-                punch_time_str = transaction.get('punch_time', '')
-
-                if not punch_time_str:
-                    continue  # Пропускаем если нет времени
-
-                try:
-                    # Парсим дату из транзакции (формат: "2025-12-01 08:30:15")
-                    transaction_date = datetime.strptime(punch_time_str[:10], '%Y-%m-%d')
-
-                    include = True
-
-                    # Проверяем фильтры
-                    if start_date and transaction_date < start_date:
-                        include = False
-
-                    if end_date and transaction_date > end_date:
-                        include = False
-
-                    if include:
-                        filtered_transactions.append(transaction)
-
-                except ValueError as e:
-                    logger.warning(f"Ошибка парсинга даты транзакции: {punch_time_str} - {e}")
-                    continue
-
-            # Заменяем данные на отфильтрованные
-            data['data'] = filtered_transactions
-            data['count'] = len(filtered_transactions)
-
-        # Формируем имя файла с учетом фильтров
-        if date_gte and date_lte:
-            # Убираем дефисы для имени файла
-            date_gte_clean = date_gte.replace('-', '')
-            date_lte_clean = date_lte.replace('-', '')
-            filename = f"skud_backup_{date_gte_clean}_{date_lte_clean}.json"
-        elif date_gte:
-            date_gte_clean = date_gte.replace('-', '')
-            filename = f"skud_backup_from_{date_gte_clean}.json"
-        elif date_lte:
-            date_lte_clean = date_lte.replace('-', '')
-            filename = f"skud_backup_to_{date_lte_clean}.json"
-        else:
-            # Если фильтров нет - используем текущую дату
-            from datetime import datetime
-            filename = f"skud_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-
-        # Добавляем информацию о фильтрации в ответ
-        if date_gte or date_lte:
-            data['filter_info'] = {
-                'date_gte': date_gte,
-                'date_lte': date_lte,
-                'original_count': len(all_transactions),
-                'filtered_count': len(data.get('data', [])),
-                'filter_applied': True
-            }
-
-        http_response = HttpResponse(
-            json.dumps(data, ensure_ascii=False, indent=2),
-            content_type='application/octet-stream'
-        )
-        http_response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-        return http_response
+        response = JsonResponse({
+            'job_id': job.id,
+            'status': job.status,
+            'created_at': job.created_at.isoformat(),
+        }, status=202)
+        response['Retry-After'] = '5'
+        return response
 
     except Exception as e:
         logger.error(f"Ошибка download_backup: {e}")
         return JsonResponse({
             'error': str(e),
             'code': 500
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+
+def _has_token(request, token):
+    """ ?token=<токен> или заголовок Authorization: Bearer <токен> """
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and (request.GET.get('token') == token or auth_header == f'Bearer {token}')
+
+
+def _can_read_employees(request):
+    """ Данные о сотрудниках - персоналу админки или по токену API_CONFIG['TOKEN'] """
+    user = request.user
+    return (user.is_active and user.is_staff) or _has_token(request, settings.API_CONFIG['TOKEN'])
+
+
+def _parse_moment(value):
+    """ Время из запроса: ISO 8601 или "YYYY-MM-DD HH:MM", без зоны - московское """
+    moment = datetime.fromisoformat(value.strip().replace(' ', 'T'))
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def presence(request):
+    """ Кто был на пункте: ?at=<время> или ?from=<время>&to=<время>, плюс ?terminal=<id> или ?area=<зона> """
+    if not _can_read_employees(request):
+        return JsonResponse({'error': 'Нет доступа', 'code': 403}, status=403)
+
+    try:
+        at = request.GET.get('at')
+        date_from = request.GET.get('from')
+        date_to = request.GET.get('to')
+
+        try:
+            if at:
+                start, end = _parse_moment(at), None
+            elif date_from and date_to:
+                start, end = _parse_moment(date_from), _parse_moment(date_to)
+            else:
+                return JsonResponse({'error': 'Укажите at или from и to', 'code': 400}, status=400)
+            terminal = int(request.GET['terminal']) if request.GET.get('terminal') else None
+        except ValueError as e:
+            return JsonResponse({'error': f'Неверный параметр: {e}', 'code': 400}, status=400)
+
+        if end is not None and end < start:
+            return JsonResponse({'error': 'from позже to', 'code': 400}, status=400)
+
+        visits = present(start, end, terminal=terminal, area=request.GET.get('area'))
+
+        return JsonResponse({
+            'success': True,
+            'from': start.isoformat(),
+            'to': end.isoformat() if end else None,
+            'count': len(visits),
+            'data': [
+                {
+                    **visit,
+                    'entered_at': visit['entered_at'].isoformat(),
+                    'left_at': visit['left_at'].isoformat() if visit['left_at'] else None,
+                }
+                for visit in visits
+            ],
+            'timestamp': timezone.now().isoformat(),
+        })
+
+    except Exception as e:
+        logger.error(f"Ошибка presence: {e}")
+        return JsonResponse({
+            'error': str(e),
+            'code': 500
+        }, status=500)
+
+
+def occupancy(request):
+    """ Загруженность для графика: ?from=<время>&to=<время>, ?terminal=<id> или ?area=<зона>, ?resolution=300|3600 """
+    if not _can_read_employees(request):
+        return JsonResponse({'error': 'Нет доступа', 'code': 403}, status=403)
+
+    try:
+        try:
+            start = _parse_moment(request.GET['from'])
+            end = _parse_moment(request.GET['to']) if request.GET.get('to') else timezone.now()
+            terminal = int(request.GET['terminal']) if request.GET.get('terminal') else None
+            resolution = int(request.GET['resolution']) if request.GET.get('resolution') else None
+        except KeyError:
+            return JsonResponse({'error': 'Укажите from', 'code': 400}, status=400)
+        except ValueError as e:
+            return JsonResponse({'error': f'Неверный параметр: {e}', 'code': 400}, status=400)
+
+        if resolution not in (None, *dict(OccupancyBucket.RESOLUTION_CHOICES)):
+            return JsonResponse({'error': 'resolution - 300 или 3600', 'code': 400}, status=400)
+        if end <= start:
+            return JsonResponse({'error': 'from позже to', 'code': 400}, status=400)
+
+        try:
+            series = occupancy_series(start, end, resolution, terminal=terminal, area=request.GET.get('area'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e), 'code': 400}, status=400)
+
+        return JsonResponse({
+            'success': True,
+            **series,
+            'timestamp': timezone.now().isoformat(),
+        })
+
+    except Exception as e:
+        logger.error(f"Ошибка occupancy: {e}")
+        return JsonResponse({
+            'error': str(e),
+            'code': 500
+        }, status=500)
+
+
+def metrics_view(request):
+    """ Метрики мониторинга, монитора, бота и автовыхода в формате Prometheus """
+    token = settings.METRICS_CONFIG.get('TOKEN')
+    if token and not _has_token(request, token):
+        return HttpResponse('Forbidden', status=403)
+
+    # То, что накопил сам веб-воркер
+    metrics.flush(force=True)
+
+    try:
+        body = render_prometheus()
+    except Exception as e:
+        logger.error(f"Ошибка metrics: {e}")
+        return HttpResponse(f'# metrics unavailable: {e}\n', status=503, content_type='text/plain')
+
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class BotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scud_bot.apps.bot'
-    verbose_name = "СКУД Бот"
\ No newline at end of file
+    verbose_name = "СКУД Бот"
+
+    def ready(self):
+        from . import signals  # noqa: F401
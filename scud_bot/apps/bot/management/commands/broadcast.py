@@ -0,0 +1,120 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Broadcast
+from ...services.broadcast import broadcast_recipients, create_broadcast, enqueue_broadcast, run_broadcast
+
+
+class Command(BaseCommand):
+    help = 'Рассылка сообщения сотрудникам с привязанным Telegram (с ограничением скорости)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--text',
+            type=str,
+            help='Текст сообщения'
+        )
+        parser.add_argument(
+            '--text-file',
+            type=str,
+            help='Взять текст сообщения из файла'
+        )
+        parser.add_argument(
+            '--emp-code',
+            type=str,
+            action='append',
+            help='Только этому сотруднику (можно указать несколько раз)'
+        )
+        parser.add_argument(
+            '--area',
+            type=str,
+            help='Только тем, кто был на пунктах зоны за 30 дней'
+        )
+        parser.add_argument(
+            '--notified',
+            action='store_true',
+            help='Только тем, у кого включены уведомления'
+        )
+        parser.add_argument(
+            '--managers',
+            action='store_true',
+            help='Только руководителям'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать число получателей, ничего не отправляя'
+        )
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            help='Отправить через Celery, а не в этом процессе'
+        )
+        parser.add_argument(
+            '--resume',
+            type=int,
+            metavar='ID',
+            help='Продолжить прерванную рассылку'
+        )
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            self._run(options['resume'])
+            return
+
+        text = options['text']
+        if options['text_file']:
+            with open(options['text_file'], encoding='utf-8') as f:
+                text = f.read()
+        if not text or not text.strip():
+            raise CommandError('Укажите --text или --text-file')
+
+        employees = broadcast_recipients(
+            emp_codes=options['emp_code'],
+            area=options['area'],
+            notified_only=options['notified'],
+            managers_only=options['managers'],
+        )
+        audience = self._describe(options)
+
+        if options['dry_run']:
+            self.stdout.write(f"Получателей: {employees.count()} ({audience})")
+            return
+
+        broadcast = create_broadcast(text.strip(), employees, audience=audience)
+        self.stdout.write(f"{broadcast}: получателей {broadcast.total} ({audience})")
+        if not broadcast.total:
+            return
+
+        if options['queue']:
+            enqueue_broadcast(broadcast)
+            self.stdout.write(f"Поставлена в очередь. Продолжить после сбоя: broadcast --resume {broadcast.id}")
+        else:
+            self._run(broadcast.id)
+
+    def _run(self, broadcast_id: int):
+        def progress(broadcast):
+            self.stdout.write(f"  отправлено {broadcast.sent}, ошибок {broadcast.failed} из {broadcast.total}")
+
+        broadcast = run_broadcast(broadcast_id, progress=progress)
+        if broadcast is None:
+            raise CommandError(f"Рассылка #{broadcast_id} не найдена, уже отправляется или завершена")
+
+        if broadcast.status == Broadcast.STATUS_DONE:
+            self.stdout.write(self.style.SUCCESS(
+                f"{broadcast} отправлена: {broadcast.sent} из {broadcast.total}, ошибок {broadcast.failed}"
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(f"{broadcast}: {broadcast.get_status_display()}"))
+
+    @staticmethod
+    def _describe(options) -> str:
+        parts = []
+        if options['emp_code']:
+            parts.append(f"коды {', '.join(options['emp_code'])}")
+        if options['area']:
+            parts.append(f"зона {options['area']}")
+        if options['notified']:
+            parts.append("с уведомлениями")
+        if options['managers']:
+            parts.append("руководители")
+        return ', '.join(parts) or 'все с Telegram'
@@ -0,0 +1,42 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...services.summaries import rebuild_summaries
+from ...services.visits import rebuild_visits
+
+
+class Command(BaseCommand):
+    help = 'Собрать визиты (пары вход-выход) из записей проходов для табеля и сводки для бота'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Пересобрать с даты YYYY-MM-DD (по умолчанию - вся история)'
+        )
+        parser.add_argument(
+            '--emp-code',
+            type=str,
+            action='append',
+            help='Только для этого сотрудника (можно указать несколько раз)'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = timezone.make_aware(datetime.strptime(options['since'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError(f"Неверная дата {options['since']}. Используйте YYYY-MM-DD")
+
+        started = time.perf_counter()
+        stats = rebuild_visits(since=since, emp_codes=options['emp_code'])
+        summaries = rebuild_summaries(since=since, emp_codes=options['emp_code'])
+
+        self.stdout.write(
+            f"Отметок: {stats['punches']}, визитов: {stats['visits']}, "
+            f"сотрудников: {stats['employees']}, сводок за день: {summaries} за {time.perf_counter() - started:.1f} с"
+        )
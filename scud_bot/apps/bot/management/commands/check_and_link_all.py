@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
-from ...models import Employee, Transaction
+from ...models import Employee
+from ...services.linker import TransactionLinker
 
 
 class Command(BaseCommand):
@@ -16,6 +17,12 @@ class Command(BaseCommand):
             type=str,
             help='Проверить только конкретного сотрудника'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Сколько записей привязывать за один UPDATE (по умолчанию 10000)'
+        )
 
     def handle(self, *args, **options):
         fix = options['fix']
@@ -23,48 +30,45 @@ class Command(BaseCommand):
 
         if emp_code:
             employees = Employee.objects.filter(emp_code=emp_code)
+            emp_codes = [emp_code]
         else:
             employees = Employee.objects.all()
+            emp_codes = None
 
-        total_unlinked = 0
-        total_linked = 0
+        linker = TransactionLinker(batch_size=options['batch_size'])
 
         self.stdout.write("Проверка привязки транзакций сотрудников")
 
-        for employee in employees:
-            unlinked = Transaction.objects.filter(
-                emp_code=employee.emp_code,
-                employee__isnull=True
-            ).count()
+        # Dry-run отчет одним запросом вместо count() на каждого сотрудника
+        report = {row['emp_code']: row for row in linker.report(emp_codes)}
+        total_unlinked = sum(row['unlinked'] for row in report.values())
 
-            total_unlinked += unlinked
+        checked = 0
+        for employee in employees.only('name', 'emp_code'):
+            checked += 1
+            row = report.get(employee.emp_code)
 
-            if unlinked > 0:
+            if row:
                 self.stdout.write(
                     f"{employee.name} ({employee.emp_code}): "
-                    f"{unlinked} непривязанных записей"
+                    f"{row['unlinked']} непривязанных записей"
                 )
-
-                if fix:
-                    Transaction.objects.filter(
-                        emp_code=employee.emp_code,
-                        employee__isnull=True
-                    ).update(employee=employee)
-
-                    self.stdout.write(f"Привязано {unlinked} записей")
-                    total_linked += unlinked
             else:
                 self.stdout.write(
                     f"{employee.name} ({employee.emp_code}): "
                     "все записи привязаны"
                 )
 
+        total_linked = 0
+        if fix and total_unlinked > 0:
+            total_linked = linker.link(emp_codes)
+
         self.stdout.write(f"ИТОГО:")
-        self.stdout.write(f"Сотрудников проверено: {employees.count()}")
+        self.stdout.write(f"Сотрудников проверено: {checked}")
         self.stdout.write(f"Непривязанных записей: {total_unlinked}")
 
         if fix:
             self.stdout.write(f"Привязано записей: {total_linked}")
         elif total_unlinked > 0:
             self.stdout.write("\nДля привязки запустите с ключом --fix")
-            self.stdout.write("Или: python manage.py check_and_link_all --fix")
\ No newline at end of file
+            self.stdout.write("Или: python manage.py check_and_link_all --fix")
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...models import Transaction
+from ...services.punch_stream import PunchStreamConsumer, publish_punches, replay
+
+
+class Command(BaseCommand):
+    help = 'Поток отметок в Redis: чтение группой, чтение после ID, дослать отметки из БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--group',
+            type=str,
+            help='Читать новые события группой потребителей (с подтверждением)'
+        )
+        parser.add_argument(
+            '--consumer',
+            type=str,
+            default='cli',
+            help='Имя потребителя в группе'
+        )
+        parser.add_argument(
+            '--replay-from',
+            type=str,
+            help='Вывести события после этого ID потока (0 - с начала хранимого)'
+        )
+        parser.add_argument(
+            '--publish-since',
+            type=str,
+            help='Опубликовать отметки из БД с даты YYYY-MM-DD (после простоя Redis)'
+        )
+
+    def handle(self, *args, **options):
+        if options['publish_since']:
+            self._publish(options['publish_since'])
+        elif options['replay_from']:
+            for event_id, event in replay(options['replay_from']):
+                self._print(event_id, event)
+        elif options['group']:
+            self._consume(options['group'], options['consumer'])
+        else:
+            raise CommandError('Укажите --group, --replay-from или --publish-since')
+
+    def _publish(self, since: str):
+        try:
+            since = timezone.make_aware(datetime.strptime(since, '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError(f"Неверная дата {since}. Используйте YYYY-MM-DD")
+
+        punches = Transaction.objects.filter(
+            punch_time__gte=since, skud_id__gt=0
+        ).select_related('source', 'terminal').order_by('punch_time', 'id')
+
+        batch_size = settings.PUNCH_STREAM_CONFIG['BATCH_SIZE']
+        batch, published = [], 0
+        for punch in punches.iterator(chunk_size=batch_size):
+            batch.append(punch)
+            if len(batch) >= batch_size:
+                published += publish_punches(batch)
+                batch = []
+        published += publish_punches(batch)
+
+        self.stdout.write(f"Опубликовано событий: {published}")
+
+    def _consume(self, group: str, consumer: str):
+        stream = PunchStreamConsumer(group, consumer)
+        self.stdout.write(f"Читаем {stream.key} группой {group} (Ctrl+C - выход)")
+        try:
+            while True:
+                events = stream.read()
+                for event_id, event in events:
+                    self._print(event_id, event)
+                stream.ack([event_id for event_id, _ in events])
+        except KeyboardInterrupt:
+            pass
+
+    def _print(self, event_id: str, event: dict):
+        self.stdout.write(f"{event_id} {json.dumps(event, ensure_ascii=False)}")
@@ -0,0 +1,70 @@
+import cProfile
+import os
+import pstats
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import SkudSource
+from ...services.capture import TrafficReplayer, read_capture
+from ...services.metrics import metrics
+from ...services.monitor import SKUDMonitor
+
+
+class Command(BaseCommand):
+    help = 'Воспроизвести записанные ответы СКУД (run_monitor --capture) через обработку монитора'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Журнал ответов СКУД (.jsonl.gz)')
+        parser.add_argument('--speed', type=float, default=0,
+                            help='Темп: 1 - как при записи, 10 - в 10 раз быстрее, 0 - без пауз (по умолчанию)')
+        parser.add_argument('--limit', type=int, default=None, help='Воспроизвести только первые N ответов')
+        parser.add_argument('--source', type=str, default=None,
+                            help='Код сервера СКУД, с которого записан журнал (по умолчанию - основной)')
+        parser.add_argument('--from-id', type=int, default=None,
+                            help='Обрабатывать записи с ID больше этого (по умолчанию - курсор из БД)')
+        parser.add_argument('--notify', action='store_true',
+                            help='Отправлять уведомления в Telegram (по умолчанию выключены)')
+        parser.add_argument('--profile', type=str, default=None,
+                            help='Сохранить профиль cProfile в файл (смотреть snakeviz/pstats)')
+        parser.add_argument('--wait', type=int, default=0,
+                            help='Подождать N секунд перед стартом, чтобы подключить py-spy к PID')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['path']):
+            raise CommandError(f"Журнал не найден: {options['path']}")
+
+        source = None
+        if options['source']:
+            source = SkudSource.objects.filter(code=options['source']).first()
+            if source is None:
+                raise CommandError(f"Сервер СКУД {options['source']} не найден")
+
+        monitor = SKUDMonitor(source=source, notifications=options['notify'])
+        if options['from_id'] is not None:
+            monitor.last_id = options['from_id']
+        else:
+            monitor.resume_cursor()
+        replayer = TrafficReplayer(monitor, speed=options['speed'])
+
+        if options['wait']:
+            self.stdout.write(f"PID {os.getpid()}: py-spy record --pid {os.getpid()} -o profile.svg")
+            time.sleep(options['wait'])
+
+        records = read_capture(options['path'])
+
+        if options['profile']:
+            profiler = cProfile.Profile()
+            stats = profiler.runcall(replayer.replay, records, options['limit'])
+            profiler.dump_stats(options['profile'])
+            pstats.Stats(profiler, stream=self.stdout).sort_stats('cumulative').print_stats(25)
+            self.stdout.write(f"Профиль сохранен: {options['profile']}")
+        else:
+            stats = replayer.replay(records, options['limit'])
+
+        metrics.flush(force=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Воспроизведено ответов: {stats['pages']} (ошибок {stats['errors']}), "
+            f"записей в ответах: {stats['rows']}, новых: {stats['new']}, за {stats['seconds']} с"
+        ))
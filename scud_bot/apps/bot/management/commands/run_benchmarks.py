@@ -0,0 +1,52 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.benchmark import BenchmarkRunner, compare_results
+
+
+class Command(BaseCommand):
+    help = 'Замеры горячих путей (монитор, автовыход, админка, импорт) с сохранением результатов в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=list(BenchmarkRunner.SCENARIOS),
+                            help='Запустить только эти сценарии')
+        parser.add_argument('--iterations', type=int, default=10, help='Повторов на сценарий (по умолчанию 10)')
+        parser.add_argument('--output', type=str, default=None,
+                            help='Файл результатов (по умолчанию benchmarks/results-<время>.json)')
+        parser.add_argument('--compare', type=str, default=None,
+                            help='JSON предыдущего запуска для сравнения')
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Не удалось прочитать {options['compare']} - {e}")
+
+        runner = BenchmarkRunner(iterations=options['iterations'])
+        report = runner.run(options['only'])
+
+        self.stdout.write(f"Данные: {report['dataset']} ({report['database']})")
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f"  {name}: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, "
+                f"{result['rows_per_s']} строк/с, {result['queries_per_call']} запросов/вызов"
+            )
+
+        output = Path(options['output'] or settings.BASE_DIR.parent / 'benchmarks' /
+                      f"results-{datetime.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены: {output}"))
+
+        if previous:
+            self.stdout.write("Сравнение с предыдущим запуском:")
+            for line in compare_results(report, previous):
+                self.stdout.write(f"  {line}")
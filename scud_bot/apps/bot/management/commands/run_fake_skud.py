@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+
+from ...services.fake_skud import FakeSkudState, PunchGenerator, make_server
+
+
+class Command(BaseCommand):
+    help = 'Запуск локальной замены СКУД для нагрузочного тестирования (SKUD_BASE_URL=http://host:port)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Адрес (по умолчанию 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8800, help='Порт (по умолчанию 8800)')
+        parser.add_argument('--rate', type=float, default=1.0,
+                            help='Новых отметок в секунду, 0 - не генерировать (по умолчанию 1)')
+        parser.add_argument('--seed', type=int, default=0, help='Сколько отметок сгенерировать в историю при старте')
+        parser.add_argument('--employees', type=int, default=200, help='Количество сотрудников (коды с 100)')
+        parser.add_argument('--terminals', type=int, default=4, help='Количество терминалов')
+        parser.add_argument('--session-ttl', type=int, default=3600,
+                            help='Через сколько секунд протухает сессионная кука (по умолчанию 3600)')
+        parser.add_argument('--password', type=str, default=None,
+                            help='Пароль для входа (по умолчанию подходит любой непустой)')
+        parser.add_argument('--latency-ms', type=int, default=0, help='Задержка каждого ответа, мс')
+        parser.add_argument('--jitter-ms', type=int, default=0, help='Случайная добавка к задержке, мс')
+        parser.add_argument('--unauthorized-rate', type=float, default=0.0,
+                            help='Доля запросов к API с ответом 401 (0..1)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Доля запросов с ответом 5xx (0..1)')
+
+    def handle(self, *args, **options):
+        state = FakeSkudState(
+            employees=options['employees'],
+            terminals=options['terminals'],
+            session_ttl=options['session_ttl'],
+            password=options['password'],
+        )
+        state.faults.latency_ms = options['latency_ms']
+        state.faults.jitter_ms = options['jitter_ms']
+        state.faults.unauthorized_rate = options['unauthorized_rate']
+        state.faults.error_rate = options['error_rate']
+
+        if options['seed']:
+            state.seed(options['seed'])
+            self.stdout.write(f"Сгенерировано отметок в историю: {options['seed']}")
+
+        generator = None
+        if options['rate'] > 0:
+            generator = PunchGenerator(state, options['rate'])
+            generator.start()
+
+        server = make_server(state, options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Поддельный СКУД запущен на http://{options['host']}:{options['port']} "
+            f"({options['rate']} отметок/с)"
+        ))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Остановлен пользователем")
+        finally:
+            if generator:
+                generator.stop()
+            server.server_close()
+            self.stdout.write(f"Статистика: {state.stats}")
@@ -1,13 +1,15 @@
 import logging
+import signal
 from django.core.management.base import BaseCommand
 from django.conf import settings
 
-from ...services.monitor import SKUDMonitor
+from ...models import SkudSource
+from ...services.monitor import MultiSourceMonitor
 
-# Настройка логирования
+# Настройка логирования (имя потока - monitor-<код сервера СКУД>)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s',
     handlers=[
         logging.StreamHandler(),
         logging.FileHandler('skud_monitor_detailed.log')
@@ -20,25 +22,53 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Запуск мониторинга СКУД системы'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--capture',
+            type=str,
+            default=None,
+            help='Записывать ответы СКУД в журнал (.jsonl.gz) для replay_monitor; '
+                 'у каждого сервера свой файл: {source} в пути или префикс <код>-'
+        )
+        parser.add_argument(
+            '--source',
+            action='append',
+            default=None,
+            help='Опрашивать только этот сервер СКУД (код, можно несколько раз)'
+        )
+
     def handle(self, *args, **options):
         logger.info("=" * 60)
         logger.info("ЗАПУСК МОНИТОРИНГА СКУД")
         logger.info("=" * 60)
 
-        # Проверяем настройки
-        if not settings.SKUD_CONFIG.get('SESSION_COOKIE'):
-            logger.error("Не настроен SESSION_COOKIE в settings.py")
+        # Основной сервер создается из SKUD_CONFIG, если его еще нет
+        SkudSource.get_default()
+
+        sources = SkudSource.objects.filter(is_enabled=True)
+        if options['source']:
+            sources = sources.filter(code__in=options['source'])
+        if not sources.exists():
+            logger.error("Нет включенных серверов СКУД (админка - Серверы СКУД)")
             return
 
-        logger.info(f"URL: {settings.SKUD_CONFIG['BASE_URL']}")
+        for source in sources:
+            logger.info(f"СКУД {source.code}: {source.base_url}")
         logger.info(f"Интервал: {settings.SKUD_CONFIG['POLL_INTERVAL']} сек")
 
-        # Создаем и запускаем монитор
-        monitor = SKUDMonitor()
+        # docker stop шлет SIGTERM - останавливаемся как по Ctrl+C и сразу отдаем лидерство
+        signal.signal(signal.SIGTERM, self._terminate)
+
+        # Создаем и запускаем монитор (поток на каждый сервер СКУД)
+        monitor = MultiSourceMonitor(capture_path=options['capture'], codes=options['source'])
 
         try:
             monitor.run()
         except KeyboardInterrupt:
             logger.info("Мониторинг остановлен пользователем")
         except Exception as e:
-            logger.error(f"Ошибка запуска - {e}")
\ No newline at end of file
+            logger.error(f"Ошибка запуска - {e}")
+
+    @staticmethod
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
@@ -0,0 +1,29 @@
+import logging
+import signal
+
+from django.core.management.base import BaseCommand
+
+from ...services.webhooks import WebhookDispatcher
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s',
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Доставка событий отметок подписчикам (вебхуки) из потока Redis'
+
+    def handle(self, *args, **options):
+        logger.info("ЗАПУСК ДОСТАВКИ СОБЫТИЙ")
+
+        # docker stop шлет SIGTERM - останавливаемся как по Ctrl+C
+        signal.signal(signal.SIGTERM, self._terminate)
+
+        WebhookDispatcher().run()
+
+    @staticmethod
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from ...services.synthetic import SyntheticDataset
+
+
+class Command(BaseCommand):
+    help = 'Заполнить БД синтетическими отметками для нагрузочных тестов (10^4 - 10^7 записей)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=100000,
+                            help='Сколько записей проходов создать (по умолчанию 100000)')
+        parser.add_argument('--employees', type=int, default=1000, help='Сотрудников (по умолчанию 1000)')
+        parser.add_argument('--terminals', type=int, default=12, help='Терминалов (по умолчанию 12)')
+        parser.add_argument('--days', type=int, default=30, help='За сколько последних дней (по умолчанию 30)')
+        parser.add_argument('--unlinked-ratio', type=float, default=0.05,
+                            help='Доля записей с неизвестным кодом сотрудника (по умолчанию 0.05)')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Размер пачки вставки')
+        parser.add_argument('--seed', type=int, default=None, help='Зерно генератора для повторяемости')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданные синтетические данные перед генерацией')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = SyntheticDataset.clear()
+            self.stdout.write(f"Удалено: {deleted}")
+
+        if not options['transactions']:
+            return
+
+        dataset = SyntheticDataset(
+            employees=options['employees'],
+            terminals=options['terminals'],
+            days=options['days'],
+            unlinked_ratio=options['unlinked_ratio'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+        )
+
+        total = options['transactions']
+
+        def progress(created):
+            self.stdout.write(f"  {created}/{total} ({created * 100 // total}%)")
+
+        result = dataset.generate(total, progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано записей: {result['transactions']}, сотрудников: {result['employees']}, "
+            f"терминалов: {result['terminals']}"
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-19 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_employee_auto_logout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=500, unique=True, verbose_name='Путь к файлу')),
+                ('file_size', models.BigIntegerField(default=0, verbose_name='Размер файла')),
+                ('total', models.IntegerField(default=0, verbose_name='Записей в файле')),
+                ('offset', models.IntegerField(default=0, verbose_name='Обработано записей')),
+                ('max_skud_id', models.IntegerField(default=0, verbose_name='Максимальный ID записи в СКУД')),
+                ('imported', models.IntegerField(default=0, verbose_name='Импортировано')),
+                ('skipped', models.IntegerField(default=0, verbose_name='Пропущено')),
+                ('errors', models.IntegerField(default=0, verbose_name='Ошибок')),
+                ('is_completed', models.BooleanField(default=False, verbose_name='Завершен')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Импорт бэкапа',
+                'verbose_name_plural': 'Импорты бэкапов',
+                'ordering': ['-updated_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-19 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0005_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('employee__isnull', True)), fields=['emp_code'], name='transaction_unlinked_idx'),
+        ),
+    ]
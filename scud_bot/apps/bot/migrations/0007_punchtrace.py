@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_transaction_unlinked_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PunchTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('skud_id', models.IntegerField(unique=True, verbose_name='ID записи в СКУД')),
+                ('emp_code', models.CharField(blank=True, max_length=20, verbose_name='Код сотрудника')),
+                ('terminal_id', models.IntegerField(blank=True, null=True, verbose_name='ID терминала')),
+                ('punch_time', models.DateTimeField(blank=True, null=True, verbose_name='Время отметки')),
+                ('fetched_at', models.DateTimeField(blank=True, null=True, verbose_name='Получена из СКУД')),
+                ('fetch_ms', models.FloatField(blank=True, null=True, verbose_name='Опрос СКУД, мс')),
+                ('lookup_ms', models.FloatField(blank=True, null=True, verbose_name='Поиск терминала/сотрудника, мс')),
+                ('insert_ms', models.FloatField(blank=True, null=True, verbose_name='Запись в БД, мс')),
+                ('enqueue_ms', models.FloatField(blank=True, null=True, verbose_name='Постановка уведомления, мс')),
+                ('ingest_ms', models.FloatField(blank=True, null=True, verbose_name='Всего в мониторе, мс')),
+                ('queue_ms', models.FloatField(blank=True, null=True, verbose_name='Ожидание в очереди, мс')),
+                ('telegram_ms', models.FloatField(blank=True, null=True, verbose_name='Ответ Telegram API, мс')),
+                ('delivery_ms', models.FloatField(blank=True, null=True, verbose_name='От опроса до доставки, мс')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='Доставлено')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+            ],
+            options={
+                'verbose_name': 'Трассировка отметки',
+                'verbose_name_plural': 'Трассировки отметок',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0007_punchtrace'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['terminal', 'punch_time'], name='transaction_terminal_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['employee', 'punch_time'], name='transaction_employee_time_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_transaction_time_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkudSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(unique=True, verbose_name='Код')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('base_url', models.CharField(max_length=200, verbose_name='Адрес СКУД')),
+                ('username', models.CharField(blank=True, max_length=100, verbose_name='Логин')),
+                ('password', models.CharField(blank=True, max_length=100, verbose_name='Пароль')),
+                ('session_cookie', models.CharField(blank=True, max_length=200, verbose_name='Сессионная кука')),
+                ('last_id', models.IntegerField(default=0, verbose_name='Последний ID записи')),
+                ('is_enabled', models.BooleanField(default=True, verbose_name='Опрашивать')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Сервер СКУД',
+                'verbose_name_plural': 'Серверы СКУД',
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='punchtrace',
+            name='source',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.skudsource', verbose_name='Сервер СКУД'),
+        ),
+        migrations.AddField(
+            model_name='terminal',
+            name='source',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='terminals', to='bot.skudsource', verbose_name='Сервер СКУД'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='source',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='bot.skudsource', verbose_name='Сервер СКУД'),
+        ),
+    ]
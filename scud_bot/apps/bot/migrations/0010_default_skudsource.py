@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Max
+
+
+def assign_default_source(apps, schema_editor):
+    """Все существующие терминалы, записи и трассировки - основного сервера из SKUD_CONFIG"""
+    SkudSource = apps.get_model('bot', 'SkudSource')
+    Terminal = apps.get_model('bot', 'Terminal')
+    Transaction = apps.get_model('bot', 'Transaction')
+    PunchTrace = apps.get_model('bot', 'PunchTrace')
+
+    # Курсор - как и раньше, максимальный ID записи (автовыход пишет 0)
+    last_id = Transaction.objects.filter(skud_id__gt=0).aggregate(last=Max('skud_id'))['last'] or 0
+
+    main, _ = SkudSource.objects.get_or_create(
+        code=settings.SKUD_CONFIG.get('DEFAULT_SOURCE', 'main'),
+        defaults={
+            'name': 'Основной СКУД',
+            'base_url': settings.SKUD_CONFIG['BASE_URL'],
+            'session_cookie': settings.SKUD_CONFIG.get('SESSION_COOKIE') or '',
+            'last_id': last_id,
+        }
+    )
+
+    Terminal.objects.filter(source__isnull=True).update(source=main)
+    Transaction.objects.filter(source__isnull=True).update(source=main)
+    PunchTrace.objects.filter(source__isnull=True).update(source=main)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_skudsource'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_default_source, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_default_skudsource'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='punchtrace',
+            name='source',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.skudsource', verbose_name='Сервер СКУД'),
+        ),
+        migrations.AlterField(
+            model_name='terminal',
+            name='source',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='terminals', to='bot.skudsource', verbose_name='Сервер СКУД'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='source',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='bot.skudsource', verbose_name='Сервер СКУД'),
+        ),
+        migrations.AlterField(
+            model_name='punchtrace',
+            name='skud_id',
+            field=models.IntegerField(verbose_name='ID записи в СКУД'),
+        ),
+        migrations.AlterField(
+            model_name='terminal',
+            name='terminal_id',
+            field=models.IntegerField(verbose_name='ID терминала'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='skud_id',
+            field=models.IntegerField(verbose_name='ID записи в СКУД'),
+        ),
+        migrations.AddConstraint(
+            model_name='punchtrace',
+            constraint=models.UniqueConstraint(fields=('source', 'skud_id'), name='punchtrace_source_skud_id_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='terminal',
+            constraint=models.UniqueConstraint(fields=('source', 'terminal_id'), name='terminal_source_id_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('source', 'skud_id'), name='transaction_source_skud_id_uniq'),
+        ),
+    ]
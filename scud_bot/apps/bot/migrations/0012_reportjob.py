@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0011_skudsource_required'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('backup', 'Бэкап СКУД'), ('employee_history', 'История сотрудника за месяц'), ('terminal_occupancy', 'Загруженность терминала')], max_length=30, verbose_name='Отчет')),
+                ('params', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('params_hash', models.CharField(db_index=True, max_length=64, verbose_name='Ключ параметров')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Строится'), ('done', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('file', models.FileField(blank=True, max_length=300, upload_to='reports/', verbose_name='Файл')),
+                ('rows', models.IntegerField(default=0, verbose_name='Строк')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Заказан')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начат')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершен')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Заказал')),
+            ],
+            options={
+                'verbose_name': 'Отчет',
+                'verbose_name_plural': 'Отчеты',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_reportjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportjob',
+            name='kind',
+            field=models.CharField(choices=[('backup', 'Бэкап СКУД'), ('employee_history', 'История сотрудника за месяц'), ('terminal_occupancy', 'Загруженность терминала'), ('timesheet', 'Табель за месяц')], max_length=30, verbose_name='Отчет'),
+        ),
+        migrations.CreateModel(
+            name='Visit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emp_code', models.CharField(max_length=20, verbose_name='Код сотрудника')),
+                ('started_at', models.DateTimeField(verbose_name='Начало')),
+                ('ended_at', models.DateTimeField(blank=True, null=True, verbose_name='Конец')),
+                ('duration', models.IntegerField(default=0, verbose_name='Длительность, с')),
+                ('status', models.CharField(choices=[('open', 'На пункте'), ('closed', 'Закрыт'), ('auto', 'Закрыт автовыходом'), ('no_exit', 'Нет выхода'), ('no_entry', 'Нет входа')], default='open', max_length=10, verbose_name='Статус')),
+                ('entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.transaction', verbose_name='Вход')),
+                ('exit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.transaction', verbose_name='Выход')),
+                ('terminal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.terminal', verbose_name='Терминал')),
+            ],
+            options={
+                'verbose_name': 'Визит',
+                'verbose_name_plural': 'Визиты',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['emp_code', 'started_at'], name='visit_emp_code_started_idx'), models.Index(fields=['started_at'], name='visit_started_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:36
+
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+# Выражение должно совпадать с services/presence.py, иначе индекс не используется
+CREATE_PRESENCE_INDEX = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+CREATE INDEX IF NOT EXISTS visit_presence_gist ON bot_visit USING gist (
+    terminal_id,
+    tstzrange(started_at, coalesce(present_until, 'infinity'::timestamptz), '[)')
+);
+"""
+
+DROP_PRESENCE_INDEX = "DROP INDEX IF EXISTS visit_presence_gist;"
+
+
+def fill_present_until(apps, schema_editor):
+    Visit = apps.get_model('bot', 'Visit')
+
+    Visit.objects.filter(status__in=['closed', 'auto']).update(present_until=F('ended_at'))
+    Visit.objects.filter(status='no_entry').update(present_until=F('started_at'))
+
+    # Без выхода - до конца дня входа (точнее пересоберет build_visits)
+    batch = []
+    for visit in Visit.objects.filter(status='no_exit').only('id', 'started_at').iterator(chunk_size=2000):
+        day = timezone.localtime(visit.started_at).date() + timedelta(days=1)
+        visit.present_until = timezone.make_aware(datetime.combine(day, time.min))
+        batch.append(visit)
+        if len(batch) >= 2000:
+            Visit.objects.bulk_update(batch, ['present_until'])
+            batch = []
+    Visit.objects.bulk_update(batch, ['present_until'])
+
+
+def create_presence_index(apps, schema_editor):
+    # tstzrange и GiST есть только в Postgres - на других базах запросы идут по started_at
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_PRESENCE_INDEX)
+
+
+def drop_presence_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_PRESENCE_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_visit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visit',
+            name='present_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='На пункте до'),
+        ),
+        migrations.RunPython(fill_present_until, migrations.RunPython.noop),
+        migrations.RunPython(create_presence_index, drop_presence_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0014_visit_presence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField(choices=[(300, '5 минут'), (3600, '1 час')], verbose_name='Интервал, с')),
+                ('start', models.DateTimeField(verbose_name='Начало интервала')),
+                ('entries', models.IntegerField(default=0, verbose_name='Входов')),
+                ('exits', models.IntegerField(default=0, verbose_name='Выходов')),
+                ('headcount', models.IntegerField(default=0, verbose_name='На пункте')),
+                ('peak', models.IntegerField(default=0, verbose_name='Максимум на пункте')),
+                ('terminal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.terminal', verbose_name='Терминал')),
+            ],
+            options={
+                'verbose_name': 'Загруженность',
+                'verbose_name_plural': 'Загруженность',
+                'ordering': ['-start'],
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'terminal', 'start'), name='occupancy_resolution_terminal_start_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0015_occupancybucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Anomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule', models.CharField(max_length=30, verbose_name='Правило')),
+                ('emp_code', models.CharField(max_length=20, verbose_name='Код сотрудника')),
+                ('punch_time', models.DateTimeField(verbose_name='Время отметки')),
+                ('message', models.CharField(max_length=255, verbose_name='Описание')),
+                ('detected_at', models.DateTimeField(auto_now_add=True, verbose_name='Обнаружено')),
+                ('is_reviewed', models.BooleanField(default=False, verbose_name='Разобрано')),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bot.employee', verbose_name='Сотрудник')),
+                ('terminal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.terminal', verbose_name='Терминал')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.transaction', verbose_name='Отметка')),
+            ],
+            options={
+                'verbose_name': 'Аномалия',
+                'verbose_name_plural': 'Аномалии',
+                'ordering': ['-punch_time'],
+                'indexes': [models.Index(fields=['punch_time'], name='anomaly_punch_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0016_anomaly'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('url', models.URLField(max_length=500, verbose_name='Адрес')),
+                ('secret', models.CharField(max_length=200, verbose_name='Секрет подписи (HMAC-SHA256)')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Отправлять')),
+                ('areas', models.CharField(blank=True, help_text='Через запятую', max_length=500, verbose_name='Зоны')),
+                ('emp_codes', models.TextField(blank=True, help_text='Через запятую или с новой строки', verbose_name='Коды сотрудников')),
+                ('batch_size', models.PositiveIntegerField(default=100, verbose_name='Событий в запросе')),
+                ('max_concurrency', models.PositiveIntegerField(default=1, help_text='Больше 1 - порядок событий не гарантирован', verbose_name='Одновременных запросов')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('terminals', models.ManyToManyField(blank=True, related_name='+', to='bot.terminal', verbose_name='Терминалы')),
+            ],
+            options={
+                'verbose_name': 'Подписка на события',
+                'verbose_name_plural': 'Подписки на события',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WebhookDeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(verbose_name='Тело запроса')),
+                ('events', models.IntegerField(default=0, verbose_name='Событий')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('status_code', models.IntegerField(blank=True, null=True, verbose_name='Код ответа')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Последняя попытка')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dead_letters', to='bot.webhooksubscription', verbose_name='Подписка')),
+            ],
+            options={
+                'verbose_name': 'Недоставленные события',
+                'verbose_name_plural': 'Недоставленные события',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
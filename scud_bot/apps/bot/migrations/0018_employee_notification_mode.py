@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0017_webhooks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='notification_mode',
+            field=models.CharField(choices=[('instant', 'О каждом проходе'), ('digest', 'Сводка за день')], default='instant', help_text='Сводка - одно сообщение в день (в 21:00) вместо уведомления о каждом проходе', max_length=10, verbose_name='Режим уведомлений'),
+        ),
+    ]
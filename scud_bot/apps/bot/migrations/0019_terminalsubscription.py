@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0018_employee_notification_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TerminalSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('chat_id', models.BigIntegerField(help_text='У групп - отрицательный', verbose_name='ID чата Telegram')),
+                ('areas', models.CharField(blank=True, help_text='Через запятую', max_length=500, verbose_name='Зоны')),
+                ('events', models.CharField(choices=[('all', 'Входы и выходы'), ('in', 'Только входы'), ('out', 'Только выходы')], default='all', max_length=5, verbose_name='События')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Отправлять')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('terminals', models.ManyToManyField(blank=True, related_name='+', to='bot.terminal', verbose_name='Терминалы')),
+            ],
+            options={
+                'verbose_name': 'Лента проходов',
+                'verbose_name_plural': 'Ленты проходов',
+                'ordering': ['name'],
+            },
+        ),
+    ]
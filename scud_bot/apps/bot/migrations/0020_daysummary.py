@@ -0,0 +1,35 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0019_terminalsubscription'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DaySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emp_code', models.CharField(max_length=20, verbose_name='Код сотрудника')),
+                ('day', models.DateField(verbose_name='День')),
+                ('first_entry_at', models.DateTimeField(blank=True, null=True, verbose_name='Первый вход')),
+                ('last_punch_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя отметка')),
+                ('last_is_entry', models.BooleanField(default=False, verbose_name='Последняя отметка - вход')),
+                ('worked', models.IntegerField(default=0, verbose_name='Отработано, с')),
+                ('open_since', models.DateTimeField(blank=True, null=True, verbose_name='На пункте с')),
+                ('first_terminal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bot.terminal', verbose_name='Терминал первого входа')),
+                ('last_terminal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bot.terminal', verbose_name='Терминал последней отметки')),
+            ],
+            options={
+                'verbose_name': 'Сводка за день',
+                'verbose_name_plural': 'Сводки за день',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('emp_code', 'day'), name='day_summary_emp_day_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0020_daysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='is_manager',
+            field=models.BooleanField(default=False, help_text='Доступна команда /onsite в боте', verbose_name='Руководитель'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0021_employee_is_manager'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('audience', models.CharField(blank=True, max_length=300, verbose_name='Получатели')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Отправляется'), ('done', 'Отправлена'), ('failed', 'Прервана'), ('cancelled', 'Остановлена')], default='pending', max_length=10, verbose_name='Статус')),
+                ('total', models.IntegerField(default=0, verbose_name='Всего')),
+                ('sent', models.IntegerField(default=0, verbose_name='Отправлено')),
+                ('failed', models.IntegerField(default=0, verbose_name='Ошибок')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начата')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Рассылка',
+                'verbose_name_plural': 'Рассылки',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BroadcastDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(verbose_name='ID чата Telegram')),
+                ('status', models.CharField(choices=[('pending', 'Ждет отправки'), ('sent', 'Отправлено'), ('failed', 'Не доставлено')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('error', models.CharField(blank=True, max_length=500, verbose_name='Ошибка')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('broadcast', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='bot.broadcast', verbose_name='Рассылка')),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bot.employee', verbose_name='Сотрудник')),
+            ],
+            options={
+                'verbose_name': 'Получатель рассылки',
+                'verbose_name_plural': 'Получатели рассылок',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['broadcast', 'status'], name='broadcast_delivery_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('broadcast', 'chat_id'), name='broadcast_delivery_chat_uniq')],
+            },
+        ),
+    ]
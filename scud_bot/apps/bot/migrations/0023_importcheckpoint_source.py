@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0022_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='source',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.skudsource', verbose_name='Сервер СКУД'),
+        ),
+        migrations.AlterField(
+            model_name='importcheckpoint',
+            name='file_path',
+            field=models.CharField(max_length=500, verbose_name='Путь к файлу'),
+        ),
+    ]
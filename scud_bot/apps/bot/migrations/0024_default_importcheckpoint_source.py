@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def assign_default_source(apps, schema_editor):
+    """Прогресс прежних импортов - основного сервера из SKUD_CONFIG (импорт без --source шел в него)"""
+    SkudSource = apps.get_model('bot', 'SkudSource')
+    ImportCheckpoint = apps.get_model('bot', 'ImportCheckpoint')
+
+    if not ImportCheckpoint.objects.filter(source__isnull=True).exists():
+        return
+
+    main, _ = SkudSource.objects.get_or_create(
+        code=settings.SKUD_CONFIG.get('DEFAULT_SOURCE', 'main'),
+        defaults={
+            'name': 'Основной СКУД',
+            'base_url': settings.SKUD_CONFIG['BASE_URL'],
+            'session_cookie': settings.SKUD_CONFIG.get('SESSION_COOKIE') or '',
+        }
+    )
+    ImportCheckpoint.objects.filter(source__isnull=True).update(source=main)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0023_importcheckpoint_source'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_default_source, migrations.RunPython.noop),
+    ]
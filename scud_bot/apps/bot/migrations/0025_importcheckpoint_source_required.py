@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0024_default_importcheckpoint_source'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importcheckpoint',
+            name='source',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bot.skudsource', verbose_name='Сервер СКУД'),
+        ),
+        migrations.AddConstraint(
+            model_name='importcheckpoint',
+            constraint=models.UniqueConstraint(fields=('source', 'file_path'), name='importcheckpoint_source_file_uniq'),
+        ),
+    ]
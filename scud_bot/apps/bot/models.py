@@ -1,10 +1,58 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
 
+class SkudSource(models.Model):
+    """Сервер СКУД (площадка): адрес, доступ и курсор опроса
+
+    ID терминалов и записей уникальны только в пределах своего сервера.
+    """
+    code = models.SlugField(max_length=50, unique=True, verbose_name="Код")
+    name = models.CharField(max_length=200, verbose_name="Название")
+    base_url = models.CharField(max_length=200, verbose_name="Адрес СКУД")
+
+    # Пустые - вход под случайным сотрудником из пула AutoLogger
+    username = models.CharField(max_length=100, blank=True, verbose_name="Логин")
+    password = models.CharField(max_length=100, blank=True, verbose_name="Пароль")
+    session_cookie = models.CharField(max_length=200, blank=True, verbose_name="Сессионная кука")
+
+    # Последняя обработанная запись - с нее продолжает монитор после перезапуска
+    last_id = models.IntegerField(default=0, verbose_name="Последний ID записи")
+    is_enabled = models.BooleanField(default=True, verbose_name="Опрашивать")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Сервер СКУД"
+        verbose_name_plural = "Серверы СКУД"
+        ordering = ['code']
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def get_default(cls) -> 'SkudSource':
+        """Основной сервер (из SKUD_CONFIG) - для кода, который не выбирает сервер явно"""
+        source, _ = cls.objects.get_or_create(
+            code=settings.SKUD_CONFIG['DEFAULT_SOURCE'],
+            defaults={
+                'name': 'Основной СКУД',
+                'base_url': settings.SKUD_CONFIG['BASE_URL'],
+                'session_cookie': settings.SKUD_CONFIG['SESSION_COOKIE'] or '',
+            }
+        )
+        return source
+
+    @property
+    def credentials(self):
+        return (self.username, self.password) if self.username else None
+
+
 class Terminal(models.Model):
     """Терминалы СКУД"""
-    terminal_id = models.IntegerField(unique=True, verbose_name="ID терминала")
+    source = models.ForeignKey(SkudSource, on_delete=models.PROTECT, related_name='terminals',
+                               verbose_name="Сервер СКУД")
+    terminal_id = models.IntegerField(verbose_name="ID терминала")
     terminal_sn = models.CharField(max_length=50, verbose_name="Серийный номер")
     terminal_alias = models.CharField(max_length=200, verbose_name="Название терминала")
     area_alias = models.CharField(max_length=200, verbose_name="Название зоны")
@@ -14,6 +62,9 @@ class Terminal(models.Model):
         verbose_name = "Терминал"
         verbose_name_plural = "Терминалы"
         ordering = ['terminal_alias']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'terminal_id'], name='terminal_source_id_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.terminal_alias} ({self.terminal_sn})"
@@ -21,6 +72,13 @@ class Terminal(models.Model):
 
 class Employee(models.Model):
     """Сотрудники"""
+    NOTIFY_INSTANT = 'instant'
+    NOTIFY_DIGEST = 'digest'
+    NOTIFY_CHOICES = [
+        (NOTIFY_INSTANT, 'О каждом проходе'),
+        (NOTIFY_DIGEST, 'Сводка за день'),
+    ]
+
     emp_id = models.IntegerField(unique=True, verbose_name="ID сотрудника")
     emp_code = models.CharField(max_length=20, verbose_name="Код сотрудника")
     name = models.CharField(max_length=200, blank=True, verbose_name="Имя сотрудника")
@@ -31,10 +89,16 @@ class Employee(models.Model):
 
     # Настройки уведомлений
     send_notifications = models.BooleanField(default=False, verbose_name="Отправлять уведомления")
+    notification_mode = models.CharField(max_length=10, choices=NOTIFY_CHOICES, default=NOTIFY_INSTANT,
+                                         verbose_name="Режим уведомлений",
+                                         help_text="Сводка - одно сообщение в день (в 21:00) вместо уведомления о каждом проходе")
 
     # Настройки автоматического выхода
     auto_logout = models.BooleanField(default=False, verbose_name="Автоматический выход", help_text="Автоматический выход в 23:55 если сотрудник остался на пункте")
 
+    # Руководитель может спросить у бота, кто сейчас на пунктах (/onsite)
+    is_manager = models.BooleanField(default=False, verbose_name="Руководитель", help_text="Доступна команда /onsite в боте")
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
 
     class Meta:
@@ -51,42 +115,48 @@ class Employee(models.Model):
         """Получает ли сотрудник уведомления?"""
         return self.send_notifications and self.telegram_id is not None
 
+    @property
+    def wants_instant_notifications(self):
+        """Уведомлять о каждом проходе (а не сводкой за день)?"""
+        return self.can_receive_notifications and self.notification_mode == self.NOTIFY_INSTANT
+
+    # Код на момент загрузки из БД - привязка нужна только если он изменился
+    _loaded_emp_code = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_emp_code = instance.__dict__.get('emp_code')
+        return instance
+
     def save(self, *args, **kwargs):
         # Сохраняем сотрудника
-        is_new = self.pk is None  # Проверяем, новый ли сотрудник
+        is_new = self._state.adding  # Проверяем, новый ли сотрудник
         super().save(*args, **kwargs)
 
-        # После сохранения привязываем его транзакции
-        self.link_existing_transactions()
-
-    def link_existing_transactions(self):
-        """Привязать существующие транзакции этого сотрудника"""
-        # Используем lazy relation через _meta
-        Transaction = self._meta.apps.get_model('bot', 'Transaction')
+        update_fields = kwargs.get('update_fields')
+        emp_code_saved = update_fields is None or 'emp_code' in update_fields
 
-        # Находим все транзакции с этим emp_code, но без привязки
-        unlinked_transactions = Transaction.objects.filter(
-            emp_code=self.emp_code,
-            employee__isnull=True
-        )
+        # Привязка записей - в фоне и только для нового сотрудника или нового кода
+        if emp_code_saved and (is_new or self.emp_code != self._loaded_emp_code):
+            from .services.linker import schedule_linking
+            schedule_linking(self.emp_code)
 
-        count = unlinked_transactions.count()
-        if count > 0:
-            # Привязываем
-            updated = unlinked_transactions.update(employee=self)
+        if emp_code_saved:
+            self._loaded_emp_code = self.emp_code
 
-            # Логируем
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.info(f"Автопривязка: {self.name} ({self.emp_code}) - привязано {updated} записей")
+    def link_existing_transactions(self):
+        """Привязать существующие транзакции этого сотрудника"""
+        from .services.linker import TransactionLinker
 
-            return updated
-        return 0
+        return TransactionLinker().link([self.emp_code])
 
 
 class Transaction(models.Model):
     """Записи проходок СКУД"""
-    skud_id = models.IntegerField(unique=True, verbose_name="ID записи в СКУД")
+    source = models.ForeignKey(SkudSource, on_delete=models.PROTECT, related_name='transactions',
+                               verbose_name="Сервер СКУД")
+    skud_id = models.IntegerField(verbose_name="ID записи в СКУД")
 
     # Делаем employee опциональным
     employee = models.ForeignKey(Employee, on_delete=models.SET_NULL,
@@ -110,6 +180,20 @@ class Transaction(models.Model):
         verbose_name = "Запись прохода"
         verbose_name_plural = "Записи проходов"
         ordering = ['-punch_time']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'skud_id'], name='transaction_source_skud_id_uniq'),
+        ]
+        indexes = [
+            # Для привязки: непривязанные записи ищутся по emp_code
+            models.Index(
+                fields=['emp_code'],
+                condition=models.Q(employee__isnull=True),
+                name='transaction_unlinked_idx',
+            ),
+            # Для списков в админке: последние/сегодняшние записи терминала и сотрудника
+            models.Index(fields=['terminal', 'punch_time'], name='transaction_terminal_time_idx'),
+            models.Index(fields=['employee', 'punch_time'], name='transaction_employee_time_idx'),
+        ]
 
     def __str__(self):
         action = "вход" if self.punch_state in ['0', 'I'] else "выход"
@@ -127,4 +211,474 @@ class Transaction(models.Model):
     @property
     def is_exit(self):
         """Выход?"""
-        return self.punch_state in ['1', 'O']
\ No newline at end of file
+        return self.punch_state in ['1', 'O']
+
+
+class Visit(models.Model):
+    """Визит на пункт: вход и выход сотрудника, собранные в один интервал (для табеля)
+
+    Собирается services/visits.py из записей проходов: на ходу монитором и
+    пакетно командой build_visits.
+    """
+    STATUS_OPEN = 'open'
+    STATUS_CLOSED = 'closed'
+    STATUS_AUTO = 'auto'
+    STATUS_NO_EXIT = 'no_exit'
+    STATUS_NO_ENTRY = 'no_entry'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'На пункте'),
+        (STATUS_CLOSED, 'Закрыт'),
+        (STATUS_AUTO, 'Закрыт автовыходом'),
+        (STATUS_NO_EXIT, 'Нет выхода'),
+        (STATUS_NO_ENTRY, 'Нет входа'),
+    ]
+
+    emp_code = models.CharField(max_length=20, verbose_name="Код сотрудника")
+    terminal = models.ForeignKey(Terminal, on_delete=models.CASCADE, related_name='+',
+                                 verbose_name="Терминал")
+
+    # Отметки, из которых собран визит (у "нет входа" есть только выход)
+    entry = models.ForeignKey(Transaction, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='+', verbose_name="Вход")
+    exit = models.ForeignKey(Transaction, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='+', verbose_name="Выход")
+
+    started_at = models.DateTimeField(verbose_name="Начало")
+    ended_at = models.DateTimeField(null=True, blank=True, verbose_name="Конец")
+    # Конец присутствия для запросов "кто был на пункте": выход, а без выхода - конец дня
+    # входа. Пусто - визит открыт. Интервал [started_at, present_until) в Postgres
+    # индексирован как tstzrange (GiST, миграция 0014)
+    present_until = models.DateTimeField(null=True, blank=True, verbose_name="На пункте до")
+    # Длительность в секундах - учитывается в табеле (0 для неполных визитов)
+    duration = models.IntegerField(default=0, verbose_name="Длительность, с")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_OPEN,
+                              verbose_name="Статус")
+
+    class Meta:
+        verbose_name = "Визит"
+        verbose_name_plural = "Визиты"
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['emp_code', 'started_at'], name='visit_emp_code_started_idx'),
+            models.Index(fields=['started_at'], name='visit_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"Сотр. {self.emp_code} - {timezone.localtime(self.started_at).strftime('%d.%m.%Y %H:%M')}"
+
+    @property
+    def is_complete(self):
+        return self.status in (self.STATUS_CLOSED, self.STATUS_AUTO)
+
+
+class OccupancyBucket(models.Model):
+    """Загруженность терминала за интервал (5 минут или час): проходы и число людей на пункте
+
+    Зона - сумма своих терминалов. Часовые интервалы собираются из пятиминутных,
+    пятиминутные хранятся OCCUPANCY_CONFIG['FINE_KEEP_DAYS'] дней.
+    """
+    RESOLUTION_5MIN = 300
+    RESOLUTION_HOUR = 3600
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_5MIN, '5 минут'),
+        (RESOLUTION_HOUR, '1 час'),
+    ]
+
+    terminal = models.ForeignKey(Terminal, on_delete=models.CASCADE, related_name='+',
+                                 verbose_name="Терминал")
+    resolution = models.IntegerField(choices=RESOLUTION_CHOICES, verbose_name="Интервал, с")
+    start = models.DateTimeField(verbose_name="Начало интервала")
+
+    entries = models.IntegerField(default=0, verbose_name="Входов")
+    exits = models.IntegerField(default=0, verbose_name="Выходов")
+    # На пункте в конце интервала и максимум за интервал (по визитам)
+    headcount = models.IntegerField(default=0, verbose_name="На пункте")
+    peak = models.IntegerField(default=0, verbose_name="Максимум на пункте")
+
+    class Meta:
+        verbose_name = "Загруженность"
+        verbose_name_plural = "Загруженность"
+        ordering = ['-start']
+        constraints = [
+            models.UniqueConstraint(fields=['resolution', 'terminal', 'start'],
+                                    name='occupancy_resolution_terminal_start_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.terminal_id} {self.start:%Y-%m-%d %H:%M} ({self.resolution} с)"
+
+
+class DaySummary(models.Model):
+    """Сводка сотрудника за день для команд бота /today, /week и /where
+
+    Собирается из визитов (services/summaries.py): монитором после каждой пачки
+    и командой build_visits. Ответы бота читают только эти строки.
+    """
+    emp_code = models.CharField(max_length=20, verbose_name="Код сотрудника")
+    day = models.DateField(verbose_name="День")
+
+    first_entry_at = models.DateTimeField(null=True, blank=True, verbose_name="Первый вход")
+    first_terminal = models.ForeignKey(Terminal, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name='+', verbose_name="Терминал первого входа")
+    # Последняя отметка дня (повторные прикладывания, как и в визитах, не учитываются)
+    last_punch_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя отметка")
+    last_is_entry = models.BooleanField(default=False, verbose_name="Последняя отметка - вход")
+    last_terminal = models.ForeignKey(Terminal, on_delete=models.SET_NULL, null=True, blank=True,
+                                      related_name='+', verbose_name="Терминал последней отметки")
+    # Закрытые визиты за день; время открытого визита бот досчитывает на момент запроса
+    worked = models.IntegerField(default=0, verbose_name="Отработано, с")
+    open_since = models.DateTimeField(null=True, blank=True, verbose_name="На пункте с")
+
+    class Meta:
+        verbose_name = "Сводка за день"
+        verbose_name_plural = "Сводки за день"
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['emp_code', 'day'], name='day_summary_emp_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.emp_code} {self.day}"
+
+
+class Anomaly(models.Model):
+    """Подозрительная отметка, найденная правилами services/anomalies.py при приеме монитором"""
+    rule = models.CharField(max_length=30, verbose_name="Правило")
+    emp_code = models.CharField(max_length=20, verbose_name="Код сотрудника")
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='+', verbose_name="Сотрудник")
+    terminal = models.ForeignKey(Terminal, on_delete=models.CASCADE, related_name='+',
+                                 verbose_name="Терминал")
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='+',
+                                    verbose_name="Отметка")
+    punch_time = models.DateTimeField(verbose_name="Время отметки")
+    message = models.CharField(max_length=255, verbose_name="Описание")
+    detected_at = models.DateTimeField(auto_now_add=True, verbose_name="Обнаружено")
+    is_reviewed = models.BooleanField(default=False, verbose_name="Разобрано")
+
+    class Meta:
+        verbose_name = "Аномалия"
+        verbose_name_plural = "Аномалии"
+        ordering = ['-punch_time']
+        indexes = [
+            models.Index(fields=['punch_time'], name='anomaly_punch_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.rule}: сотр. {self.emp_code} в {timezone.localtime(self.punch_time).strftime('%d.%m %H:%M')}"
+
+
+class TerminalSubscription(models.Model):
+    """Лента проходов по терминалам для руководителя смены: кто пришел и ушел
+
+    Проходы за FEED_INTERVAL секунд приходят в чат одним сообщением.
+    """
+    EVENTS_ALL = 'all'
+    EVENTS_IN = 'in'
+    EVENTS_OUT = 'out'
+    EVENTS_CHOICES = [
+        (EVENTS_ALL, 'Входы и выходы'),
+        (EVENTS_IN, 'Только входы'),
+        (EVENTS_OUT, 'Только выходы'),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name="Название")
+    chat_id = models.BigIntegerField(verbose_name="ID чата Telegram", help_text="У групп - отрицательный")
+    terminals = models.ManyToManyField(Terminal, blank=True, related_name='+', verbose_name="Терминалы")
+    areas = models.CharField(max_length=500, blank=True, verbose_name="Зоны", help_text="Через запятую")
+    events = models.CharField(max_length=5, choices=EVENTS_CHOICES, default=EVENTS_ALL, verbose_name="События")
+    is_active = models.BooleanField(default=True, verbose_name="Отправлять")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Лента проходов"
+        verbose_name_plural = "Ленты проходов"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def area_list(self):
+        return [area.strip() for area in self.areas.split(',') if area.strip()]
+
+    def accepts(self, is_entry: bool) -> bool:
+        return self.events == self.EVENTS_ALL or (self.events == self.EVENTS_IN) == is_entry
+
+
+class WebhookSubscription(models.Model):
+    """Получатель событий отметок (HR, зарплата): адрес, секрет подписи и фильтры
+
+    События берутся из потока Redis (services/punch_stream.py) - у каждой подписки
+    своя группа потребителей, так что медленный получатель не задерживает других.
+    Пустой фильтр - без ограничения.
+    """
+    name = models.CharField(max_length=200, verbose_name="Название")
+    url = models.URLField(max_length=500, verbose_name="Адрес")
+    secret = models.CharField(max_length=200, verbose_name="Секрет подписи (HMAC-SHA256)")
+    is_active = models.BooleanField(default=True, verbose_name="Отправлять")
+
+    terminals = models.ManyToManyField(Terminal, blank=True, related_name='+', verbose_name="Терминалы")
+    areas = models.CharField(max_length=500, blank=True, verbose_name="Зоны",
+                             help_text="Через запятую")
+    emp_codes = models.TextField(blank=True, verbose_name="Коды сотрудников",
+                                 help_text="Через запятую или с новой строки")
+
+    batch_size = models.PositiveIntegerField(default=100, verbose_name="Событий в запросе")
+    max_concurrency = models.PositiveIntegerField(default=1, verbose_name="Одновременных запросов",
+                                                  help_text="Больше 1 - порядок событий не гарантирован")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Подписка на события"
+        verbose_name_plural = "Подписки на события"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def area_list(self):
+        return [area.strip() for area in self.areas.split(',') if area.strip()]
+
+    @property
+    def emp_code_list(self):
+        return [code.strip() for code in self.emp_codes.replace(',', '\n').splitlines() if code.strip()]
+
+
+class WebhookDeadLetter(models.Model):
+    """Пачка событий, которую не удалось доставить после всех попыток"""
+    subscription = models.ForeignKey(WebhookSubscription, on_delete=models.CASCADE,
+                                     related_name='dead_letters', verbose_name="Подписка")
+    payload = models.JSONField(verbose_name="Тело запроса")
+    events = models.IntegerField(default=0, verbose_name="Событий")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    status_code = models.IntegerField(null=True, blank=True, verbose_name="Код ответа")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Последняя попытка")
+
+    class Meta:
+        verbose_name = "Недоставленные события"
+        verbose_name_plural = "Недоставленные события"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.subscription} - {self.events} событий"
+
+
+class ImportCheckpoint(models.Model):
+    """Прогресс импорта файла бэкапа (для возобновления после прерывания)
+
+    Один и тот же файл можно загрузить в разные серверы СКУД - прогресс у каждого свой.
+    """
+    source = models.ForeignKey(SkudSource, on_delete=models.CASCADE, related_name='+',
+                               verbose_name="Сервер СКУД")
+    file_path = models.CharField(max_length=500, verbose_name="Путь к файлу")
+    file_size = models.BigIntegerField(default=0, verbose_name="Размер файла")
+    total = models.IntegerField(default=0, verbose_name="Записей в файле")
+
+    # Индекс следующей необработанной записи в файле
+    offset = models.IntegerField(default=0, verbose_name="Обработано записей")
+    max_skud_id = models.IntegerField(default=0, verbose_name="Максимальный ID записи в СКУД")
+
+    imported = models.IntegerField(default=0, verbose_name="Импортировано")
+    skipped = models.IntegerField(default=0, verbose_name="Пропущено")
+    errors = models.IntegerField(default=0, verbose_name="Ошибок")
+
+    is_completed = models.BooleanField(default=False, verbose_name="Завершен")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Импорт бэкапа"
+        verbose_name_plural = "Импорты бэкапов"
+        ordering = ['-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'file_path'], name='importcheckpoint_source_file_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_path} ({self.offset}/{self.total})"
+
+
+class PunchTrace(models.Model):
+    """Трассировка отметки: сколько заняла каждая стадия от опроса СКУД до Telegram"""
+    source = models.ForeignKey(SkudSource, on_delete=models.CASCADE, related_name='+',
+                               verbose_name="Сервер СКУД")
+    skud_id = models.IntegerField(verbose_name="ID записи в СКУД")
+    emp_code = models.CharField(max_length=20, blank=True, verbose_name="Код сотрудника")
+    terminal_id = models.IntegerField(null=True, blank=True, verbose_name="ID терминала")
+    punch_time = models.DateTimeField(null=True, blank=True, verbose_name="Время отметки")
+    fetched_at = models.DateTimeField(null=True, blank=True, verbose_name="Получена из СКУД")
+
+    # Стадии монитора, мс
+    fetch_ms = models.FloatField(null=True, blank=True, verbose_name="Опрос СКУД, мс")
+    lookup_ms = models.FloatField(null=True, blank=True, verbose_name="Поиск терминала/сотрудника, мс")
+    insert_ms = models.FloatField(null=True, blank=True, verbose_name="Запись в БД, мс")
+    enqueue_ms = models.FloatField(null=True, blank=True, verbose_name="Постановка уведомления, мс")
+    ingest_ms = models.FloatField(null=True, blank=True, verbose_name="Всего в мониторе, мс")
+
+    # Стадии доставки уведомления, мс
+    queue_ms = models.FloatField(null=True, blank=True, verbose_name="Ожидание в очереди, мс")
+    telegram_ms = models.FloatField(null=True, blank=True, verbose_name="Ответ Telegram API, мс")
+    delivery_ms = models.FloatField(null=True, blank=True, verbose_name="От опроса до доставки, мс")
+    delivered_at = models.DateTimeField(null=True, blank=True, verbose_name="Доставлено")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
+
+    class Meta:
+        verbose_name = "Трассировка отметки"
+        verbose_name_plural = "Трассировки отметок"
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'skud_id'], name='punchtrace_source_skud_id_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Трассировка {self.skud_id}"
+
+
+class ReportJob(models.Model):
+    """Фоновое построение тяжелого отчета (Celery) с файлом результата в MEDIA_ROOT
+
+    Одинаковые запросы (тот же тип и параметры) получают уже готовый файл.
+    """
+    KIND_BACKUP = 'backup'
+    KIND_EMPLOYEE_HISTORY = 'employee_history'
+    KIND_TERMINAL_OCCUPANCY = 'terminal_occupancy'
+    KIND_TIMESHEET = 'timesheet'
+    KIND_CHOICES = [
+        (KIND_BACKUP, 'Бэкап СКУД'),
+        (KIND_EMPLOYEE_HISTORY, 'История сотрудника за месяц'),
+        (KIND_TERMINAL_OCCUPANCY, 'Загруженность терминала'),
+        (KIND_TIMESHEET, 'Табель за месяц'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Строится'),
+        (STATUS_DONE, 'Готов'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name="Отчет")
+    params = models.JSONField(default=dict, verbose_name="Параметры")
+    # sha256 от типа и параметров - по нему находятся готовые файлы
+    params_hash = models.CharField(max_length=64, db_index=True, verbose_name="Ключ параметров")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING,
+                              verbose_name="Статус")
+    file = models.FileField(upload_to='reports/', max_length=300, blank=True, verbose_name="Файл")
+    rows = models.IntegerField(default=0, verbose_name="Строк")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                     null=True, blank=True, verbose_name="Заказал")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Заказан")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начат")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершен")
+
+    class Meta:
+        verbose_name = "Отчет"
+        verbose_name_plural = "Отчеты"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.id}"
+
+    @property
+    def is_active(self):
+        return self.status in (self.STATUS_PENDING, self.STATUS_RUNNING)
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+
+class Broadcast(models.Model):
+    """Рассылка сообщения сотрудникам: получатели и их статусы - в BroadcastDelivery
+
+    Отправляется с ограничением скорости (BROADCAST_CONFIG), прерванная рассылка
+    продолжается с неотправленных получателей.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Отправляется'),
+        (STATUS_DONE, 'Отправлена'),
+        (STATUS_FAILED, 'Прервана'),
+        (STATUS_CANCELLED, 'Остановлена'),
+    ]
+
+    text = models.TextField(verbose_name="Текст")
+    audience = models.CharField(max_length=300, blank=True, verbose_name="Получатели")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING,
+                              verbose_name="Статус")
+
+    total = models.IntegerField(default=0, verbose_name="Всего")
+    sent = models.IntegerField(default=0, verbose_name="Отправлено")
+    failed = models.IntegerField(default=0, verbose_name="Ошибок")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                     null=True, blank=True, verbose_name="Автор")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+    # Обновляется после каждой пачки: давно не обновлявшаяся "Отправляется" - упавшая
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлена")
+
+    class Meta:
+        verbose_name = "Рассылка"
+        verbose_name_plural = "Рассылки"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Рассылка #{self.id}"
+
+
+class BroadcastDelivery(models.Model):
+    """Получатель рассылки и судьба его сообщения"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ждет отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Не доставлено'),
+    ]
+
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, related_name='deliveries',
+                                  verbose_name="Рассылка")
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='+', verbose_name="Сотрудник")
+    chat_id = models.BigIntegerField(verbose_name="ID чата Telegram")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING,
+                              verbose_name="Статус")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    error = models.CharField(max_length=500, blank=True, verbose_name="Ошибка")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        verbose_name = "Получатель рассылки"
+        verbose_name_plural = "Получатели рассылок"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['broadcast', 'status'], name='broadcast_delivery_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['broadcast', 'chat_id'], name='broadcast_delivery_chat_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.broadcast} -> {self.chat_id}"
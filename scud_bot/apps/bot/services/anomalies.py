@@ -0,0 +1,206 @@
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Type
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import Anomaly, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+class RecentPunch(NamedTuple):
+    """Отметка в памяти движка - только то, что нужно правилам"""
+    punch_time: datetime
+    is_entry: bool
+    terminal_id: int
+    terminal: str
+    area: str
+    verify_type: int
+
+
+class Rule:
+    """Правило: смотрит на новую отметку и предыдущие отметки сотрудника (новые - в конце)
+
+    Правила не ходят в БД - им хватает истории в памяти. Новое правило -
+    подкласс с @register и его код в ANOMALY_CONFIG['RULES'].
+    """
+    code = ''
+    title = ''
+
+    def __init__(self, config: dict):
+        self.config = config
+
+    def check(self, punch: RecentPunch, history: Sequence[RecentPunch]) -> Optional[str]:
+        """Описание аномалии или None"""
+        raise NotImplementedError
+
+
+RULES: Dict[str, Type[Rule]] = {}
+
+
+def register(rule_class: Type[Rule]) -> Type[Rule]:
+    RULES[rule_class.code] = rule_class
+    return rule_class
+
+
+def rule_title(code: str) -> str:
+    rule_class = RULES.get(code)
+    return rule_class.title if rule_class else code
+
+
+def _hhmm(moment: datetime) -> str:
+    return timezone.localtime(moment).strftime('%H:%M')
+
+
+@register
+class DoubleEntryRule(Rule):
+    """Вход, когда предыдущая отметка - тоже вход (повторное прикладывание не в счет)"""
+    code = 'double_entry'
+    title = 'Повторный вход без выхода'
+
+    def check(self, punch, history):
+        if not punch.is_entry or not history or not history[-1].is_entry:
+            return None
+        previous = history[-1]
+        gap = (punch.punch_time - previous.punch_time).total_seconds()
+        # Давний вход без выхода закроет автовыход - это не аномалия приема
+        if gap <= settings.VISITS_CONFIG['DUPLICATE_GAP'] or \
+                gap > settings.VISITS_CONFIG['MAX_VISIT_HOURS'] * 3600:
+            return None
+        return f"Предыдущий вход в {_hhmm(previous.punch_time)} ({previous.terminal})"
+
+
+@register
+class ExitWithoutEntryRule(Rule):
+    """Выход, когда предыдущая отметка - тоже выход"""
+    code = 'exit_without_entry'
+    title = 'Выход без входа'
+
+    def check(self, punch, history):
+        if punch.is_entry or not history or history[-1].is_entry:
+            return None
+        previous = history[-1]
+        if (punch.punch_time - previous.punch_time).total_seconds() <= settings.VISITS_CONFIG['DUPLICATE_GAP']:
+            return None
+        return f"Предыдущий выход в {_hhmm(previous.punch_time)} ({previous.terminal})"
+
+
+@register
+class TwoTerminalsRule(Rule):
+    """Отметки на разных пунктах за считанные секунды (терминалы одной зоны - один пункт)"""
+    code = 'two_terminals'
+    title = 'Два пункта за секунды'
+
+    def check(self, punch, history):
+        if not history:
+            return None
+        previous = history[-1]
+        if previous.terminal_id == punch.terminal_id or (punch.area and previous.area == punch.area):
+            return None
+        gap = (punch.punch_time - previous.punch_time).total_seconds()
+        if gap > self.config['TWO_TERMINALS_SECONDS']:
+            return None
+        return f"Через {int(gap)} с после отметки на {previous.terminal}"
+
+
+@register
+class FailedVerifyRule(Rule):
+    """Несколько отметок подряд в обход биометрии (FAILED_VERIFY_TYPES) за короткое время"""
+    code = 'failed_verify'
+    title = 'Повторная авторизация в обход биометрии'
+
+    def check(self, punch, history):
+        failed_types = self.config['FAILED_VERIFY_TYPES']
+        if punch.verify_type not in failed_types:
+            return None
+        window = self.config['FAILED_VERIFY_MINUTES'] * 60
+        count = 1
+        for previous in reversed(history):
+            if previous.verify_type not in failed_types or \
+                    (punch.punch_time - previous.punch_time).total_seconds() > window:
+                break
+            count += 1
+        # Срабатываем один раз на серию, а не на каждую следующую отметку
+        if count != self.config['FAILED_VERIFY_COUNT']:
+            return None
+        return f"{count} отметки подряд способом {punch.verify_type} за {self.config['FAILED_VERIFY_MINUTES']} мин"
+
+
+class AnomalyEngine:
+    """Проверка отметок правилами на лету: история сотрудника - кольцевой буфер в памяти
+
+    Памяти - не больше MAX_EMPLOYEES буферов по HISTORY отметок; после
+    перезапуска история копится заново (первые отметки сотрудника не проверяются).
+    Отметки, пришедшие не по порядку времени, не проверяются и в историю не попадают.
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        self.config = config or settings.ANOMALY_CONFIG
+        self.rules = [RULES[code](self.config) for code in self.config['RULES']]
+        self.history: 'OrderedDict[str, deque]' = OrderedDict()
+
+    def check(self, transaction: Transaction) -> List[Anomaly]:
+        """Аномалии отметки (несохраненные) - терминал и сотрудник уже в transaction"""
+        terminal = transaction.terminal
+        punch = RecentPunch(transaction.punch_time, transaction.is_entry, terminal.id,
+                            terminal.terminal_alias, terminal.area_alias, transaction.verify_type)
+
+        history = self.history.get(transaction.emp_code)
+        if history is None:
+            history = self.history[transaction.emp_code] = deque(maxlen=self.config['HISTORY'])
+            if len(self.history) > self.config['MAX_EMPLOYEES']:
+                self.history.popitem(last=False)
+        else:
+            self.history.move_to_end(transaction.emp_code)
+            if history and punch.punch_time < history[-1].punch_time:
+                return []
+
+        found = []
+        for rule in self.rules:
+            message = rule.check(punch, history)
+            if message:
+                found.append(Anomaly(
+                    rule=rule.code,
+                    emp_code=transaction.emp_code,
+                    employee=transaction.employee,
+                    terminal=terminal,
+                    transaction=transaction,
+                    punch_time=transaction.punch_time,
+                    message=message[:255],
+                ))
+        history.append(punch)
+        return found
+
+
+def save_anomalies(anomalies: Iterable[Anomaly], alert: bool = True) -> List[Anomaly]:
+    """Записать найденное одним запросом и поставить оповещение в очередь"""
+    anomalies = Anomaly.objects.bulk_create(list(anomalies))
+    if not anomalies:
+        return anomalies
+
+    logger.warning(f"Аномалий при приеме: {len(anomalies)}")
+    if alert and settings.ANOMALY_CONFIG['ALERT_CHAT_ID']:
+        from ..tasks import send_anomaly_alerts
+
+        try:
+            send_anomaly_alerts.delay([anomaly.id for anomaly in anomalies])
+        except Exception as e:
+            logger.error(f"Не удалось поставить оповещение об аномалиях - {e}")
+    return anomalies
+
+
+def format_anomaly_alert(anomalies: Sequence[Anomaly], limit: int = 20) -> str:
+    """Текст оповещения руководителю"""
+    lines = [f"Аномалии при проходах: {len(anomalies)}"]
+    for anomaly in anomalies[:limit]:
+        who = anomaly.employee.name if anomaly.employee else f"сотр. {anomaly.emp_code}"
+        lines.append(
+            f"{_hhmm(anomaly.punch_time)} {anomaly.terminal.terminal_alias} - {who}: "
+            f"{rule_title(anomaly.rule)}. {anomaly.message}"
+        )
+    if len(anomalies) > limit:
+        lines.append(f"... и еще {len(anomalies) - limit}")
+    return '\n'.join(lines)
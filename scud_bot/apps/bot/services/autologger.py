@@ -4,6 +4,8 @@ import re
 import logging
 from typing import Optional, Tuple
 
+from .metrics import metrics
+
 
 logger = logging.getLogger(__name__)
 
@@ -11,8 +13,10 @@ logger = logging.getLogger(__name__)
 class AutoLogger:
     """ класс автоматически получающий куку """
 
-    def __init__(self, base_url: str = "http://188.92.110.218"):
+    def __init__(self, base_url: str = "http://188.92.110.218", credentials: Optional[Tuple[str, str]] = None):
         self.base_url = base_url
+        # Учетная запись сервера СКУД, без нее - случайный сотрудник из пула
+        self.credentials = credentials
         self.session = requests.Session()
         self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
 
@@ -66,7 +70,7 @@ class AutoLogger:
 
             csrf_token = csrf_tokens[0]
 
-            username, password = self.get_random_employee()
+            username, password = self.credentials or self.get_random_employee()
 
             # данные для авторизации
 
@@ -91,13 +95,16 @@ class AutoLogger:
                 for name, value in cookies.items():
                     if 'session' in name.lower():
                         logger.info(f"Получена новая кука для пользователя {username}")
+                        metrics.inc('skud_cookie_refresh_total', result='success')
                         return value
 
             logger.error(f'Ошибка при авторизации {response.status_code}')
+            metrics.inc('skud_cookie_refresh_total', result='failure')
             return None
 
         except Exception as e:
             logger.error(f'Ошибка при попытке получения куки - {e}')
+            metrics.inc('skud_cookie_refresh_total', result='failure')
             return None
 
 
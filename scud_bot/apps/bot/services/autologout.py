@@ -1,11 +1,15 @@
 import logging
+import time
 import requests
 from datetime import datetime, time as time_type, timedelta
 from django.utils import timezone
-from django.conf import settings
 from django.db.models import Q
 
 from ..models import Employee, Transaction, Terminal
+from .metrics import metrics
+from .occupancy import update_occupancy
+from .summaries import update_summaries
+from .visits import update_visits
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +18,6 @@ class AutoLogoutService:
     """Сервис для автоматического выхода сотрудников в 23:55"""
 
     def __init__(self):
-        self.base_url = settings.SKUD_CONFIG['BASE_URL']
         self.headers = {
             "Host": "http",
             "User-Agent": "iClock Proxy/1.09",
@@ -40,23 +43,36 @@ class AutoLogoutService:
         day_end = timezone.make_aware(datetime.combine(target_date, time_type.max))
 
         # Получаем всех сотрудников с активным автовыходом
-        employees_with_auto_logout = Employee.objects.filter(auto_logout=True)
+        employees_with_auto_logout = list(Employee.objects.filter(auto_logout=True))
+        if not employees_with_auto_logout:
+            return []
+
+        by_id = {employee.id: employee for employee in employees_with_auto_logout}
+        by_code = {}
+        for employee in employees_with_auto_logout:
+            by_code.setdefault(employee.emp_code, []).append(employee)
+
+        # Все записи за сегодня одним запросом: привязанные к сотруднику или с его кодом
+        transactions_today = Transaction.objects.filter(
+            Q(employee__auto_logout=True) | Q(emp_code__in=list(by_code)),
+            punch_time__range=[day_start, day_end]
+        ).select_related('terminal__source').order_by('punch_time', 'id')
+
+        # Последняя транзакция за сегодня для каждого сотрудника
+        last_transactions = {}
+        for transaction in transactions_today:
+            owners = {transaction.employee_id} if transaction.employee_id in by_id else set()
+            owners.update(employee.id for employee in by_code.get(transaction.emp_code, []))
+            for employee_id in owners:
+                last_transactions[employee_id] = transaction
 
         on_site_employees = []
 
         for employee in employees_with_auto_logout:
-            # Получаем все транзакции сотрудника за сегодня
-            transactions_today = Transaction.objects.filter(
-                Q(employee=employee) | Q(emp_code=employee.emp_code),
-                punch_time__range=[day_start, day_end]
-            ).order_by('punch_time')
-
-            if not transactions_today.exists():
+            last_transaction = last_transactions.get(employee.id)
+            if last_transaction is None:
                 continue  # Сотрудник не был сегодня на пункте
 
-            # Находим последнюю транзакцию за сегодня
-            last_transaction = transactions_today.last()
-
             # Если последняя транзакция - ВХОД, сотрудник на пункте
             if last_transaction.is_entry:
                 # Ищем терминал последнего входа
@@ -81,8 +97,8 @@ class AutoLogoutService:
         # Форматируем время для СКУД
         timestamp_str = logout_time.strftime('%Y-%m-%d %H:%M:%S')
 
-        # Формируем URL с серийным номером терминала
-        url = f"{self.base_url}/iclock/cdata?SN={terminal.terminal_sn}&table=ATTLOG&Stamp=9999"
+        # Формируем URL с серийным номером терминала (на сервер СКУД этого терминала)
+        url = f"{terminal.source.base_url}/iclock/cdata?SN={terminal.terminal_sn}&table=ATTLOG&Stamp=9999"
 
         # Формируем тело запроса (точно как в ручных выходах)
         data = f"{employee.emp_id}\t{timestamp_str}\t1\t1\t0\t0\t0\t0\t0\t0\t661\n"
@@ -143,6 +159,7 @@ class AutoLogoutService:
         try:
             # Создаем запись транзакции
             transaction = Transaction.objects.create(
+                source_id=terminal.source_id,
                 skud_id=0,  # Временный ID, т.к. создается через API
                 employee=employee,
                 emp_code=employee.emp_code,
@@ -169,7 +186,15 @@ class AutoLogoutService:
         if target_time is None:
             target_time = timezone.now()
 
+        started = time.perf_counter()
+        try:
+            return self._perform_auto_logout(target_time)
+        finally:
+            metrics.inc('autologout_runs_total')
+            metrics.set('autologout_run_duration_seconds', time.perf_counter() - started)
+            metrics.flush(force=True)
 
+    def _perform_auto_logout(self, target_time):
         logger.info(f" ЗАПУСК АВТОМАТИЧЕСКОГО ВЫХОДА - ({target_time})")
 
 
@@ -183,6 +208,7 @@ class AutoLogoutService:
         logger.info(f"Найдено {len(on_site_employees)} сотрудников на пункте:")
 
         results = []
+        local_records = []
 
         for item in on_site_employees:
             employee = item['employee']
@@ -209,6 +235,8 @@ class AutoLogoutService:
 
             # 2. Создаем локальную запись (даже если запрос к СКУД не удался)
             local_record = self.create_local_logout_record(employee, terminal, logout_time)
+            if local_record is not None:
+                local_records.append(local_record)
 
             result = {
                 'employee': employee,
@@ -227,10 +255,21 @@ class AutoLogoutService:
             else:
                 logger.warning(f" {employee.name}: ошибка выписки - {message}")
 
+        # Закрываем визиты записями автовыхода
+        try:
+            update_visits(local_records)
+            update_occupancy(local_records)
+            update_summaries(local_records)
+        except Exception as e:
+            logger.error(f"Ошибка сборки визитов после автовыхода - {e}")
+
         # Сводка
         successful = sum(1 for r in results if r['logout_success'])
         logger.info(f"Итог: {successful} из {len(results)} сотрудников выписаны успешно")
 
+        metrics.set('autologout_processed', len(results))
+        metrics.set('autologout_success_ratio', successful / len(results))
+
         return results
 
     def run_daily_auto_logout(self):
@@ -0,0 +1,260 @@
+import json
+import logging
+import platform
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ..models import Employee, ImportCheckpoint, Terminal, Transaction
+from .anomalies import AnomalyEngine
+from .autologout import AutoLogoutService
+from .importer import BackupImporter
+from .synthetic import EMP_ID_BASE, SKUD_ID_BASE, SyntheticDataset, synthetic_source
+from .visits import build_timesheet, rebuild_visits
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class BenchmarkRunner:
+    """Замеры горячих путей на текущих данных БД
+
+    Для каждого сценария: задержка (p50/p95/max), пропускная способность и
+    число SQL запросов на вызов. Результаты - JSON для сравнения запусков.
+    """
+
+    def __init__(self, iterations: int = 10, warmup: int = 1):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.results: Dict[str, dict] = {}
+        self._client = None
+        self._user = None
+
+    # Замер
+
+    def measure(self, name: str, func: Callable[[], Optional[int]], iterations: Optional[int] = None,
+                teardown: Optional[Callable[[], None]] = None) -> dict:
+        """Вызвать func iterations раз; func может вернуть число обработанных строк"""
+        iterations = iterations or self.iterations
+
+        for _ in range(self.warmup):
+            func()
+            if teardown:
+                teardown()
+
+        timings = []
+        queries = []
+        rows = 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                rows += func() or 1
+                timings.append(time.perf_counter() - started)
+            queries.append(len(ctx.captured_queries))
+            if teardown:
+                teardown()
+
+        total = sum(timings)
+        result = {
+            'iterations': iterations,
+            'rows': rows,
+            'total_s': round(total, 4),
+            'mean_ms': round(statistics.mean(timings) * 1000, 3),
+            'p50_ms': round(_percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(_percentile(timings, 95) * 1000, 3),
+            'max_ms': round(max(timings) * 1000, 3),
+            'rows_per_s': round(rows / total, 1) if total else None,
+            'queries_per_call': round(statistics.mean(queries), 1),
+        }
+        self.results[name] = result
+        logger.info(f"{name}: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, "
+                    f"{result['queries_per_call']} запросов")
+        return result
+
+    # Админка
+
+    def _admin_client(self) -> Client:
+        if self._client is None:
+            User = get_user_model()
+            self._user = User.objects.create_superuser(
+                username=f'benchmark-{uuid.uuid4().hex[:8]}', email='', password=None
+            )
+            self._client = Client(HTTP_HOST='localhost')
+            self._client.force_login(self._user)
+        return self._client
+
+    def _get(self, url: str) -> Callable[[], int]:
+        def call():
+            response = self._admin_client().get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} вернул {response.status_code}")
+            return 1
+        return call
+
+    def cleanup(self):
+        if self._user is not None:
+            self._user.delete()
+            self._user = None
+            self._client = None
+
+    # Сценарии
+
+    def bench_process_transaction(self, count: int = 200):
+        """Запись новых отметок монитором (без сети: отметки подаются напрямую)"""
+        from .monitor import SKUDMonitor
+
+        # Только синтетические сотрудники - реальным ушли бы уведомления
+        source = synthetic_source()
+        terminals = list(Terminal.objects.filter(source=source, is_monitored=True).order_by('id'))
+        emp_codes = list(Employee.objects.filter(emp_id__gte=EMP_ID_BASE, telegram_id__isnull=True)
+                         .order_by('id').values_list('emp_code', flat=True)[:1000])
+        if not terminals or not emp_codes:
+            logger.warning("process_transaction: нет синтетических данных (seed_synthetic) - пропуск")
+            return
+
+        monitor = SKUDMonitor(source=source)
+
+        start_id = max(SyntheticDataset.next_skud_id(), SKUD_ID_BASE) + 100_000_000
+        state = {'next_id': start_id}
+
+        def call():
+            skud_id = state['next_id']
+            state['next_id'] += 1
+            terminal = terminals[skud_id % len(terminals)]
+            monitor.process_transaction({
+                'id': skud_id,
+                'emp_code': emp_codes[skud_id % len(emp_codes)],
+                'terminal': terminal.terminal_id,
+                'terminal_sn': terminal.terminal_sn,
+                'terminal_alias': terminal.terminal_alias,
+                'area_alias': terminal.area_alias,
+                'punch_time': timezone.localtime().strftime('%Y-%m-%d %H:%M:%S'),
+                'punch_state': '0',
+                'verify_type': 15,
+            })
+            return 1
+
+        try:
+            self.measure('monitor.process_transaction', call, iterations=count)
+        finally:
+            Transaction.objects.filter(source=source, skud_id__gte=start_id).delete()
+
+    def bench_on_site_today(self):
+        service = AutoLogoutService()
+        self.measure(
+            'autologout.get_employees_on_site_today',
+            lambda: len(service.get_employees_on_site_today(timezone.localdate())),
+        )
+
+    def bench_admin(self):
+        self.measure('admin.employee_changelist', self._get('/admin/bot/employee/'))
+        self.measure('admin.terminal_changelist', self._get('/admin/bot/terminal/'))
+        self.measure('admin.transaction_changelist', self._get('/admin/bot/transaction/'))
+        self.measure('admin.stats', self._get('/admin/stats/'))
+
+    def bench_import_backup(self, rows: int = 5000, batch_size: int = 1000):
+        """Импорт бэкапа из rows записей (после каждой итерации записи удаляются)"""
+        # Тот же набор, что в БД, - иначе замер дополнил бы справочники и следующие запуски несравнимы
+        dataset = SyntheticDataset.seeded(seed=1)
+        if dataset is None:
+            logger.warning("import_backup: нет синтетических данных (seed_synthetic) - пропуск")
+            return
+
+        importer = BackupImporter(batch_size=batch_size, restart=True, source=synthetic_source())
+        start_id = max(SyntheticDataset.next_skud_id(), SKUD_ID_BASE) + 200_000_000
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'benchmark_backup.json'
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'data': dataset.backup_rows(rows, start_id)}, f, ensure_ascii=False)
+
+            def call():
+                return importer.import_file(path)['imported']
+
+            def teardown():
+                Transaction.objects.filter(source=importer.source, skud_id__gte=start_id).delete()
+                ImportCheckpoint.objects.filter(file_path=str(path)).delete()
+
+            self.measure('import_backup', call, iterations=max(self.iterations // 3, 1), teardown=teardown)
+
+    def bench_visits(self):
+        """Полная пересборка визитов и табель за текущий месяц"""
+        self.measure('visits.rebuild', lambda: rebuild_visits()['punches'],
+                     iterations=max(self.iterations // 3, 1))
+        month = timezone.localdate().strftime('%Y-%m')
+        self.measure('visits.timesheet', lambda: len(build_timesheet(month)))
+
+    def bench_anomalies(self, count: int = 1000):
+        """Правила аномалий на последних отметках (в памяти - запросов к БД быть не должно)"""
+        punches = list(Transaction.objects.select_related('terminal').order_by('-punch_time')[:count])
+        if not punches:
+            logger.warning("anomalies: нет записей проходов - пропуск")
+            return
+        punches.reverse()
+
+        def call():
+            engine = AnomalyEngine()
+            for punch in punches:
+                engine.check(punch)
+            return len(punches)
+
+        self.measure('anomalies.check', call)
+
+    SCENARIOS = {
+        'monitor': 'bench_process_transaction',
+        'autologout': 'bench_on_site_today',
+        'admin': 'bench_admin',
+        'import': 'bench_import_backup',
+        'visits': 'bench_visits',
+        'anomalies': 'bench_anomalies',
+    }
+
+    def run(self, scenarios: Optional[List[str]] = None) -> dict:
+        try:
+            for name in scenarios or list(self.SCENARIOS):
+                getattr(self, self.SCENARIOS[name])()
+        finally:
+            self.cleanup()
+
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'dataset': {
+                'transactions': Transaction.objects.count(),
+                'employees': Employee.objects.count(),
+                'terminals': Terminal.objects.count(),
+            },
+            'results': self.results,
+        }
+
+
+def compare_results(current: dict, previous: dict) -> List[str]:
+    """Строки сравнения p50 и числа запросов с предыдущим запуском"""
+    lines = []
+    for name, result in current['results'].items():
+        before = previous.get('results', {}).get(name)
+        if not before:
+            lines.append(f"{name}: новый сценарий")
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        lines.append(
+            f"{name}: p50 {before['p50_ms']} -> {result['p50_ms']} мс (x{ratio:.2f}), "
+            f"запросов {before['queries_per_call']} -> {result['queries_per_call']}"
+        )
+    return lines
@@ -5,7 +5,10 @@ from typing import Optional, Tuple
 from django.conf import settings
 
 
-from ..models import Employee
+from ..models import Employee, TerminalSubscription
+from .metrics import metrics
+from .onsite import onsite_reply, onsite_snapshot, terminal_page
+from .summaries import EmployeeSummary
 
 logger = logging.getLogger(__name__)
 
@@ -46,7 +49,7 @@ class TelegramBot:
             return []
 
 
-    def send_message(self, chat_id: int, text: str) -> bool:
+    def send_message(self, chat_id: int, text: str, reply_markup: Optional[dict] = None) -> bool:
         """отправить сообщение"""
         if not self.token:
             return False
@@ -56,14 +59,56 @@ class TelegramBot:
             'chat_id': chat_id,
             'text': text,
         }
+        if reply_markup:
+            payload['reply_markup'] = reply_markup
 
+        started = time.perf_counter()
         try:
             response = requests.post(url, json=payload, timeout=10)
             response.raise_for_status()
+            metrics.inc('telegram_send_total')
             return True
         except Exception as e:
+            metrics.inc('telegram_send_failures_total')
             logger.error(f"Ошибка отправки сообщения - {e}")
             return False
+        finally:
+            metrics.observe('telegram_send_duration_seconds', time.perf_counter() - started)
+
+
+    def edit_message(self, chat_id: int, message_id: int, text: str, reply_markup: Optional[dict] = None) -> bool:
+        """заменить текст и кнопки отправленного сообщения (листание списков)"""
+        if not self.token:
+            return False
+
+        payload = {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'text': text,
+            'reply_markup': reply_markup or {'inline_keyboard': []},
+        }
+        try:
+            response = requests.post(f"{self.base_url}/editMessageText", json=payload, timeout=10)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка изменения сообщения - {e}")
+            return False
+
+
+    def answer_callback(self, callback_id: str, text: str = '') -> bool:
+        """ответить на нажатие кнопки (иначе Telegram показывает часики)"""
+        if not self.token:
+            return False
+
+        try:
+            response = requests.post(f"{self.base_url}/answerCallbackQuery",
+                                     json={'callback_query_id': callback_id, 'text': text}, timeout=10)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка ответа на кнопку - {e}")
+            return False
 
 
     def link_employee(self, telegram_id: int, telegram_username: str) -> Tuple[bool, str]:
@@ -91,7 +136,7 @@ class TelegramBot:
             employee.telegram_id = telegram_id
             employee.telegram_username = username
             employee.send_notifications = True
-            employee.save()
+            employee.save(update_fields=['telegram_id', 'telegram_username', 'send_notifications'])
 
             logger.info(f"Telegram привязан: {employee.name} -> @{username}")
 
@@ -107,8 +152,69 @@ class TelegramBot:
             return False, f"Ошибка - {str(e)}"
 
 
+    def set_notification_mode(self, telegram_id: int, mode: str) -> str:
+        """Сменить режим уведомлений сотрудника, привязанного к этому чату"""
+        employee = Employee.objects.filter(telegram_id=telegram_id).first()
+        if not employee:
+            return "Аккаунт не привязан. Используйте /start"
+
+        employee.notification_mode = mode
+        employee.save(update_fields=['notification_mode'])
+        logger.info(f"Режим уведомлений {employee.name}: {mode}")
+
+        if mode == Employee.NOTIFY_DIGEST:
+            return "Готово! Вместо уведомлений о каждом проходе - одна сводка в день в 21:00"
+        return "Готово! Вы будете получать уведомление о каждом проходе"
+
+
+    def employee_summary(self, telegram_id: int, command: str) -> str:
+        """Ответ на /today, /week, /where - из сводок за день, без чтения записей проходов"""
+        employee = Employee.objects.filter(telegram_id=telegram_id).first()
+        if not employee:
+            return "Аккаунт не привязан. Используйте /start"
+
+        summary = EmployeeSummary(employee)
+        if command == '/today':
+            return summary.today_text()
+        if command == '/week':
+            return summary.week_text()
+        return summary.where_text()
+
+
+    @staticmethod
+    def is_manager_chat(chat_id: int) -> bool:
+        """Руководитель - сотрудник с флагом или чат с лентой проходов"""
+        return Employee.objects.filter(telegram_id=chat_id, is_manager=True).exists() or \
+            TerminalSubscription.objects.filter(chat_id=chat_id, is_active=True).exists()
+
+
+    def handle_callback(self, callback: dict):
+        """обработать нажатие inline-кнопки (листание /onsite)"""
+        message = callback.get('message', {})
+        chat_id = message.get('chat', {}).get('id')
+        data = callback.get('data', '')
+
+        if not chat_id or not data.startswith('onsite:') or not self.is_manager_chat(chat_id):
+            self.answer_callback(callback.get('id'))
+            return
+
+        try:
+            _, terminal_id, page = data.split(':')
+            text, keyboard = terminal_page(onsite_snapshot(), int(terminal_id), int(page))
+        except ValueError:
+            self.answer_callback(callback.get('id'))
+            return
+
+        self.edit_message(chat_id, message.get('message_id'), text, keyboard)
+        self.answer_callback(callback.get('id'))
+
+
     def handle_command(self, update: dict):
         """обработать команду из обновления"""
+        if 'callback_query' in update:
+            self.handle_callback(update['callback_query'])
+            return
+
         message = update.get('message', {})
         chat_id = message.get('chat', {}).get('id')
         text = message.get('text', '').strip()
@@ -161,10 +267,30 @@ class TelegramBot:
                 )
                 self.send_message(chat_id, error_msg)
 
+        elif text.lower() in ('/digest', '/instant'):
+            mode = Employee.NOTIFY_DIGEST if text.lower() == '/digest' else Employee.NOTIFY_INSTANT
+            self.send_message(chat_id, self.set_notification_mode(chat_id, mode))
+
+        elif text.lower() in ('/today', '/week', '/where'):
+            self.send_message(chat_id, self.employee_summary(chat_id, text.lower()))
+
+        elif text.lower().split(maxsplit=1)[0] == '/onsite':
+            if not self.is_manager_chat(chat_id):
+                self.send_message(chat_id, "Команда доступна только руководителям")
+                return
+            reply, keyboard = onsite_reply(text[len('/onsite'):])
+            self.send_message(chat_id, reply, keyboard)
+
         elif text.lower() == '/help':
             help_text = (
                 "ℹПомощь:\n\n"
                 "/start - Привязать аккаунт к системе\n"
+                "/today - Приход и отработанное время сегодня\n"
+                "/week - Отработано за неделю\n"
+                "/where - Где и когда была последняя отметка\n"
+                "/onsite [пункт] - Кто сейчас на пунктах (для руководителей)\n"
+                "/digest - Одна сводка проходов в день (в 21:00)\n"
+                "/instant - Уведомление о каждом проходе\n"
                 "/help - Эта справка\n\n"
                 "Для привязки:\n"
                 "1. Ваш username должен быть указан в системе\n"
@@ -215,6 +341,8 @@ class TelegramBot:
                 for update in updates:
                     self.handle_command(update)
 
+                metrics.flush()
+
                 # Небольшая пауза между опросами
                 time.sleep(settings.TELEGRAM_POLL_INTERVAL)
 
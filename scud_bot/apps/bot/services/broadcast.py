@@ -0,0 +1,282 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, List, NamedTuple, Optional
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from ..models import Broadcast, BroadcastDelivery, Employee, Visit
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def broadcast_recipients(emp_codes: Optional[List[str]] = None, area: Optional[str] = None,
+                         notified_only: bool = False, managers_only: bool = False):
+    """Сотрудники с привязанным Telegram по фильтрам; зона - кто был на ее пунктах за 30 дней"""
+    employees = Employee.objects.filter(telegram_id__isnull=False)
+    if emp_codes:
+        employees = employees.filter(emp_code__in=emp_codes)
+    if area:
+        employees = employees.filter(emp_code__in=Visit.objects.filter(
+            terminal__area_alias=area, started_at__gte=timezone.now() - timedelta(days=30),
+        ).values('emp_code'))
+    if notified_only:
+        employees = employees.filter(send_notifications=True)
+    if managers_only:
+        employees = employees.filter(is_manager=True)
+    return employees
+
+
+def create_broadcast(text: str, employees, audience: str = '', user=None) -> Broadcast:
+    """Рассылка и ее получатели (по одному на чат: у двух карточек может быть один Telegram)"""
+    recipients = {}
+    for employee_id, chat_id in employees.order_by('emp_code').values_list('id', 'telegram_id'):
+        recipients.setdefault(chat_id, employee_id)
+
+    with db_transaction.atomic():
+        broadcast = Broadcast.objects.create(
+            text=text,
+            audience=audience[:300],
+            total=len(recipients),
+            requested_by=user if user is not None and user.is_authenticated else None,
+        )
+        BroadcastDelivery.objects.bulk_create([
+            BroadcastDelivery(broadcast=broadcast, employee_id=employee_id, chat_id=chat_id)
+            for chat_id, employee_id in recipients.items()
+        ], batch_size=1000)
+    return broadcast
+
+
+def enqueue_broadcast(broadcast: Broadcast):
+    """Поставить рассылку в Celery после коммита"""
+    from ..tasks import send_broadcast
+
+    def enqueue():
+        try:
+            send_broadcast.delay(broadcast.id)
+        except Exception as e:
+            logger.error(f"Не удалось поставить {broadcast} в очередь - {e}")
+            Broadcast.objects.filter(pk=broadcast.pk, status=Broadcast.STATUS_PENDING).update(
+                status=Broadcast.STATUS_FAILED, error=f"Очередь недоступна: {e}", updated_at=timezone.now(),
+            )
+
+    db_transaction.on_commit(enqueue)
+
+
+class RateLimiter:
+    """Не чаще rate отправок в секунду на все потоки; после ответа 429 - общая пауза"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_at, now)
+            self.next_at = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+
+class SendResult(NamedTuple):
+    ok: bool
+    retry_after: Optional[float]
+    permanent: bool
+    error: str
+
+
+class TelegramSender:
+    """sendMessage с пулом соединений на concurrency запросов и разбором ответа Telegram"""
+
+    def __init__(self, concurrency: int):
+        self.url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+
+    def send(self, chat_id: int, text: str) -> SendResult:
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.url, json={'chat_id': chat_id, 'text': text}, timeout=10)
+        except requests.RequestException as e:
+            return SendResult(False, None, False, str(e))
+        finally:
+            metrics.observe('telegram_send_duration_seconds', time.perf_counter() - started)
+
+        if response.ok:
+            return SendResult(True, None, False, '')
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        error = data.get('description') or response.text[:500]
+        if response.status_code == 429:
+            return SendResult(False, data.get('parameters', {}).get('retry_after', 1), False, error)
+        # 400 (чат не найден) и 403 (бот заблокирован) при повторе не пройдут
+        return SendResult(False, None, 400 <= response.status_code < 500, error)
+
+
+def stale_broadcasts() -> List[int]:
+    """Рассылки, отправка которых оборвалась (процесс упал, не обновив статус)"""
+    stale = timezone.now() - timedelta(seconds=settings.BROADCAST_CONFIG['STALE_SECONDS'])
+    return list(Broadcast.objects.filter(
+        status=Broadcast.STATUS_RUNNING, updated_at__lt=stale,
+    ).values_list('id', flat=True))
+
+
+def claim_broadcast(broadcast_id: int) -> Optional[Broadcast]:
+    """Взять рассылку в работу: новую, прерванную или упавшую (давно без обновлений)
+
+    None - рассылку уже отправляет другой процесс, она завершена или остановлена.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.BROADCAST_CONFIG['STALE_SECONDS'])
+    claimed = Broadcast.objects.filter(pk=broadcast_id).filter(
+        Q(status__in=[Broadcast.STATUS_PENDING, Broadcast.STATUS_FAILED]) |
+        Q(status=Broadcast.STATUS_RUNNING, updated_at__lt=stale)
+    ).update(status=Broadcast.STATUS_RUNNING, error='', updated_at=now)
+    if not claimed:
+        return None
+
+    broadcast = Broadcast.objects.get(pk=broadcast_id)
+    if broadcast.started_at is None:
+        broadcast.started_at = now
+        broadcast.save(update_fields=['started_at', 'updated_at'])
+    return broadcast
+
+
+class BroadcastDispatcher:
+    """Отправка рассылки пачками по CHUNK получателей
+
+    Внутри пачки CONCURRENCY потоков шлют с общим ограничением RATE сообщений
+    в секунду; 429 от Telegram ставит на паузу всех. После пачки статусы
+    получателей и счетчики рассылки пишутся в БД - упавшую рассылку
+    продолжит следующий запуск.
+    """
+
+    def __init__(self, broadcast: Broadcast, progress: Optional[Callable[[Broadcast], None]] = None):
+        config = settings.BROADCAST_CONFIG
+        self.broadcast = broadcast
+        self.progress = progress
+        self.limiter = RateLimiter(config['RATE'])
+        self.sender = TelegramSender(config['CONCURRENCY'])
+
+    def deliver(self, delivery: BroadcastDelivery):
+        config = settings.BROADCAST_CONFIG
+        failures = throttles = 0
+        while failures < config['MAX_ATTEMPTS']:
+            self.limiter.wait()
+            result = self.sender.send(delivery.chat_id, self.broadcast.text)
+            delivery.attempts += 1
+            if result.ok:
+                delivery.status = BroadcastDelivery.STATUS_SENT
+                delivery.sent_at = timezone.now()
+                delivery.error = ''
+                metrics.inc('telegram_send_total')
+                return
+
+            delivery.error = result.error[:500]
+            if result.retry_after:
+                logger.warning(f"{self.broadcast}: Telegram просит паузу {result.retry_after} с")
+                metrics.inc('broadcast_throttled_total')
+                throttles += 1
+                if throttles >= config['MAX_THROTTLES']:
+                    break
+                self.limiter.pause(result.retry_after)
+                continue
+            metrics.inc('telegram_send_failures_total')
+            failures += 1
+            if result.permanent:
+                break
+            time.sleep(failures)
+
+        delivery.status = BroadcastDelivery.STATUS_FAILED
+
+    def _heartbeat(self, stop: threading.Event):
+        """Пока идет отправка - обновлять updated_at: иначе пауза 429 дольше STALE_SECONDS
+        выглядит как сбой и resume_broadcasts запустит вторую отправку тех же получателей"""
+        interval = settings.BROADCAST_CONFIG['STALE_SECONDS'] / 3
+        try:
+            while not stop.wait(interval):
+                Broadcast.objects.filter(pk=self.broadcast.pk, status=Broadcast.STATUS_RUNNING).update(
+                    updated_at=timezone.now(),
+                )
+        except Exception as e:
+            logger.error(f"{self.broadcast}: не удалось обновить отметку активности - {e}")
+        finally:
+            connection.close()
+
+    def _cancelled(self) -> bool:
+        return Broadcast.objects.filter(pk=self.broadcast.pk, status=Broadcast.STATUS_CANCELLED).exists()
+
+    def _save_progress(self, chunk: List[BroadcastDelivery]):
+        BroadcastDelivery.objects.bulk_update(chunk, ['status', 'attempts', 'error', 'sent_at'])
+        counts = dict(self.broadcast.deliveries.values_list('status').annotate(c=Count('id')).order_by())
+        self.broadcast.sent = counts.get(BroadcastDelivery.STATUS_SENT, 0)
+        self.broadcast.failed = counts.get(BroadcastDelivery.STATUS_FAILED, 0)
+        # Только счетчики: статус "остановлена" из админки не затираем
+        self.broadcast.save(update_fields=['sent', 'failed', 'updated_at'])
+        metrics.inc('broadcast_sent_total', sum(d.status == BroadcastDelivery.STATUS_SENT for d in chunk))
+        metrics.inc('broadcast_failed_total', sum(d.status == BroadcastDelivery.STATUS_FAILED for d in chunk))
+        if self.progress:
+            self.progress(self.broadcast)
+
+    def run(self) -> Broadcast:
+        config = settings.BROADCAST_CONFIG
+        pending = self.broadcast.deliveries.filter(status=BroadcastDelivery.STATUS_PENDING).order_by('id')
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop,), daemon=True)
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(max_workers=config['CONCURRENCY']) as pool:
+                while True:
+                    if self._cancelled():
+                        logger.info(f"{self.broadcast} остановлена")
+                        self.broadcast.refresh_from_db()
+                        return self.broadcast
+                    chunk = list(pending[:config['CHUNK']])
+                    if not chunk:
+                        break
+                    list(pool.map(self.deliver, chunk))
+                    self._save_progress(chunk)
+        except Exception as e:
+            logger.error(f"{self.broadcast} прервана - {e}")
+            Broadcast.objects.filter(pk=self.broadcast.pk, status=Broadcast.STATUS_RUNNING).update(
+                status=Broadcast.STATUS_FAILED, error=str(e), updated_at=timezone.now(),
+            )
+            raise
+        finally:
+            stop.set()
+            heartbeat.join()
+            metrics.flush(force=True)
+
+        Broadcast.objects.filter(pk=self.broadcast.pk, status=Broadcast.STATUS_RUNNING).update(
+            status=Broadcast.STATUS_DONE, finished_at=timezone.now(), updated_at=timezone.now(),
+        )
+        self.broadcast.refresh_from_db()
+        logger.info(f"{self.broadcast}: отправлено {self.broadcast.sent} из {self.broadcast.total}, "
+                    f"ошибок {self.broadcast.failed}")
+        return self.broadcast
+
+
+def run_broadcast(broadcast_id: int, progress: Optional[Callable[[Broadcast], None]] = None) -> Optional[Broadcast]:
+    """Отправить (или продолжить) рассылку; None - ее уже отправляет другой процесс или она завершена"""
+    broadcast = claim_broadcast(broadcast_id)
+    if broadcast is None:
+        logger.warning(f"Рассылка #{broadcast_id} уже отправляется или завершена")
+        return None
+    return BroadcastDispatcher(broadcast, progress).run()
@@ -0,0 +1,149 @@
+import gzip
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficRecorder:
+    """Запись ответов СКУД в сжатый журнал для последующего воспроизведения
+
+    Одна строка JSON на запрос страницы: время, код ответа, длительность и
+    тело ответа как есть (или текст ошибки, если ответа не было). Файл -
+    gzip, дописывается новыми блоками, так что перезапуск монитора журнал
+    не теряет.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def record(self, status: Optional[int], elapsed_ms: float, body: Optional[str] = None,
+               error: Optional[str] = None, page: int = 1):
+        entry = {'t': round(time.time(), 3), 'status': status, 'ms': round(elapsed_ms, 1)}
+        if page > 1:
+            # Дочитывание пропущенного - относится к предыдущему опросу
+            entry['page'] = page
+        if body is not None:
+            entry['body'] = body
+        if error is not None:
+            entry['error'] = error
+
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        try:
+            with self._lock:
+                self._file.write(line + '\n')
+                # Сбрасываем каждую запись - журнал должен пережить падение процесса
+                self._file.flush()
+                self.records += 1
+        except OSError as e:
+            logger.warning(f"Не удалось записать ответ СКУД в журнал - {e}")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path: str) -> Iterator[dict]:
+    """Записи журнала по порядку (оборванная последняя строка пропускается)"""
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning("Пропущена поврежденная строка журнала")
+        except EOFError:
+            # Процесс упал посреди записи блока gzip - все до него уже прочитано
+            logger.warning(f"Журнал {path} оборван на последней записи")
+
+
+class TrafficReplayer:
+    """Подает записанные ответы СКУД в тот же конвейер обработки, что и монитор
+
+    speed=1 - в записанном темпе, 10 - в 10 раз быстрее, 0 - без пауз.
+    """
+
+    def __init__(self, monitor, speed: float = 0):
+        self.monitor = monitor
+        self.speed = speed
+        self.stats = {'pages': 0, 'errors': 0, 'rows': 0, 'new': 0}
+
+    def replay(self, records: Iterator[dict], limit: Optional[int] = None) -> dict:
+        started = time.monotonic()
+        first_t = None
+
+        for poll in self._polls(records):
+            if limit is not None and self.stats['pages'] >= limit:
+                break
+
+            record = poll[0]
+            if first_t is None:
+                first_t = record['t']
+            if self.speed:
+                # Ждем момента, когда этот ответ пришел при записи (с учетом ускорения)
+                due = (record['t'] - first_t) / self.speed
+                delay = due - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            items = []
+            failed = False
+            for page in poll:
+                self.stats['pages'] += 1
+                data = self._parse(page)
+                if data is None:
+                    self.stats['errors'] += 1
+                    failed = True
+                    continue
+                items.extend(data.get('data', []))
+
+            # Как и монитор: опрос с недочитанной страницей не обрабатывается
+            if failed:
+                continue
+
+            if not self.monitor.last_id and items:
+                # Курсора нет (пустая БД) - обрабатываем журнал с самого начала
+                self.monitor.last_id = min(item['id'] for item in items) - 1
+
+            self.stats['rows'] += len(items)
+            new_transactions = self.monitor.extract_new_transactions({'data': items})
+            self.stats['new'] += len(new_transactions)
+
+            # Время получения - текущее: отставание и трассировка считаются от момента воспроизведения
+            self.monitor.process_batch(new_transactions, time.time(), sum(p.get('ms', 0.0) for p in poll))
+
+        self.stats['seconds'] = round(time.monotonic() - started, 3)
+        return self.stats
+
+    @staticmethod
+    def _polls(records: Iterator[dict]) -> Iterator[List[dict]]:
+        """Сгруппировать записи по опросам: первая страница и дочитанные за ней"""
+        poll = []
+        for record in records:
+            if record.get('page', 1) == 1 and poll:
+                yield poll
+                poll = []
+            poll.append(record)
+        if poll:
+            yield poll
+
+    @staticmethod
+    def _parse(record: dict) -> Optional[dict]:
+        if record.get('status') != 200 or 'body' not in record:
+            return None
+        try:
+            return json.loads(record['body'])
+        except ValueError:
+            return None
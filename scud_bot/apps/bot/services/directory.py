@@ -0,0 +1,171 @@
+import json
+import logging
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from ..models import Employee, Terminal
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class SharedDirectory:
+    """Общий для всех процессов справочник сотрудников и терминалов в Redis
+
+    Компактные записи (список значений полей) лежат в хешах по emp_code и
+    "source_id:terminal_id". Любое изменение увеличивает номер версии - локальные копии
+    в процессах сверяются с ним и обновляются только когда он изменился.
+    """
+
+    # Версия в ключах меняется вместе с форматом записей - старые записи не читаются
+    PREFIX = 'scud:directory:v3'
+
+    # Все поля модели: пропущенное осталось бы отложенным и читалось бы отдельным запросом
+    EMPLOYEE_FIELDS = tuple(f.attname for f in Employee._meta.concrete_fields)
+    TERMINAL_FIELDS = tuple(f.attname for f in Terminal._meta.concrete_fields)
+
+    def __init__(self):
+        self.redis = get_redis()
+        self.employees_key = f'{self.PREFIX}:employees'
+        self.terminals_key = f'{self.PREFIX}:terminals'
+        self.version_key = f'{self.PREFIX}:version'
+        self.ready_key = f'{self.PREFIX}:ready'
+        self.rebuild_lock_key = f'{self.PREFIX}:rebuild_lock'
+
+    # Сериализация
+
+    @staticmethod
+    def _pack(obj, fields) -> str:
+        return json.dumps([getattr(obj, f) for f in fields], cls=DjangoJSONEncoder,
+                          ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def _unpack(model, fields, raw: str):
+        # to_python возвращает даты из строк ISO; from_db - экземпляр считается загруженным (save() сделает UPDATE)
+        values = [field.to_python(value) for field, value in zip(model._meta.concrete_fields, json.loads(raw))]
+        return model.from_db('default', fields, values)
+
+    def _employee(self, raw: str) -> Employee:
+        return self._unpack(Employee, self.EMPLOYEE_FIELDS, raw)
+
+    def _terminal(self, raw: str) -> Terminal:
+        return self._unpack(Terminal, self.TERMINAL_FIELDS, raw)
+
+    @staticmethod
+    def terminal_key(source_id: int, terminal_id: int) -> str:
+        # ID терминалов уникальны только в пределах сервера СКУД
+        return f'{source_id}:{terminal_id}'
+
+    @staticmethod
+    def _parse_terminal_key(key: str) -> Tuple[int, int]:
+        source_id, terminal_id = key.split(':')
+        return int(source_id), int(terminal_id)
+
+    # Чтение
+
+    def version(self) -> Optional[int]:
+        value = self.redis.get(self.version_key)
+        return int(value) if value is not None else None
+
+    def ensure_ready(self):
+        """Заполнить справочник из БД, если его еще нет (или Redis очищен)"""
+        if not self.redis.exists(self.ready_key):
+            self.rebuild()
+
+    def get_employee(self, emp_code: str) -> Optional[Employee]:
+        raw = self.redis.hget(self.employees_key, emp_code)
+        return self._employee(raw) if raw else None
+
+    def all_employees(self) -> Dict[str, Employee]:
+        return {code: self._employee(raw) for code, raw in self.redis.hgetall(self.employees_key).items()}
+
+    def all_terminals(self) -> Dict[Tuple[int, int], Terminal]:
+        """(source_id, terminal_id) -> терминал"""
+        return {
+            self._parse_terminal_key(key): self._terminal(raw)
+            for key, raw in self.redis.hgetall(self.terminals_key).items()
+        }
+
+    # Запись
+
+    def rebuild(self):
+        """Полностью перечитать справочник из БД"""
+        if not self.redis.set(self.rebuild_lock_key, 1, nx=True, ex=60):
+            # Справочник перестраивает другой процесс - ждем, чтобы не читать пустой
+            for _ in range(50):
+                if self.redis.exists(self.ready_key):
+                    return
+                time.sleep(0.2)
+            logger.warning("Справочник так и не был построен другим процессом")
+            return
+
+        try:
+            # При дублях emp_code побеждает меньший id - как и при привязке записей
+            employees = {
+                emp.emp_code: self._pack(emp, self.EMPLOYEE_FIELDS)
+                for emp in Employee.objects.order_by('-id')
+            }
+            terminals = {
+                self.terminal_key(term.source_id, term.terminal_id): self._pack(term, self.TERMINAL_FIELDS)
+                for term in Terminal.objects.all()
+            }
+
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(self.employees_key, self.terminals_key)
+            if employees:
+                pipe.hset(self.employees_key, mapping=employees)
+            if terminals:
+                pipe.hset(self.terminals_key, mapping=terminals)
+            pipe.set(self.ready_key, 1)
+            pipe.incr(self.version_key)
+            pipe.execute()
+
+            logger.info(f"Справочник обновлен: {len(employees)} сотрудников, {len(terminals)} терминалов")
+        finally:
+            self.redis.delete(self.rebuild_lock_key)
+
+    def refresh(self, kind: str, keys: Optional[Iterable[str]], channel: str = None):
+        """Перечитать измененные записи из БД, увеличить версию и оповестить подписчиков"""
+        if keys is None:
+            self.rebuild()
+        else:
+            keys = list(keys)
+            pipe = self.redis.pipeline(transaction=True)
+
+            if kind == 'employee':
+                fresh = {
+                    emp.emp_code: self._pack(emp, self.EMPLOYEE_FIELDS)
+                    for emp in Employee.objects.filter(emp_code__in=keys).order_by('-id')
+                }
+                hash_key = self.employees_key
+            else:
+                wanted = set(keys)
+                terminal_ids = [self._parse_terminal_key(k)[1] for k in keys]
+                fresh = {
+                    key: self._pack(term, self.TERMINAL_FIELDS)
+                    for term in Terminal.objects.filter(terminal_id__in=terminal_ids)
+                    if (key := self.terminal_key(term.source_id, term.terminal_id)) in wanted
+                }
+                hash_key = self.terminals_key
+
+            removed = [k for k in keys if k not in fresh]
+            if removed:
+                pipe.hdel(hash_key, *removed)
+            if fresh:
+                pipe.hset(hash_key, mapping=fresh)
+            pipe.incr(self.version_key)
+            pipe.execute()
+
+        if channel:
+            self.redis.publish(channel, json.dumps({'kind': kind, 'keys': keys}))
+
+
+def refresh_directory(kind: str, keys: Optional[Iterable[str]] = None):
+    """Обновить общий справочник и разослать сброс локальных кэшей"""
+    try:
+        SharedDirectory().refresh(kind, keys, channel=settings.LOOKUP_CACHE_CONFIG['CHANNEL'])
+    except Exception as e:
+        logger.warning(f"Не удалось обновить общий справочник ({kind}) - {e}")
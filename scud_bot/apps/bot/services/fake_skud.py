@@ -0,0 +1,422 @@
+"""Локальная замена СКУД для нагрузочного тестирования и проверки отказоустойчивости
+
+Реализует то, чем пользуется проект:
+- /login/ - форма с CSRF токеном, после входа выдается кука sessionid с ограниченным сроком жизни
+- /iclock/api/transactions/ - список отметок с пагинацией (page, page_size) и сортировкой (ordering)
+- /iclock/cdata?SN=...&table=ATTLOG - прием отметок от терминалов (так работает автовыход)
+
+Генерирует синтетические отметки с заданной частотой и умеет имитировать сбои:
+задержку ответа, 401 (протухшая кука) и 5xx. Зависит только от стандартной библиотеки.
+"""
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+UNAUTHORIZED = {'detail': 'Учетные данные не были предоставлены.'}
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><title>Вход</title></head>
+<body>
+<form method="post" action="/login/">
+<input type="hidden" name="csrfmiddlewaretoken" value="{token}">
+<input type="text" name="username">
+<input type="password" name="password">
+<input type="hidden" name="login_user" value="employee">
+<button type="submit">Войти</button>
+</form>
+</body></html>
+"""
+
+
+@dataclass
+class FaultConfig:
+    """Имитация сбоев (доли - от 0 до 1)"""
+    latency_ms: int = 0  # Задержка каждого ответа
+    jitter_ms: int = 0  # Случайная добавка к задержке
+    unauthorized_rate: float = 0.0  # Доля запросов к API, получающих 401
+    error_rate: float = 0.0  # Доля запросов, получающих 5xx
+
+
+class FakeSkudState:
+    """Данные поддельного СКУД: отметки, терминалы, сессии"""
+
+    def __init__(self, employees: int = 200, terminals: int = 4, session_ttl: int = 3600,
+                 max_rows: int = 500000, password: Optional[str] = None):
+        self.session_ttl = session_ttl
+        self.max_rows = max_rows
+        self.password = password
+        self.faults = FaultConfig()
+
+        self._lock = threading.Lock()
+        self._rows: List[dict] = []
+        self._next_id = 1
+        self._sessions: Dict[str, float] = {}  # sessionid -> time.monotonic() истечения
+        self._csrf_tokens: Dict[str, float] = {}
+
+        self.emp_codes = [str(100 + i) for i in range(employees)]
+        self.terminals = {
+            i: {
+                'terminal_sn': f'FAKE{i:04d}',
+                'terminal_alias': f'Пункт {i}',
+                'area_alias': f'Зона {(i - 1) % 3 + 1}',
+            }
+            for i in range(1, terminals + 1)
+        }
+        self._terminal_by_sn = {t['terminal_sn']: tid for tid, t in self.terminals.items()}
+        self._on_site = set()  # Кто сейчас внутри - чтобы вход/выход чередовались
+
+        self.stats = {'requests': 0, 'unauthorized': 0, 'errors': 0, 'generated': 0, 'ingested': 0}
+
+    # Отметки
+
+    def _terminal_id_for_sn(self, sn: str) -> int:
+        terminal_id = self._terminal_by_sn.get(sn)
+        if terminal_id is None:
+            # Незнакомый терминал - регистрируем, как это делает настоящий СКУД
+            terminal_id = max(self.terminals, default=0) + 1
+            self.terminals[terminal_id] = {
+                'terminal_sn': sn,
+                'terminal_alias': f'Терминал {sn}',
+                'area_alias': '',
+            }
+            self._terminal_by_sn[sn] = terminal_id
+        return terminal_id
+
+    def add_punch(self, emp_code: str, terminal_id: int, punch_time: datetime,
+                  punch_state: str, verify_type: int) -> dict:
+        with self._lock:
+            terminal = self.terminals[terminal_id]
+            row = {
+                'id': self._next_id,
+                'emp_code': emp_code,
+                'terminal': terminal_id,
+                'terminal_sn': terminal['terminal_sn'],
+                'terminal_alias': terminal['terminal_alias'],
+                'area_alias': terminal['area_alias'],
+                'punch_time': punch_time.strftime(TIME_FORMAT),
+                'punch_state': punch_state,
+                'verify_type': verify_type,
+                'upload_time': datetime.now().strftime(TIME_FORMAT),
+            }
+            self._next_id += 1
+            self._rows.append(row)
+            if len(self._rows) > self.max_rows:
+                del self._rows[:len(self._rows) - self.max_rows]
+            return row
+
+    def generate_punch(self, punch_time: Optional[datetime] = None) -> dict:
+        """Случайная отметка: вход, если сотрудник снаружи, иначе выход"""
+        emp_code = random.choice(self.emp_codes)
+        terminal_id = random.choice(list(self.terminals))
+
+        if emp_code in self._on_site:
+            self._on_site.discard(emp_code)
+            punch_state = '1'
+        else:
+            self._on_site.add(emp_code)
+            punch_state = '0'
+
+        self.stats['generated'] += 1
+        return self.add_punch(emp_code, terminal_id, punch_time or datetime.now(),
+                              punch_state, random.choice((1, 15)))
+
+    def seed(self, count: int, days: int = 7):
+        """Заполнить историю за последние days дней"""
+        started = datetime.now() - timedelta(days=days)
+        step = timedelta(days=days) / max(count, 1)
+        for i in range(count):
+            self.generate_punch(started + step * i)
+
+    def ingest_attlog(self, sn: str, body: str) -> int:
+        """Принять отметки терминала (строки ATTLOG: PIN, время, состояние, способ, ...)"""
+        accepted = 0
+        with self._lock:
+            terminal_id = self._terminal_id_for_sn(sn)
+
+        for line in body.splitlines():
+            fields = line.split('\t')
+            if len(fields) < 2 or not fields[0].strip():
+                continue
+            try:
+                punch_time = datetime.strptime(fields[1].strip(), TIME_FORMAT)
+            except ValueError:
+                continue
+
+            punch_state = fields[2].strip() if len(fields) > 2 else '0'
+            verify_type = int(fields[3]) if len(fields) > 3 and fields[3].strip().isdigit() else 1
+            self.add_punch(fields[0].strip(), terminal_id, punch_time, punch_state, verify_type)
+            accepted += 1
+
+        self.stats['ingested'] += accepted
+        return accepted
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def query(self, ordering: str = '-id', page: int = 1, page_size: int = 10,
+              emp_code: Optional[str] = None) -> Tuple[int, List[dict]]:
+        """Страница отметок и общее количество"""
+        field = ordering.lstrip('-') if ordering.lstrip('-') in ('id', 'punch_time') else 'id'
+        reverse = ordering.startswith('-')
+
+        with self._lock:
+            rows = self._rows
+            if emp_code:
+                rows = [r for r in rows if r['emp_code'] == emp_code]
+
+            start = (page - 1) * page_size
+
+            if field == 'id':
+                # Отметки и так лежат по возрастанию id - берем срез без сортировки и копий
+                if not reverse:
+                    return len(rows), rows[start:start + page_size]
+                end = len(rows) - start
+                return len(rows), rows[max(end - page_size, 0):max(end, 0)][::-1]
+
+            ordered = sorted(rows, key=lambda r: (r[field], r['id']), reverse=reverse)
+            return len(rows), ordered[start:start + page_size]
+
+    # Сессии
+
+    def issue_csrf(self) -> str:
+        token = secrets.token_hex(16)
+        with self._lock:
+            self._csrf_tokens[token] = time.monotonic() + 3600
+        return token
+
+    def check_csrf(self, token: str) -> bool:
+        with self._lock:
+            expires = self._csrf_tokens.get(token)
+            return expires is not None and expires > time.monotonic()
+
+    def login(self, username: str, password: str) -> Optional[str]:
+        if not username or not password:
+            return None
+        if self.password is not None and password != self.password:
+            return None
+
+        session_id = secrets.token_hex(16)
+        with self._lock:
+            now = time.monotonic()
+            # Заодно чистим истекшие
+            self._sessions = {sid: exp for sid, exp in self._sessions.items() if exp > now}
+            self._sessions[session_id] = now + self.session_ttl
+        return session_id
+
+    def check_session(self, session_id: Optional[str]) -> bool:
+        if not session_id:
+            return False
+        with self._lock:
+            expires = self._sessions.get(session_id)
+            return expires is not None and expires > time.monotonic()
+
+    def expire_sessions(self):
+        with self._lock:
+            self._sessions = {}
+
+
+class FakeSkudHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeSKUD/1.0'
+    state: FakeSkudState = None  # Подставляется в make_server
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    # Ответы
+
+    def _send(self, status: int, body: str, content_type: str = 'text/html; charset=utf-8',
+              headers: Optional[Dict[str, str]] = None):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status: int, data: dict):
+        self._send(status, json.dumps(data, ensure_ascii=False), 'application/json')
+
+    def _cookies(self) -> Dict[str, str]:
+        cookie = SimpleCookie()
+        cookie.load(self.headers.get('Cookie', ''))
+        return {name: morsel.value for name, morsel in cookie.items()}
+
+    def _inject_faults(self, api: bool) -> bool:
+        """Задержка и случайные ошибки. True - ответ уже отправлен"""
+        faults = self.state.faults
+        self.state.stats['requests'] += 1
+
+        delay = faults.latency_ms + (random.uniform(0, faults.jitter_ms) if faults.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000)
+
+        if faults.error_rate and random.random() < faults.error_rate:
+            self.state.stats['errors'] += 1
+            self._send(random.choice((500, 502, 503)), 'Internal Server Error', 'text/plain')
+            return True
+
+        if api and faults.unauthorized_rate and random.random() < faults.unauthorized_rate:
+            self.state.stats['unauthorized'] += 1
+            self._send_json(401, UNAUTHORIZED)
+            return True
+
+        return False
+
+    # Маршруты
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path == '/iclock/api/transactions/':
+            if not self._inject_faults(api=True):
+                self._transactions(params)
+        elif url.path == '/iclock/cdata':
+            if not self._inject_faults(api=False):
+                # Рукопожатие терминала
+                self._send(200, f"GET OPTION FROM: {params.get('SN', '')}\nStamp=9999\n", 'text/plain')
+        elif url.path in ('/', '/login/'):
+            if not self._inject_faults(api=False):
+                self._login_page()
+        elif url.path == '/_fake/stats':
+            self._send_json(200, dict(self.state.stats, rows=self.state.count()))
+        else:
+            self._send(404, 'Not Found', 'text/plain')
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8', errors='replace') if length else ''
+
+        if url.path == '/login/':
+            if not self._inject_faults(api=False):
+                self._login(body, params)
+        elif url.path == '/iclock/cdata':
+            if not self._inject_faults(api=False):
+                self._cdata(body, params)
+        elif url.path == '/_fake/expire_sessions':
+            self.state.expire_sessions()
+            self._send_json(200, {'expired': True})
+        else:
+            self._send(404, 'Not Found', 'text/plain')
+
+    def _login_page(self):
+        token = self.state.issue_csrf()
+        self._send(200, LOGIN_PAGE.format(token=token),
+                   headers={'Set-Cookie': f'csrftoken={token}; Path=/'})
+
+    def _login(self, body: str, params: dict):
+        form = {k: v[-1] for k, v in parse_qs(body).items()}
+
+        token = form.get('csrfmiddlewaretoken', '')
+        cookie_token = self._cookies().get('csrftoken')
+        if not self.state.check_csrf(token) or (cookie_token and cookie_token != token):
+            self._send(403, 'CSRF verification failed', 'text/plain')
+            return
+
+        session_id = self.state.login(form.get('username', ''), form.get('password', ''))
+        if not session_id:
+            self._send(200, LOGIN_PAGE.format(token=self.state.issue_csrf()))
+            return
+
+        self._send(302, '', headers={
+            'Location': params.get('next', '/'),
+            'Set-Cookie': f'sessionid={session_id}; Path=/; HttpOnly',
+        })
+
+    def _transactions(self, params: dict):
+        if not self.state.check_session(self._cookies().get('sessionid')):
+            self.state.stats['unauthorized'] += 1
+            self._send_json(401, UNAUTHORIZED)
+            return
+
+        try:
+            page = max(int(params.get('page', 1)), 1)
+            page_size = max(int(params.get('page_size', 10)), 1)
+        except ValueError:
+            self._send_json(400, {'detail': 'Неверные параметры пагинации'})
+            return
+
+        count, rows = self.state.query(
+            ordering=params.get('ordering', '-id'),
+            page=page,
+            page_size=page_size,
+            emp_code=params.get('emp_code'),
+        )
+
+        base = f"http://{self.headers.get('Host', 'localhost')}/iclock/api/transactions/"
+        query = {k: v for k, v in params.items() if k != 'page'}
+        query_str = '&'.join(f'{k}={v}' for k, v in query.items())
+
+        def page_url(number):
+            return f"{base}?{query_str}&page={number}" if query_str else f"{base}?page={number}"
+
+        self._send_json(200, {
+            'count': count,
+            'next': page_url(page + 1) if page * page_size < count else None,
+            'previous': page_url(page - 1) if page > 1 else None,
+            'msg': '',
+            'code': 0,
+            'data': rows,
+        })
+
+    def _cdata(self, body: str, params: dict):
+        sn = params.get('SN')
+        if not sn:
+            self._send(400, 'SN required', 'text/plain')
+            return
+
+        if params.get('table') != 'ATTLOG':
+            # Другие таблицы (OPERLOG и т.п.) просто подтверждаем
+            self._send(200, 'OK', 'text/plain')
+            return
+
+        accepted = self.state.ingest_attlog(sn, body)
+        self._send(200, f'OK: {accepted}', 'text/plain')
+
+
+class PunchGenerator(threading.Thread):
+    """Фоновая генерация отметок с заданной частотой (в секунду)"""
+
+    def __init__(self, state: FakeSkudState, rate: float):
+        super().__init__(name='fake-skud-generator', daemon=True)
+        self.state = state
+        self.rate = rate
+        self._stop_event = threading.Event()
+
+    def run(self):
+        interval = 1.0 / self.rate
+        next_at = time.monotonic()
+        while not self._stop_event.is_set():
+            self.state.generate_punch()
+            next_at += interval
+            # Если отстали - не догоняем пачкой, а продолжаем с текущего момента
+            next_at = max(next_at, time.monotonic() - 1)
+            self._stop_event.wait(max(next_at - time.monotonic(), 0))
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def make_server(state: FakeSkudState, host: str = '127.0.0.1', port: int = 8800) -> ThreadingHTTPServer:
+    handler = type('BoundFakeSkudHandler', (FakeSkudHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
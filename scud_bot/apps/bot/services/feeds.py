@@ -0,0 +1,112 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import Terminal, TerminalSubscription, Transaction
+from .notifications import push_pending
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+FEED_PREFIX = 'scud:notify:feed'
+
+
+def feed_item(transaction: Transaction) -> str:
+    """Строка ленты в очереди чата: время, вход/выход, кто, где (без обращения к БД)"""
+    employee = transaction.employee
+    return json.dumps([
+        timezone.localtime(transaction.punch_time).strftime('%H:%M'),
+        transaction.is_entry,
+        employee.name if employee and employee.name else f"Сотр. {transaction.emp_code}",
+        transaction.terminal.terminal_alias,
+    ], ensure_ascii=False)
+
+
+def format_feed_message(items: List[list], max_lines: Optional[int] = None) -> str:
+    """Одно сообщение на все проходы окна; длинная пересменка - первые строки и итог"""
+    max_lines = max_lines or settings.NOTIFICATIONS_CONFIG['FEED_MAX_LINES']
+    entries = sum(1 for _, is_entry, _, _ in items if is_entry)
+
+    lines = []
+    if len(items) > 1:
+        lines.append(f"Проходов: {len(items)} (входов {entries}, выходов {len(items) - entries})")
+    for punch_time, is_entry, name, terminal in items[:max_lines]:
+        lines.append(f"{punch_time} {'вход' if is_entry else 'выход'} - {name}, {terminal}")
+    if len(items) > max_lines:
+        lines.append(f"... и еще {len(items) - max_lines}")
+    return '\n'.join(lines)
+
+
+class TerminalFeeds:
+    """Рассылка лент проходов: индекс "терминал -> подписки" в памяти монитора
+
+    Индекс перечитывается раз в FEED_REFRESH секунд, так что на отметку - только
+    поиск в словаре. Проходы пачки раскладываются по чатам, а в Redis копятся
+    за FEED_INTERVAL секунд: в чат уходит одно сообщение на окно, не чаще.
+    """
+
+    def __init__(self):
+        self.by_terminal: Dict[int, List[TerminalSubscription]] = {}
+        self._loaded_at = None
+
+    def refresh(self, force: bool = False):
+        if not force and self._loaded_at is not None and \
+                time.monotonic() - self._loaded_at < settings.NOTIFICATIONS_CONFIG['FEED_REFRESH']:
+            return
+
+        subscriptions = list(TerminalSubscription.objects.filter(is_active=True).prefetch_related('terminals'))
+        areas = {area for subscription in subscriptions for area in subscription.area_list}
+        area_terminals = defaultdict(set)
+        if areas:
+            for terminal_id, area in Terminal.objects.filter(area_alias__in=areas).values_list('id', 'area_alias'):
+                area_terminals[area].add(terminal_id)
+
+        index = defaultdict(list)
+        for subscription in subscriptions:
+            terminal_ids = {terminal.id for terminal in subscription.terminals.all()}
+            for area in subscription.area_list:
+                terminal_ids |= area_terminals[area]
+            for terminal_id in terminal_ids:
+                index[terminal_id].append(subscription)
+
+        self.by_terminal = dict(index)
+        self._loaded_at = time.monotonic()
+
+    def subscribers(self, terminal_id: int) -> List[TerminalSubscription]:
+        return self.by_terminal.get(terminal_id, [])
+
+    def dispatch(self, transactions: Iterable[Transaction]) -> int:
+        """Разложить отметки пачки по чатам подписчиков; возвращает число чатов"""
+        self.refresh()
+        if not self.by_terminal:
+            return 0
+
+        items = defaultdict(dict)
+        for transaction in transactions:
+            for subscription in self.subscribers(transaction.terminal_id):
+                # Чат с несколькими подходящими подписками получает отметку один раз
+                if subscription.accepts(transaction.is_entry) and transaction.id not in items[subscription.chat_id]:
+                    items[subscription.chat_id][transaction.id] = feed_item(transaction)
+
+        from ..tasks import send_terminal_feed
+
+        window = settings.NOTIFICATIONS_CONFIG['FEED_INTERVAL']
+        chats = 0
+        for chat_id, chat_items in items.items():
+            if not chat_items:
+                continue
+            chats += 1
+            key = f'{FEED_PREFIX}:{chat_id}'
+            if push_pending(key, list(chat_items.values()), window):
+                try:
+                    send_terminal_feed.apply_async((chat_id,), countdown=window)
+                except Exception as e:
+                    # Проходы остаются в ленте - без метки окна их отправку поставит следующая пачка
+                    get_redis().delete(f'{key}:scheduled')
+                    logger.error(f"Не удалось поставить ленту чата {chat_id} в очередь - {e}")
+        return chats
@@ -0,0 +1,261 @@
+import glob
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from django.db import connection, connections, transaction as db_transaction
+from django.utils import timezone
+
+from ..models import ImportCheckpoint, SkudSource, Terminal, Transaction
+from .lookup_cache import LookupCache
+
+logger = logging.getLogger(__name__)
+
+
+class BackupImporter:
+    """Импорт JSON бэкапов СКУД пачками с сохранением прогресса в БД"""
+
+    def __init__(self, batch_size: int = 1000, restart: bool = False, source: Optional[SkudSource] = None):
+        self.batch_size = batch_size
+        self.restart = restart
+        # Сервер СКУД, с которого снят бэкап (ID записей и терминалов - его)
+        self.source = source or SkudSource.get_default()
+
+        # Кэш общий для всех потоков, создание терминалов под локом
+        self._terminal_lock = threading.Lock()
+        self.cache = LookupCache()
+        self.cache.load()
+
+    @staticmethod
+    def resolve_files(path: str) -> List[Path]:
+        """Файл, директория или glob-маска -> список файлов бэкапов"""
+        target = Path(path)
+
+        if target.is_dir():
+            return sorted(target.glob('*.json'))
+
+        if target.exists():
+            return [target]
+
+        return sorted(Path(p) for p in glob.glob(path) if Path(p).is_file())
+
+    def import_files(self, files: List[Path], workers: int = 1) -> List[dict]:
+        """Импортировать несколько файлов в пуле потоков"""
+        if workers <= 1 or len(files) <= 1:
+            return [self.import_file(f) for f in files]
+
+        results = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self._import_in_thread, f): f for f in files}
+            for future in as_completed(futures):
+                results.append(future.result())
+
+        return results
+
+    def _import_in_thread(self, file_path: Path) -> dict:
+        try:
+            return self.import_file(file_path)
+        finally:
+            # у каждого потока свое соединение с БД - закрываем его
+            connections.close_all()
+
+    def import_file(self, file_path: Path) -> dict:
+        """Импортировать один файл, продолжая с сохраненной позиции"""
+        result = {
+            'file': file_path.name,
+            'total': 0,
+            'imported': 0,
+            'skipped': 0,
+            'errors': 0,
+            'resumed_from': 0,
+            'status': 'ok',
+        }
+
+        try:
+            file_size = file_path.stat().st_size
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения {file_path}: {e}")
+            result['status'] = f"ошибка чтения: {e}"
+            return result
+
+        if 'data' not in data:
+            result['status'] = "файл не содержит ключ 'data'"
+            return result
+
+        items = data['data']
+        result['total'] = len(items)
+
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(
+            source=self.source,
+            file_path=str(file_path.resolve()),
+            defaults={'file_size': file_size, 'total': len(items)}
+        )
+
+        # Файл изменился или запрошен полный перезапуск - начинаем с нуля
+        if not created and (self.restart or checkpoint.file_size != file_size):
+            checkpoint.file_size = file_size
+            checkpoint.total = len(items)
+            checkpoint.offset = 0
+            checkpoint.max_skud_id = 0
+            checkpoint.imported = checkpoint.skipped = checkpoint.errors = 0
+            checkpoint.is_completed = False
+            checkpoint.save()
+
+        if checkpoint.is_completed:
+            result['status'] = 'уже импортирован'
+            return result
+
+        result['resumed_from'] = checkpoint.offset
+        if checkpoint.offset:
+            logger.info(f"{file_path.name}: продолжаем с записи {checkpoint.offset}/{len(items)}")
+
+        for start in range(checkpoint.offset, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            new_transactions, skipped, errors, max_id = self._prepare_batch(batch)
+
+            # Пачка и позиция в файле фиксируются одной транзакцией
+            with db_transaction.atomic():
+                imported = self._insert(new_transactions)
+                # Записи, которые успел вставить параллельный импорт пересекающегося файла
+                skipped += len(new_transactions) - imported
+
+                checkpoint.offset = start + len(batch)
+                checkpoint.max_skud_id = max(checkpoint.max_skud_id, max_id)
+                checkpoint.imported += imported
+                checkpoint.skipped += skipped
+                checkpoint.errors += errors
+                checkpoint.save()
+
+            result['imported'] += imported
+            result['skipped'] += skipped
+            result['errors'] += errors
+
+            logger.info(f"{file_path.name}: обработано {checkpoint.offset}/{len(items)}")
+
+        checkpoint.is_completed = True
+        checkpoint.save(update_fields=['is_completed', 'updated_at'])
+
+        return result
+
+    def _insert(self, transactions: List[Transaction]) -> int:
+        """Вставить пачку; возвращает число действительно добавленных записей
+
+        bulk_create(ignore_conflicts=True) не сообщает, какие строки пропущены,
+        поэтому вставка своим запросом: ON CONFLICT DO NOTHING молча пропускает
+        skud_id, уже вставленные параллельным импортом, а RETURNING отдает
+        только действительно добавленные строки.
+        """
+        if not transactions:
+            return 0
+
+        opts = Transaction._meta
+        fields = [field for field in opts.concrete_fields if not field.primary_key]
+        quote = connection.ops.quote_name
+        row = f"({', '.join(['%s'] * len(fields))})"
+        batch_size = connection.ops.bulk_batch_size(fields, transactions)
+
+        inserted = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(transactions), batch_size):
+                chunk = transactions[start:start + batch_size]
+                cursor.execute(
+                    f"INSERT INTO {quote(opts.db_table)} ({', '.join(quote(f.column) for f in fields)}) "
+                    f"VALUES {', '.join([row] * len(chunk))} "
+                    f"ON CONFLICT DO NOTHING RETURNING {quote(opts.pk.column)}",
+                    [field.get_db_prep_save(field.pre_save(obj, True), connection)
+                     for obj in chunk for field in fields],
+                )
+                inserted += len(cursor.fetchall())
+        return inserted
+
+    def _prepare_batch(self, batch: List[dict]):
+        """Подготовить пачку: дубликаты отсеиваются одним запросом по skud_id"""
+        skipped = errors = 0
+        max_id = 0
+
+        batch_ids = [item.get('id') for item in batch if item.get('id')]
+        existing = set(
+            Transaction.objects.filter(source=self.source, skud_id__in=batch_ids)
+            .values_list('skud_id', flat=True)
+        )
+
+        new_transactions = []
+        for item in batch:
+            skud_id = item.get('id')
+            if not skud_id:
+                errors += 1
+                continue
+
+            max_id = max(max_id, skud_id)
+
+            if skud_id in existing:
+                skipped += 1
+                continue
+            existing.add(skud_id)
+
+            terminal = self._get_terminal_or_create(item)
+            if not terminal:
+                errors += 1
+                continue
+
+            emp_code = item.get('emp_code', '')
+
+            new_transactions.append(Transaction(
+                source=self.source,
+                skud_id=skud_id,
+                employee=self.cache.get_employee(emp_code),
+                emp_code=emp_code,
+                terminal=terminal,
+                punch_time=self._parse_time(item.get('punch_time')),
+                punch_state=item.get('punch_state', '0'),
+                verify_type=item.get('verify_type', 1),
+            ))
+
+        return new_transactions, skipped, errors, max_id
+
+    def _get_terminal_or_create(self, item: dict) -> Optional[Terminal]:
+        """Получить или создать терминал"""
+        terminal_id = item.get('terminal')
+        if terminal_id is None:
+            return None
+
+        terminal = self.cache.get_terminal(self.source.id, terminal_id)
+        if terminal:
+            return terminal
+
+        with self._terminal_lock:
+            terminal = self.cache.get_terminal(self.source.id, terminal_id)
+            if terminal:
+                return terminal
+
+            try:
+                terminal, _ = Terminal.objects.get_or_create(
+                    source=self.source,
+                    terminal_id=terminal_id,
+                    defaults={
+                        'terminal_sn': item.get('terminal_sn', ''),
+                        'terminal_alias': item.get('terminal_alias', f'Терминал {terminal_id}'),
+                        'area_alias': item.get('area_alias', ''),
+                        'is_monitored': False,
+                    }
+                )
+            except Exception as e:
+                logger.error(f"Ошибка создания терминала {terminal_id}: {e}")
+                return None
+
+            self.cache.add_terminal(terminal)
+            return terminal
+
+    @staticmethod
+    def _parse_time(punch_time_str):
+        try:
+            naive_dt = datetime.strptime(punch_time_str, "%Y-%m-%d %H:%M:%S")
+            return timezone.make_aware(naive_dt, timezone.get_current_timezone())
+        except (TypeError, ValueError):
+            return timezone.now()
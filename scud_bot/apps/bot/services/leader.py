@@ -0,0 +1,89 @@
+import logging
+import os
+import socket
+import time
+import uuid
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Продлить/снять аренду можно только своим токеном - чужую аренду не трогаем
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """Выбор лидера среди реплик через аренду в Redis
+
+    Лидер держит ключ с TTL и продлевает его из основного цикла: если
+    процесс завис, аренда истекает и ее забирает резервная реплика.
+    """
+
+    def __init__(self, name: str, ttl: float = None):
+        config = settings.LEADER_CONFIG
+        self.key = f'scud:leader:{name}'
+        self.ttl = ttl or config['TTL']
+        self.token = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.redis = get_redis()
+        self.is_leader = False
+        self._checked_at = 0.0
+
+    def heartbeat(self) -> bool:
+        """Захватить аренду или продлить свою. True - мы лидер"""
+        ttl_ms = int(self.ttl * 1000)
+        self._checked_at = time.monotonic()
+        try:
+            if self.is_leader:
+                held = bool(self.redis.eval(_RENEW, 1, self.key, self.token, ttl_ms))
+            else:
+                held = bool(self.redis.set(self.key, self.token, nx=True, px=ttl_ms))
+        except RedisError as e:
+            # Без Redis аренду не захватит и резерв - лидер продолжает работать,
+            # чтобы отказ Redis не останавливал прием отметок
+            logger.warning(f"Аренда лидера недоступна - {e}")
+            return self.is_leader
+
+        if held and not self.is_leader:
+            logger.info(f"Получено лидерство ({self.token})")
+        elif not held and self.is_leader:
+            logger.warning("Лидерство потеряно")
+
+        self.is_leader = held
+        return held
+
+    def keep_alive(self) -> bool:
+        """Продлить аренду, если прошла треть TTL (вызывать внутри долгой обработки)"""
+        if time.monotonic() - self._checked_at < self.ttl / 3:
+            return self.is_leader
+        return self.heartbeat()
+
+    def holder(self):
+        try:
+            return self.redis.get(self.key)
+        except RedisError:
+            return None
+
+    def release(self):
+        if not self.is_leader:
+            return
+        try:
+            self.redis.eval(_RELEASE, 1, self.key, self.token)
+            logger.info("Лидерство передано")
+        except RedisError as e:
+            logger.warning(f"Не удалось снять аренду лидера - {e}")
+        self.is_leader = False
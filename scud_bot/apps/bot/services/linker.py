@@ -0,0 +1,136 @@
+import logging
+from typing import Iterable, List, Optional
+
+from django.db import connection, transaction as db_transaction
+
+from ..models import Employee, Transaction
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Пока ключ жив, повторная постановка привязки того же кода в очередь не нужна
+LINK_PENDING_KEY = 'scud:link:pending:{emp_code}'
+LINK_PENDING_TTL = 300
+
+
+class TransactionLinker:
+    """Привязка записей проходов к сотрудникам одним UPDATE ... FROM по emp_code"""
+
+    def __init__(self, batch_size: int = 10000):
+        self.batch_size = batch_size
+        self.transaction_table = Transaction._meta.db_table
+        self.employee_table = Employee._meta.db_table
+
+    def _employees_subquery(self, emp_codes: Optional[List[str]]):
+        """Один сотрудник на код (emp_code в Employee не уникален - берем меньший id)"""
+        sql = f"SELECT emp_code, MIN(id) AS id FROM {self.employee_table}"
+        params = []
+
+        if emp_codes is not None:
+            placeholders = ', '.join(['%s'] * len(emp_codes))
+            sql += f" WHERE emp_code IN ({placeholders})"
+            params = list(emp_codes)
+
+        sql += " GROUP BY emp_code"
+        return sql, params
+
+    def report(self, emp_codes: Optional[Iterable[str]] = None) -> List[dict]:
+        """Dry-run: сколько непривязанных записей у каждого сотрудника"""
+        emp_codes = list(emp_codes) if emp_codes is not None else None
+        if emp_codes == []:
+            return []
+
+        employees_sql, params = self._employees_subquery(emp_codes)
+
+        sql = f"""
+            SELECT e.id, e.emp_code, emp.name, COUNT(t.id)
+            FROM ({employees_sql}) e
+            JOIN {self.employee_table} emp ON emp.id = e.id
+            JOIN {self.transaction_table} t
+                ON t.emp_code = e.emp_code AND t.employee_id IS NULL
+            GROUP BY e.id, e.emp_code, emp.name
+            ORDER BY e.emp_code
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        return [
+            {'employee_id': row[0], 'emp_code': row[1], 'name': row[2], 'unlinked': row[3]}
+            for row in rows
+        ]
+
+    def link(self, emp_codes: Optional[Iterable[str]] = None) -> int:
+        """Привязать все непривязанные записи, пачками по batch_size"""
+        emp_codes = list(emp_codes) if emp_codes is not None else None
+        if emp_codes == []:
+            return 0
+
+        employees_sql, employees_params = self._employees_subquery(emp_codes)
+
+        # Пачка ограничивается по id записей, чтобы не держать блокировку на всю таблицу
+        sql = f"""
+            UPDATE {self.transaction_table} AS t
+            SET employee_id = e.id
+            FROM ({employees_sql}) e
+            WHERE t.emp_code = e.emp_code
+              AND t.employee_id IS NULL
+              AND t.id IN (
+                  SELECT u.id FROM {self.transaction_table} u
+                  JOIN ({employees_sql}) ue ON ue.emp_code = u.emp_code
+                  WHERE u.employee_id IS NULL
+                  ORDER BY u.id
+                  LIMIT %s
+              )
+        """
+        params = employees_params + employees_params + [self.batch_size]
+
+        total = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                updated = cursor.rowcount
+
+            total += updated
+            if updated < self.batch_size:
+                break
+
+        if total:
+            logger.info(f"Автопривязка: привязано {total} записей")
+
+        return total
+
+
+def schedule_linking(emp_code: str):
+    """Поставить фоновую привязку записей по коду в очередь (после коммита, без дублей)"""
+    if not emp_code:
+        return
+
+    def enqueue():
+        from ..tasks import link_employee_transactions
+
+        try:
+            key = LINK_PENDING_KEY.format(emp_code=emp_code)
+            if not get_redis().set(key, 1, nx=True, ex=LINK_PENDING_TTL):
+                logger.debug(f"Привязка для {emp_code} уже в очереди")
+                return
+        except Exception as e:
+            logger.debug(f"Redis недоступен, ставим привязку без дедупликации - {e}")
+
+        try:
+            link_employee_transactions.delay(emp_code)
+        except Exception as e:
+            logger.warning(f"Не удалось поставить привязку в очередь, выполняем сразу - {e}")
+            release_linking(emp_code)
+            TransactionLinker().link([emp_code])
+
+    db_transaction.on_commit(enqueue)
+
+
+def release_linking(emp_code: str):
+    """Снять отметку о стоящей в очереди привязке"""
+    try:
+        get_redis().delete(LINK_PENDING_KEY.format(emp_code=emp_code))
+    except Exception as e:
+        logger.debug(f"Redis недоступен - {e}")
@@ -0,0 +1,275 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from redis.exceptions import RedisError
+
+from ..models import Employee, Terminal
+from .directory import SharedDirectory, refresh_directory
+from .redis_client import create_pubsub
+
+logger = logging.getLogger(__name__)
+
+
+def publish_invalidation(kind: str, keys: Optional[Iterable] = None):
+    """Оповестить процессы об изменении сотрудников/терминалов (после коммита)
+
+    kind - 'employee' (ключи - emp_code) или 'terminal' (ключи - SharedDirectory.terminal_key),
+    keys=None - сбросить все записи этого типа. Справочник обновляет Celery: полная
+    перестройка может ждать блокировку другого процесса, а запрос админки ждать не должен.
+    """
+    from ..tasks import refresh_shared_directory
+
+    if keys is not None:
+        keys = sorted({str(k) for k in keys if k is not None and k != ''})
+
+    def enqueue():
+        try:
+            refresh_shared_directory.delay(kind, keys)
+        except Exception as e:
+            logger.warning(f"Не удалось поставить обновление справочника в очередь - {e}")
+            refresh_directory(kind, keys)
+
+    db_transaction.on_commit(enqueue)
+
+
+class LookupCache:
+    """Кэш сотрудников и терминалов в памяти процесса
+
+    Локальная LRU-копия общего справочника из Redis (SharedDirectory): сверяется
+    с его версией не чаще раза в VERSION_CHECK_INTERVAL секунд и сразу - по
+    сообщению из канала сброса. Отсутствующие коды сотрудников запоминаются на
+    NEGATIVE_TTL секунд. Если Redis недоступен - читаем напрямую из БД.
+    """
+
+    REDIS_RETRY_DELAY = 30
+
+    def __init__(self, directory: SharedDirectory = None):
+        config = settings.LOOKUP_CACHE_CONFIG
+        self.negative_ttl = config['NEGATIVE_TTL']
+        self.local_size = config['LOCAL_SIZE']
+        self.version_check_interval = config['VERSION_CHECK_INTERVAL']
+
+        self.directory = directory or SharedDirectory()
+        self._lock = threading.RLock()
+
+        self.employees_by_code = OrderedDict()
+        self.missing_codes = {}  # emp_code -> time.monotonic(), до которого кода нет
+        # Ключи терминалов - (source_id, terminal_id): ID уникальны только в пределах сервера СКУД
+        self.all_terminals_by_id = {}
+        self.monitored_terminals = {}
+        self._monitored_sources = set()
+
+        self._terminals_dirty = True
+        self._version = None
+        self._checked_at = 0.0
+        # После ошибки Redis какое-то время читаем из БД, не дожидаясь таймаутов
+        self._redis_down_until = 0.0
+        # Растет при каждом сбросе - чтобы не записать в кэш устаревшие данные
+        self._generation = 0
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, e: Exception):
+        if self._redis_available():
+            logger.warning(f"Общий справочник недоступен, читаем из БД - {e}")
+        self._redis_down_until = time.monotonic() + self.REDIS_RETRY_DELAY
+
+    def load(self):
+        """Загружаем сотрудников и терминалы в память"""
+        try:
+            self.directory.ensure_ready()
+            version = self.directory.version()
+            employees = self.directory.all_employees()
+        except RedisError as e:
+            self._redis_failed(e)
+            version = None
+            employees = {emp.emp_code: emp for emp in Employee.objects.order_by('-id')}
+
+        with self._lock:
+            self._version = version
+            self._checked_at = time.monotonic()
+            self.employees_by_code = OrderedDict(list(employees.items())[-self.local_size:])
+            self.missing_codes = {}
+
+        self._load_terminals()
+
+    def _load_terminals(self):
+        terminals = None
+        if self._redis_available():
+            try:
+                terminals = self.directory.all_terminals()
+            except RedisError as e:
+                self._redis_failed(e)
+
+        if terminals is None:
+            terminals = {(term.source_id, term.terminal_id): term for term in Terminal.objects.all()}
+
+        with self._lock:
+            self.all_terminals_by_id = terminals
+            self.monitored_terminals = {key: t for key, t in terminals.items() if t.is_monitored}
+            self._monitored_sources = {source_id for source_id, _ in self.monitored_terminals}
+            self._terminals_dirty = False
+
+    def _check_version(self):
+        """Сбросить локальную копию, если версия общего справочника изменилась"""
+        now = time.monotonic()
+        if now - self._checked_at < self.version_check_interval or not self._redis_available():
+            return
+        self._checked_at = now
+
+        try:
+            version = self.directory.version()
+            if version is None:
+                # Redis очищен - заполняем справочник заново
+                self.directory.ensure_ready()
+                version = self.directory.version()
+        except RedisError as e:
+            self._redis_failed(e)
+            return
+
+        if version != self._version:
+            with self._lock:
+                self._version = version
+                self._generation += 1
+                self.employees_by_code = OrderedDict()
+                self.missing_codes = {}
+                self._terminals_dirty = True
+
+    def _fetch_employee(self, emp_code: str) -> Optional[Employee]:
+        if self._redis_available() and self._version is not None:
+            try:
+                return self.directory.get_employee(emp_code)
+            except RedisError as e:
+                self._redis_failed(e)
+
+        return Employee.objects.filter(emp_code=emp_code).order_by('id').first()
+
+    def get_employee(self, emp_code: str) -> Optional[Employee]:
+        """Найти сотрудника по коду (в Redis/БД идем только при промахе кэша)"""
+        if not emp_code:  # emp_code может быть пустым
+            return None
+
+        self._check_version()
+
+        with self._lock:
+            employee = self.employees_by_code.get(emp_code)
+            if employee:
+                self.employees_by_code.move_to_end(emp_code)
+                return employee
+
+            missing_until = self.missing_codes.get(emp_code)
+            if missing_until and missing_until > time.monotonic():
+                return None
+
+            generation = self._generation
+
+        employee = self._fetch_employee(emp_code)
+
+        with self._lock:
+            # Пока шел запрос, запись могли изменить - тогда не кэшируем
+            if generation != self._generation:
+                return employee
+
+            if employee:
+                self.employees_by_code[emp_code] = employee
+                if len(self.employees_by_code) > self.local_size:
+                    self.employees_by_code.popitem(last=False)
+                self.missing_codes.pop(emp_code, None)
+            else:
+                self.missing_codes[emp_code] = time.monotonic() + self.negative_ttl
+
+        return employee
+
+    def _ensure_terminals(self):
+        self._check_version()
+        if self._terminals_dirty:
+            self._load_terminals()
+
+    def get_terminal(self, source_id: int, terminal_id: int) -> Optional[Terminal]:
+        self._ensure_terminals()
+        return self.all_terminals_by_id.get((source_id, terminal_id))
+
+    def add_terminal(self, terminal: Terminal):
+        key = (terminal.source_id, terminal.terminal_id)
+        with self._lock:
+            self.all_terminals_by_id[key] = terminal
+            if terminal.is_monitored:
+                self.monitored_terminals[key] = terminal
+                self._monitored_sources.add(terminal.source_id)
+
+    def should_process_terminal(self, source_id: int, terminal_id: int) -> bool:
+        """Нужно ли обрабатывать этот терминал? (без отслеживаемых на сервере - все)"""
+        self._ensure_terminals()
+        if source_id in self._monitored_sources:
+            return (source_id, terminal_id) in self.monitored_terminals
+        return True
+
+    def invalidate_employees(self, emp_codes: Optional[Iterable[str]] = None):
+        with self._lock:
+            self._generation += 1
+            if emp_codes is None:
+                self.employees_by_code = OrderedDict()
+                self.missing_codes = {}
+                return
+
+            for emp_code in emp_codes:
+                self.employees_by_code.pop(emp_code, None)
+                self.missing_codes.pop(emp_code, None)
+
+    def invalidate_terminals(self):
+        # Терминалов немного - перечитываем их целиком при следующем обращении
+        with self._lock:
+            self._generation += 1
+            self._terminals_dirty = True
+
+    def apply_message(self, data: str):
+        """Применить сообщение о сбросе из канала"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning(f"Некорректное сообщение сброса кэша: {data}")
+            return
+
+        if message.get('kind') == 'employee':
+            self.invalidate_employees(message.get('keys'))
+        elif message.get('kind') == 'terminal':
+            self.invalidate_terminals()
+
+        # Версия уже увеличена - сверимся с ней при следующем обращении
+        self._checked_at = 0.0
+
+        logger.info(f"Сброс кэша: {message.get('kind')} {message.get('keys') or 'все'}")
+
+    def start_listener(self):
+        """Слушать канал сброса кэша в фоновом потоке"""
+        thread = threading.Thread(target=self._listen, name='lookup-cache-listener', daemon=True)
+        thread.start()
+        return thread
+
+    def _listen(self):
+        channel = settings.LOOKUP_CACHE_CONFIG['CHANNEL']
+
+        while True:
+            try:
+                pubsub = create_pubsub()
+                pubsub.subscribe(channel)
+                logger.info(f"Подписка на сброс кэша: {channel}")
+
+                # Пока не были подписаны, могли пропустить изменения - сверяем версию
+                self._checked_at = 0.0
+
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self.apply_message(message['data'])
+
+            except Exception as e:
+                logger.warning(f"Подписка на сброс кэша прервана - {e}")
+
+            time.sleep(5)
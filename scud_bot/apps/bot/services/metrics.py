@@ -0,0 +1,183 @@
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Гистограммы по времени (секунды)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Описание всех метрик: имя -> (тип, описание, границы корзин для гистограмм)
+METRICS = {
+    'skud_poll_duration_seconds': ('histogram', 'Длительность запроса новых записей к СКУД', LATENCY_BUCKETS),
+    'skud_poll_rows': ('histogram', 'Новых записей за один опрос СКУД', (0, 1, 5, 10, 25, 50, 100)),
+    'skud_poll_errors_total': ('counter', 'Ошибки опроса СКУД', None),
+    'skud_ingest_lag_seconds': ('gauge', 'Отставание: сейчас минус время последней сохраненной отметки', None),
+    'skud_db_write_duration_seconds': ('histogram', 'Время записи пачки новых отметок в БД', LATENCY_BUCKETS),
+    'skud_leader_transitions_total': ('counter', 'Смены роли реплики монитора (лидер/резерв)', None),
+    'skud_cookie_refresh_total': ('counter', 'Обновления сессионной куки СКУД', None),
+    'telegram_send_duration_seconds': ('histogram', 'Длительность отправки сообщения в Telegram', LATENCY_BUCKETS),
+    'telegram_send_total': ('counter', 'Отправленные сообщения Telegram', None),
+    'telegram_send_failures_total': ('counter', 'Неудачные отправки сообщений Telegram', None),
+    'autologout_run_duration_seconds': ('gauge', 'Длительность последнего запуска автовыхода', None),
+    'autologout_success_ratio': ('gauge', 'Доля успешных выходов в последнем запуске автовыхода', None),
+    'autologout_processed': ('gauge', 'Сотрудников в последнем запуске автовыхода', None),
+    'autologout_runs_total': ('counter', 'Запуски автовыхода', None),
+    'stream_published_total': ('counter', 'Отметки, опубликованные в поток Redis', None),
+    'stream_publish_errors_total': ('counter', 'Ошибки публикации отметок в поток Redis', None),
+    'webhook_request_duration_seconds': ('histogram', 'Длительность запроса к получателю событий', LATENCY_BUCKETS),
+    'webhook_request_failures_total': ('counter', 'Неудачные запросы к получателям событий', None),
+    'webhook_events_delivered_total': ('counter', 'События, доставленные получателям', None),
+    'webhook_dead_letters_total': ('counter', 'Пачки событий, перенесенные в недоставленные', None),
+    'broadcast_sent_total': ('counter', 'Сообщения рассылок, отправленные получателям', None),
+    'broadcast_failed_total': ('counter', 'Сообщения рассылок, не доставленные после всех попыток', None),
+    'broadcast_throttled_total': ('counter', 'Ответы Telegram 429 (пауза) при рассылке', None),
+}
+
+COUNTERS_KEY = 'scud:metrics:counters'
+GAUGES_KEY = 'scud:metrics:gauges'
+
+
+# Граница корзины гистограммы в имени ряда
+BUCKET_BOUND = re.compile(r'[{,]le="([^"]*)"')
+
+
+def _escape(value: str) -> str:
+    """Значение метки по правилам текстового формата Prometheus"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    inner = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f'{name}{{{inner}}}'
+
+
+class MetricsRegistry:
+    """Метрики процесса: копятся в памяти и периодически сбрасываются в Redis
+
+    Redis служит локальным агрегатором для всех процессов (монитор, бот,
+    Celery, gunicorn), эндпоинт /metrics читает оттуда уже сложенные значения.
+    """
+
+    def __init__(self):
+        self.flush_interval = settings.METRICS_CONFIG['FLUSH_INTERVAL']
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._flushed_at = time.monotonic()
+
+    @staticmethod
+    def _labels(labels: dict) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _series(name, self._labels(labels))
+        with self._lock:
+            self._counters[key] += value
+
+    def set(self, name: str, value: float, **labels):
+        key = _series(name, self._labels(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Добавить значение в гистограмму (накопительные корзины как в Prometheus)"""
+        buckets = METRICS[name][2]
+        label_items = self._labels(labels)
+
+        with self._lock:
+            for bound in buckets:
+                # Нулевые корзины тоже пишем - у гистограммы должен быть полный набор границ
+                self._counters[_series(f'{name}_bucket', label_items + (('le', str(bound)),))] += value <= bound
+            self._counters[_series(f'{name}_bucket', label_items + (('le', '+Inf'),))] += 1
+            self._counters[_series(f'{name}_sum', label_items)] += value
+            self._counters[_series(f'{name}_count', label_items)] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def flush(self, force: bool = False):
+        """Сбросить накопленное в Redis (не чаще FLUSH_INTERVAL, если не force)"""
+        if not force and time.monotonic() - self._flushed_at < self.flush_interval:
+            return
+
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(float)
+            gauges, self._gauges = self._gauges, {}
+            self._flushed_at = time.monotonic()
+
+        if not counters and not gauges:
+            return
+
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for key, value in counters.items():
+                pipe.hincrbyfloat(COUNTERS_KEY, key, value)
+            if gauges:
+                pipe.hset(GAUGES_KEY, mapping=gauges)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Не удалось выгрузить метрики - {e}")
+            # Вернем обратно, чтобы не потерять счетчики до следующей попытки
+            with self._lock:
+                for key, value in counters.items():
+                    self._counters[key] += value
+                for key, value in gauges.items():
+                    self._gauges.setdefault(key, value)
+
+
+def _metric_name(series: str) -> str:
+    name = series.split('{', 1)[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def render_prometheus() -> str:
+    """Собрать все метрики из Redis в текстовый формат Prometheus"""
+    redis = get_redis()
+    values = {}
+    values.update(redis.hgetall(COUNTERS_KEY))
+    values.update(redis.hgetall(GAUGES_KEY))
+
+    by_metric = defaultdict(list)
+    for series, value in values.items():
+        by_metric[_metric_name(series)].append((series, value))
+
+    lines = []
+    for name in sorted(by_metric):
+        kind, help_text, _ = METRICS.get(name, ('untyped', '', None))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for series, value in sorted(by_metric[name], key=lambda item: _sort_key(item[0])):
+            lines.append(f'{series} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _sort_key(series: str):
+    # Корзины гистограммы - по возрастанию границы, +Inf в конце
+    match = BUCKET_BOUND.search(series)
+    if match:
+        bound = match.group(1)
+        return series[:match.start()], float('inf') if bound == '+Inf' else float(bound)
+    return series, 0.0
+
+
+metrics = MetricsRegistry()
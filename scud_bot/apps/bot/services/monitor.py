@@ -1,100 +1,132 @@
 import requests
+import threading
 import time
 import logging
-from typing import Optional, List
+from pathlib import Path
+from typing import Dict, Optional, List
 from django.conf import settings
+from django.db import connection
+from django.db.models import Max
 from django.utils import timezone
 from datetime import datetime
 
-from ..models import Employee, Terminal, Transaction
-from .bot import TelegramBot
+from ..models import Anomaly, Employee, SkudSource, Terminal, Transaction
+from .anomalies import AnomalyEngine, save_anomalies
 from .autologger import AutoLogger
+from .capture import TrafficRecorder
+from .feeds import TerminalFeeds
+from .leader import LeaderLease
+from .lookup_cache import LookupCache
+from .metrics import metrics
+from .notifications import deliver_punch_notification, schedule_punch_notification
+from .occupancy import update_occupancy
+from .punch_stream import publish_punches
+from .tracing import NO_TRACE, Tracer
+from .summaries import update_summaries
+from .visits import update_visits
 
 logger = logging.getLogger(__name__)
 
 
 class SKUDMonitor:
-    """Класс для мониторинга СКУД"""
+    """Мониторинг одного сервера СКУД (по умолчанию - основного)"""
 
-    def __init__(self):
-        self.base_url = settings.SKUD_CONFIG['BASE_URL']
-        self.session_cookie = settings.SKUD_CONFIG['SESSION_COOKIE']
+    PAGE_SIZE = 50
+
+    def __init__(self, source: Optional[SkudSource] = None, capture_path: Optional[str] = None,
+                 notifications: bool = True, cache: Optional[LookupCache] = None):
+        self.source = source or SkudSource.get_default()
+        self.base_url = self.source.base_url
+        self.session_cookie = self.source.session_cookie
         self.last_id = 0
-        self.autologger = AutoLogger(base_url=self.base_url)
+        self.autologger = AutoLogger(base_url=self.base_url, credentials=self.source.credentials)
+
+        # Опросы подряд с ошибкой - пауза между ними растет (у каждого сервера своя)
+        self.failures = 0
+        self.stop_event = threading.Event()
+
+        # При воспроизведении журнала уведомления отключены
+        self.notifications = notifications
+
+        # Аренда лидера (при нескольких репликах опрашивает только лидер)
+        self.lease = None
+
+        # Запись ответов СКУД для воспроизведения (replay_monitor)
+        capture_path = capture_path or settings.SKUD_CONFIG.get('CAPTURE_PATH')
+        self.recorder = TrafficRecorder(capture_path) if capture_path else None
+        if self.recorder:
+            logger.info(f"Ответы СКУД записываются в {capture_path}")
+
+        # Для метрик: время записи в БД за текущий опрос и последняя сохраненная отметка
+        self._db_write_time = 0.0
+        self._newest_punch_time = None
+        self._stored: List[Transaction] = []
+        self._anomalies: List[Anomaly] = []
+
+        # Ленты проходов для руководителей (индекс подписок по терминалам)
+        self.feeds = TerminalFeeds()
+
+        # Правила аномалий: история сотрудников этого сервера - в памяти, без чтения из БД
+        self.anomaly_engine = AnomalyEngine() if settings.ANOMALY_CONFIG['ENABLED'] else None
 
-        # Кэш
-        self.employees_by_code = {}
-        self.all_terminals_by_id = {}
-        self.monitored_terminals = {}
+        # Трассировка стадий обработки каждой отметки
+        self.tracer = Tracer(source_id=self.source.id)
 
-        self._load_cache()
+        # Кэш сотрудников и терминалов (сбрасывается по событиям из админки),
+        # при опросе нескольких серверов - общий для всех
+        self._own_cache = cache is None
+        self.cache = cache or LookupCache()
+        if self._own_cache:
+            self._load_cache()
 
     def _load_cache(self):
         """Загружаем сотрудников и терминалы в память"""
-        # Сотрудники по коду
-        for emp in Employee.objects.all():
-            self.employees_by_code[emp.emp_code] = emp
+        self.cache.load()
 
-        # Все терминалы
-        for term in Terminal.objects.all():
-            self.all_terminals_by_id[term.terminal_id] = term
-            if term.is_monitored:
-                self.monitored_terminals[term.terminal_id] = term
+        monitored_count = len(self.cache.monitored_terminals)
+        total_count = len(self.cache.all_terminals_by_id)
 
-        monitored_count = len(self.monitored_terminals)
-        total_count = len(self.all_terminals_by_id)
-
-        logger.info(f"Загружено {len(self.employees_by_code)} сотрудников")
+        logger.info(f"Загружено {len(self.cache.employees_by_code)} сотрудников")
         logger.info(f"Терминалов: {monitored_count} отслеживаемых из {total_count} всего")
 
         if monitored_count > 0:
             logger.info("Отслеживаемые терминалы:")
-            for term in self.monitored_terminals.values():
+            for term in self.cache.monitored_terminals.values():
                 logger.info(f"   - {term.terminal_alias} (ID: {term.terminal_id})")
 
     def _get_employee(self, emp_code: str) -> Optional[Employee]:
         """Найти сотрудника по коду"""
-        # поиск сотрудника в кеше
-        employee = self.employees_by_code.get(emp_code)
-
-        # если нет в кеше, проверяем не добавили ли его
-        if not employee and emp_code:  # emp_code может быть пустым
-            try:
-                employee = Employee.objects.get(emp_code=emp_code)
-                # добавляем в кеш
-                self.employees_by_code[emp_code] = employee
-                logger.info(f"Найден новый сотрудник в БД - {employee.name} ({emp_code})")
-            except Employee.DoesNotExist:
-                pass
-
-        return employee
+        return self.cache.get_employee(emp_code)
 
     def _should_process_terminal(self, terminal_id: int) -> bool:
         """Нужно ли обрабатывать этот терминал?"""
-        if self.monitored_terminals:
-            return terminal_id in self.monitored_terminals
-        return True
+        return self.cache.should_process_terminal(self.source.id, terminal_id)
 
     def _get_terminal_or_create(self, skud_data: dict) -> Optional[Terminal]:
         """Получить или создать терминал"""
         terminal_id = skud_data.get('terminal')
 
         # Если терминал уже в базе
-        if terminal_id in self.all_terminals_by_id:
-            return self.all_terminals_by_id[terminal_id]
+        terminal = self.cache.get_terminal(self.source.id, terminal_id)
+        if terminal:
+            return terminal
 
         # Создаем новый
         try:
-            terminal = Terminal.objects.create(
+            terminal, created = Terminal.objects.get_or_create(
+                source=self.source,
                 terminal_id=terminal_id,
-                terminal_sn=skud_data.get('terminal_sn', ''),
-                terminal_alias=skud_data.get('terminal_alias', 'Неизвестный'),
-                area_alias=skud_data.get('area_alias', ''),
-                is_monitored=False
+                defaults={
+                    'terminal_sn': skud_data.get('terminal_sn', ''),
+                    'terminal_alias': skud_data.get('terminal_alias', 'Неизвестный'),
+                    'area_alias': skud_data.get('area_alias', ''),
+                    'is_monitored': False,
+                }
             )
 
-            self.all_terminals_by_id[terminal_id] = terminal
-            logger.info(f"🆕 Создан терминал: {terminal.terminal_alias} (ID: {terminal_id})")
+            self.cache.add_terminal(terminal)
+            if created:
+                logger.info(f"🆕 Создан терминал: {terminal.terminal_alias} (ID: {terminal_id})")
             return terminal
 
         except Exception as e:
@@ -108,13 +140,43 @@ class SKUDMonitor:
         params = {
             'format': 'json',
             'ordering': '-id',
-            'page_size': 50,
+            'page_size': self.PAGE_SIZE,
         }
 
+        poll_started = time.perf_counter()
+        data = self._fetch_page(url, params)
+        if data is None:
+            self.failures += 1
+            return []
+        self.failures = 0
+        metrics.observe('skud_poll_duration_seconds', time.perf_counter() - poll_started,
+                        source=self.source.code)
+
+        # С прошлого опроса записей больше, чем на одной странице - догоняем по следующим
+        items = list(data.get('data', []))
+        page = 1
+        while (self.last_id and page < settings.SKUD_CONFIG['CATCHUP_PAGES']
+               and len(data.get('data', [])) >= self.PAGE_SIZE
+               and all(item['id'] > self.last_id for item in data['data'])):
+            page += 1
+            logger.info(f"Догоняем пропущенные записи: страница {page}")
+            data = self._fetch_page(url, dict(params, page=page), page=page)
+            if data is None:
+                # Иначе курсор перескочит через недочитанные страницы - повторим опрос целиком
+                self.failures += 1
+                return []
+            items.extend(data.get('data', []))
+
+        return self.extract_new_transactions({'data': items})
+
+    def _fetch_page(self, url: str, params: dict, page: int = 1) -> Optional[dict]:
+        """Одна страница ответа СКУД (с обновлением куки при 401), None - при ошибке"""
         headers = {}
         if self.session_cookie:
             headers['Cookie'] = f'sessionid={self.session_cookie}'
 
+        poll_started = time.perf_counter()
+
         try:
             logger.debug(f"Запрос к {url}")
             response = requests.get(url, params=params, headers=headers, timeout=15)
@@ -126,37 +188,135 @@ class SKUDMonitor:
 
                 if new_cookie:
                     self.session_cookie = new_cookie
+                    # Куку подхватят другие реплики и API выгрузки
+                    SkudSource.objects.filter(pk=self.source.pk).update(session_cookie=new_cookie)
 
                     # запрос с новой кукой
                     headers['Cookie'] = f'sessionid={new_cookie}'
                     response = requests.get(url, params=params, headers=headers, timeout=15)
                 else:
                     logger.error("Не удалось получить новую куку")
-                    return []
+                    if self.recorder:
+                        self.recorder.record(response.status_code, (time.perf_counter() - poll_started) * 1000,
+                                             body=response.text, page=page)
+                    return None
 
-            response.raise_for_status()
-            data = response.json()
-
-            new_transactions = []
-            for item in data.get('data', []):
-                if item['id'] > self.last_id:
-                    self.last_id = item['id']
-                    new_transactions.append(item)
+            if self.recorder:
+                self.recorder.record(response.status_code, (time.perf_counter() - poll_started) * 1000,
+                                     body=response.text, page=page)
 
-            return new_transactions
+            response.raise_for_status()
+            return response.json()
 
         except requests.exceptions.HTTPError as e:
+            metrics.inc('skud_poll_errors_total', kind='http', source=self.source.code)
             if e.response.status_code == 401:
                 logger.error("Ошибка авторизации после попытки обновления")
             else:
                 logger.error(f"Ошибка HTTP - {e}")
-            return []
+            return None
         except Exception as e:
+            metrics.inc('skud_poll_errors_total', kind='request', source=self.source.code)
             logger.error(f"Ошибка запроса -- {e}")
+            if self.recorder and isinstance(e, requests.exceptions.RequestException):
+                self.recorder.record(None, (time.perf_counter() - poll_started) * 1000, error=str(e), page=page)
+            return None
+
+    def extract_new_transactions(self, data: dict) -> List[dict]:
+        """Отобрать из ответа СКУД еще не обработанные записи (по возрастанию ID)
+
+        Без курсора (первый запуск на пустой БД) начинаем с последней записи
+        СКУД, не обрабатывая историю.
+        """
+        items = data.get('data', [])
+        if not items:
+            metrics.observe('skud_poll_rows', 0, source=self.source.code)
             return []
 
+        if not self.last_id:
+            self.last_id = max(item['id'] for item in items)
+            logger.info(f"Курсор не найден - начинаем после записи {self.last_id}")
+            self.save_cursor(self.last_id)
+            metrics.observe('skud_poll_rows', 0, source=self.source.code)
+            return []
+
+        new_transactions = sorted((item for item in items if item['id'] > self.last_id),
+                                  key=lambda item: item['id'])
+        if new_transactions:
+            self.last_id = new_transactions[-1]['id']
+
+        metrics.observe('skud_poll_rows', len(new_transactions), source=self.source.code)
+        return new_transactions
+
+    def resume_cursor(self):
+        """Продолжить с последней обработанной записи (при старте и смене лидера)
+
+        Курсор хранится в SkudSource.last_id, максимальный skud_id сервера в
+        БД - страховка, если курсор не успели сохранить.
+        """
+        stored = SkudSource.objects.filter(pk=self.source.pk).values_list('last_id', flat=True).first()
+        saved = Transaction.objects.filter(source=self.source, skud_id__gt=0).aggregate(last=Max('skud_id'))['last']
+        self.last_id = max(stored or 0, saved or 0)
+        if self.last_id:
+            logger.info(f"Курсор: продолжаем после записи {self.last_id}")
+
+    def save_cursor(self, last_id: int):
+        """Сохранить курсор (только вперед - воспроизведение старого журнала его не откатит)"""
+        SkudSource.objects.filter(pk=self.source.pk, last_id__lt=last_id).update(last_id=last_id)
+
+    def process_batch(self, new_transactions: List[dict], fetched_at: float, fetch_ms: float):
+        """Обработать новые записи одного опроса"""
+        if not new_transactions:
+            logger.debug("Нет новых записей")
+            return
+
+        logger.info(f"Получено {len(new_transactions)} новых записей")
+
+        self._db_write_time = 0.0
+        self._stored = []
+        self._anomalies = []
+        processed_id = None
+        for i, data in enumerate(new_transactions):
+            # Долгая пачка: продлеваем аренду, а если ее забрала другая реплика - останавливаемся
+            if self.lease and not self.lease.keep_alive():
+                logger.warning(f"Лидерство потеряно, необработанные записи остаются новому лидеру "
+                               f"({len(new_transactions) - i} шт.)")
+                break
+            logger.debug(f"  {i + 1}. ID {data.get('id')} - {data.get('emp_code')}")
+            trace = self.tracer.start(data, fetched_at, fetch_ms)
+            self.process_transaction(data, trace)
+            processed_id = data.get('id')
+        metrics.observe('skud_db_write_duration_seconds', self._db_write_time, source=self.source.code)
+        self.tracer.flush()
+
+        # Событие в поток - для других систем, ленты - руководителям (при воспроизведении журнала - нет).
+        # Сразу после записи: производные данные ниже пересобираются синхронно и задержали бы доставку
+        if self.notifications:
+            publish_punches(self._stored)
+            try:
+                self.feeds.dispatch(self._stored)
+            except Exception as e:
+                logger.error(f"Ошибка рассылки лент проходов - {e}")
+
+        # Визиты, загруженность и сводки для бота - всей пачкой; ошибка тут не должна мешать приему отметок
+        try:
+            update_visits(self._stored)
+            update_occupancy(self._stored)
+            update_summaries(self._stored)
+        except Exception as e:
+            logger.error(f"Ошибка сборки визитов, загруженности и сводок - {e}")
+
+        try:
+            save_anomalies(self._anomalies, alert=self.notifications)
+        except Exception as e:
+            logger.error(f"Ошибка записи аномалий - {e}")
+
+        # Сохраняем только обработанное - недоделанное дочитает новый лидер
+        if processed_id:
+            self.save_cursor(processed_id)
+
 
-    def process_transaction(self, skud_data: dict):
+    def process_transaction(self, skud_data: dict, trace=NO_TRACE):
         """Обработать одну транзакцию"""
         trans_id = skud_data.get('id')
         emp_code = skud_data.get('emp_code')
@@ -166,22 +326,28 @@ class SKUDMonitor:
 
         logger.info(f"Обработка ID {trans_id}: сотр. {emp_code}, терм. {terminal_id}, {action} в {punch_time}")
 
-        # Проверяем терминал
-        if not self._should_process_terminal(terminal_id):
-            logger.debug(f"Пропуск терминала {terminal_id}")
-            return
+        with trace.span('lookup'):
+            # Проверяем терминал
+            if not self._should_process_terminal(terminal_id):
+                logger.debug(f"Пропуск терминала {terminal_id}")
+                return
+
+            # Ищем сотрудника (может быть None)
+            employee = self._get_employee(emp_code)
 
-        # Ищем сотрудника (может быть None)
-        employee = self._get_employee(emp_code)
+            # Получаем терминал
+            terminal = self._get_terminal_or_create(skud_data)
 
-        # Получаем терминал
-        terminal = self._get_terminal_or_create(skud_data)
         if not terminal:
             logger.error(f"Не удалось получить терминал {terminal_id}")
             return
 
         # Проверяем дубликат
-        if Transaction.objects.filter(skud_id=trans_id).exists():
+        write_started = time.perf_counter()
+        with trace.span('insert'):
+            is_duplicate = Transaction.objects.filter(source=self.source, skud_id=trans_id).exists()
+        if is_duplicate:
+            self._db_write_time += time.perf_counter() - write_started
             logger.debug(f"Дубликат ID {trans_id}, пропускаем")
             return
 
@@ -199,24 +365,36 @@ class SKUDMonitor:
 
         # Сохраняем транзакцию с emp_code
         try:
-            transaction = Transaction.objects.create(
-                skud_id=trans_id,
-                employee=employee,
-                emp_code=emp_code,
-                terminal=terminal,
-                punch_time=aware_dt,
-                punch_state=skud_data['punch_state'],
-                verify_type=skud_data['verify_type'],
-            )
+            with trace.span('insert'):
+                transaction = Transaction.objects.create(
+                    source=self.source,
+                    skud_id=trans_id,
+                    employee=employee,
+                    emp_code=emp_code,
+                    terminal=terminal,
+                    punch_time=aware_dt,
+                    punch_state=skud_data['punch_state'],
+                    verify_type=skud_data['verify_type'],
+                )
+            self._db_write_time += time.perf_counter() - write_started
+            trace.mark_stored(aware_dt)
+            self._stored.append(transaction)
+
+            if self.anomaly_engine:
+                self._anomalies.extend(self.anomaly_engine.check(transaction))
+
+            if self._newest_punch_time is None or aware_dt > self._newest_punch_time:
+                self._newest_punch_time = aware_dt
 
             # Логируем
             if employee:
                 logger.info(f"СОХРАНЕНО: {employee} - {terminal.terminal_alias}")
 
                 # Отправляем уведомление если нужно
-                if employee.can_receive_notifications and terminal.is_monitored:
+                if self.notifications and employee.wants_instant_notifications and terminal.is_monitored:
                     logger.info(f"[УВЕДОМЛЕНИЕ] Отправляю {employee.name}")
-                    self._send_notification(employee, transaction)
+                    with trace.span('enqueue'):
+                        self._send_notification(employee, transaction, trace.fetched_at)
             else:
                 logger.info(f"СОХРАНЕНО: Сотр. {emp_code} - {terminal.terminal_alias}")
 
@@ -225,58 +403,169 @@ class SKUDMonitor:
             import traceback
             logger.error(traceback.format_exc())
 
-    def _send_notification(self, employee: Employee, transaction: Transaction):
-        """Отправить уведомление"""
+    def _send_notification(self, employee: Employee, transaction: Transaction,
+                           fetched_at: Optional[float] = None):
+        """Поставить уведомление в очередь Celery с окном объединения (при недоступности - отправить сразу)"""
         try:
-            action = "вход" if transaction.is_entry else "выход"
-            location = transaction.terminal.terminal_alias
-
-            # transaction.punch_time уже в московском времени
-            time_str = transaction.punch_time.strftime('%H:%M')
-            date_str = transaction.punch_time.strftime('%d.%m.%Y')
-
-            # Создаем сообщение в зависимости от типа события
-            if action == "вход":
-                message = f"Вы прибыли на пункт {location} в {time_str} {date_str}"
-            else:  # выход
-                message = f"Вы покинули пункт {location} в {time_str} {date_str}"
-
-            # Отправляем через бота
-            bot = TelegramBot()
-            success = bot.send_message(employee.telegram_id, message)
-
-            if success:
-                logger.info(f"Уведомление отправлено {employee.name}")
-            else:
-                logger.warning(f"Не удалось отправить уведомление {employee.name}")
+            schedule_punch_notification(employee, transaction, fetched_at)
+            return
+        except Exception as e:
+            logger.warning(f"Очередь недоступна, отправляю уведомление сразу - {e}")
 
+        try:
+            deliver_punch_notification(employee, transaction, fetched_at)
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления - {e}")
 
+    def poll_delay(self) -> float:
+        """Пауза до следующего опроса: после ошибок растет вдвое, до MAX_BACKOFF"""
+        interval = settings.SKUD_CONFIG['POLL_INTERVAL']
+        if not self.failures:
+            return interval
+        return min(interval * 2 ** self.failures, settings.SKUD_CONFIG['MAX_BACKOFF'])
+
+    def stop(self):
+        self.stop_event.set()
+
     def run(self):
-        """Запуск мониторинга"""
-        logger.info("МОНИТОРИНГ СКУД ЗАПУЩЕН")
+        """Запуск мониторинга (до stop() или Ctrl+C)"""
+        logger.info(f"МОНИТОРИНГ СКУД ЗАПУЩЕН: {self.source} ({self.base_url})")
         logger.info("=" * 60)
 
-        while True:
-            try:
-                # Получаем новые транзакции
-                new_transactions = self.fetch_new_transactions()
+        if self._own_cache:
+            self.cache.start_listener()
 
-                if new_transactions:
-                    logger.info(f"Получено {len(new_transactions)} новых записей")
+        if settings.LEADER_CONFIG['ENABLED']:
+            # Аренда у каждого сервера своя - серверы распределяются между репликами
+            self.lease = LeaderLease(f'monitor:{self.source.code}')
+        leading = False
+        labels = {'source': self.source.code}
 
-                    for i, data in enumerate(new_transactions):
-                        logger.debug(f"  {i + 1}. ID {data.get('id')} - {data.get('emp_code')}")
-                        self.process_transaction(data)
-                else:
-                    logger.debug("Нет новых записей")
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    # Опрашивает только лидер, остальные реплики ждут истечения его аренды
+                    if self.lease and not self.lease.heartbeat():
+                        if leading:
+                            leading = False
+                            metrics.inc('skud_leader_transitions_total', role='standby', **labels)
+                            logger.warning(f"Монитор {self.source.code} переведен в резерв")
+                        self.stop_event.wait(settings.LEADER_CONFIG['STANDBY_INTERVAL'])
+                        continue
+
+                    if not leading:
+                        leading = True
+                        metrics.inc('skud_leader_transitions_total', role='leader', **labels)
+                        self.resume_cursor()
+
+                    # Получаем новые транзакции
+                    fetched_at = time.time()
+                    new_transactions = self.fetch_new_transactions()
+                    fetch_ms = (time.time() - fetched_at) * 1000
+
+                    self.process_batch(new_transactions, fetched_at, fetch_ms)
+
+                    if self._newest_punch_time:
+                        lag = (timezone.now() - self._newest_punch_time).total_seconds()
+                        metrics.set('skud_ingest_lag_seconds', lag, **labels)
+                    metrics.flush()
+
+                    self.stop_event.wait(self.poll_delay())
+
+                except KeyboardInterrupt:
+                    logger.info("Мониторинг остановлен")
+                    break
+                except Exception as e:
+                    logger.error(f"Критическая ошибка ({self.source.code}): {e}")
+                    self.stop_event.wait(30)
+        finally:
+            # Сразу отдаем лидерство резервной реплике (деплой, остановка контейнера)
+            if self.lease:
+                self.lease.release()
+            if self.recorder:
+                self.recorder.close()
+
+
+class MultiSourceMonitor:
+    """Опрос всех включенных серверов СКУД одновременно: по потоку на сервер
+
+    Список серверов перечитывается каждые SOURCES_REFRESH секунд: новые
+    запускаются, выключенные и удаленные останавливаются, а измененные в
+    админке (адрес, учетная запись) - перезапускаются.
+    """
+
+    def __init__(self, capture_path: Optional[str] = None, codes: Optional[List[str]] = None):
+        self.capture_path = capture_path or settings.SKUD_CONFIG.get('CAPTURE_PATH')
+        self.codes = codes
+        self.cache = LookupCache()
+        self.monitors: Dict[str, SKUDMonitor] = {}
+        self.threads: Dict[str, threading.Thread] = {}
+
+    def _enabled_sources(self) -> Dict[str, SkudSource]:
+        sources = SkudSource.objects.filter(is_enabled=True)
+        if self.codes:
+            sources = sources.filter(code__in=self.codes)
+        return {source.code: source for source in sources}
+
+    def _source_capture_path(self, code: str) -> Optional[str]:
+        """Журнал у каждого сервера свой - иначе ответы разных СКУД перемешаются"""
+        if not self.capture_path:
+            return None
+        if '{source}' in self.capture_path:
+            return self.capture_path.replace('{source}', code)
+        path = Path(self.capture_path)
+        return str(path.with_name(f'{code}-{path.name}'))
+
+    def sync_sources(self):
+        sources = self._enabled_sources()
+
+        for code in list(self.monitors):
+            monitor = self.monitors[code]
+            source = sources.get(code)
+            if source is not None and source.updated_at == monitor.source.updated_at \
+                    and self.threads[code].is_alive():
+                continue
+            logger.info(f"Останавливаем опрос {code}")
+            monitor.stop()
+            del self.monitors[code]
+            del self.threads[code]
+
+        for code, source in sources.items():
+            if code in self.monitors:
+                continue
+            monitor = SKUDMonitor(source=source, capture_path=self._source_capture_path(code),
+                                  cache=self.cache)
+            thread = threading.Thread(target=self._run_monitor, args=(monitor,),
+                                      name=f'monitor-{code}', daemon=True)
+            self.monitors[code] = monitor
+            self.threads[code] = thread
+            thread.start()
+
+    @staticmethod
+    def _run_monitor(monitor: SKUDMonitor):
+        try:
+            monitor.run()
+        finally:
+            # у каждого потока свое соединение с БД - закрываем его
+            connection.close()
 
-                time.sleep(settings.SKUD_CONFIG['POLL_INTERVAL'])
+    def run(self):
+        self.cache.load()
+        logger.info(f"Загружено {len(self.cache.employees_by_code)} сотрудников, "
+                    f"{len(self.cache.all_terminals_by_id)} терминалов")
+        self.cache.start_listener()
 
-            except KeyboardInterrupt:
-                logger.info("Мониторинг остановлен")
-                break
-            except Exception as e:
-                logger.error(f"Критическая ошибка: {e}")
-                time.sleep(30)
\ No newline at end of file
+        try:
+            while True:
+                self.sync_sources()
+                if not self.monitors:
+                    logger.warning("Нет включенных серверов СКУД")
+                time.sleep(settings.SKUD_CONFIG['SOURCES_REFRESH'])
+        except KeyboardInterrupt:
+            logger.info("Мониторинг остановлен")
+        finally:
+            for monitor in self.monitors.values():
+                monitor.stop()
+            # Ждем, пока потоки отдадут аренду (stop_grace_period в docker-compose - 20 сек)
+            for thread in self.threads.values():
+                thread.join(timeout=15)
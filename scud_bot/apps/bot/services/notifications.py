@@ -0,0 +1,189 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from ..models import Employee, Transaction
+from .bot import TelegramBot
+from .redis_client import get_redis
+from .tracing import record_delivery
+
+logger = logging.getLogger(__name__)
+
+PENDING_PREFIX = 'scud:notify:pending'
+
+# (отметка, время получения из СКУД, время постановки в очередь) - для трассировки
+PendingPunch = Tuple[Transaction, Optional[float], Optional[float]]
+
+
+def format_punch_message(transaction: Transaction) -> str:
+    """Текст уведомления о проходе"""
+    location = transaction.terminal.terminal_alias
+
+    # В БД время в UTC - показываем московское
+    punch_time = timezone.localtime(transaction.punch_time)
+    time_str = punch_time.strftime('%H:%M')
+    date_str = punch_time.strftime('%d.%m.%Y')
+
+    # Создаем сообщение в зависимости от типа события
+    if transaction.is_entry:
+        return f"Вы прибыли на пункт {location} в {time_str} {date_str}"
+    return f"Вы покинули пункт {location} в {time_str} {date_str}"
+
+
+def format_coalesced_message(transactions: Sequence[Transaction]) -> str:
+    """Одно сообщение на несколько отметок подряд"""
+    if len(transactions) == 1:
+        return format_punch_message(transactions[0])
+
+    date_str = timezone.localtime(transactions[0].punch_time).strftime('%d.%m.%Y')
+    lines = [f"Ваши проходы {date_str}:"]
+    for transaction in transactions:
+        action = 'вход' if transaction.is_entry else 'выход'
+        lines.append(f"{timezone.localtime(transaction.punch_time).strftime('%H:%M')} - {action}, "
+                     f"{transaction.terminal.terminal_alias}")
+    return '\n'.join(lines)
+
+
+def deliver_notifications(employee: Employee, punches: Sequence[PendingPunch]) -> bool:
+    """Отправить одно сообщение об отметках и записать стадии доставки каждой в трассировку"""
+    started_at = time.time()
+
+    message = format_coalesced_message([transaction for transaction, _, _ in punches])
+
+    send_started = time.perf_counter()
+    success = TelegramBot().send_message(employee.telegram_id, message)
+    telegram_ms = (time.perf_counter() - send_started) * 1000
+
+    if success:
+        logger.info(f"Уведомление отправлено {employee.name} (отметок: {len(punches)})")
+        for transaction, fetched_at, enqueued_at in punches:
+            record_delivery(transaction.source_id, transaction.skud_id, fetched_at, enqueued_at,
+                            started_at, telegram_ms)
+    else:
+        logger.warning(f"Не удалось отправить уведомление {employee.name}")
+
+    return success
+
+
+def deliver_punch_notification(employee: Employee, transaction: Transaction,
+                               fetched_at: Optional[float] = None,
+                               enqueued_at: Optional[float] = None) -> bool:
+    """Отправить уведомление о проходе и записать стадии доставки в трассировку"""
+    return deliver_notifications(employee, [(transaction, fetched_at, enqueued_at)])
+
+
+def open_window(key: str, window: int) -> bool:
+    """Начать окно объединения; True - окна не было, отметку нужно отправить сразу"""
+    return bool(get_redis().set(f'{key}:window', 1, nx=True, ex=window))
+
+
+def window_left(key: str) -> float:
+    """Сколько секунд осталось до конца окна (0 - уже закончилось)"""
+    return max(get_redis().pttl(f'{key}:window'), 0) / 1000
+
+
+def push_pending(key: str, items: List[str], window: int) -> bool:
+    """Дописать элементы в окно объединения; True - окно новое и отправку нужно поставить
+
+    Метка "задача уже стоит" живет дольше окна: если задачу потеряли, следующий
+    элемент поставит новую.
+    """
+    pipe = get_redis().pipeline()
+    pipe.rpush(key, *items)
+    pipe.expire(key, window * 10)
+    pipe.set(f'{key}:scheduled', 1, nx=True, ex=window * 3)
+    return bool(pipe.execute()[-1])
+
+
+def drop_pending(key: str, items: List[str]):
+    """Откатить push_pending, если отправку поставить не удалось: убрать элементы и метку окна"""
+    pipe = get_redis().pipeline()
+    for item in items:
+        pipe.lrem(key, 1, item)
+    pipe.delete(f'{key}:scheduled')
+    pipe.execute()
+
+
+def take_pending(key: str) -> List:
+    """Забрать накопленное за окно (атомарно - новый элемент начнет новое окно)"""
+    pipe = get_redis().pipeline()
+    pipe.lrange(key, 0, -1)
+    pipe.delete(key, f'{key}:scheduled')
+    items, _ = pipe.execute()
+    return [json.loads(item) for item in items]
+
+
+def schedule_punch_notification(employee: Employee, transaction: Transaction,
+                                fetched_at: Optional[float] = None):
+    """Поставить уведомление в очередь с окном объединения COALESCE_SECONDS
+
+    Первая отметка открывает окно и уходит сразу - одиночный проход не ждет.
+    Следующие за ней в пределах окна дописываются в список сотрудника в Redis,
+    первая из них ставит задачу на конец окна - та отправит их одним сообщением.
+    Ошибки Redis и Celery пробрасываются (монитор отправит уведомление сразу) -
+    поэтому при ошибке Celery окно откатывается, иначе отметка ушла бы еще раз.
+    """
+    from ..tasks import send_coalesced_notification, send_punch_notification
+
+    window = settings.NOTIFICATIONS_CONFIG['COALESCE_SECONDS']
+    key = f'{PENDING_PREFIX}:{employee.id}'
+    if not window or open_window(key, window):
+        try:
+            send_punch_notification.delay(transaction.id, fetched_at, time.time())
+        except Exception:
+            if window:
+                get_redis().delete(f'{key}:window')
+            raise
+        return
+
+    item = json.dumps([transaction.id, fetched_at, time.time()])
+    if push_pending(key, [item], window):
+        try:
+            send_coalesced_notification.apply_async((employee.id,), countdown=window_left(key))
+        except Exception:
+            drop_pending(key, [item])
+            raise
+
+
+def build_digests(day: date) -> List[Tuple[Employee, str]]:
+    """Сводки за день сотрудникам в режиме "сводка" - одним сгруппированным запросом"""
+    start = timezone.make_aware(datetime.combine(day, dt_time.min))
+    rows = Transaction.objects.filter(
+        employee__notification_mode=Employee.NOTIFY_DIGEST,
+        employee__send_notifications=True,
+        employee__telegram_id__isnull=False,
+        terminal__is_monitored=True,
+        punch_time__gte=start,
+        punch_time__lt=start + timedelta(days=1),
+    ).values(
+        'employee_id', 'employee__name', 'employee__telegram_id', 'terminal__terminal_alias',
+    ).annotate(
+        first_entry=Min('punch_time', filter=Q(punch_state__in=['0', 'I'])),
+        last_exit=Max('punch_time', filter=Q(punch_state__in=['1', 'O'])),
+        first_punch=Min('punch_time'),
+        punches=Count('id'),
+    ).order_by('employee_id', 'first_punch')
+
+    by_employee = defaultdict(list)
+    for row in rows:
+        by_employee[(row['employee_id'], row['employee__name'], row['employee__telegram_id'])].append(row)
+
+    def hhmm(moment):
+        return timezone.localtime(moment).strftime('%H:%M') if moment else '-'
+
+    digests = []
+    for (employee_id, name, telegram_id), terminals in by_employee.items():
+        lines = [f"Ваши проходы за {day.strftime('%d.%m.%Y')}:"]
+        for row in terminals:
+            lines.append(f"{row['terminal__terminal_alias']}: приход {hhmm(row['first_entry'])}, "
+                         f"уход {hhmm(row['last_exit'])} (отметок: {row['punches']})")
+        employee = Employee(id=employee_id, name=name, telegram_id=telegram_id)
+        digests.append((employee, '\n'.join(lines)))
+    return digests
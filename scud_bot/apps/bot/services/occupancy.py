@@ -0,0 +1,210 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from ..models import OccupancyBucket, Terminal, Transaction
+from .presence import overlapping_visits, terminal_ids
+
+logger = logging.getLogger(__name__)
+
+FINE = OccupancyBucket.RESOLUTION_5MIN
+HOUR = OccupancyBucket.RESOLUTION_HOUR
+
+
+def floor_time(moment: datetime, resolution: int) -> datetime:
+    """Начало интервала, в который попадает moment (от эпохи - для Москвы совпадает с местным часом)"""
+    ts = int(moment.timestamp())
+    return datetime.fromtimestamp(ts - ts % resolution, tz=dt_timezone.utc)
+
+
+def ceil_time(moment: datetime, resolution: int) -> datetime:
+    floored = floor_time(moment, resolution)
+    return floored if floored == moment else floored + timedelta(seconds=resolution)
+
+
+def build_buckets(start: datetime, end: datetime, resolution: int = FINE,
+                  terminals: Optional[List[int]] = None) -> int:
+    """Пересчитать интервалы [start, end) по записям проходов и визитам
+
+    Проходы - по индексу (terminal, punch_time) только за окно, число людей -
+    проходом по визитам окна (вход +1, конец присутствия -1).
+    """
+    start, end = floor_time(start, resolution), ceil_time(end, resolution)
+    if terminals is None:
+        terminals = list(Terminal.objects.values_list('id', flat=True))
+    if not terminals or start >= end:
+        return 0
+    step = timedelta(seconds=resolution)
+
+    counts = defaultdict(lambda: [0, 0])
+    punches = Transaction.objects.filter(
+        terminal_id__in=terminals, punch_time__gte=start, punch_time__lt=end,
+    ).values_list('terminal_id', 'punch_time', 'punch_state')
+    for terminal_id, punch_time, punch_state in punches.iterator(chunk_size=5000):
+        counts[(terminal_id, floor_time(punch_time, resolution))][0 if punch_state in ('0', 'I') else 1] += 1
+
+    initial = defaultdict(int)
+    events = defaultdict(list)
+    visits = overlapping_visits(terminals, start, end).values_list('terminal_id', 'started_at', 'present_until')
+    for terminal_id, started_at, present_until in visits.iterator(chunk_size=5000):
+        if started_at >= end or (present_until is not None and present_until <= start):
+            continue
+        if started_at <= start:
+            initial[terminal_id] += 1
+        else:
+            events[terminal_id].append((started_at, 1))
+        if present_until is not None and present_until < end:
+            events[terminal_id].append((present_until, -1))
+
+    rows = []
+    for terminal_id in terminals:
+        # Уход раньше прихода в ту же секунду - иначе максимум завышается
+        timeline = sorted(events[terminal_id])
+        count = initial[terminal_id]
+        i = 0
+        bucket = start
+        while bucket < end:
+            bucket_end = bucket + step
+            peak = count
+            while i < len(timeline) and timeline[i][0] < bucket_end:
+                count += timeline[i][1]
+                peak = max(peak, count)
+                i += 1
+            entries, exits = counts.get((terminal_id, bucket), (0, 0))
+            # Пустые интервалы не храним - в графике это нули
+            if entries or exits or peak:
+                rows.append(OccupancyBucket(
+                    terminal_id=terminal_id, resolution=resolution, start=bucket,
+                    entries=entries, exits=exits, headcount=count, peak=peak,
+                ))
+            bucket = bucket_end
+
+    with db_transaction.atomic():
+        OccupancyBucket.objects.filter(
+            resolution=resolution, terminal_id__in=terminals, start__gte=start, start__lt=end,
+        ).delete()
+        OccupancyBucket.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
+
+
+def rollup_hours(start: datetime, end: datetime) -> int:
+    """Собрать часовые интервалы из пятиминутных (без обращения к записям проходов)"""
+    start, end = floor_time(start, HOUR), ceil_time(end, HOUR)
+
+    hours = {}
+    fine = OccupancyBucket.objects.filter(
+        resolution=FINE, start__gte=start, start__lt=end,
+    ).order_by('start').values_list('terminal_id', 'start', 'entries', 'exits', 'headcount', 'peak')
+    for terminal_id, bucket, entries, exits, headcount, peak in fine.iterator(chunk_size=5000):
+        hour_start = floor_time(bucket, HOUR)
+        hour = hours.get((terminal_id, hour_start))
+        if hour is None:
+            hour = hours[(terminal_id, hour_start)] = OccupancyBucket(
+                terminal_id=terminal_id, resolution=HOUR, start=hour_start,
+            )
+        hour.entries += entries
+        hour.exits += exits
+        hour.peak = max(hour.peak, peak)
+        # На пункте в конце часа - из последнего пятиминутного интервала часа (пустой - никого)
+        last_fine = hour_start + timedelta(seconds=HOUR - FINE)
+        hour.headcount = headcount if bucket == last_fine else 0
+
+    with db_transaction.atomic():
+        OccupancyBucket.objects.filter(resolution=HOUR, start__gte=start, start__lt=end).delete()
+        OccupancyBucket.objects.bulk_create(list(hours.values()), batch_size=2000)
+    return len(hours)
+
+
+def update_occupancy(punches: Iterable) -> int:
+    """Пересчитать пятиминутные интервалы, которых коснулись новые отметки (после сборки визитов)"""
+    punches = list(punches)
+    if not punches:
+        return 0
+    times = [punch.punch_time for punch in punches]
+    terminals = sorted({punch.terminal_id for punch in punches})
+    return build_buckets(min(times), max(times) + timedelta(seconds=FINE), FINE, terminals)
+
+
+def refresh_occupancy(now: Optional[datetime] = None) -> dict:
+    """Периодический пересчет: последние пятиминутки, их часы и очистка старых пятиминуток
+
+    Пересчет окна подбирает то, что инкрементально не видно: опоздавшие отметки,
+    закрытые задним числом визиты.
+    """
+    now = now or timezone.now()
+    config = settings.OCCUPANCY_CONFIG
+    since = now - timedelta(minutes=config['RECOMPUTE_MINUTES'])
+
+    fine = build_buckets(since, now, FINE)
+    hours = rollup_hours(since, now)
+    pruned, _ = OccupancyBucket.objects.filter(
+        resolution=FINE, start__lt=now - timedelta(days=config['FINE_KEEP_DAYS']),
+    ).delete()
+
+    return {'fine': fine, 'hours': hours, 'pruned': pruned}
+
+
+def backfill_occupancy(since: datetime, until: Optional[datetime] = None) -> dict:
+    """Построить интервалы за историю по дням: часы - за весь период, пятиминутки - за FINE_KEEP_DAYS"""
+    until = until or timezone.now()
+    fine_from = until - timedelta(days=settings.OCCUPANCY_CONFIG['FINE_KEEP_DAYS'])
+    stats = {'fine': 0, 'hours': 0, 'days': 0}
+
+    day = floor_time(since, HOUR)
+    while day < until:
+        day_end = min(day + timedelta(days=1), until)
+        if day_end > fine_from:
+            stats['fine'] += build_buckets(max(day, floor_time(fine_from, FINE)), day_end, FINE)
+        if day >= fine_from:
+            stats['hours'] += rollup_hours(day, day_end)
+        else:
+            stats['hours'] += build_buckets(day, day_end, HOUR)
+        stats['days'] += 1
+        day = day_end
+
+    return stats
+
+
+def occupancy_series(start: datetime, end: datetime, resolution: Optional[int] = None,
+                     terminal: Optional[int] = None, area: Optional[str] = None) -> dict:
+    """Ряд для графика: метки времени и значения без пропусков
+
+    Зона - сумма своих терминалов; ее максимум - сумма максимумов терминалов (оценка сверху).
+    """
+    if resolution is None:
+        # Пятиминутки - для коротких периодов, пока они хранятся
+        fine_from = timezone.now() - timedelta(days=settings.OCCUPANCY_CONFIG['FINE_KEEP_DAYS'])
+        resolution = FINE if end - start <= timedelta(days=2) and start >= fine_from else HOUR
+
+    start, end = floor_time(start, resolution), ceil_time(end, resolution)
+    step = timedelta(seconds=resolution)
+    points = int((end - start) / step)
+    if points > settings.OCCUPANCY_CONFIG['MAX_POINTS']:
+        raise ValueError(f"Слишком много точек ({points}) - уменьшите период или возьмите интервал 1 час")
+
+    totals = defaultdict(lambda: [0, 0, 0, 0])
+    buckets = OccupancyBucket.objects.filter(
+        resolution=resolution, terminal_id__in=terminal_ids(terminal, area), start__gte=start, start__lt=end,
+    ).values_list('start', 'entries', 'exits', 'headcount', 'peak')
+    for bucket, *values in buckets:
+        total = totals[bucket]
+        for i, value in enumerate(values):
+            total[i] += value
+
+    labels, series = [], {'entries': [], 'exits': [], 'headcount': [], 'peak': []}
+    bucket = start
+    while bucket < end:
+        labels.append(timezone.localtime(bucket).isoformat())
+        entries, exits, headcount, peak = totals.get(bucket, (0, 0, 0, 0))
+        series['entries'].append(entries)
+        series['exits'].append(exits)
+        series['headcount'].append(headcount)
+        series['peak'].append(peak)
+        bucket += step
+
+    return {'resolution': resolution, 'labels': labels, 'series': series}
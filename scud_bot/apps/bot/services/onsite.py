@@ -0,0 +1,156 @@
+import json
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from ..models import Terminal
+from .presence import present
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'scud:onsite:snapshot'
+SNAPSHOT_LOCK_KEY = 'scud:onsite:snapshot:lock'
+
+# Текст сообщения и inline-клавиатура Telegram (None - без кнопок)
+Page = Tuple[str, Optional[dict]]
+
+
+def compute_snapshot(now: Optional[datetime] = None) -> dict:
+    """Кто сейчас на каждом пункте - по визитам (те же правила, что у "кто был на пункте")"""
+    now = now or timezone.now()
+    terminals = {
+        terminal.id: {'id': terminal.id, 'alias': terminal.terminal_alias, 'area': terminal.area_alias, 'people': []}
+        for terminal in Terminal.objects.order_by('terminal_alias', 'id')
+    }
+    for visit in present(now):
+        terminals[visit['terminal_id']]['people'].append(
+            [visit['emp_code'], visit['name'], visit['entered_at'].isoformat()]
+        )
+    for terminal in terminals.values():
+        terminal['people'].sort(key=lambda person: (person[1] or person[0]).lower())
+    return {'at': timezone.localtime(now).isoformat(), 'terminals': list(terminals.values())}
+
+
+def _snapshot_age(snapshot: dict) -> float:
+    return (timezone.now() - datetime.fromisoformat(snapshot['at'])).total_seconds()
+
+
+def _cached_snapshot() -> Optional[dict]:
+    cached = get_redis().get(SNAPSHOT_KEY)
+    return json.loads(cached) if cached else None
+
+
+def onsite_snapshot() -> dict:
+    """Снимок "кто на пунктах" из Redis (свежий - CACHE_SECONDS) - общий для бота и админки
+
+    Утренняя волна запросов руководителей стоит одного расчета: устаревший
+    снимок пересчитывает тот, кто взял блокировку, остальные пока получают
+    прежний (не старше STALE_SECONDS), а если его нет - ждут нового.
+    Без Redis считаем на каждый запрос.
+    """
+    config = settings.ONSITE_CONFIG
+    try:
+        redis = get_redis()
+        snapshot = _cached_snapshot()
+        if snapshot and _snapshot_age(snapshot) < config['CACHE_SECONDS']:
+            return snapshot
+
+        if not redis.set(SNAPSHOT_LOCK_KEY, 1, nx=True, ex=config['LOCK_SECONDS']):
+            if snapshot:
+                return snapshot
+            # Снимка нет совсем - его уже считает другой процесс
+            deadline = time.monotonic() + config['LOCK_SECONDS']
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                snapshot = _cached_snapshot()
+                if snapshot:
+                    return snapshot
+            logger.warning("Снимок присутствия так и не был построен другим процессом")
+    except RedisError as e:
+        logger.warning(f"Снимок присутствия недоступен в Redis - {e}")
+
+    snapshot = compute_snapshot()
+    try:
+        pipe = get_redis().pipeline()
+        pipe.set(SNAPSHOT_KEY, json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')),
+                 ex=config['STALE_SECONDS'])
+        pipe.delete(SNAPSHOT_LOCK_KEY)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Не удалось сохранить снимок присутствия - {e}")
+    return snapshot
+
+
+def find_terminals(snapshot: dict, query: str) -> List[dict]:
+    """Терминалы по названию или зоне: точное совпадение, иначе - по части названия"""
+    query = query.strip().lower()
+    exact = [terminal for terminal in snapshot['terminals']
+             if query in (terminal['alias'].lower(), (terminal['area'] or '').lower())]
+    return exact or [terminal for terminal in snapshot['terminals'] if query in terminal['alias'].lower()]
+
+
+def _snapshot_time(snapshot: dict) -> str:
+    return datetime.fromisoformat(snapshot['at']).strftime('%H:%M')
+
+
+def overview_page(snapshot: dict, terminals: Optional[List[dict]] = None) -> Page:
+    """Число людей по пунктам; кнопка пункта открывает список"""
+    terminals = snapshot['terminals'] if terminals is None else terminals
+    busy = [terminal for terminal in terminals if terminal['people']]
+    total = sum(len(terminal['people']) for terminal in busy)
+
+    lines = [f"На пунктах в {_snapshot_time(snapshot)}: {total}"]
+    lines += [f"{terminal['alias']} - {len(terminal['people'])}" for terminal in busy]
+    if not busy:
+        lines.append("Никого нет")
+
+    buttons = [[{'text': f"{terminal['alias']} ({len(terminal['people'])})",
+                 'callback_data': f"onsite:{terminal['id']}:0"}] for terminal in busy]
+    return '\n'.join(lines), {'inline_keyboard': buttons} if buttons else None
+
+
+def terminal_page(snapshot: dict, terminal_id: int, page: int = 0) -> Page:
+    """Страница списка людей на пункте с кнопками листания"""
+    terminal = next((terminal for terminal in snapshot['terminals'] if terminal['id'] == terminal_id), None)
+    if terminal is None:
+        return "Пункт не найден", None
+
+    people = terminal['people']
+    page_size = settings.ONSITE_CONFIG['PAGE_SIZE']
+    pages = max((len(people) + page_size - 1) // page_size, 1)
+    page = min(max(page, 0), pages - 1)
+
+    lines = [f"{terminal['alias']} в {_snapshot_time(snapshot)}: {len(people)} чел."]
+    if pages > 1:
+        lines[0] += f" (стр. {page + 1} из {pages})"
+    for emp_code, name, entered_at in people[page * page_size:(page + 1) * page_size]:
+        lines.append(f"{datetime.fromisoformat(entered_at).strftime('%H:%M')} {name or f'Сотр. {emp_code}'}")
+    if not people:
+        lines.append("Никого нет")
+
+    buttons = []
+    if page > 0:
+        buttons.append({'text': '◀', 'callback_data': f"onsite:{terminal_id}:{page - 1}"})
+    if page < pages - 1:
+        buttons.append({'text': '▶', 'callback_data': f"onsite:{terminal_id}:{page + 1}"})
+    return '\n'.join(lines), {'inline_keyboard': [buttons]} if buttons else None
+
+
+def onsite_reply(query: str = '') -> Page:
+    """Ответ на /onsite [пункт]: без пункта - сводка, один пункт - список, зона - сводка по ней"""
+    snapshot = onsite_snapshot()
+    if not query.strip():
+        return overview_page(snapshot)
+
+    terminals = find_terminals(snapshot, query)
+    if not terminals:
+        return f"Пункт \"{query.strip()}\" не найден", None
+    if len(terminals) == 1:
+        return terminal_page(snapshot, terminals[0]['id'])
+    return overview_page(snapshot, terminals)
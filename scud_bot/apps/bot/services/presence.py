@@ -0,0 +1,79 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Employee, Terminal, Visit
+
+logger = logging.getLogger(__name__)
+
+# То же выражение, что в индексе visit_presence_gist (миграция 0014)
+PRESENCE_RANGE = (
+    "tstzrange(bot_visit.started_at, coalesce(bot_visit.present_until, 'infinity'::timestamptz), '[)')"
+)
+
+
+def _max_presence() -> timedelta:
+    """Дольше визит не длится: MAX_VISIT_HOURS, а без выхода - до конца дня входа"""
+    return timedelta(hours=max(settings.VISITS_CONFIG['MAX_VISIT_HOURS'], 24))
+
+
+def terminal_ids(terminal: Optional[int] = None, area: Optional[str] = None) -> List[int]:
+    """Терминалы запроса: один терминал, все терминалы зоны или все"""
+    terminals = Terminal.objects.all()
+    if terminal is not None:
+        terminals = terminals.filter(pk=terminal)
+    if area:
+        terminals = terminals.filter(area_alias=area)
+    return list(terminals.values_list('id', flat=True))
+
+
+def overlapping_visits(terminals: List[int], start: datetime, end: Optional[datetime]):
+    """Визиты терминалов, присутствие в которых пересекается с [start, end] (end=None - момент start)"""
+    visits = Visit.objects.filter(terminal_id__in=terminals).exclude(status=Visit.STATUS_NO_ENTRY)
+
+    if connection.vendor == 'postgresql':
+        # GiST по (terminal_id, tstzrange) - без перебора истории
+        if end is None:
+            return visits.extra(where=[f"{PRESENCE_RANGE} @> %s::timestamptz"], params=[start])
+        return visits.extra(where=[f"{PRESENCE_RANGE} && tstzrange(%s, %s, '[]')"], params=[start, end])
+
+    # Другие базы: визит не длиннее _max_presence, так что хватает окна по started_at
+    end = end or start
+    return visits.filter(
+        started_at__lte=end,
+        started_at__gte=start - _max_presence(),
+    ).filter(Q(present_until__gt=start) | Q(present_until__isnull=True))
+
+
+def present(start: datetime, end: Optional[datetime] = None, terminal: Optional[int] = None,
+            area: Optional[str] = None) -> List[dict]:
+    """Кто был на пункте в момент start (или в любой момент интервала [start, end])"""
+    terminals = terminal_ids(terminal, area)
+    if not terminals:
+        return []
+
+    visits = list(
+        overlapping_visits(terminals, start, end).select_related('terminal').order_by('started_at', 'id')
+    )
+    names = dict(Employee.objects.filter(
+        emp_code__in={visit.emp_code for visit in visits}
+    ).values_list('emp_code', 'name'))
+
+    return [
+        {
+            'emp_code': visit.emp_code,
+            'name': names.get(visit.emp_code, ''),
+            'terminal_id': visit.terminal_id,
+            'terminal': visit.terminal.terminal_alias,
+            'area': visit.terminal.area_alias,
+            'entered_at': timezone.localtime(visit.started_at),
+            'left_at': timezone.localtime(visit.ended_at) if visit.ended_at else None,
+            'status': visit.status,
+        }
+        for visit in visits
+    ]
@@ -0,0 +1,149 @@
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from redis.exceptions import RedisError, ResponseError
+
+from ..models import Transaction
+from .metrics import metrics
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+Event = Tuple[str, Dict[str, str]]
+
+
+def punch_event(transaction: Transaction) -> dict:
+    """Компактное событие отметки (ID терминала и записи - как в СКУД)"""
+    return {
+        'source': transaction.source.code,
+        'skud_id': transaction.skud_id,
+        'emp_code': transaction.emp_code,
+        'terminal_id': transaction.terminal.terminal_id,
+        'state': 'in' if transaction.is_entry else 'out',
+        'time': timezone.localtime(transaction.punch_time).isoformat(),
+    }
+
+
+def decode_event(event_id: str, fields: Dict[str, str]) -> dict:
+    """Событие из потока (в Redis все значения - строки) с ID потока"""
+    return {
+        'id': event_id,
+        'source': fields['source'],
+        'skud_id': int(fields['skud_id']),
+        'emp_code': fields['emp_code'],
+        'terminal_id': int(fields['terminal_id']),
+        'state': fields['state'],
+        'time': fields['time'],
+    }
+
+
+def publish_punches(transactions: Iterable[Transaction]) -> int:
+    """Опубликовать записанные отметки в поток Redis пачками (pipeline)
+
+    Длина потока ограничена MAXLEN (приблизительно - так дешевле для Redis).
+    Ошибка Redis не мешает приему отметок: событие теряется, растет счетчик
+    stream_publish_errors_total, а пропуск можно дослать командой punch_stream --publish-since.
+    """
+    config = settings.PUNCH_STREAM_CONFIG
+    transactions = list(transactions)
+    if not config['ENABLED'] or not transactions:
+        return 0
+
+    published = 0
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for start in range(0, len(transactions), config['BATCH_SIZE']):
+            for transaction in transactions[start:start + config['BATCH_SIZE']]:
+                pipe.xadd(config['KEY'], punch_event(transaction),
+                          maxlen=config['MAXLEN'], approximate=True)
+            published += len(pipe.execute())
+    except RedisError as e:
+        metrics.inc('stream_publish_errors_total')
+        logger.error(f"Не удалось опубликовать отметки в поток - {e} "
+                     f"(опубликовано {published} из {len(transactions)})")
+    metrics.inc('stream_published_total', published)
+    return published
+
+
+def ensure_group(group: str, start_id: str = '$') -> bool:
+    """Создать группу потребителей (и поток, если его еще нет). False - группа уже есть
+
+    start_id='$' - только новые события, '0' - с начала хранимого потока.
+    """
+    try:
+        get_redis().xgroup_create(settings.PUNCH_STREAM_CONFIG['KEY'], group, id=start_id, mkstream=True)
+        return True
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+        return False
+
+
+def reassign_pending(group: str, consumers: List[str], count: int = 100) -> int:
+    """Неподтвержденные события ушедших потребителей группы - первому из consumers
+
+    Потребитель, которого больше нет (например, уменьшили число потоков), свои
+    события уже не дочитает. Вызывать, пока потребители группы не запущены, -
+    иначе событие может уйти двоим. Возвращает число переданных событий.
+    """
+    key = settings.PUNCH_STREAM_CONFIG['KEY']
+    redis = get_redis()
+    moved = 0
+    for info in redis.xinfo_consumers(key, group):
+        name = info['name']
+        if name in consumers:
+            continue
+        while True:
+            pending = redis.xpending_range(key, group, min='-', max='+', count=count, consumername=name)
+            if not pending:
+                break
+            # Вытесненные из потока (MAXLEN) Redis просто убирает из списка неподтвержденных
+            moved += len(redis.xclaim(key, group, consumers[0], 0,
+                                      [entry['message_id'] for entry in pending], justid=True))
+        redis.xgroup_delconsumer(key, group, name)
+    return moved
+
+
+def replay(from_id: str = '0', count: int = 1000) -> Iterator[Event]:
+    """События после from_id (не включая его) - для догонки после простоя потребителя"""
+    key = settings.PUNCH_STREAM_CONFIG['KEY']
+    redis = get_redis()
+    start = f'({from_id}' if from_id not in ('0', '-') else '-'
+    while True:
+        batch = redis.xrange(key, min=start, max='+', count=count)
+        yield from batch
+        if len(batch) < count:
+            return
+        start = f'({batch[-1][0]}'
+
+
+class PunchStreamConsumer:
+    """Потребитель в группе: сначала свои неподтвержденные события (после падения), потом новые"""
+
+    def __init__(self, group: str, consumer: str, start_id: str = '$'):
+        self.key = settings.PUNCH_STREAM_CONFIG['KEY']
+        self.group = group
+        self.consumer = consumer
+        self.redis = get_redis()
+        self._pending = True
+        ensure_group(group, start_id)
+
+    def read(self, count: int = 100, block_ms: Optional[int] = 2000) -> List[Event]:
+        """Пачка событий; block_ms меньше таймаута чтения общего клиента Redis (5 сек)"""
+        if self._pending:
+            response = self.redis.xreadgroup(self.group, self.consumer, {self.key: '0'}, count=count)
+            events = response[0][1] if response else []
+            if events:
+                return events
+            self._pending = False
+
+        response = self.redis.xreadgroup(self.group, self.consumer, {self.key: '>'},
+                                         count=count, block=block_ms)
+        return response[0][1] if response else []
+
+    def ack(self, ids: List[str]) -> int:
+        if not ids:
+            return 0
+        return self.redis.xack(self.key, self.group, *ids)
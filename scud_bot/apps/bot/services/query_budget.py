@@ -0,0 +1,86 @@
+import re
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql: str) -> str:
+    """SQL без конкретных значений - одинаковые запросы с разными параметрами совпадают"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget:
+    """Считает SQL запросы внутри блока with
+
+    С max_queries падает, если запросов больше бюджета, и печатает самые
+    частые отпечатки запросов - обычно это и есть N+1.
+
+        with QueryBudget(max_queries=10, label='список сотрудников'):
+            client.get('/admin/bot/employee/')
+    """
+
+    def __init__(self, max_queries: Optional[int] = None, using: str = 'default', label: str = ''):
+        self.max_queries = max_queries
+        self.label = label
+        self._context = CaptureQueriesContext(connections[using])
+
+    def __enter__(self):
+        self._context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None and self.max_queries is not None and self.count > self.max_queries:
+            raise QueryBudgetExceeded(self.report(
+                f"{self.label}: {self.count} запросов при бюджете {self.max_queries}"
+            ))
+
+    @property
+    def queries(self) -> List[str]:
+        return [query['sql'] for query in self._context.captured_queries]
+
+    @property
+    def count(self) -> int:
+        return len(self._context.captured_queries)
+
+    def fingerprints(self) -> Counter:
+        return Counter(fingerprint(sql) for sql in self.queries)
+
+    def report(self, title: str, limit: int = 10) -> str:
+        lines = [title]
+        for sql, count in self.fingerprints().most_common(limit):
+            lines.append(f"  {count} x {sql[:300]}")
+        return '\n'.join(lines)
+
+
+def grown_fingerprints(small: QueryBudget, large: QueryBudget) -> List[Tuple[str, int, int]]:
+    """Запросы, которых стало больше на большем наборе данных: (отпечаток, было, стало)"""
+    before = small.fingerprints()
+    after = large.fingerprints()
+    grown = [(sql, before.get(sql, 0), count) for sql, count in after.items() if count > before.get(sql, 0)]
+    return sorted(grown, key=lambda item: item[2] - item[1], reverse=True)
+
+
+def assert_constant_queries(small: QueryBudget, large: QueryBudget, label: str = ''):
+    """Число запросов не должно зависеть от количества строк"""
+    if large.count <= small.count:
+        return
+
+    lines = [f"{label}: запросов стало {large.count} вместо {small.count} - растет вместе с данными"]
+    for sql, before, after in grown_fingerprints(small, large)[:10]:
+        lines.append(f"  {before} -> {after} x {sql[:300]}")
+    raise QueryBudgetExceeded('\n'.join(lines))
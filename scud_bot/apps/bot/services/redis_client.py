@@ -0,0 +1,34 @@
+import logging
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def get_redis() -> redis.Redis:
+    """Общий клиент Redis (тот же инстанс, что и брокер Celery)"""
+    global _client
+
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=5,
+            socket_connect_timeout=2,
+            decode_responses=True,
+        )
+
+    return _client
+
+
+def create_pubsub():
+    """Отдельное соединение для подписки (без таймаута чтения, в отличие от общего клиента)"""
+    client = redis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=2,
+        health_check_interval=30,
+        decode_responses=True,
+    )
+    return client.pubsub(ignore_subscribe_messages=True)
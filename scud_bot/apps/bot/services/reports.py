@@ -0,0 +1,437 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+from datetime import date, datetime, time as time_type, timedelta
+from pathlib import Path
+from typing import Optional, TextIO, Tuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import ReportJob, SkudSource, Terminal, Transaction
+from .skud_api import fetch_scud_data
+from .visits import build_timesheet
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR = 'reports'
+
+VERIFY_TYPES = {1: 'Отпечаток', 4: 'Карта', 15: 'Лицо', 99: 'Автовыход'}
+
+
+class ReportParamsError(ValueError):
+    """Некорректные параметры отчета"""
+
+
+# Параметры
+
+def _parse_date(value, name: str) -> Optional[str]:
+    if value in (None, ''):
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise ReportParamsError(f"Неверный формат даты {name}: {value}. Используйте YYYY-MM-DD")
+
+
+def _parse_month(value, today: date) -> str:
+    month = value or today.strftime('%Y-%m')
+    try:
+        return datetime.strptime(str(month), '%Y-%m').strftime('%Y-%m')
+    except ValueError:
+        raise ReportParamsError(f"Неверный месяц: {month}. Используйте YYYY-MM")
+
+
+def normalize_params(kind: str, params: dict) -> dict:
+    """Проверить параметры и привести к каноническому виду (от него считается ключ)"""
+    today = timezone.localdate()
+
+    if kind == ReportJob.KIND_BACKUP:
+        code = params.get('source') or settings.SKUD_CONFIG['DEFAULT_SOURCE']
+        if not SkudSource.objects.filter(code=code).exists():
+            raise ReportParamsError(f"Сервер СКУД {code} не найден")
+        return {
+            'source': code,
+            'date_from': _parse_date(params.get('date_from'), 'date_from'),
+            'date_to': _parse_date(params.get('date_to'), 'date_to'),
+        }
+
+    if kind == ReportJob.KIND_EMPLOYEE_HISTORY:
+        emp_code = str(params.get('emp_code') or '').strip()
+        if not emp_code:
+            raise ReportParamsError("Не указан код сотрудника")
+        return {'emp_code': emp_code, 'month': _parse_month(params.get('month'), today)}
+
+    if kind == ReportJob.KIND_TIMESHEET:
+        return {'month': _parse_month(params.get('month'), today)}
+
+    if kind == ReportJob.KIND_TERMINAL_OCCUPANCY:
+        try:
+            terminal = int(params.get('terminal'))
+        except (TypeError, ValueError):
+            raise ReportParamsError("Не указан терминал")
+        if not Terminal.objects.filter(pk=terminal).exists():
+            raise ReportParamsError(f"Терминал {terminal} не найден")
+        date_to = _parse_date(params.get('date_to'), 'date_to') or today.isoformat()
+        date_from = _parse_date(params.get('date_from'), 'date_from') or \
+            (date.fromisoformat(date_to) - timedelta(days=29)).isoformat()
+        if date_from > date_to:
+            raise ReportParamsError("Начало периода позже конца")
+        return {'terminal': terminal, 'date_from': date_from, 'date_to': date_to}
+
+    raise ReportParamsError(f"Неизвестный отчет: {kind}")
+
+
+def params_hash(kind: str, params: dict) -> str:
+    payload = json.dumps({'kind': kind, 'params': params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _month_bounds(month: str) -> Tuple[date, date]:
+    first = datetime.strptime(month, '%Y-%m').date()
+    next_month = (first + timedelta(days=32)).replace(day=1)
+    return first, next_month
+
+
+def period_end(kind: str, params: dict) -> Optional[date]:
+    """Последний день периода отчета (None - до текущего момента)"""
+    if kind in (ReportJob.KIND_EMPLOYEE_HISTORY, ReportJob.KIND_TIMESHEET):
+        return _month_bounds(params['month'])[1] - timedelta(days=1)
+    value = params.get('date_to')
+    return date.fromisoformat(value) if value else None
+
+
+def describe(kind: str, params: dict) -> str:
+    """Параметры отчета для людей"""
+    if kind == ReportJob.KIND_EMPLOYEE_HISTORY:
+        return f"сотр. {params['emp_code']}, {params['month']}"
+    if kind == ReportJob.KIND_TIMESHEET:
+        return params['month']
+
+    period = f"{params.get('date_from') or '...'} - {params.get('date_to') or 'сейчас'}"
+    if kind == ReportJob.KIND_TERMINAL_OCCUPANCY:
+        return f"терминал {params['terminal']}, {period}"
+    return f"{params['source']}, {period}"
+
+
+def download_name(job: ReportJob) -> str:
+    params = job.params
+    if job.kind == ReportJob.KIND_BACKUP:
+        # Как раньше отдавал /api/download_backup/
+        date_from = (params.get('date_from') or '').replace('-', '')
+        date_to = (params.get('date_to') or '').replace('-', '')
+        if date_from and date_to:
+            return f"skud_backup_{date_from}_{date_to}.json"
+        if date_from:
+            return f"skud_backup_from_{date_from}.json"
+        if date_to:
+            return f"skud_backup_to_{date_to}.json"
+        return f"skud_backup_{timezone.localtime(job.finished_at or job.created_at).strftime('%Y%m%d_%H%M%S')}.json"
+    if job.kind == ReportJob.KIND_EMPLOYEE_HISTORY:
+        return f"history_{params['emp_code']}_{params['month']}.csv"
+    if job.kind == ReportJob.KIND_TIMESHEET:
+        return f"timesheet_{params['month']}.csv"
+    return f"occupancy_{params['terminal']}_{params['date_from']}_{params['date_to']}.csv"
+
+
+# Заказ и построение
+
+def _is_reusable(job: ReportJob, now) -> bool:
+    config = settings.REPORTS_CONFIG
+
+    if job.is_active:
+        # Строится - ждем его, если только построение не зависло
+        return now - job.created_at < timedelta(seconds=config['STALE_AFTER'])
+
+    if job.status == ReportJob.STATUS_FAILED:
+        # Ошибку отдаем опрашивающим клиентам, а не строим тут же заново на каждый запрос
+        return job.finished_at is not None and \
+            now - job.finished_at < timedelta(seconds=config['RETRY_FAILED_AFTER'])
+
+    if not job.file or not default_storage.exists(job.file.name):
+        return False
+
+    # Период закончился до построения - данные уже не изменятся
+    end = period_end(job.kind, job.params)
+    if end is not None and job.started_at and end < timezone.localtime(job.started_at).date():
+        return True
+
+    return now - job.finished_at < timedelta(seconds=config['FRESH_TTL'])
+
+
+def request_report(kind: str, params: dict, user=None, force: bool = False) -> Tuple[ReportJob, bool]:
+    """Найти готовый (или строящийся) отчет с теми же параметрами или поставить новый
+
+    Возвращает (отчет, создан ли новый). ReportParamsError - если параметры неверные.
+    """
+    params = normalize_params(kind, params)
+    digest = params_hash(kind, params)
+
+    if not force:
+        now = timezone.now()
+        latest = ReportJob.objects.filter(params_hash=digest).order_by('-created_at').first()
+        if latest is not None:
+            if _is_reusable(latest, now):
+                return latest, False
+            if latest.is_active:
+                logger.warning(f"Построение {latest} зависло - заказываем заново")
+                ReportJob.objects.filter(pk=latest.pk, status=latest.status).update(
+                    status=ReportJob.STATUS_FAILED, error="Построение зависло", finished_at=now,
+                )
+
+    job = ReportJob.objects.create(
+        kind=kind,
+        params=params,
+        params_hash=digest,
+        requested_by=user if user is not None and user.is_authenticated else None,
+    )
+    db_transaction.on_commit(lambda: _enqueue(job.id))
+    return job, True
+
+
+def _enqueue(job_id: int):
+    from ..tasks import build_report
+
+    try:
+        build_report.delay(job_id)
+    except Exception as e:
+        logger.error(f"Не удалось поставить отчет {job_id} в очередь - {e}")
+        ReportJob.objects.filter(pk=job_id, status=ReportJob.STATUS_PENDING).update(
+            status=ReportJob.STATUS_FAILED, error=f"Очередь недоступна: {e}", finished_at=timezone.now(),
+        )
+
+
+def run_report_job(job_id: int) -> Optional[ReportJob]:
+    """Построить отчет (вызывается из Celery). Файл пишется рядом и переименовывается в конце"""
+    claimed = ReportJob.objects.filter(pk=job_id, status=ReportJob.STATUS_PENDING).update(
+        status=ReportJob.STATUS_RUNNING, started_at=timezone.now(),
+    )
+    if not claimed:
+        logger.info(f"Отчет {job_id} уже строится или удален")
+        return None
+
+    job = ReportJob.objects.get(pk=job_id)
+    builder, extension = BUILDERS[job.kind]
+
+    name = f"{REPORTS_DIR}/{job.kind}/{job.params_hash[:16]}-{job.id}.{extension}"
+    path = Path(default_storage.path(name))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.part')
+
+    logger.info(f"Строим отчет {job}: {describe(job.kind, job.params)}")
+    try:
+        # utf-8-sig - чтобы Excel открывал CSV с кириллицей
+        encoding = 'utf-8-sig' if extension == 'csv' else 'utf-8'
+        with open(partial, 'w', encoding=encoding, newline='') as out:
+            rows = builder(job.params, out)
+        os.replace(partial, path)
+    except Exception as e:
+        partial.unlink(missing_ok=True)
+        logger.error(f"Ошибка построения отчета {job} - {e}")
+        ReportJob.objects.filter(pk=job.pk).update(
+            status=ReportJob.STATUS_FAILED, error=str(e)[:2000], finished_at=timezone.now(),
+        )
+        job.refresh_from_db()
+        return job
+
+    ReportJob.objects.filter(pk=job.pk).update(
+        status=ReportJob.STATUS_DONE, file=name, rows=rows, finished_at=timezone.now(),
+    )
+    job.refresh_from_db()
+    logger.info(f"Отчет {job} готов: {rows} строк за {job.duration:.1f} с")
+    return job
+
+
+def prune_report_jobs(keep_days: int) -> int:
+    """Удалить старые отчеты вместе с файлами"""
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    deleted = 0
+    for job in ReportJob.objects.filter(created_at__lt=cutoff).only('id', 'file'):
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        deleted += 1
+    return deleted
+
+
+# Отчеты
+
+def _day_start(day: date):
+    return timezone.make_aware(datetime.combine(day, time_type.min))
+
+
+def filter_by_dates(rows: list, date_from: Optional[str], date_to: Optional[str]) -> list:
+    """Записи СКУД в диапазоне дат (по дате punch_time, включительно)"""
+    filtered = []
+    for row in rows:
+        # Формат punch_time: "2025-12-01 08:30:15" - даты сравниваются как строки
+        day = (row.get('punch_time') or '')[:10]
+        if len(day) != 10:
+            continue
+        if date_from and day < date_from:
+            continue
+        if date_to and day > date_to:
+            continue
+        filtered.append(row)
+    return filtered
+
+
+def build_backup(params: dict, out: TextIO) -> int:
+    """Полный бэкап записей с сервера СКУД (формат import_backup)"""
+    source = SkudSource.objects.get(code=params['source'])
+    url = f"{source.base_url}/iclock/api/transactions/"
+    query = {
+        'format': 'json',
+        'page_size': 80000,
+        'ordering': '-id',
+    }
+
+    response = fetch_scud_data(source, url, query, max_retries=3, timeout=300)
+    data = response.json()
+    all_transactions = data.get('data', [])
+
+    if params['date_from'] or params['date_to']:
+        data['data'] = filter_by_dates(all_transactions, params['date_from'], params['date_to'])
+        data['count'] = len(data['data'])
+        data['filter_info'] = {
+            'date_gte': params['date_from'],
+            'date_lte': params['date_to'],
+            'original_count': len(all_transactions),
+            'filtered_count': len(data['data']),
+            'filter_applied': True
+        }
+
+    json.dump(data, out, ensure_ascii=False, indent=2)
+    return len(data.get('data', []))
+
+
+def build_employee_history(params: dict, out: TextIO) -> int:
+    """Все отметки сотрудника за месяц (по коду - включая непривязанные)"""
+    first, next_month = _month_bounds(params['month'])
+    emp_code = params['emp_code']
+
+    punches = Transaction.objects.filter(
+        Q(emp_code=emp_code) | Q(employee__emp_code=emp_code),
+        punch_time__gte=_day_start(first),
+        punch_time__lt=_day_start(next_month),
+    ).select_related('terminal', 'source').order_by('punch_time', 'id')
+
+    writer = csv.writer(out, delimiter=';')
+    writer.writerow(['Дата', 'Время', 'Событие', 'Терминал', 'Зона', 'Способ', 'Сервер СКУД'])
+
+    rows = 0
+    for punch in punches.iterator(chunk_size=2000):
+        local = timezone.localtime(punch.punch_time)
+        writer.writerow([
+            local.strftime('%d.%m.%Y'),
+            local.strftime('%H:%M:%S'),
+            'Вход' if punch.is_entry else 'Выход',
+            punch.terminal.terminal_alias,
+            punch.terminal.area_alias,
+            VERIFY_TYPES.get(punch.verify_type, punch.verify_type),
+            punch.source.name,
+        ])
+        rows += 1
+    return rows
+
+
+def build_terminal_occupancy(params: dict, out: TextIO) -> int:
+    """Загруженность терминала по дням: входы, выходы, сотрудники и максимум на пункте"""
+    date_from = date.fromisoformat(params['date_from'])
+    date_to = date.fromisoformat(params['date_to'])
+
+    punches = Transaction.objects.filter(
+        terminal_id=params['terminal'],
+        punch_time__gte=_day_start(date_from),
+        punch_time__lt=_day_start(date_to + timedelta(days=1)),
+    ).order_by('punch_time', 'id').values_list('punch_time', 'emp_code', 'punch_state')
+
+    days = {}
+    current_day = None
+    on_site = set()
+    for punch_time, emp_code, punch_state in punches.iterator(chunk_size=5000):
+        local = timezone.localtime(punch_time)
+        day = local.date()
+        if day != current_day:
+            # Присутствие считается в пределах суток (как автовыход)
+            current_day = day
+            on_site = set()
+            stats = days[day] = {'entries': 0, 'exits': 0, 'employees': set(), 'peak': 0,
+                                 'first_entry': None, 'last_exit': None, 'on_site': on_site}
+
+        stats['employees'].add(emp_code)
+        if punch_state in ('0', 'I'):
+            stats['entries'] += 1
+            on_site.add(emp_code)
+            stats['first_entry'] = stats['first_entry'] or local
+        else:
+            stats['exits'] += 1
+            on_site.discard(emp_code)
+            stats['last_exit'] = local
+        stats['peak'] = max(stats['peak'], len(on_site))
+
+    writer = csv.writer(out, delimiter=';')
+    writer.writerow(['Дата', 'Входов', 'Выходов', 'Сотрудников', 'Максимум на пункте',
+                     'Первый вход', 'Последний выход', 'Остались на конец дня'])
+
+    day = date_from
+    rows = 0
+    while day <= date_to:
+        stats = days.get(day)
+        if stats is None:
+            writer.writerow([day.strftime('%d.%m.%Y'), 0, 0, 0, 0, '', '', 0])
+        else:
+            writer.writerow([
+                day.strftime('%d.%m.%Y'),
+                stats['entries'],
+                stats['exits'],
+                len(stats['employees']),
+                stats['peak'],
+                stats['first_entry'].strftime('%H:%M') if stats['first_entry'] else '',
+                stats['last_exit'].strftime('%H:%M') if stats['last_exit'] else '',
+                len(stats['on_site']),
+            ])
+        rows += 1
+        day += timedelta(days=1)
+    return rows
+
+
+def _hours(seconds: float) -> str:
+    # Десятичная запятая - для Excel с русской локалью
+    return f"{seconds / 3600:.2f}".replace('.', ',')
+
+
+def build_timesheet_report(params: dict, out: TextIO) -> int:
+    """Табель за месяц: часы на пункте по дням по визитам (services/visits.py)"""
+    first, next_month = _month_bounds(params['month'])
+    days = [first + timedelta(days=i) for i in range((next_month - first).days)]
+
+    writer = csv.writer(out, delimiter=';')
+    writer.writerow(['Код', 'Сотрудник'] + [day.strftime('%d') for day in days] +
+                    ['Часов', 'Визитов', 'Без выхода', 'Без входа', 'Автовыходов'])
+
+    rows = 0
+    for sheet in build_timesheet(params['month']):
+        writer.writerow(
+            [sheet['emp_code'], sheet['name']] +
+            [_hours(sheet['days'][day]) if sheet['days'].get(day) else '' for day in days] +
+            [_hours(sheet['total']), sheet['visits'], sheet['no_exit'], sheet['no_entry'], sheet['auto']]
+        )
+        rows += 1
+    return rows
+
+
+# Тип отчета -> (построитель, расширение файла)
+BUILDERS = {
+    ReportJob.KIND_BACKUP: (build_backup, 'json'),
+    ReportJob.KIND_EMPLOYEE_HISTORY: (build_employee_history, 'csv'),
+    ReportJob.KIND_TERMINAL_OCCUPANCY: (build_terminal_occupancy, 'csv'),
+    ReportJob.KIND_TIMESHEET: (build_timesheet_report, 'csv'),
+}
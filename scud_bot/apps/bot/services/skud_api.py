@@ -0,0 +1,54 @@
+import logging
+
+import requests
+
+from ..models import SkudSource
+from .autologger import AutoLogger
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_scud_data(source: SkudSource, url: str, params: dict, max_retries: int = 2, timeout: int = 30):
+    """Запрос к API сервера СКУД с автополучением куки (новая кука сохраняется в SkudSource)"""
+    session_cookie = source.session_cookie
+
+    for attempt in range(max_retries):
+        try:
+            cookies = {'sessionid': session_cookie}
+
+            response = requests.get(
+                url,
+                params=params,
+                cookies=cookies,
+                timeout=timeout
+            )
+
+            # успех
+            if response.status_code == 200:
+                return response
+
+            # сессия умерла - обновляем куку
+            if response.status_code == 401 and attempt < max_retries - 1:
+                logger.info("Сессия истекла, получаем новую куку...")
+
+                autologger = AutoLogger(base_url=source.base_url, credentials=source.credentials)
+                new_cookie = autologger.get_new_cookie()
+
+                if new_cookie:
+                    session_cookie = new_cookie
+                    SkudSource.objects.filter(pk=source.pk).update(session_cookie=new_cookie)
+                    logger.info("Кука обновлена")
+                    continue
+                else:
+                    raise Exception("Не удалось получить новую куку")
+
+            # другие ошибки - сразу падаем
+            response.raise_for_status()
+
+        except requests.exceptions.RequestException as e:
+            if attempt < max_retries - 1:
+                logger.warning(f"Ошибка запроса, пробуем снова: {e}")
+                continue
+            raise
+
+    raise Exception("Все попытки запроса исчерпаны")
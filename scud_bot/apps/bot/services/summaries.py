@@ -0,0 +1,201 @@
+import logging
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from ..models import DaySummary, Employee, Visit
+from .visits import split_by_day
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+
+def build_summaries(emp_codes: Optional[Iterable[str]], first_day: date, last_day: date) -> int:
+    """Пересобрать сводки сотрудников за дни [first_day, last_day] из визитов (None - все сотрудники)"""
+    if emp_codes is not None:
+        emp_codes = sorted(set(emp_codes))
+        if not emp_codes:
+            return 0
+    start = timezone.make_aware(datetime.combine(first_day, dt_time.min))
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), dt_time.min))
+
+    # Визиты, задевающие дни: начатые в них и ночные смены с предыдущего дня
+    visits = Visit.objects.filter(
+        started_at__lt=end,
+        started_at__gte=start - timedelta(hours=settings.VISITS_CONFIG['MAX_VISIT_HOURS']),
+    ).filter(
+        Q(started_at__gte=start) | Q(ended_at__gt=start) | Q(status=Visit.STATUS_OPEN)
+    )
+    if emp_codes is not None:
+        visits = visits.filter(emp_code__in=emp_codes)
+    visits = visits.order_by('started_at', 'id').values_list(
+        'emp_code', 'terminal_id', 'exit__terminal_id', 'started_at', 'ended_at', 'status',
+    )
+
+    summaries = {}
+
+    def summary(emp_code: str, day: date) -> DaySummary:
+        row = summaries.get((emp_code, day))
+        if row is None:
+            row = summaries[(emp_code, day)] = DaySummary(emp_code=emp_code, day=day)
+        return row
+
+    def punch(emp_code: str, moment: datetime, terminal_id: int, is_entry: bool):
+        if not start <= moment < end:
+            return
+        row = summary(emp_code, timezone.localtime(moment).date())
+        # Визиты идут по времени входа - первый встреченный вход и есть первый за день
+        if is_entry and row.first_entry_at is None:
+            row.first_entry_at, row.first_terminal_id = moment, terminal_id
+        if row.last_punch_at is None or moment >= row.last_punch_at:
+            row.last_punch_at, row.last_terminal_id, row.last_is_entry = moment, terminal_id, is_entry
+
+    for emp_code, terminal_id, exit_terminal_id, started_at, ended_at, status in visits.iterator(chunk_size=5000):
+        if status != Visit.STATUS_NO_ENTRY:
+            punch(emp_code, started_at, terminal_id, True)
+        if status in (Visit.STATUS_CLOSED, Visit.STATUS_AUTO, Visit.STATUS_NO_ENTRY):
+            punch(emp_code, ended_at, exit_terminal_id, False)
+
+        if status in (Visit.STATUS_CLOSED, Visit.STATUS_AUTO):
+            for day, seconds in split_by_day(max(started_at, start), min(ended_at, end)):
+                summary(emp_code, day).worked += round(seconds)
+        elif status == Visit.STATUS_OPEN and started_at >= start:
+            summary(emp_code, timezone.localtime(started_at).date()).open_since = started_at
+
+    stale = DaySummary.objects.filter(day__gte=first_day, day__lte=last_day)
+    if emp_codes is not None:
+        stale = stale.filter(emp_code__in=emp_codes)
+    with db_transaction.atomic():
+        stale.delete()
+        DaySummary.objects.bulk_create(list(summaries.values()), batch_size=2000)
+    return len(summaries)
+
+
+def update_summaries(punches: Iterable) -> int:
+    """Пересобрать сводки дней, которых коснулись новые отметки (после сборки визитов)
+
+    Предыдущий день тоже: выход мог закрыть ночную смену, начатую вчера.
+    """
+    punches = [punch for punch in punches if punch.emp_code]
+    if not punches:
+        return 0
+    days = [timezone.localtime(punch.punch_time).date() for punch in punches]
+    return build_summaries({punch.emp_code for punch in punches},
+                           min(days) - timedelta(days=1), max(days))
+
+
+def rebuild_summaries(since: Optional[datetime] = None, emp_codes: Optional[List[str]] = None) -> int:
+    """Пересобрать сводки с даты since (по умолчанию - с первого визита) по сегодня"""
+    if since is None:
+        first = Visit.objects.aggregate(first=Min('started_at'))['first']
+        if first is None:
+            return 0
+        since = first
+    return build_summaries(emp_codes, timezone.localtime(since).date(), timezone.localdate())
+
+
+# Ответы бота
+
+def format_duration(seconds: float) -> str:
+    minutes = int(seconds) // 60
+    return f"{minutes // 60} ч {minutes % 60:02d} мин"
+
+
+class EmployeeSummary:
+    """Сводки сотрудника за текущую неделю и вчера (ночная смена) - одним запросом"""
+
+    def __init__(self, employee: Employee, now: Optional[datetime] = None):
+        self.employee = employee
+        self.now = timezone.localtime(now or timezone.now())
+        self.today = self.now.date()
+        self.week_start = self.today - timedelta(days=self.today.weekday())
+
+        self.rows = {
+            row.day: row
+            for row in DaySummary.objects.filter(
+                emp_code=employee.emp_code,
+                day__gte=min(self.week_start, self.today - timedelta(days=1)),
+                day__lte=self.today,
+            ).select_related('first_terminal', 'last_terminal')
+        }
+        self.open_row = self._open_row()
+
+    def _open_row(self) -> Optional[DaySummary]:
+        """Сводка дня, в который начат еще открытый визит (старше MAX_VISIT_HOURS - уже без выхода)"""
+        max_visit = timedelta(hours=settings.VISITS_CONFIG['MAX_VISIT_HOURS'])
+        for day in sorted(self.rows, reverse=True):
+            row = self.rows[day]
+            if row.open_since and row.last_punch_at == row.open_since:
+                return row if self.now - row.open_since <= max_visit else None
+            if row.last_punch_at:
+                return None
+        return None
+
+    def worked(self, day: date) -> float:
+        """Отработано за день, с открытым визитом - по текущий момент"""
+        row = self.rows.get(day)
+        seconds = row.worked if row else 0
+        if self.open_row:
+            for open_day, open_seconds in split_by_day(self.open_row.open_since, self.now):
+                if open_day == day:
+                    seconds += open_seconds
+        return seconds
+
+    def today_text(self) -> str:
+        row = self.rows.get(self.today)
+        lines = [f"Сегодня, {self.today.strftime('%d.%m.%Y')}:"]
+        if row is None and self.open_row is None:
+            lines.append("Отметок пока нет")
+            return '\n'.join(lines)
+
+        if row and row.first_entry_at:
+            lines.append(f"Приход: {timezone.localtime(row.first_entry_at).strftime('%H:%M')} "
+                         f"({row.first_terminal.terminal_alias if row.first_terminal else '-'})")
+        lines.append(f"Отработано: {format_duration(self.worked(self.today))}")
+        lines.append(self._status_line())
+        return '\n'.join(lines)
+
+    def week_text(self) -> str:
+        days = [self.week_start + timedelta(days=i) for i in range((self.today - self.week_start).days + 1)]
+        worked = {day: self.worked(day) for day in days}
+        lines = [f"Неделя с {self.week_start.strftime('%d.%m')}: {format_duration(sum(worked.values()))}"]
+        for day in days:
+            if worked[day]:
+                lines.append(f"{WEEKDAYS[day.weekday()]} {day.strftime('%d.%m')} - {format_duration(worked[day])}")
+        return '\n'.join(lines)
+
+    def where_text(self) -> str:
+        return self._status_line()
+
+    def _last_row(self) -> Optional[DaySummary]:
+        for day in sorted(self.rows, reverse=True):
+            if self.rows[day].last_punch_at:
+                return self.rows[day]
+        # Давно не отмечался - последняя сводка вообще (отдельный запрос)
+        return DaySummary.objects.filter(
+            emp_code=self.employee.emp_code, last_punch_at__isnull=False,
+        ).select_related('last_terminal').first()
+
+    def _status_line(self) -> str:
+        if self.open_row:
+            row = self.open_row
+            terminal = row.last_terminal.terminal_alias if row.last_terminal else '-'
+            return f"Сейчас на пункте {terminal} с {self._moment(row.open_since)}"
+
+        row = self._last_row()
+        if row is None:
+            return "Отметок пока нет"
+        terminal = row.last_terminal.terminal_alias if row.last_terminal else '-'
+        action = 'вход' if row.last_is_entry else 'выход'
+        return f"Последняя отметка: {action} {self._moment(row.last_punch_at)}, {terminal}"
+
+    def _moment(self, moment: datetime) -> str:
+        moment = timezone.localtime(moment)
+        if moment.date() == self.today:
+            return moment.strftime('%H:%M')
+        return moment.strftime('%H:%M %d.%m.%Y')
@@ -0,0 +1,216 @@
+import logging
+import random
+from datetime import datetime, time as time_type, timedelta
+from typing import Callable, Iterator, List, Optional
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ..models import Employee, SkudSource, Terminal, Transaction
+from .lookup_cache import publish_invalidation
+
+logger = logging.getLogger(__name__)
+
+# Синтетические данные живут в своих диапазонах ID - их можно удалить, не задев реальные
+SKUD_ID_BASE = 1_000_000_000
+EMP_ID_BASE = 900_000_000
+TERMINAL_ID_BASE = 900_000
+EMP_CODE_PREFIX = 'S'
+
+# Терминалы и записи - на отдельном (не опрашиваемом) сервере СКУД,
+# чтобы не сдвинуть курсор монитора основного
+SYNTHETIC_SOURCE = 'synthetic'
+
+
+def synthetic_source() -> SkudSource:
+    source, _ = SkudSource.objects.get_or_create(
+        code=SYNTHETIC_SOURCE,
+        defaults={'name': 'Синтетические данные', 'base_url': '', 'is_enabled': False},
+    )
+    return source
+
+
+class SyntheticDataset:
+    """Генератор реалистичных данных для нагрузочных тестов
+
+    Сотрудники приходят утром и уходят вечером через один из терминалов
+    своей зоны, часть отметок - с кодами, которых нет в справочнике
+    (непривязанные), часть сотрудников остается на пункте (цель автовыхода).
+    Последний день набора - сегодня.
+    """
+
+    AREAS = ['Север', 'Юг', 'Центр', 'Склад']
+
+    def __init__(self, employees: int = 1000, terminals: int = 12, days: int = 30,
+                 unlinked_ratio: float = 0.05, stay_ratio: float = 0.1,
+                 batch_size: int = 10000, seed: Optional[int] = None):
+        self.employees = employees
+        self.terminals = terminals
+        self.days = days
+        self.unlinked_ratio = unlinked_ratio
+        self.stay_ratio = stay_ratio
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.source = synthetic_source()
+
+    @classmethod
+    def seeded(cls, **kwargs) -> Optional['SyntheticDataset']:
+        """Генератор под уже созданный набор (seed_synthetic): справочники он не дополняет
+
+        None - синтетических сотрудников или терминалов в БД нет.
+        """
+        employees = Employee.objects.filter(emp_id__gte=EMP_ID_BASE).count()
+        terminals = Terminal.objects.filter(source__code=SYNTHETIC_SOURCE, terminal_id__gte=TERMINAL_ID_BASE).count()
+        if not employees or not terminals:
+            return None
+        return cls(employees=employees, terminals=terminals, **kwargs)
+
+    @staticmethod
+    def clear() -> dict:
+        """Удалить все синтетические данные"""
+        with db_transaction.atomic():
+            transactions, _ = Transaction.objects.filter(source__code=SYNTHETIC_SOURCE).delete()
+            Transaction.objects.filter(employee__emp_id__gte=EMP_ID_BASE).update(employee=None)
+
+            # Без ORM delete - иначе сигнал сброса кэша на каждого из тысяч сотрудников
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {Employee._meta.db_table} WHERE emp_id >= %s', [EMP_ID_BASE])
+                employees = cursor.rowcount
+
+            terminals, _ = Terminal.objects.filter(source__code=SYNTHETIC_SOURCE).delete()
+
+            # Справочник перестраиваем один раз целиком
+            publish_invalidation('employee')
+        return {'transactions': transactions, 'employees': employees, 'terminals': terminals}
+
+    @staticmethod
+    def next_skud_id() -> int:
+        last = Transaction.objects.filter(source__code=SYNTHETIC_SOURCE, skud_id__gte=SKUD_ID_BASE) \
+            .aggregate(m=Max('skud_id'))['m']
+        return (last or SKUD_ID_BASE - 1) + 1
+
+    def ensure_terminals(self) -> List[Terminal]:
+        terminals = Terminal.objects.filter(source=self.source)
+        existing = {t.terminal_id: t for t in terminals}
+        missing = [
+            Terminal(
+                source=self.source,
+                terminal_id=TERMINAL_ID_BASE + i,
+                terminal_sn=f'SYN{i:05d}',
+                terminal_alias=f'Пункт {self.AREAS[i % len(self.AREAS)]} {i // len(self.AREAS) + 1}',
+                area_alias=self.AREAS[i % len(self.AREAS)],
+                # Отслеживается примерно треть терминалов, как на проде
+                is_monitored=i % 3 == 0,
+            )
+            for i in range(self.terminals) if TERMINAL_ID_BASE + i not in existing
+        ]
+        Terminal.objects.bulk_create(missing)
+        if missing:
+            publish_invalidation('terminal')
+        return list(terminals.filter(terminal_id__lt=TERMINAL_ID_BASE + self.terminals))
+
+    def ensure_employees(self) -> List[Employee]:
+        existing = set(Employee.objects.filter(emp_id__gte=EMP_ID_BASE).values_list('emp_id', flat=True))
+        missing = [
+            Employee(
+                emp_id=EMP_ID_BASE + i,
+                emp_code=f'{EMP_CODE_PREFIX}{i}',
+                name=f'Сотрудник {i}',
+                auto_logout=i % 2 == 0,
+            )
+            for i in range(self.employees) if EMP_ID_BASE + i not in existing
+        ]
+        # bulk_create не вызывает save() и сигналы - справочник обновляем одним перестроением
+        Employee.objects.bulk_create(missing, batch_size=self.batch_size)
+        if missing:
+            publish_invalidation('employee')
+        return list(Employee.objects.filter(emp_id__gte=EMP_ID_BASE,
+                                            emp_id__lt=EMP_ID_BASE + self.employees))
+
+    def _punches(self, count: int, employees: List[Employee], terminals: List[Terminal]) -> Iterator[tuple]:
+        """(employee или None, emp_code, terminal, punch_time, punch_state) - count штук"""
+        today = timezone.localdate()
+        first_day = today - timedelta(days=self.days - 1)
+        by_area = {}
+        for terminal in terminals:
+            by_area.setdefault(terminal.area_alias, []).append(terminal)
+        areas = list(by_area.values())
+
+        produced = 0
+        while produced < count:
+            day = first_day + timedelta(days=self.random.randrange(self.days))
+            if self.random.random() < self.unlinked_ratio:
+                employee = None
+                emp_code = f'{EMP_CODE_PREFIX}X{self.random.randrange(self.employees)}'
+            else:
+                employee = self.random.choice(employees)
+                emp_code = employee.emp_code
+
+            terminal = self.random.choice(self.random.choice(areas))
+            entry = timezone.make_aware(datetime.combine(day, time_type(6))) + timedelta(
+                minutes=self.random.randrange(240), seconds=self.random.randrange(60)
+            )
+            yield employee, emp_code, terminal, entry, '0'
+            produced += 1
+
+            if produced < count and self.random.random() >= self.stay_ratio:
+                exit_time = entry + timedelta(minutes=self.random.randrange(240, 720))
+                yield employee, emp_code, terminal, exit_time, '1'
+                produced += 1
+
+    def generate(self, transactions: int, progress: Optional[Callable[[int], None]] = None) -> dict:
+        terminals = self.ensure_terminals()
+        employees = self.ensure_employees()
+        skud_id = self.next_skud_id()
+
+        batch = []
+        created = 0
+        for employee, emp_code, terminal, punch_time, punch_state in self._punches(transactions, employees, terminals):
+            batch.append(Transaction(
+                source=self.source,
+                skud_id=skud_id,
+                employee=employee,
+                emp_code=emp_code,
+                terminal=terminal,
+                punch_time=punch_time,
+                punch_state=punch_state,
+                verify_type=self.random.choice((1, 4, 15)),
+            ))
+            skud_id += 1
+
+            if len(batch) >= self.batch_size:
+                Transaction.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+                if progress:
+                    progress(created)
+
+        if batch:
+            Transaction.objects.bulk_create(batch)
+            created += len(batch)
+            if progress:
+                progress(created)
+
+        logger.info(f"Синтетика: {created} записей, {len(employees)} сотрудников, {len(terminals)} терминалов")
+        return {'transactions': created, 'employees': len(employees), 'terminals': len(terminals)}
+
+    def backup_rows(self, count: int, start_id: int) -> List[dict]:
+        """Записи в формате бэкапа СКУД (для замеров import_backup)"""
+        terminals = self.ensure_terminals()
+        employees = self.ensure_employees()
+        rows = []
+        for i, (employee, emp_code, terminal, punch_time, punch_state) in enumerate(
+                self._punches(count, employees, terminals)):
+            rows.append({
+                'id': start_id + i,
+                'emp_code': emp_code,
+                'terminal': terminal.terminal_id,
+                'terminal_sn': terminal.terminal_sn,
+                'terminal_alias': terminal.terminal_alias,
+                'area_alias': terminal.area_alias,
+                'punch_time': timezone.localtime(punch_time).strftime('%Y-%m-%d %H:%M:%S'),
+                'punch_state': punch_state,
+                'verify_type': 15,
+            })
+        return rows
@@ -0,0 +1,151 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from typing import List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import PunchTrace
+
+logger = logging.getLogger(__name__)
+
+MONITOR_FIELDS = ['emp_code', 'terminal_id', 'punch_time', 'fetched_at',
+                  'fetch_ms', 'lookup_ms', 'insert_ms', 'enqueue_ms', 'ingest_ms']
+DELIVERY_FIELDS = ['queue_ms', 'telegram_ms', 'delivery_ms', 'delivered_at']
+
+
+class Trace:
+    """Замеры стадий обработки одной отметки"""
+
+    def __init__(self, source_id: int, skud_data: dict, fetched_at: float, fetch_ms: float):
+        self.source_id = source_id
+        self.skud_id = skud_data.get('id')
+        self.emp_code = skud_data.get('emp_code') or ''
+        self.terminal_id = skud_data.get('terminal')
+        self.fetched_at = fetched_at  # time.time() момента получения из СКУД
+        self.punch_time = None
+        self.stored = False
+        self.stages = {'fetch_ms': fetch_ms}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            key = f'{stage}_ms'
+            self.stages[key] = self.stages.get(key, 0.0) + (time.perf_counter() - started) * 1000
+
+    def mark_stored(self, punch_time):
+        """Отметка записана в БД - трассировку нужно сохранить"""
+        self.stored = True
+        self.punch_time = punch_time
+
+    def to_model(self) -> PunchTrace:
+        return PunchTrace(
+            source_id=self.source_id,
+            skud_id=self.skud_id,
+            emp_code=self.emp_code,
+            terminal_id=self.terminal_id,
+            punch_time=self.punch_time,
+            fetched_at=datetime.fromtimestamp(self.fetched_at, tz=dt_timezone.utc),
+            ingest_ms=self.stages['fetch_ms'] + (time.perf_counter() - self._started) * 1000,
+            **self.stages,
+        )
+
+
+class _NoTrace:
+    """Заглушка, когда трассировка выключена"""
+    fetched_at = None
+
+    @contextmanager
+    def span(self, stage: str):
+        yield
+
+    def mark_stored(self, punch_time):
+        pass
+
+
+NO_TRACE = _NoTrace()
+
+
+class Tracer:
+    """Копит трассировки опроса и пишет их в БД одним запросом (кольцевой буфер)"""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, source_id: int):
+        self.source_id = source_id
+        self.enabled = settings.TRACING_CONFIG['ENABLED']
+        self.max_rows = settings.TRACING_CONFIG['MAX_ROWS']
+        self._pending: List[Trace] = []
+        self._flushes = 0
+
+    def start(self, skud_data: dict, fetched_at: float, fetch_ms: float):
+        if not self.enabled:
+            return NO_TRACE
+        trace = Trace(self.source_id, skud_data, fetched_at, fetch_ms)
+        self._pending.append(trace)
+        return trace
+
+    def flush(self):
+        traces = [t.to_model() for t in self._pending if t.stored]
+        self._pending = []
+        if not traces:
+            return
+
+        try:
+            # Доставка могла записать свои стадии раньше - обновляем только поля монитора
+            PunchTrace.objects.bulk_create(
+                traces,
+                update_conflicts=True,
+                unique_fields=['source', 'skud_id'],
+                update_fields=MONITOR_FIELDS,
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить трассировки - {e}")
+            return
+
+        self._flushes += 1
+        if self._flushes % self.PRUNE_EVERY == 0:
+            prune_traces(self.max_rows)
+
+
+def prune_traces(max_rows: int):
+    """Оставить только max_rows последних трассировок"""
+    boundary = PunchTrace.objects.order_by('-id').values_list('id', flat=True)[max_rows:max_rows + 1]
+    boundary = list(boundary)
+    if boundary:
+        deleted, _ = PunchTrace.objects.filter(id__lte=boundary[0]).delete()
+        logger.debug(f"Удалено {deleted} старых трассировок")
+
+
+def record_delivery(source_id: int, skud_id: int, fetched_at: Optional[float],
+                    enqueued_at: Optional[float], started_at: float, telegram_ms: float):
+    """Записать стадии доставки уведомления (из Celery задачи или монитора)"""
+    if not settings.TRACING_CONFIG['ENABLED'] or not skud_id:
+        return
+
+    now = time.time()
+    trace = PunchTrace(
+        source_id=source_id,
+        skud_id=skud_id,
+        queue_ms=(started_at - enqueued_at) * 1000 if enqueued_at else None,
+        telegram_ms=telegram_ms,
+        delivery_ms=(now - fetched_at) * 1000 if fetched_at else None,
+        delivered_at=timezone.now(),
+    )
+
+    try:
+        # Монитор мог еще не сохранить свою часть - upsert по (source, skud_id)
+        PunchTrace.objects.bulk_create(
+            [trace],
+            update_conflicts=True,
+            unique_fields=['source', 'skud_id'],
+            update_fields=DELIVERY_FIELDS,
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить трассировку доставки {skud_id} - {e}")
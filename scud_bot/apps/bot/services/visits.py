@@ -0,0 +1,329 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time as time_type, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Employee, Transaction, Visit
+
+logger = logging.getLogger(__name__)
+
+AUTO_LOGOUT_VERIFY_TYPE = 99
+
+VISIT_FIELDS = ['terminal', 'entry', 'exit', 'started_at', 'ended_at', 'present_until', 'duration', 'status']
+
+# Поля отметки, которые нужны для сборки (values_list(named=True) и Transaction подходят одинаково)
+PUNCH_FIELDS = ['id', 'emp_code', 'terminal_id', 'punch_time', 'punch_state', 'verify_type']
+
+
+class Sessionizer:
+    """Сборка визитов одного сотрудника из его отметок, по порядку времени
+
+    Правила:
+    - повторный вход в пределах DUPLICATE_GAP от входа - повторное прикладывание, пропускается;
+    - вход при открытом визите - у прошлого визита не было выхода (no_exit);
+    - выход закрывает открытый визит; автовыход (verify_type=99) - со статусом auto;
+    - визит длиннее MAX_VISIT_HOURS не закрывается выходом: без выхода + выход без входа;
+    - выход без открытого визита - визит "нет входа" (повторный выход и лишний автовыход - пропуск).
+
+    Визит не режется по суткам: ночная смена - один интервал, по дням его делит табель.
+    """
+
+    def __init__(self, last: Optional[Visit] = None):
+        config = settings.VISITS_CONFIG
+        self.duplicate_gap = timedelta(seconds=config['DUPLICATE_GAP'])
+        self.max_visit = timedelta(hours=config['MAX_VISIT_HOURS'])
+        # Последний визит сотрудника - состояние, от которого продолжаем
+        self.last = last
+        self.touched: Dict[int, Visit] = {}
+
+    def feed(self, punch):
+        last = self.last
+        is_open = last is not None and last.status == Visit.STATUS_OPEN
+
+        if punch.punch_state in ('0', 'I'):
+            if is_open:
+                if punch.punch_time - last.started_at <= self.duplicate_gap:
+                    return
+                self._mark_no_exit(last, until=punch.punch_time)
+            self._start(punch, Visit.STATUS_OPEN)
+            return
+
+        if is_open:
+            if punch.punch_time - last.started_at <= self.max_visit:
+                last.exit_id = punch.id
+                last.ended_at = punch.punch_time
+                last.present_until = punch.punch_time
+                last.duration = int((punch.punch_time - last.started_at).total_seconds())
+                last.status = Visit.STATUS_AUTO if punch.verify_type == AUTO_LOGOUT_VERIFY_TYPE \
+                    else Visit.STATUS_CLOSED
+                self._touch(last)
+                return
+            self._mark_no_exit(last, until=punch.punch_time)
+
+        if punch.verify_type == AUTO_LOGOUT_VERIFY_TYPE:
+            return
+        if last is not None and last.ended_at and punch.punch_time - last.ended_at <= self.duplicate_gap:
+            return
+        self._start(punch, Visit.STATUS_NO_ENTRY)
+
+    def expire(self, now: datetime):
+        """Открытый визит старше MAX_VISIT_HOURS - выхода уже не будет"""
+        if self.last is not None and self.last.status == Visit.STATUS_OPEN \
+                and now - self.last.started_at > self.max_visit:
+            self._mark_no_exit(self.last)
+
+    def _start(self, punch, status: str):
+        visit = Visit(
+            emp_code=punch.emp_code,
+            terminal_id=punch.terminal_id,
+            started_at=punch.punch_time,
+            status=status,
+        )
+        if status == Visit.STATUS_NO_ENTRY:
+            # Когда вошел - неизвестно: присутствия такой визит не дает (пустой интервал)
+            visit.exit_id = punch.id
+            visit.ended_at = punch.punch_time
+            visit.present_until = punch.punch_time
+        else:
+            visit.entry_id = punch.id
+        self.last = visit
+        self._touch(visit)
+
+    def _mark_no_exit(self, visit: Visit, until: Optional[datetime] = None):
+        visit.status = Visit.STATUS_NO_EXIT
+        visit.ended_at = None
+        # Без выхода считаем на пункте до конца дня входа (как "кто на пункте сегодня"),
+        # но не дольше следующей отметки сотрудника
+        day_end = _day_start(timezone.localtime(visit.started_at).date() + timedelta(days=1))
+        visit.present_until = min(day_end, until) if until else day_end
+        visit.exit_id = None
+        visit.duration = 0
+        self._touch(visit)
+
+    def _touch(self, visit: Visit):
+        self.touched[id(visit)] = visit
+
+
+def _save(visits: Iterable[Visit]):
+    new = []
+    changed = []
+    for visit in visits:
+        (changed if visit.pk else new).append(visit)
+    if new:
+        Visit.objects.bulk_create(new, batch_size=1000)
+    if changed:
+        Visit.objects.bulk_update(changed, VISIT_FIELDS, batch_size=1000)
+
+
+def _reopen(visit: Visit, since: datetime) -> Visit:
+    """Вернуть визит в состояние до отметок начиная с since (их соберем заново)"""
+    if visit.status != Visit.STATUS_NO_ENTRY and (visit.ended_at is None or visit.ended_at >= since):
+        visit.status = Visit.STATUS_OPEN
+        visit.ended_at = None
+        visit.present_until = None
+        visit.exit_id = None
+        visit.duration = 0
+    return visit
+
+
+def rebuild_visits(since: Optional[datetime] = None, emp_codes: Optional[List[str]] = None,
+                   now: Optional[datetime] = None) -> dict:
+    """Пакетная сборка визитов: заново с момента since (None - вся история)
+
+    Один проход по отметкам, упорядоченным по (emp_code, время), без запросов на
+    сотрудника: визиты пишутся пачками bulk_create/bulk_update.
+    """
+    now = now or timezone.now()
+    config = settings.VISITS_CONFIG
+    chunk_size = config['BATCH_SIZE']
+    stats = {'punches': 0, 'visits': 0, 'employees': 0}
+
+    visits = Visit.objects.all()
+    punches = Transaction.objects.exclude(emp_code='')
+    if emp_codes is not None:
+        visits = visits.filter(emp_code__in=emp_codes)
+        punches = punches.filter(emp_code__in=emp_codes)
+
+    with db_transaction.atomic():
+        # Состояние на момент since: последний визит каждого сотрудника до него
+        # (раньше, чем за MAX_VISIT_HOURS, визиты от новых отметок уже не меняются)
+        last_visits = {}
+        if since is not None:
+            visits.filter(started_at__gte=since).delete()
+            punches = punches.filter(punch_time__gte=since)
+            earlier = visits.filter(
+                started_at__lt=since,
+                started_at__gte=since - timedelta(hours=config['MAX_VISIT_HOURS']),
+            ).order_by('started_at', 'id')
+            for visit in earlier:
+                last_visits[visit.emp_code] = visit
+            last_visits = {code: _reopen(visit, since) for code, visit in last_visits.items()}
+            Visit.objects.bulk_update(list(last_visits.values()), VISIT_FIELDS, batch_size=1000)
+        else:
+            visits.delete()
+
+        pending: List[Visit] = []
+        current_code = None
+        sessionizer = None
+
+        def finish():
+            sessionizer.expire(now)
+            pending.extend(sessionizer.touched.values())
+            stats['visits'] += len(sessionizer.touched)
+            stats['employees'] += 1
+
+        rows = punches.order_by('emp_code', 'punch_time', 'id').values_list(*PUNCH_FIELDS, named=True)
+        for punch in rows.iterator(chunk_size=chunk_size):
+            if punch.emp_code != current_code:
+                if sessionizer is not None:
+                    finish()
+                    if len(pending) >= chunk_size:
+                        _save(pending)
+                        pending = []
+                current_code = punch.emp_code
+                sessionizer = Sessionizer(last_visits.pop(current_code, None))
+            sessionizer.feed(punch)
+            stats['punches'] += 1
+
+        if sessionizer is not None:
+            finish()
+
+        # Сотрудники без новых отметок - только проверить, не истек ли открытый визит
+        for visit in last_visits.values():
+            idle = Sessionizer(visit)
+            idle.expire(now)
+            pending.extend(idle.touched.values())
+
+        _save(pending)
+
+    logger.info(f"Визиты собраны: {stats['punches']} отметок, {stats['visits']} визитов, "
+                f"{stats['employees']} сотрудников")
+    return stats
+
+
+def expire_open_visits(now: Optional[datetime] = None) -> int:
+    """Открытые визиты старше MAX_VISIT_HOURS - без выхода (сотрудник ушел без отметки)"""
+    now = now or timezone.now()
+    stale = list(Visit.objects.filter(
+        status=Visit.STATUS_OPEN,
+        started_at__lt=now - timedelta(hours=settings.VISITS_CONFIG['MAX_VISIT_HOURS']),
+    ))
+    touched = []
+    for visit in stale:
+        sessionizer = Sessionizer(visit)
+        sessionizer.expire(now)
+        touched.extend(sessionizer.touched.values())
+    _save(touched)
+    return len(touched)
+
+
+def update_visits(punches: Iterable) -> int:
+    """Дособрать визиты по новым отметкам (вызывается монитором после записи пачки)
+
+    Отметки позже последнего визита сотрудника просто продолжают его. Опоздавшие
+    (дочитанные, импортированные) - пересобираем сотрудника с их времени.
+    """
+    by_code = defaultdict(list)
+    for punch in punches:
+        if punch.emp_code:
+            by_code[punch.emp_code].append(punch)
+    if not by_code:
+        return 0
+
+    # Последний визит каждого сотрудника пачки - одним запросом
+    latest = {}
+    window_start = min(p.punch_time for group in by_code.values() for p in group) - \
+        timedelta(hours=settings.VISITS_CONFIG['MAX_VISIT_HOURS'])
+    for visit in Visit.objects.filter(
+        Q(started_at__gte=window_start) | Q(status=Visit.STATUS_OPEN),
+        emp_code__in=list(by_code),
+    ).order_by('started_at', 'id'):
+        latest[visit.emp_code] = visit
+
+    touched = []
+    late = {}
+    for emp_code, group in by_code.items():
+        group.sort(key=lambda p: (p.punch_time, p.id))
+        last = latest.get(emp_code)
+        if last is not None and group[0].punch_time < (last.ended_at or last.started_at):
+            late[emp_code] = group[0].punch_time
+            continue
+
+        sessionizer = Sessionizer(last)
+        for punch in group:
+            sessionizer.feed(punch)
+        touched.extend(sessionizer.touched.values())
+
+    _save(touched)
+
+    for emp_code, since in late.items():
+        logger.info(f"Отметка сотр. {emp_code} пришла с опозданием - пересобираем визиты с {since}")
+        rebuild_visits(since=since, emp_codes=[emp_code])
+
+    return len(touched)
+
+
+# Табель
+
+def _day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time_type.min))
+
+
+def split_by_day(started_at: datetime, ended_at: datetime) -> Iterable[tuple]:
+    """(день, секунды) интервала, разрезанного по местной полуночи"""
+    start = timezone.localtime(started_at)
+    end = timezone.localtime(ended_at)
+    while start < end:
+        next_day = _day_start(start.date() + timedelta(days=1))
+        chunk_end = min(end, next_day)
+        yield start.date(), (chunk_end - start).total_seconds()
+        start = timezone.localtime(chunk_end)
+
+
+def build_timesheet(month: str) -> List[dict]:
+    """Табель за месяц (YYYY-MM): часы по дням и итоги по каждому сотруднику с визитами"""
+    first = datetime.strptime(month, '%Y-%m').date()
+    next_month = (first + timedelta(days=32)).replace(day=1)
+    month_start, month_end = _day_start(first), _day_start(next_month)
+
+    # Визиты, задевающие месяц: начатые в нем и ночные смены с прошлого месяца
+    visits = Visit.objects.filter(
+        started_at__lt=month_end,
+        started_at__gte=month_start - timedelta(hours=settings.VISITS_CONFIG['MAX_VISIT_HOURS']),
+    ).filter(
+        Q(started_at__gte=month_start) | Q(ended_at__gt=month_start)
+    ).order_by().values_list('emp_code', 'started_at', 'ended_at', 'status')
+
+    sheets = {}
+    for emp_code, started_at, ended_at, status in visits.iterator(chunk_size=5000):
+        sheet = sheets.get(emp_code)
+        if sheet is None:
+            sheet = sheets[emp_code] = {
+                'emp_code': emp_code, 'days': defaultdict(float),
+                'visits': 0, 'no_exit': 0, 'no_entry': 0, 'auto': 0,
+            }
+
+        if status in (Visit.STATUS_CLOSED, Visit.STATUS_AUTO):
+            for day, seconds in split_by_day(max(started_at, month_start), min(ended_at, month_end)):
+                sheet['days'][day] += seconds
+            sheet['visits'] += 1
+            if status == Visit.STATUS_AUTO:
+                sheet['auto'] += 1
+        elif status == Visit.STATUS_NO_EXIT:
+            sheet['no_exit'] += 1
+        elif status == Visit.STATUS_NO_ENTRY:
+            sheet['no_entry'] += 1
+
+    names = dict(Employee.objects.filter(emp_code__in=list(sheets)).values_list('emp_code', 'name'))
+    rows = []
+    for emp_code in sorted(sheets):
+        sheet = sheets[emp_code]
+        sheet['name'] = names.get(emp_code, '')
+        sheet['total'] = sum(sheet['days'].values())
+        rows.append(sheet)
+    return rows
@@ -0,0 +1,289 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import requests
+from django.conf import settings
+from django.db import connection
+from redis.exceptions import RedisError
+from requests.adapters import HTTPAdapter
+
+from ..models import Terminal, WebhookDeadLetter, WebhookSubscription
+from .metrics import metrics
+from .punch_stream import PunchStreamConsumer, decode_event, ensure_group, reassign_pending
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """Подпись запроса: HMAC-SHA256 от "<timestamp>.<тело>" (время в подписи - от повтора запроса)"""
+    return hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+
+
+class DeliveryResult(NamedTuple):
+    ok: bool
+    retryable: bool
+    status_code: Optional[int]
+    error: str
+
+
+class WebhookSender:
+    """Запросы к одному получателю: свой пул соединений на max_concurrency запросов"""
+
+    def __init__(self, subscription: WebhookSubscription):
+        self.subscription = subscription
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(subscription.max_concurrency, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, payload: dict) -> DeliveryResult:
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            'X-SCUD-Delivery': payload['delivery_id'],
+            'X-SCUD-Timestamp': timestamp,
+            'X-SCUD-Signature': f'sha256={sign(self.subscription.secret, timestamp, body)}',
+        }
+
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.subscription.url, data=body, headers=headers,
+                                         timeout=settings.WEBHOOK_CONFIG['TIMEOUT'])
+        except requests.RequestException as e:
+            return DeliveryResult(False, True, None, str(e))
+        finally:
+            metrics.observe('webhook_request_duration_seconds', time.perf_counter() - started)
+
+        if response.status_code < 300:
+            return DeliveryResult(True, False, response.status_code, '')
+        # Ошибки получателя и перегрузка - повторяем, остальные 4xx не пройдут и при повторе
+        retryable = response.status_code >= 500 or response.status_code in (408, 429)
+        return DeliveryResult(False, retryable, response.status_code, response.text[:1000])
+
+
+def subscription_filter(subscription: WebhookSubscription) -> Callable[[Dict[str, str]], bool]:
+    """Проверка события потока фильтрами подписки (терминалы и зоны - по ID терминала в СКУД)"""
+    terminals = None
+    areas = subscription.area_list
+    selected = subscription.terminals.values_list('source__code', 'terminal_id')
+    if areas or selected.exists():
+        by_area = Terminal.objects.filter(area_alias__in=areas).values_list('source__code', 'terminal_id')
+        terminals = {(code, str(terminal_id)) for code, terminal_id in [*selected, *by_area]}
+    emp_codes = set(subscription.emp_code_list)
+
+    def matches(fields: Dict[str, str]) -> bool:
+        if terminals is not None and (fields['source'], fields['terminal_id']) not in terminals:
+            return False
+        return not emp_codes or fields['emp_code'] in emp_codes
+
+    return matches
+
+
+def retry_delay(attempt: int) -> float:
+    config = settings.WEBHOOK_CONFIG
+    return min(config['RETRY_BASE'] * 2 ** attempt, config['RETRY_MAX'])
+
+
+def group_name(subscription_id: int) -> str:
+    return f'webhook:{subscription_id}'
+
+
+class SubscriptionWorker:
+    """Доставка одной подписки: max_concurrency потоков-потребителей ее группы в потоке отметок
+
+    Событие подтверждается в Redis только после доставки (или переноса в
+    недоставленные), так что после перезапуска недоставленное отправится снова.
+    Неподтвержденное потребителями, которых стало меньше, забирает worker-0.
+    Подписка, выключенная дольше, чем поток хранит события (MAXLEN), часть их потеряет.
+    """
+
+    def __init__(self, subscription: WebhookSubscription):
+        self.subscription = subscription
+        self.group = group_name(subscription.id)
+        self.sender = WebhookSender(subscription)
+        self.matches = subscription_filter(subscription)
+        self.stop_event = threading.Event()
+        self.threads: List[threading.Thread] = []
+
+    def start(self):
+        consumers = [f'worker-{i}' for i in range(max(self.subscription.max_concurrency, 1))]
+        try:
+            ensure_group(self.group)
+            moved = reassign_pending(self.group, consumers)
+            if moved:
+                logger.info(f"Подписка {self.subscription}: {moved} неподтвержденных событий ушедших потоков "
+                            f"переданы {consumers[0]}")
+        except RedisError as e:
+            logger.error(f"Подписка {self.subscription}: не удалось забрать неподтвержденные события - {e}")
+
+        for i, consumer_name in enumerate(consumers):
+            thread = threading.Thread(target=self._run, args=(consumer_name,),
+                                      name=f'webhook-{self.subscription.id}-{i}', daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def is_alive(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
+
+    def join(self, timeout: float) -> bool:
+        """Дождаться остановки потоков; False - кто-то еще доставляет"""
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        return not self.is_alive()
+
+    def _run(self, consumer_name: str):
+        try:
+            consumer = None
+            while not self.stop_event.is_set():
+                try:
+                    consumer = consumer or PunchStreamConsumer(self.group, consumer_name)
+                    events = consumer.read(count=self.subscription.batch_size,
+                                           block_ms=settings.WEBHOOK_CONFIG['BLOCK_MS'])
+                except RedisError as e:
+                    logger.error(f"Подписка {self.subscription}: поток недоступен - {e}")
+                    self.stop_event.wait(5)
+                    continue
+                if not events:
+                    continue
+
+                # Пустые поля - событие уже вытеснено из потока (MAXLEN)
+                selected = [decode_event(event_id, fields) for event_id, fields in events
+                            if fields and self.matches(fields)]
+                if selected and not self.deliver(selected):
+                    # Остановка во время повторов - пачка останется неподтвержденной
+                    return
+                consumer.ack([event_id for event_id, _ in events])
+        finally:
+            # у каждого потока свое соединение с БД - закрываем его
+            connection.close()
+
+    def deliver(self, events: List[dict]) -> bool:
+        """Отправить пачку с повторами; False - остановлены, не доставив"""
+        config = settings.WEBHOOK_CONFIG
+        payload = {
+            'delivery_id': f"{self.subscription.id}:{events[0]['id']}",
+            'events': events,
+        }
+        labels = {'subscription': self.subscription.id}
+
+        result = None
+        for attempt in range(config['MAX_ATTEMPTS']):
+            if attempt and self.stop_event.wait(retry_delay(attempt - 1)):
+                return False
+            result = self.sender.post(payload)
+            if result.ok:
+                metrics.inc('webhook_events_delivered_total', len(events), **labels)
+                return True
+            metrics.inc('webhook_request_failures_total', **labels)
+            logger.warning(f"Подписка {self.subscription}: попытка {attempt + 1} не удалась "
+                           f"({result.status_code or result.error})")
+            if not result.retryable:
+                break
+
+        WebhookDeadLetter.objects.create(
+            subscription=self.subscription,
+            payload=payload,
+            events=len(events),
+            attempts=attempt + 1,
+            status_code=result.status_code,
+            error=result.error,
+        )
+        metrics.inc('webhook_dead_letters_total', **labels)
+        logger.error(f"Подписка {self.subscription}: {len(events)} событий перенесены в недоставленные")
+        return True
+
+
+class WebhookDispatcher:
+    """Все активные подписки: список перечитывается каждые REFRESH секунд
+
+    Измененная в админке подписка перезапускается, у удаленной удаляется
+    группа потребителей в Redis. Новые потоки подписки запускаются только
+    после остановки прежних - иначе одну неподтвержденную пачку отправят двое.
+    """
+
+    def __init__(self):
+        self.workers: Dict[int, SubscriptionWorker] = {}
+        # Остановленные, но еще не завершившиеся (ждут ответа получателя или чтения потока)
+        self.stopping: Dict[int, SubscriptionWorker] = {}
+
+    def sync_subscriptions(self):
+        subscriptions = {
+            subscription.id: subscription
+            for subscription in WebhookSubscription.objects.filter(is_active=True)
+        }
+
+        for subscription_id in list(self.workers):
+            worker = self.workers[subscription_id]
+            subscription = subscriptions.get(subscription_id)
+            if subscription is not None and subscription.updated_at == worker.subscription.updated_at \
+                    and worker.is_alive():
+                continue
+            logger.info(f"Останавливаем доставку {worker.subscription}")
+            worker.stop()
+            del self.workers[subscription_id]
+            self.stopping[subscription_id] = worker
+
+            if not WebhookSubscription.objects.filter(pk=subscription_id).exists():
+                try:
+                    get_redis().xgroup_destroy(settings.PUNCH_STREAM_CONFIG['KEY'], group_name(subscription_id))
+                except RedisError as e:
+                    logger.warning(f"Не удалось удалить группу подписки {subscription_id} - {e}")
+
+        config = settings.WEBHOOK_CONFIG
+        for subscription_id, subscription in subscriptions.items():
+            if subscription_id in self.workers:
+                continue
+            previous = self.stopping.get(subscription_id)
+            if previous is not None and not previous.join(config['TIMEOUT'] + config['BLOCK_MS'] / 1000):
+                logger.warning(f"Доставка {subscription} еще не остановилась - запуск при следующей проверке")
+                continue
+            logger.info(f"Запускаем доставку {subscription} -> {subscription.url}")
+            worker = SubscriptionWorker(subscription)
+            worker.start()
+            self.workers[subscription_id] = worker
+
+        self.stopping = {subscription_id: worker for subscription_id, worker in self.stopping.items()
+                         if worker.is_alive()}
+
+    def run(self):
+        try:
+            while True:
+                self.sync_subscriptions()
+                if not self.workers:
+                    logger.warning("Нет активных подписок на события")
+                metrics.flush()
+                time.sleep(settings.WEBHOOK_CONFIG['REFRESH'])
+        except KeyboardInterrupt:
+            logger.info("Доставка событий остановлена")
+        finally:
+            workers = [*self.workers.values(), *self.stopping.values()]
+            for worker in workers:
+                worker.stop()
+            for worker in workers:
+                worker.join(timeout=5)
+            metrics.flush(force=True)
+
+
+def redeliver(dead_letter: WebhookDeadLetter) -> bool:
+    """Повторить недоставленную пачку (из админки); доставленная удаляется"""
+    result = WebhookSender(dead_letter.subscription).post(dead_letter.payload)
+    if result.ok:
+        dead_letter.delete()
+        return True
+
+    dead_letter.attempts += 1
+    dead_letter.status_code = result.status_code
+    dead_letter.error = result.error
+    dead_letter.save(update_fields=['attempts', 'status_code', 'error', 'updated_at'])
+    return False
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Employee, Terminal
+from .services.directory import SharedDirectory
+from .services.lookup_cache import publish_invalidation
+
+
+@receiver([post_save, post_delete], sender=Employee)
+def employee_changed(sender, instance, **kwargs):
+    """Сбросить кэш сотрудника в процессах (и по старому коду, если его поменяли)"""
+    publish_invalidation('employee', [instance.emp_code, getattr(instance, '_loaded_emp_code', None)])
+
+
+@receiver([post_save, post_delete], sender=Terminal)
+def terminal_changed(sender, instance, **kwargs):
+    publish_invalidation('terminal', [SharedDirectory.terminal_key(instance.source_id, instance.terminal_id)])
@@ -1,7 +1,22 @@
 import logging
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
+from .models import Anomaly, Broadcast, Employee, TerminalSubscription, Transaction, WebhookDeadLetter
+from .services.anomalies import format_anomaly_alert
 from .services.autologout import AutoLogoutService
+from .services.bot import TelegramBot
+from .services.broadcast import run_broadcast, stale_broadcasts
+from .services.directory import SharedDirectory, refresh_directory
+from .services.feeds import FEED_PREFIX, format_feed_message
+from .services.linker import TransactionLinker, release_linking
+from .services.metrics import metrics
+from .services.notifications import (PENDING_PREFIX, build_digests, deliver_notifications,
+                                     deliver_punch_notification, take_pending)
+from .services.occupancy import refresh_occupancy
+from .services.reports import prune_report_jobs, run_report_job
+from .services.visits import expire_open_visits
+from .services.webhooks import redeliver
 
 logger = logging.getLogger(__name__)
 
@@ -67,4 +82,221 @@ def test_auto_logout():
             }
             for data in on_site
         ]
-    }
\ No newline at end of file
+    }
+
+
+@shared_task
+def link_employee_transactions(emp_code):
+    """Фоновая привязка записей проходов к сотруднику после изменения его кода"""
+    # Снимаем отметку до привязки: изменения кода во время работы поставят задачу снова
+    release_linking(emp_code)
+
+    linked = TransactionLinker().link([emp_code])
+
+    return {
+        'emp_code': emp_code,
+        'linked': linked,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def rebuild_directory():
+    """Периодически перестраивать общий справочник (страховка от пропущенных изменений)"""
+    SharedDirectory().rebuild()
+    return {'timestamp': timezone.now().isoformat()}
+
+
+@shared_task
+def refresh_shared_directory(kind, keys=None):
+    """Обновить записи общего справочника после изменений в админке и разослать сброс кэшей"""
+    refresh_directory(kind, keys)
+    return {'kind': kind, 'keys': len(keys) if keys is not None else None}
+
+
+@shared_task
+def send_punch_notification(transaction_id, fetched_at=None, enqueued_at=None):
+    """Отправить уведомление о проходе (ставится монитором сразу после записи отметки)"""
+    transaction = Transaction.objects.select_related('employee', 'terminal').filter(
+        id=transaction_id
+    ).first()
+
+    if not transaction or not transaction.employee:
+        return {'success': False, 'error': 'Запись или сотрудник не найдены'}
+
+    employee = transaction.employee
+    if not employee.wants_instant_notifications:
+        return {'success': False, 'error': 'Сотрудник не получает уведомления о проходах'}
+
+    success = deliver_punch_notification(employee, transaction, fetched_at, enqueued_at)
+    metrics.flush(force=True)
+
+    return {
+        'success': success,
+        'skud_id': transaction.skud_id,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def send_coalesced_notification(employee_id):
+    """Отправить одним сообщением отметки сотрудника, пришедшие после первой в окне COALESCE_SECONDS"""
+    pending = take_pending(f'{PENDING_PREFIX}:{employee_id}')
+    employee = Employee.objects.filter(id=employee_id).first()
+    if not pending or not employee:
+        return {'success': False, 'error': 'Нет отметок или сотрудник не найден'}
+
+    # Режим могли сменить на сводку, пока копилось окно
+    if not employee.wants_instant_notifications:
+        return {'success': False, 'error': 'Сотрудник не получает уведомления о проходах'}
+
+    timings = {transaction_id: (fetched_at, enqueued_at) for transaction_id, fetched_at, enqueued_at in pending}
+    transactions = Transaction.objects.select_related('terminal').filter(id__in=timings).order_by('punch_time', 'id')
+    punches = [(transaction, *timings[transaction.id]) for transaction in transactions]
+    if not punches:
+        return {'success': False, 'error': 'Записи не найдены'}
+
+    success = deliver_notifications(employee, punches)
+    metrics.flush(force=True)
+
+    return {
+        'success': success,
+        'punches': len(punches),
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def send_terminal_feed(chat_id):
+    """Отправить в чат руководителя проходы, накопленные за окно FEED_INTERVAL"""
+    items = take_pending(f'{FEED_PREFIX}:{chat_id}')
+    if not items:
+        return {'success': False, 'error': 'Нет проходов'}
+
+    # Подписку могли выключить, пока копилось окно
+    if not TerminalSubscription.objects.filter(chat_id=chat_id, is_active=True).exists():
+        return {'success': False, 'error': 'Нет активной подписки'}
+
+    success = TelegramBot().send_message(chat_id, format_feed_message(items))
+    metrics.flush(force=True)
+
+    return {
+        'success': success,
+        'punches': len(items),
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def send_daily_digests():
+    """Сводка проходов за сегодня сотрудникам в режиме "сводка" (по расписанию в 21:00)"""
+    digests = build_digests(timezone.localdate())
+
+    bot = TelegramBot()
+    sent = sum(bot.send_message(employee.telegram_id, text) for employee, text in digests)
+    metrics.flush(force=True)
+
+    logger.info(f"Сводки за день отправлены: {sent}/{len(digests)}")
+    return {
+        'sent': sent,
+        'total': len(digests),
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def send_anomaly_alerts(anomaly_ids):
+    """Оповестить чат руководителя об аномалиях одного опроса (одним сообщением)"""
+    anomalies = list(Anomaly.objects.select_related('employee', 'terminal').filter(
+        id__in=anomaly_ids
+    ).order_by('punch_time', 'id'))
+    if not anomalies:
+        return {'success': False, 'error': 'Аномалии не найдены'}
+
+    success = TelegramBot().send_message(settings.ANOMALY_CONFIG['ALERT_CHAT_ID'],
+                                         format_anomaly_alert(anomalies))
+    metrics.flush(force=True)
+
+    return {
+        'success': success,
+        'anomalies': len(anomalies),
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def redeliver_webhooks(dead_letter_ids):
+    """Повторить недоставленные пачки событий (действие в админке)"""
+    delivered = 0
+    for dead_letter in WebhookDeadLetter.objects.select_related('subscription').filter(id__in=dead_letter_ids):
+        delivered += redeliver(dead_letter)
+    metrics.flush(force=True)
+
+    return {
+        'delivered': delivered,
+        'failed': len(dead_letter_ids) - delivered,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def send_broadcast(broadcast_id):
+    """Отправить рассылку (или продолжить прерванную) с ограничением скорости"""
+    broadcast = run_broadcast(broadcast_id)
+    if broadcast is None:
+        return {'success': False, 'error': 'Рассылка уже отправляется или завершена'}
+
+    return {
+        'success': broadcast.status == Broadcast.STATUS_DONE,
+        'broadcast_id': broadcast.id,
+        'sent': broadcast.sent,
+        'failed': broadcast.failed,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def resume_broadcasts():
+    """Продолжить рассылки, отправка которых оборвалась вместе с процессом"""
+    resumed = stale_broadcasts()
+    for broadcast_id in resumed:
+        logger.warning(f"Рассылка #{broadcast_id} оборвалась - продолжаем")
+        send_broadcast.delay(broadcast_id)
+    return {'resumed': resumed, 'timestamp': timezone.now().isoformat()}
+
+
+@shared_task
+def build_report(job_id):
+    """Построить заказанный отчет (ReportJob) и сохранить файл в media/reports"""
+    job = run_report_job(job_id)
+    if job is None:
+        return {'success': False, 'error': 'Отчет уже строится или удален'}
+
+    return {
+        'success': job.status == job.STATUS_DONE,
+        'job_id': job.id,
+        'rows': job.rows,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+@shared_task
+def cleanup_reports():
+    """Удалить отчеты старше REPORTS_CONFIG['KEEP_DAYS'] вместе с файлами"""
+    deleted = prune_report_jobs(settings.REPORTS_CONFIG['KEEP_DAYS'])
+    logger.info(f"Удалено старых отчетов: {deleted}")
+    return {'deleted': deleted, 'timestamp': timezone.now().isoformat()}
+
+
+@shared_task
+def close_stale_visits():
+    """Закрыть открытые визиты старше MAX_VISIT_HOURS как визиты без выхода"""
+    expired = expire_open_visits()
+    return {'expired': expired, 'timestamp': timezone.now().isoformat()}
+
+
+@shared_task
+def refresh_occupancy_buckets():
+    """Пересчитать последние интервалы загруженности, собрать часы и удалить старые пятиминутки"""
+    result = refresh_occupancy()
+    return {**result, 'timestamp': timezone.now().isoformat()}
@@ -1,3 +1,1106 @@
+import hashlib
+import hmac
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .models import (Anomaly, Broadcast, BroadcastDelivery, Employee, ImportCheckpoint, OccupancyBucket, PunchTrace,
+                     ReportJob, SkudSource, Terminal, TerminalSubscription, Transaction, Visit, WebhookDeadLetter,
+                     WebhookSubscription)
+from .services.anomalies import AnomalyEngine, save_anomalies
+from .services.autologout import AutoLogoutService
+from .services.broadcast import broadcast_recipients, claim_broadcast, create_broadcast, stale_broadcasts
+from .services.capture import TrafficRecorder, read_capture
+from .services.directory import SharedDirectory
+from .services.importer import BackupImporter
+from .services.linker import TransactionLinker
+from .services.leader import LeaderLease
+from .services.lookup_cache import LookupCache
+from .services import metrics as metrics_module
+from .services import onsite as onsite_module
+from .services.metrics import MetricsRegistry, render_prometheus
+from .services.monitor import SKUDMonitor
+from .services.query_budget import (
+    QueryBudget, QueryBudgetExceeded, assert_constant_queries, fingerprint,
+)
+from .services.synthetic import TERMINAL_ID_BASE, SyntheticDataset
+from .services.tracing import Tracer, prune_traces, record_delivery
+from .services.feeds import TerminalFeeds, format_feed_message
+from .services.notifications import PENDING_PREFIX, build_digests, schedule_punch_notification
+from .services.onsite import compute_snapshot, find_terminals, overview_page, terminal_page
+from .services.occupancy import build_buckets, occupancy_series, rollup_hours
+from .services.presence import present
+from .services.punch_stream import PunchStreamConsumer, decode_event, publish_punches, reassign_pending, replay
+from .services.redis_client import get_redis
+from .services.reports import ReportParamsError, request_report
+from .services.summaries import EmployeeSummary, update_summaries
+from .services.visits import build_timesheet, rebuild_visits, update_visits
+from .services.webhooks import DeliveryResult, SubscriptionWorker, WebhookSender, subscription_filter
+
+
+def redis_available() -> bool:
+    try:
+        return get_redis().ping()
+    except RedisError:
+        return False
+
+
+@skipUnless(redis_available(), 'Redis недоступен')
+class RedisTestCase(TestCase):
+    """Проверки поверх настоящего Redis: ключи из redis_keys удаляются до и после теста"""
+
+    redis_keys = ()
+
+    def setUp(self):
+        self.redis = get_redis()
+        self.addCleanup(self._clear)
+        self._clear()
+
+    def _clear(self):
+        keys = [key for pattern in self.redis_keys for key in self.redis.scan_iter(pattern)]
+        if keys:
+            self.redis.delete(*keys)
+
+
+class QueryBudgetHarnessTests(TestCase):
+
+    def test_fingerprint_ignores_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'Иван'"),
+            fingerprint("SELECT *  FROM t WHERE id IN (7) AND name = 'Петр'"),
+        )
+
+    def test_budget_reports_fingerprints(self):
+        with self.assertRaises(QueryBudgetExceeded) as ctx:
+            with QueryBudget(max_queries=1, label='проверка'):
+                for i in range(3):
+                    list(Terminal.objects.filter(terminal_id=i))
+
+        self.assertIn('3 x SELECT', str(ctx.exception))
+
+
+class QueryBudgetTests(TestCase):
+    """Число SQL запросов точек входа не должно расти вместе с количеством строк
+
+    Каждая проверка выполняется на малом наборе данных, затем набор
+    увеличивается в несколько раз и запросов должно стать не больше.
+    """
+
+    SMALL = 4
+    LARGE = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', '', 'admin')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _grow(self, employees: int):
+        SyntheticDataset(employees=employees, terminals=employees // 2, days=2,
+                         seed=employees).generate(employees * 6)
+
+    def assertQueriesConstant(self, label, func):
+        self._grow(self.SMALL)
+        func()  # прогрев: ContentType, сессия и т.п.
+        with QueryBudget() as small:
+            func()
+
+        self._grow(self.LARGE)
+        with QueryBudget() as large:
+            func()
+
+        assert_constant_queries(small, large, label)
+
+    def _get(self, url):
+        def call():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        return call
+
+    def test_employee_changelist(self):
+        self.assertQueriesConstant('список сотрудников', self._get('/admin/bot/employee/'))
+
+    def test_terminal_changelist(self):
+        self.assertQueriesConstant('список терминалов', self._get('/admin/bot/terminal/'))
+
+    def test_transaction_changelist(self):
+        self.assertQueriesConstant('список записей', self._get('/admin/bot/transaction/'))
+
+    def test_admin_stats(self):
+        self.assertQueriesConstant('статистика', self._get('/admin/stats/'))
+
+    def test_terminal_on_site(self):
+        def call():
+            terminal = Terminal.objects.get(terminal_id=TERMINAL_ID_BASE)
+            self._get(f'/admin/bot/terminal/{terminal.id}/on_site/')()
+
+        self.assertQueriesConstant('кто на пункте', call)
+
+    def test_employees_on_site_today(self):
+        service = AutoLogoutService()
+        self.assertQueriesConstant(
+            'get_employees_on_site_today',
+            lambda: service.get_employees_on_site_today(timezone.localdate()),
+        )
+
+    def test_linker(self):
+        linker = TransactionLinker()
+        self.assertQueriesConstant('TransactionLinker.report', lambda: linker.report())
+
+
+class BackupImportTests(TestCase):
+    """Импорт бэкапов: продолжение с сохраненной позиции, перезапуск, счет вставленных"""
+
+    def setUp(self):
+        self.source = SkudSource.objects.create(code='backup', name='Бэкап', base_url='')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'backup.json'
+
+    def _write(self, skud_ids):
+        self.path.write_text(json.dumps({'data': [
+            {'id': skud_id, 'emp_code': '100', 'terminal': 1,
+             'punch_time': '2026-03-02 08:00:00', 'punch_state': '0'}
+            for skud_id in skud_ids
+        ]}), encoding='utf-8')
+
+    def _import(self):
+        return BackupImporter(batch_size=2, source=self.source).import_file(self.path)
+
+    def _imported_ids(self):
+        return sorted(Transaction.objects.filter(source=self.source).values_list('skud_id', flat=True))
+
+    def test_resume_restart_and_changed_file(self):
+        self._write(range(1, 6))
+        # Прошлый запуск прервался после первой пачки
+        ImportCheckpoint.objects.create(source=self.source, file_path=str(self.path.resolve()),
+                                        file_size=self.path.stat().st_size, total=5, offset=2, imported=2)
+
+        result = self._import()
+        self.assertEqual((result['resumed_from'], result['imported'], result['skipped']), (2, 3, 0))
+        self.assertEqual(self._imported_ids(), [3, 4, 5])
+        self.assertEqual(self._import()['status'], 'уже импортирован')
+
+        out = StringIO()
+        call_command('import_backup', file=str(self.path), restart=True, workers=1, batch_size=2,
+                     source='backup', stdout=out)
+        self.assertIn('Импортировано: 2', out.getvalue())
+        self.assertIn('Пропущено: 3', out.getvalue())
+        self.assertEqual(self._imported_ids(), [1, 2, 3, 4, 5])
+
+        # Файл дописан - размер другой, импорт начинается заново
+        self._write(range(1, 8))
+        result = self._import()
+        self.assertEqual((result['resumed_from'], result['imported'], result['skipped']), (0, 2, 5))
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.offset, checkpoint.max_skud_id, checkpoint.imported, checkpoint.is_completed),
+                         (7, 7, 2, True))
+
+    def test_same_file_into_another_source(self):
+        self._write([1, 2, 3])
+        self._import()
+        other = SkudSource.objects.create(code='backup-2', name='Бэкап 2', base_url='')
+
+        result = BackupImporter(batch_size=2, source=other).import_file(self.path)
+        self.assertEqual((result['status'], result['imported']), ('ok', 3))
+        self.assertEqual(Transaction.objects.filter(source=other).count(), 3)
+        self.assertEqual(ImportCheckpoint.objects.filter(file_path=str(self.path.resolve())).count(), 2)
+
+    def test_concurrent_insert_not_counted(self):
+        self._write([1, 2, 3])
+        importer = BackupImporter(batch_size=10, source=self.source)
+        prepare = importer._prepare_batch
+
+        def racing(batch):
+            prepared = prepare(batch)
+            # Параллельный импорт пересекающегося файла успел вставить запись 2
+            Transaction.objects.create(source=self.source, skud_id=2, emp_code='100',
+                                       terminal=Terminal.objects.get(source=self.source),
+                                       punch_time=timezone.now(), punch_state='0', verify_type=1)
+            return prepared
+
+        importer._prepare_batch = racing
+        result = importer.import_file(self.path)
+        self.assertEqual((result['imported'], result['skipped']), (2, 1))
+        self.assertEqual(ImportCheckpoint.objects.get().imported, 2)
+
+
+class EmployeeLinkingTests(TestCase):
+    """Привязка записей ставится в очередь только при смене кода сотрудника и после коммита"""
+
+    def test_links_only_after_code_change_commits(self):
+        employee = Employee.objects.get(pk=Employee.objects.create(emp_id=1, emp_code='100', name='Иванов').pk)
+
+        with mock.patch('scud_bot.apps.bot.services.linker.get_redis', side_effect=RedisError('down')), \
+                mock.patch('scud_bot.apps.bot.tasks.refresh_shared_directory.delay'), \
+                mock.patch('scud_bot.apps.bot.tasks.link_employee_transactions.delay') as link:
+            with self.captureOnCommitCallbacks(execute=True):
+                employee.telegram_id = 555
+                employee.save()
+                Employee.objects.get(pk=employee.pk).save(update_fields=['name'])
+            link.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                employee.emp_code = '200'
+                employee.save()
+                link.assert_not_called()
+            link.assert_called_once_with('200')
+
+
+class TestDirectory(SharedDirectory):
+    PREFIX = 'scud:test:directory'
+
+
+class SharedDirectoryTests(RedisTestCase):
+    """Общий справочник в Redis и локальные копии процессов, сверяющиеся с его версией"""
+
+    redis_keys = (f'{TestDirectory.PREFIX}:*',)
+
+    def test_refresh_reaches_process_cache(self):
+        Employee.objects.create(emp_id=1, emp_code='100', name='Старое', is_manager=True)
+        directory = TestDirectory()
+        config = {**settings.LOOKUP_CACHE_CONFIG, 'VERSION_CHECK_INTERVAL': 0}
+        with self.settings(LOOKUP_CACHE_CONFIG=config):
+            cache = LookupCache(directory)
+            cache.load()
+
+        # Все поля из Redis - без дочитывания отложенных полей из БД
+        with self.assertNumQueries(0):
+            employee = cache.get_employee('100')
+            self.assertEqual((employee.name, employee.is_manager), ('Старое', True))
+            self.assertIsNotNone(employee.created_at)
+            self.assertIsNone(cache.get_employee('200'))
+
+        # Изменения из админки: справочник перечитывает записи и увеличивает версию
+        Employee.objects.filter(emp_code='100').update(name='Новое')
+        Employee.objects.create(emp_id=2, emp_code='200', name='Новый')
+        directory.refresh('employee', ['100', '200'])
+        self.assertEqual(cache.get_employee('100').name, 'Новое')
+        self.assertEqual(cache.get_employee('200').name, 'Новый')
+
+        Employee.objects.filter(emp_code='200').delete()
+        directory.refresh('employee', ['200'])
+        self.assertIsNone(cache.get_employee('200'))
+        self.assertEqual(set(directory.all_employees()), {'100'})
+
+
+class LeaderLeaseTests(RedisTestCase):
+    """Аренда лидера: продление своей, захват истекшей, чужую не трогаем"""
+
+    redis_keys = ('scud:leader:test-lease',)
+
+    def test_takeover_after_ttl(self):
+        leader = LeaderLease('test-lease', ttl=0.5)
+        standby = LeaderLease('test-lease', ttl=0.5)
+
+        self.assertTrue(leader.heartbeat())
+        self.assertFalse(standby.heartbeat())
+        time.sleep(0.3)
+        # Продление отодвигает истечение - резерв аренду не получает
+        self.assertTrue(leader.heartbeat())
+        time.sleep(0.3)
+        self.assertFalse(standby.heartbeat())
+        self.assertEqual(standby.holder(), leader.token)
+
+        # Лидер завис дольше TTL - аренду забирает резерв, а старый лидер ее уже не продлит
+        time.sleep(0.6)
+        self.assertTrue(standby.heartbeat())
+        self.assertFalse(leader.heartbeat())
+        self.assertFalse(leader.is_leader)
+        leader.release()
+        self.assertEqual(standby.holder(), standby.token)
+
+        standby.release()
+        self.assertIsNone(standby.holder())
+
+
+class MonitorCursorTests(TestCase):
+    """Курсор опроса у каждого сервера СКУД свой и двигается только вперед"""
+
+    def test_resume_and_save_per_source(self):
+        north = SkudSource.objects.create(code='north', name='Север', base_url='', last_id=40)
+        south = SkudSource.objects.create(code='south', name='Юг', base_url='', last_id=7)
+        terminal = Terminal.objects.create(source=north, terminal_id=1, terminal_sn='C1',
+                                           terminal_alias='Север', area_alias='Север')
+        # Курсор не успели сохранить после последних записей - страхует max(skud_id) сервера
+        for skud_id in (39, 52):
+            Transaction.objects.create(source=north, skud_id=skud_id, emp_code='100', terminal=terminal,
+                                       punch_time=timezone.now(), punch_state='0', verify_type=1)
+
+        monitors = {source.code: SKUDMonitor(source, notifications=False, cache=LookupCache())
+                    for source in (north, south)}
+        for monitor in monitors.values():
+            monitor.resume_cursor()
+        self.assertEqual(monitors['north'].last_id, 52)
+        self.assertEqual(monitors['south'].last_id, 7)
+
+        # Воспроизведение старого журнала курсор не откатывает
+        monitors['north'].save_cursor(30)
+        monitors['south'].save_cursor(60)
+        self.assertEqual(dict(SkudSource.objects.filter(code__in=['north', 'south'])
+                              .values_list('code', 'last_id')), {'north': 40, 'south': 60})
+
+        monitors['south'].resume_cursor()
+        self.assertEqual(monitors['south'].last_id, 60)
+
+
+class TracingTests(TestCase):
+    """Стадии обработки отметки - монитора и доставки - собираются в одну трассировку"""
+
+    def setUp(self):
+        self.source = SkudSource.objects.create(code='trace', name='Трассировка', base_url='')
+        Terminal.objects.create(source=self.source, terminal_id=1, terminal_sn='T1',
+                                terminal_alias='Вход', area_alias='Офис', is_monitored=True)
+
+    def _punch(self, skud_id):
+        return {'id': skud_id, 'emp_code': '100', 'terminal': 1, 'punch_time': '2026-03-02 08:00:00',
+                'punch_state': '0', 'verify_type': 1}
+
+    def test_stages_reach_punch_trace(self):
+        monitor = SKUDMonitor(self.source, notifications=False, cache=LookupCache())
+        fetched_at = time.time() - 0.5
+        monitor.process_batch([self._punch(10)], fetched_at, 120.0)
+
+        trace = PunchTrace.objects.get(source=self.source, skud_id=10)
+        self.assertEqual((trace.emp_code, trace.terminal_id, trace.fetch_ms), ('100', 1, 120.0))
+        self.assertGreater(trace.lookup_ms, 0)
+        self.assertGreater(trace.insert_ms, 0)
+        self.assertGreaterEqual(trace.ingest_ms, 120.0 + trace.lookup_ms + trace.insert_ms)
+        self.assertIsNone(trace.delivered_at)
+
+        # Доставка дописывает свои стадии, не затирая стадии монитора
+        started_at = time.time()
+        record_delivery(self.source.id, 10, fetched_at, started_at - 0.2, started_at, telegram_ms=40.0)
+        trace.refresh_from_db()
+        self.assertEqual((trace.fetch_ms, trace.telegram_ms), (120.0, 40.0))
+        self.assertAlmostEqual(trace.queue_ms, 200.0, delta=1)
+        self.assertGreaterEqual(trace.delivery_ms, 500.0)
+        self.assertIsNotNone(trace.delivered_at)
+
+    def test_ring_buffer_keeps_newest(self):
+        tracer = Tracer(self.source.id)
+        tracer.PRUNE_EVERY = 1
+        tracer.max_rows = 2
+        for skud_id in (1, 2, 3):
+            tracer.start(self._punch(skud_id), time.time(), 1.0).mark_stored(timezone.now())
+            tracer.flush()
+        self.assertEqual(sorted(PunchTrace.objects.values_list('skud_id', flat=True)), [2, 3])
+
+        # Отметки, не дошедшие до БД, не трассируются
+        tracer.start(self._punch(4), time.time(), 1.0)
+        tracer.flush()
+        prune_traces(1)
+        self.assertEqual(list(PunchTrace.objects.values_list('skud_id', flat=True)), [3])
+
+
+class CaptureTests(TestCase):
+    """Журнал ответов СКУД переживает перезапуск записи и читается целиком"""
+
+    def test_round_trip_across_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'capture' / 'skud.jsonl.gz'
+            recorder = TrafficRecorder(path)
+            recorder.record(200, 12.34, body='{"data": []}')
+            recorder.record(200, 5, body='{"data": [{"id": 1}]}', page=2)
+            recorder.close()
+
+            # Перезапуск монитора дописывает в тот же файл
+            recorder = TrafficRecorder(path)
+            recorder.record(None, 10000, error='timeout')
+            recorder.close()
+
+            records = list(read_capture(str(path)))
+
+        self.assertEqual([(r['status'], r.get('body'), r.get('error'), r.get('page', 1)) for r in records], [
+            (200, '{"data": []}', None, 1),
+            (200, '{"data": [{"id": 1}]}', None, 2),
+            (None, None, 'timeout', 1),
+        ])
+        self.assertEqual(records[0]['ms'], 12.3)
+
+
+class ReportJobTests(TestCase):
+    """Повторный заказ отчета с теми же параметрами отдает уже заказанный"""
+
+    def test_reuse_by_params(self):
+        kind = ReportJob.KIND_EMPLOYEE_HISTORY
+        job, created = request_report(kind, {'emp_code': ' 100 ', 'month': '2026-03'})
+        self.assertTrue(created)
+
+        # Параметры приводятся к одному виду - ключ тот же
+        self.assertEqual(request_report(kind, {'emp_code': '100', 'month': '2026-03'}), (job, False))
+        self.assertTrue(request_report(kind, {'emp_code': '100', 'month': '2026-02'})[1])
+        self.assertTrue(request_report(kind, {'emp_code': '100', 'month': '2026-03'}, force=True)[1])
+        with self.assertRaises(ReportParamsError):
+            request_report(kind, {'emp_code': '100', 'month': 'март'})
+
+    def test_stale_and_failed_jobs(self):
+        kind = ReportJob.KIND_TIMESHEET
+        job, _ = request_report(kind, {'month': '2026-03'})
+
+        # Построение зависло - заказывается заново, старое помечается ошибкой
+        ReportJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        retry, created = request_report(kind, {'month': '2026-03'})
+        self.assertTrue(created)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.STATUS_FAILED)
+
+        # Свежую ошибку отдаем как есть, через RETRY_FAILED_AFTER - строим снова
+        ReportJob.objects.filter(pk=retry.pk).update(status=ReportJob.STATUS_FAILED, finished_at=timezone.now())
+        self.assertEqual(request_report(kind, {'month': '2026-03'}), (retry, False))
+        ReportJob.objects.filter(pk=retry.pk).update(finished_at=timezone.now() - timedelta(hours=1))
+        self.assertTrue(request_report(kind, {'month': '2026-03'})[1])
+
+    def test_download_backup_waits_for_the_file(self):
+        SkudSource.objects.create(code='backup', name='Бэкап', base_url='')
+        url = '/api/download_backup/?source=backup&date__gte=2025-11-01&date__lte=2025-11-30'
+        job, _ = request_report(ReportJob.KIND_BACKUP, {'source': 'backup', 'date_from': '2025-11-01',
+                                                        'date_to': '2025-11-30'})
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        Path(media.name, 'backup.json').write_bytes(b'{"data": []}')
+
+        # Не успел за DOWNLOAD_WAIT - номер задачи, чтобы повторить запрос
+        with self.settings(REPORTS_CONFIG={**settings.REPORTS_CONFIG, 'DOWNLOAD_WAIT': 0}):
+            response = self.client.get(url)
+        self.assertEqual((response.status_code, response.json()['job_id']), (202, job.id))
+
+        # Воркер достроил, пока запрос ждал, - отдаем файл, как раньше
+        def worker_finishes(seconds):
+            ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.STATUS_DONE, file='backup.json',
+                                                       finished_at=timezone.now())
+
+        with self.settings(MEDIA_ROOT=media.name), \
+                mock.patch('scud_bot.apps.bot.api.time.sleep', side_effect=worker_finishes) as sleep:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'{"data": []}')
+            response.close()
+        sleep.assert_called_once()
+
+
+class PunchTestCase(TestCase):
+    """Один пункт и отметки на нем - общая основа проверок визитов и того, что из них строится"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.source = SkudSource.objects.create(code='visits', name='Визиты', base_url='')
+        cls.terminal = Terminal.objects.create(source=cls.source, terminal_id=1, terminal_sn='V1',
+                                               terminal_alias='Пункт', area_alias='Зона')
+
+    def _punch(self, when, state, verify_type=1, emp_code='100'):
+        self._next_id = getattr(self, '_next_id', 0) + 1
+        return Transaction.objects.create(
+            source=self.source, skud_id=self._next_id, emp_code=emp_code, terminal=self.terminal,
+            punch_time=timezone.make_aware(datetime.strptime(when, '%Y-%m-%d %H:%M')),
+            punch_state=state, verify_type=verify_type,
+        )
+
+
+class VisitTests(PunchTestCase):
+    """Сборка визитов из отметок: повторы, пропуски, автовыход, полночь"""
+
+    def _visits(self):
+        return [
+            (timezone.localtime(v.started_at).strftime('%d %H:%M'), v.status, v.duration // 60)
+            for v in Visit.objects.order_by('started_at', 'id')
+        ]
+
+    def test_duplicates_and_missing_punches(self):
+        for when, state in [('2026-03-02 08:00', '0'), ('2026-03-02 08:01', '0'),
+                            ('2026-03-02 12:00', '1'), ('2026-03-02 12:01', '1'),
+                            ('2026-03-02 13:00', '0'), ('2026-03-02 18:00', '0'),
+                            ('2026-03-02 19:00', '1'), ('2026-03-02 21:00', '1')]:
+            self._punch(when, state)
+
+        rebuild_visits()
+
+        self.assertEqual(self._visits(), [
+            ('02 08:00', Visit.STATUS_CLOSED, 240),
+            ('02 13:00', Visit.STATUS_NO_EXIT, 0),
+            ('02 18:00', Visit.STATUS_CLOSED, 60),
+            ('02 21:00', Visit.STATUS_NO_ENTRY, 0),
+        ])
+
+    def test_night_shift_and_auto_logout(self):
+        self._punch('2026-03-02 22:00', '0')
+        self._punch('2026-03-03 06:00', '1')
+        self._punch('2026-03-03 09:00', '0')
+        self._punch('2026-03-03 23:50', '1', verify_type=99)
+        # Автовыход, когда визит уже закрыт, визитов не добавляет
+        self._punch('2026-03-04 23:50', '1', verify_type=99)
+
+        rebuild_visits()
+
+        self.assertEqual(self._visits(), [
+            ('02 22:00', Visit.STATUS_CLOSED, 480),
+            ('03 09:00', Visit.STATUS_AUTO, 890),
+        ])
+        sheet, = build_timesheet('2026-03')
+        self.assertEqual(sheet['days'][datetime(2026, 3, 2).date()], 2 * 3600)
+        self.assertEqual(sheet['days'][datetime(2026, 3, 3).date()], 6 * 3600 + 890 * 60)
+        self.assertEqual(sheet['auto'], 1)
+
+    def test_incremental_matches_batch(self):
+        punches = [self._punch(when, state) for when, state in [
+            ('2026-03-02 08:00', '0'), ('2026-03-02 12:00', '1'), ('2026-03-02 13:00', '0'),
+            ('2026-03-02 17:00', '1'), ('2026-03-03 08:00', '0'), ('2026-03-03 17:00', '1'),
+        ]]
+
+        # По пачкам, и одна отметка пришла позже следующих
+        update_visits(punches[:2])
+        update_visits(punches[3:5])
+        update_visits(punches[2:3])
+        update_visits(punches[5:])
+        incremental = self._visits()
+
+        rebuild_visits()
+        self.assertEqual(incremental, self._visits())
+        self.assertEqual(len(incremental), 3)
+
+
+class PresenceTests(PunchTestCase):
+    """Кто был на пункте в момент или за период"""
+
+    def test_presence(self):
+        self._punch('2026-03-02 08:00', '0', emp_code='100')
+        self._punch('2026-03-02 12:00', '1', emp_code='100')
+        # Без выхода - на пункте до следующей своей отметки или до конца дня
+        self._punch('2026-03-02 10:00', '0', emp_code='200')
+        self._punch('2026-03-02 23:00', '1', emp_code='300')
+        rebuild_visits()
+
+        def codes(start, end=None):
+            start = timezone.make_aware(datetime.strptime(start, '%Y-%m-%d %H:%M'))
+            end = end and timezone.make_aware(datetime.strptime(end, '%Y-%m-%d %H:%M'))
+            return sorted(visit['emp_code'] for visit in present(start, end, terminal=self.terminal.id))
+
+        self.assertEqual(codes('2026-03-02 11:00'), ['100', '200'])
+        self.assertEqual(codes('2026-03-02 12:00'), ['200'])
+        self.assertEqual(codes('2026-03-03 00:00'), [])
+        self.assertEqual(codes('2026-03-01 20:00', '2026-03-02 08:00'), ['100'])
+        self.assertEqual(present(timezone.now(), area='Нет такой зоны'), [])
+
+
+class OccupancyTests(PunchTestCase):
+    """Интервалы загруженности и их сборка в часы"""
+
+    def test_occupancy_buckets(self):
+        self._punch('2026-03-02 08:02', '0', emp_code='100')
+        self._punch('2026-03-02 08:03', '0', emp_code='200')
+        self._punch('2026-03-02 08:07', '1', emp_code='100')
+        self._punch('2026-03-02 09:10', '1', emp_code='200')
+        rebuild_visits()
+
+        def moment(value):
+            return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d %H:%M'))
+
+        build_buckets(moment('2026-03-02 08:00'), moment('2026-03-02 10:00'))
+        rollup_hours(moment('2026-03-02 08:00'), moment('2026-03-02 10:00'))
+
+        fine = occupancy_series(
+            moment('2026-03-02 08:00'), moment('2026-03-02 08:15'),
+            OccupancyBucket.RESOLUTION_5MIN, terminal=self.terminal.id,
+        )['series']
+        self.assertEqual(fine['entries'], [2, 0, 0])
+        self.assertEqual(fine['exits'], [0, 1, 0])
+        self.assertEqual(fine['headcount'], [2, 1, 1])
+        self.assertEqual(fine['peak'], [2, 2, 1])
+
+        hours = occupancy_series(
+            moment('2026-03-02 08:00'), moment('2026-03-02 10:00'),
+            OccupancyBucket.RESOLUTION_HOUR, area=self.terminal.area_alias,
+        )['series']
+        self.assertEqual(hours['entries'], [2, 0])
+        self.assertEqual(hours['exits'], [1, 1])
+        self.assertEqual(hours['headcount'], [1, 0])
+        self.assertEqual(hours['peak'], [2, 1])
+
+
+class MetricsTests(RedisTestCase):
+    """Счетчики и гистограммы процесса доходят до /metrics в текстовом формате Prometheus"""
+
+    redis_keys = ('scud:test:metrics:*',)
+
+    def test_flush_and_render(self):
+        registry = MetricsRegistry()
+        registry.inc('telegram_send_total', 2)
+        registry.inc('skud_poll_errors_total', source='north "A"\\\n')
+        for value in (0.003, 0.3, 60):
+            registry.observe('skud_poll_duration_seconds', value, role='leader')
+
+        with mock.patch.multiple(metrics_module, COUNTERS_KEY='scud:test:metrics:counters',
+                                 GAUGES_KEY='scud:test:metrics:gauges'):
+            registry.flush(force=True)
+            lines = render_prometheus().splitlines()
+
+        self.assertIn('# TYPE skud_poll_duration_seconds histogram', lines)
+        self.assertIn('telegram_send_total 2', lines)
+        self.assertIn('skud_poll_errors_total{source="north \\"A\\"\\\\\\n"} 1', lines)
+
+        buckets = [line for line in lines if line.startswith('skud_poll_duration_seconds_bucket')]
+        self.assertEqual([line.split(',le="')[1].split('"')[0] for line in buckets],
+                         ['0.01', '0.025', '0.05', '0.1', '0.25', '0.5', '1', '2.5', '5', '10', '30', '+Inf'])
+        self.assertEqual(buckets[0], 'skud_poll_duration_seconds_bucket{role="leader",le="0.01"} 1')
+        self.assertEqual(buckets[-2:], ['skud_poll_duration_seconds_bucket{role="leader",le="30"} 2',
+                                        'skud_poll_duration_seconds_bucket{role="leader",le="+Inf"} 3'])
+        self.assertIn('skud_poll_duration_seconds_count{role="leader"} 3', lines)
+
+
+class ApiAccessTests(TestCase):
+    """Данные о сотрудниках в API - персоналу админки или по токену"""
+
+    def test_presence_and_occupancy_require_access(self):
+        requests = [('/api/presence/', {'at': '2026-03-02 10:00'}),
+                    ('/api/occupancy/', {'from': '2026-03-02 08:00', 'to': '2026-03-02 10:00'})]
+
+        with self.settings(API_CONFIG={'TOKEN': 'secret'}):
+            for url, params in requests:
+                self.assertEqual(self.client.get(url, params).status_code, 403)
+                self.assertEqual(self.client.get(url, {**params, 'token': 'wrong'}).status_code, 403)
+                self.assertEqual(self.client.get(url, params, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+        self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+        for url, params in requests:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+
+
+class AnomalyTests(TestCase):
+    """Правила аномалий на потоке отметок"""
+
+    def test_rules(self):
+        source = SkudSource.objects.create(code='anomalies', name='Аномалии', base_url='')
+        north = Terminal.objects.create(source=source, terminal_id=1, terminal_sn='A1',
+                                        terminal_alias='Север', area_alias='Север')
+        south = Terminal.objects.create(source=source, terminal_id=2, terminal_sn='A2',
+                                        terminal_alias='Юг', area_alias='Юг')
+        engine = AnomalyEngine()
+        found = []
+
+        def punch(skud_id, when, state, terminal=north, verify_type=1, emp_code='100'):
+            transaction = Transaction.objects.create(
+                source=source, skud_id=skud_id, emp_code=emp_code, terminal=terminal,
+                punch_time=timezone.make_aware(datetime.strptime(when, '%Y-%m-%d %H:%M:%S')),
+                punch_state=state, verify_type=verify_type,
+            )
+            with self.assertNumQueries(0):
+                hits = engine.check(transaction)
+            found.extend(hits)
+            return [hit.rule for hit in hits]
+
+        self.assertEqual(punch(1, '2026-03-02 08:00:00', '0'), [])
+        self.assertEqual(punch(2, '2026-03-02 08:01:00', '0'), [])  # повторное прикладывание
+        self.assertEqual(punch(3, '2026-03-02 09:00:00', '0'), ['double_entry'])
+        self.assertEqual(punch(4, '2026-03-02 09:00:20', '1', terminal=south), ['two_terminals'])
+        self.assertEqual(punch(5, '2026-03-02 12:00:00', '1'), ['exit_without_entry'])
+        self.assertEqual(punch(6, '2026-03-02 07:00:00', '0'), [])  # не по порядку
+
+        for skud_id, minute in ((7, 10), (8, 11), (9, 12), (10, 13)):
+            rules = punch(skud_id, f'2026-03-02 13:{minute}:00', '0', verify_type=0, emp_code='200')
+            self.assertEqual(rules, ['failed_verify'] if skud_id == 9 else [])
+
+        save_anomalies(found, alert=False)
+        self.assertEqual(Anomaly.objects.count(), 4)
+
+
+class PunchStreamTests(RedisTestCase):
+    """Поток отметок: публикация, догонка по ID, группа потребителей"""
+
+    redis_keys = ('scud:test:punches',)
+
+    def setUp(self):
+        super().setUp()
+        source = SkudSource.objects.create(code='stream', name='Поток', base_url='')
+        terminal = Terminal.objects.create(source=source, terminal_id=7, terminal_sn='S7',
+                                           terminal_alias='Проходная', area_alias='Проходная')
+        self.punches = [
+            Transaction.objects.create(source=source, skud_id=skud_id, emp_code='100', terminal=terminal,
+                                       punch_time=timezone.now(), punch_state=state, verify_type=1)
+            for skud_id, state in ((1, '0'), (2, '1'), (3, '0'))
+        ]
+        config = {**settings.PUNCH_STREAM_CONFIG, 'ENABLED': True, 'KEY': 'scud:test:punches', 'BATCH_SIZE': 2}
+        stream_settings = self.settings(PUNCH_STREAM_CONFIG=config)
+        stream_settings.enable()
+        self.addCleanup(stream_settings.disable)
+
+    def test_publish_replay_and_consume(self):
+        consumer = PunchStreamConsumer('test', 'worker-1', start_id='0')
+        self.assertEqual(publish_punches(self.punches), 3)
+
+        events = [decode_event(*event) for event in replay(count=2)]
+        self.assertEqual([(e['skud_id'], e['state'], e['terminal_id']) for e in events],
+                         [(1, 'in', 7), (2, 'out', 7), (3, 'in', 7)])
+        self.assertEqual([event_id for event_id, _ in replay(events[0]['id'])],
+                         [e['id'] for e in events[1:]])
+
+        # Неподтвержденные события после перезапуска потребитель получает снова
+        self.assertEqual(len(consumer.read(count=2, block_ms=None)), 2)
+        restarted = PunchStreamConsumer('test', 'worker-1')
+        unacked = restarted.read(count=10, block_ms=None)
+        self.assertEqual([event_id for event_id, _ in unacked], [e['id'] for e in events[:2]])
+        self.assertEqual(restarted.ack([event_id for event_id, _ in unacked]), 2)
+        self.assertEqual([event_id for event_id, _ in restarted.read(count=10, block_ms=None)], [events[2]['id']])
+
+    def test_pending_of_dropped_consumers_reassigned(self):
+        publish_punches(self.punches)
+        # Было два потока подписки, worker-1 взял пачку и не подтвердил ее
+        PunchStreamConsumer('test', 'worker-0', start_id='0')
+        taken = [event_id for event_id, _ in PunchStreamConsumer('test', 'worker-1').read(count=2, block_ms=None)]
+
+        # Поток остался один - пачку дочитывает worker-0, ушедший потребитель удален
+        self.assertEqual(reassign_pending('test', ['worker-0']), 2)
+        self.assertEqual([info['name'] for info in self.redis.xinfo_consumers('scud:test:punches', 'test')],
+                         ['worker-0'])
+        consumer = PunchStreamConsumer('test', 'worker-0')
+        self.assertEqual([event_id for event_id, _ in consumer.read(count=10, block_ms=None)], taken)
+        self.assertEqual(reassign_pending('test', ['worker-0']), 0)
+
+
+class WebhookTests(TestCase):
+    """Подписки на события отметок: фильтры, подпись запроса, повторы и недоставленные"""
+
+    def test_subscription_filter(self):
+        source = SkudSource.objects.create(code='hooks', name='Вебхуки', base_url='')
+        north = Terminal.objects.create(source=source, terminal_id=1, terminal_sn='H1',
+                                        terminal_alias='Север', area_alias='Север')
+        Terminal.objects.create(source=source, terminal_id=2, terminal_sn='H2',
+                                terminal_alias='Юг', area_alias='Юг')
+        Terminal.objects.create(source=source, terminal_id=3, terminal_sn='H3',
+                                terminal_alias='Склад', area_alias='Склад')
+
+        def event(terminal_id, emp_code='100'):
+            return {'source': 'hooks', 'terminal_id': str(terminal_id), 'emp_code': emp_code}
+
+        everything = subscription_filter(WebhookSubscription.objects.create(name='all', url='http://hr', secret='s'))
+        self.assertTrue(everything(event(3)))
+
+        subscription = WebhookSubscription.objects.create(
+            name='hr', url='http://hr', secret='s', areas='Юг, ', emp_codes='100,\n200',
+        )
+        subscription.terminals.add(north)
+        matches = subscription_filter(subscription)
+        self.assertTrue(matches(event(1)))
+        self.assertTrue(matches(event(2, '200')))
+        self.assertFalse(matches(event(3)))
+        self.assertFalse(matches(event(2, '300')))
+        self.assertFalse(matches({**event(1), 'source': 'other'}))
+
+    def _sender(self, *responses):
+        subscription = WebhookSubscription.objects.create(name='hr', url='http://hr/hook', secret='s3cret')
+        sender = WebhookSender(subscription)
+        sender.session.post = mock.Mock(side_effect=responses)
+        return sender
+
+    def test_signed_request(self):
+        sender = self._sender(mock.Mock(status_code=204))
+        self.assertTrue(sender.post({'delivery_id': '1:1-0', 'events': []}).ok)
+
+        (url,), kwargs = sender.session.post.call_args
+        headers = kwargs['headers']
+        expected = hmac.new(b's3cret', headers['X-SCUD-Timestamp'].encode() + b'.' + kwargs['data'],
+                            hashlib.sha256).hexdigest()
+        self.assertEqual((url, headers['X-SCUD-Delivery']), ('http://hr/hook', '1:1-0'))
+        self.assertEqual(headers['X-SCUD-Signature'], f'sha256={expected}')
+
+    def test_retryable_and_permanent_errors(self):
+        responses = [mock.Mock(status_code=code, text='error') for code in (503, 429, 408, 400, 404)]
+        sender = self._sender(*responses, requests.ConnectionError('refused'))
+        results = [sender.post({'delivery_id': '1:1-0', 'events': []}) for _ in range(6)]
+        self.assertEqual([(result.ok, result.retryable, result.status_code) for result in results], [
+            (False, True, 503), (False, True, 429), (False, True, 408),
+            (False, False, 400), (False, False, 404), (False, True, None),
+        ])
+
+    def test_dead_letter_after_max_attempts(self):
+        subscription = WebhookSubscription.objects.create(name='hr', url='http://hr/hook', secret='s')
+        worker = SubscriptionWorker(subscription)
+        events = [{'id': '1-0', 'emp_code': '100'}]
+        config = {**settings.WEBHOOK_CONFIG, 'MAX_ATTEMPTS': 3, 'RETRY_BASE': 0}
+
+        with self.settings(WEBHOOK_CONFIG=config), mock.patch.object(worker.sender, 'post') as post:
+            post.return_value = DeliveryResult(False, True, 503, 'unavailable')
+            self.assertTrue(worker.deliver(events))
+            self.assertEqual(post.call_count, 3)
+
+            # Постоянная ошибка - без повторов
+            post.reset_mock(return_value=True)
+            post.return_value = DeliveryResult(False, False, 410, 'gone')
+            self.assertTrue(worker.deliver(events))
+            self.assertEqual(post.call_count, 1)
+
+        self.assertEqual(list(WebhookDeadLetter.objects.order_by('id').values_list('attempts', 'status_code', 'events')),
+                         [(3, 503, 1), (1, 410, 1)])
+        self.assertEqual(WebhookDeadLetter.objects.first().payload, {'delivery_id': f'{subscription.id}:1-0',
+                                                                      'events': events})
+
+
+class DailyDigestTests(PunchTestCase):
+    """Сводки проходов за день сотрудникам в режиме сводки"""
+
+    def test_daily_digest(self):
+        self.terminal.is_monitored = True
+        self.terminal.save()
+        digest = Employee.objects.create(emp_id=1, emp_code='100', name='Сводка', telegram_id=1,
+                                         send_notifications=True, notification_mode=Employee.NOTIFY_DIGEST)
+        Employee.objects.create(emp_id=2, emp_code='200', name='Сразу', telegram_id=2, send_notifications=True)
+        for when, state, emp_code in (('2026-03-02 08:00', '0', '100'), ('2026-03-02 08:01', '0', '100'),
+                                      ('2026-03-02 17:30', '1', '100'), ('2026-03-03 08:00', '0', '100'),
+                                      ('2026-03-02 09:00', '0', '200')):
+            self._punch(when, state, emp_code=emp_code)
+        TransactionLinker().link(['100', '200'])
+
+        with self.assertNumQueries(1):
+            digests = build_digests(datetime(2026, 3, 2).date())
+
+        self.assertEqual([(employee.id, text) for employee, text in digests], [
+            (digest.id, "Ваши проходы за 02.03.2026:\nПункт: приход 08:00, уход 17:30 (отметок: 3)"),
+        ])
+
+
+class NotificationQueueTests(RedisTestCase):
+    """Окно объединения уведомлений в Redis"""
+
+    redis_keys = (f'{PENDING_PREFIX}:*',)
+
+    def setUp(self):
+        super().setUp()
+        source = SkudSource.objects.create(code='notify', name='Уведомления', base_url='')
+        terminal = Terminal.objects.create(source=source, terminal_id=1, terminal_sn='N1',
+                                           terminal_alias='Пункт', area_alias='Зона')
+        self.employee = Employee.objects.create(emp_id=1, emp_code='100', telegram_id=1, send_notifications=True)
+        self.punches = [
+            Transaction.objects.create(source=source, skud_id=skud_id, emp_code='100', employee=self.employee,
+                                       terminal=terminal, punch_time=timezone.now(), punch_state='0', verify_type=1)
+            for skud_id in (1, 2, 3)
+        ]
+        self.key = f'{PENDING_PREFIX}:{self.employee.id}'
+        window_settings = self.settings(NOTIFICATIONS_CONFIG={**settings.NOTIFICATIONS_CONFIG, 'COALESCE_SECONDS': 30})
+        window_settings.enable()
+        self.addCleanup(window_settings.disable)
+
+    def _patch(self, task, method, **kwargs):
+        return mock.patch(f'scud_bot.apps.bot.tasks.{task}.{method}', **kwargs)
+
+    def test_first_punch_sent_at_once(self):
+        with self._patch('send_punch_notification', 'delay') as delay, \
+                self._patch('send_coalesced_notification', 'apply_async') as apply_async:
+            schedule_punch_notification(self.employee, self.punches[0])
+            delay.assert_called_once()
+            self.assertEqual(delay.call_args.args[0], self.punches[0].id)
+            apply_async.assert_not_called()
+
+            # Следующие в окне - одним сообщением в конце окна
+            schedule_punch_notification(self.employee, self.punches[1])
+            schedule_punch_notification(self.employee, self.punches[2])
+            delay.assert_called_once()
+            apply_async.assert_called_once()
+            self.assertAlmostEqual(apply_async.call_args.kwargs['countdown'], 30, delta=1)
+        self.assertEqual([json.loads(item)[0] for item in self.redis.lrange(self.key, 0, -1)],
+                         [self.punches[1].id, self.punches[2].id])
+
+    def test_failed_schedule_rolls_back(self):
+        with self._patch('send_punch_notification', 'delay', side_effect=OSError('брокер недоступен')):
+            with self.assertRaises(OSError):
+                schedule_punch_notification(self.employee, self.punches[0])
+        # Монитор отправил уведомление сам - окно не открыто, следующая отметка тоже уйдет сразу
+        self.assertEqual(self.redis.exists(f'{self.key}:window'), 0)
+
+        with self._patch('send_punch_notification', 'delay'):
+            schedule_punch_notification(self.employee, self.punches[0])
+        with self._patch('send_coalesced_notification', 'apply_async', side_effect=OSError('брокер недоступен')):
+            with self.assertRaises(OSError):
+                schedule_punch_notification(self.employee, self.punches[1])
+        # Отметку из окна убрали, следующая снова ставит задачу
+        self.assertEqual(self.redis.exists(self.key, f'{self.key}:scheduled'), 0)
+
+        with self._patch('send_coalesced_notification', 'apply_async') as apply_async:
+            schedule_punch_notification(self.employee, self.punches[2])
+        apply_async.assert_called_once()
+        self.assertEqual(self.redis.llen(self.key), 1)
+
+
+class TerminalFeedTests(TestCase):
+    """Индекс лент проходов по терминалам и текст сообщения"""
+
+    def test_feed_index(self):
+        source = SkudSource.objects.create(code='feeds', name='Ленты', base_url='')
+        north = Terminal.objects.create(source=source, terminal_id=1, terminal_sn='F1',
+                                        terminal_alias='Север', area_alias='Север')
+        south = Terminal.objects.create(source=source, terminal_id=2, terminal_sn='F2',
+                                        terminal_alias='Юг', area_alias='Юг')
+        store = Terminal.objects.create(source=source, terminal_id=3, terminal_sn='F3',
+                                        terminal_alias='Склад', area_alias='Склад')
+
+        shift = TerminalSubscription.objects.create(name='смена', chat_id=-100, areas='Юг')
+        shift.terminals.add(north)
+        exits = TerminalSubscription.objects.create(name='выходы', chat_id=-200, areas='Юг',
+                                                    events=TerminalSubscription.EVENTS_OUT)
+        TerminalSubscription.objects.create(name='выключена', chat_id=-300, areas='Склад', is_active=False)
+
+        feeds = TerminalFeeds()
+        with self.assertNumQueries(3):
+            feeds.refresh()
+        self.assertEqual(feeds.subscribers(north.id), [shift])
+        self.assertCountEqual(feeds.subscribers(south.id), [shift, exits])
+        self.assertEqual(feeds.subscribers(store.id), [])
+        self.assertFalse(exits.accepts(True))
+        self.assertTrue(exits.accepts(False))
+
+        items = [['08:0%d' % i, i % 2 == 0, f'Сотр. {i}', 'Юг'] for i in range(5)]
+        message = format_feed_message(items, max_lines=3)
+        self.assertEqual(message.splitlines()[0], 'Проходов: 5 (входов 3, выходов 2)')
+        self.assertEqual(message.splitlines()[-1], '... и еще 2')
+        self.assertEqual(format_feed_message(items[:1]), '08:00 вход - Сотр. 0, Юг')
+
+
+class EmployeeSummaryTests(PunchTestCase):
+    """Ответы бота /today, /week и /where из сводок по дням"""
+
+    def test_employee_summaries(self):
+        employee = Employee.objects.create(emp_id=1, emp_code='100', name='Сводка', telegram_id=1)
+        # Ночная смена с воскресенья, днем перерыв, вечером снова на пункте
+        punches = [self._punch(when, state) for when, state in [
+            ('2026-03-01 22:00', '0'), ('2026-03-02 06:00', '1'),
+            ('2026-03-02 13:00', '0'), ('2026-03-02 15:30', '1'), ('2026-03-02 18:00', '0'),
+        ]]
+        update_visits(punches)
+        update_summaries(punches)
+
+        now = timezone.make_aware(datetime(2026, 3, 2, 19, 15))
+        with self.assertNumQueries(1):
+            summary = EmployeeSummary(employee, now=now)
+            today, week, where = summary.today_text(), summary.week_text(), summary.where_text()
+
+        self.assertEqual(today, "Сегодня, 02.03.2026:\nПриход: 13:00 (Пункт)\n"
+                                "Отработано: 9 ч 45 мин\nСейчас на пункте Пункт с 18:00")
+        self.assertEqual(week, "Неделя с 02.03: 9 ч 45 мин\nПн 02.03 - 9 ч 45 мин")
+        self.assertEqual(where, "Сейчас на пункте Пункт с 18:00")
+
+        exit_punch = self._punch('2026-03-02 19:00', '1')
+        update_visits([exit_punch])
+        update_summaries([exit_punch])
+        summary = EmployeeSummary(employee, now=now)
+        self.assertEqual(summary.where_text(), "Последняя отметка: выход 19:00, Пункт")
+        self.assertEqual(summary.worked(now.date()), 9.5 * 3600)
+
+
+class OnsiteTests(PunchTestCase):
+    """Снимок "кто на пунктах" и страницы /onsite"""
+
+    def test_onsite_pages(self):
+        Employee.objects.create(emp_id=1, emp_code='100', name='Бор')
+        Employee.objects.create(emp_id=2, emp_code='200', name='Ан')
+        for when, state, emp_code in (('2026-03-02 08:00', '0', '100'), ('2026-03-02 08:30', '0', '200'),
+                                      ('2026-03-02 09:00', '0', '300'), ('2026-03-02 09:10', '1', '300')):
+            self._punch(when, state, emp_code=emp_code)
+        rebuild_visits()
+
+        with self.settings(ONSITE_CONFIG={'CACHE_SECONDS': 30, 'PAGE_SIZE': 1}):
+            snapshot = compute_snapshot(timezone.make_aware(datetime(2026, 3, 2, 10, 0)))
+            self.assertEqual(find_terminals(snapshot, 'зона'), snapshot['terminals'])
+
+            text, keyboard = overview_page(snapshot)
+            self.assertEqual(text, "На пунктах в 10:00: 2\nПункт - 2")
+            self.assertEqual(keyboard['inline_keyboard'][0][0]['callback_data'], f"onsite:{self.terminal.id}:0")
+
+            text, keyboard = terminal_page(snapshot, self.terminal.id, 1)
+            self.assertEqual(text, "Пункт в 10:00: 2 чел. (стр. 2 из 2)\n08:00 Бор")
+            self.assertEqual(keyboard, {'inline_keyboard': [[
+                {'text': '◀', 'callback_data': f"onsite:{self.terminal.id}:0"},
+            ]]})
+
+
+class OnsiteSnapshotCacheTests(RedisTestCase):
+    """Снимок присутствия пересчитывает один процесс, остальные не дублируют расчет"""
+
+    redis_keys = ('scud:test:onsite*',)
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.multiple(onsite_module, SNAPSHOT_KEY='scud:test:onsite',
+                                      SNAPSHOT_LOCK_KEY='scud:test:onsite:lock')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        override = self.settings(ONSITE_CONFIG={'CACHE_SECONDS': 30, 'STALE_SECONDS': 300,
+                                                'LOCK_SECONDS': 1, 'PAGE_SIZE': 10})
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _store(self, age: int) -> dict:
+        snapshot = {'at': (timezone.now() - timedelta(seconds=age)).isoformat(), 'terminals': []}
+        self.redis.set('scud:test:onsite', json.dumps(snapshot))
+        return snapshot
+
+    def test_fresh_snapshot_is_not_recomputed(self):
+        fresh = self._store(age=5)
+        with mock.patch.object(onsite_module, 'compute_snapshot') as compute:
+            self.assertEqual(onsite_module.onsite_snapshot(), fresh)
+        compute.assert_not_called()
+
+    def test_stale_snapshot_served_while_locked(self):
+        stale = self._store(age=60)
+        self.redis.set('scud:test:onsite:lock', 1)
+        with mock.patch.object(onsite_module, 'compute_snapshot') as compute:
+            self.assertEqual(onsite_module.onsite_snapshot(), stale)
+        compute.assert_not_called()
+
+    def test_stale_snapshot_recomputed_by_lock_holder(self):
+        self._store(age=60)
+        fresh = {'at': timezone.now().isoformat(), 'terminals': []}
+        with mock.patch.object(onsite_module, 'compute_snapshot', return_value=fresh):
+            self.assertEqual(onsite_module.onsite_snapshot(), fresh)
+        self.assertEqual(json.loads(self.redis.get('scud:test:onsite')), fresh)
+        self.assertFalse(self.redis.exists('scud:test:onsite:lock'))
+
+    def test_waits_for_snapshot_built_elsewhere(self):
+        self.redis.set('scud:test:onsite:lock', 1)
+        built = {'at': timezone.now().isoformat(), 'terminals': []}
+
+        def sleep(seconds):
+            self.redis.set('scud:test:onsite', json.dumps(built))
+
+        with mock.patch.object(onsite_module, 'compute_snapshot') as compute, \
+                mock.patch.object(onsite_module.time, 'sleep', side_effect=sleep):
+            self.assertEqual(onsite_module.onsite_snapshot(), built)
+        compute.assert_not_called()
+
+
+class BroadcastTests(TestCase):
+    """Получатели рассылки и продолжение прерванной"""
+
+    def test_recipients_and_resume(self):
+        Employee.objects.create(emp_id=1, emp_code='100', name='А', telegram_id=11, send_notifications=True)
+        # Две карточки с одним Telegram - одно сообщение
+        Employee.objects.create(emp_id=2, emp_code='200', name='Б', telegram_id=11)
+        Employee.objects.create(emp_id=3, emp_code='300', name='В', telegram_id=33, is_manager=True)
+        Employee.objects.create(emp_id=4, emp_code='400', name='Без Telegram')
+
+        self.assertEqual(broadcast_recipients(managers_only=True).get().emp_code, '300')
+        self.assertEqual(broadcast_recipients(notified_only=True).get().emp_code, '100')
+
+        broadcast = create_broadcast('Внимание', broadcast_recipients(), audience='все')
+        self.assertEqual(broadcast.total, 2)
+        self.assertEqual(sorted(broadcast.deliveries.values_list('chat_id', flat=True)), [11, 33])
+
+        self.assertIsNotNone(claim_broadcast(broadcast.id))
+        # Уже отправляется - второй процесс ее не возьмет, пока она обновляется
+        self.assertIsNone(claim_broadcast(broadcast.id))
+        self.assertEqual(stale_broadcasts(), [])
 
-# Create your tests here.
+        Broadcast.objects.filter(pk=broadcast.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(stale_broadcasts(), [broadcast.id])
+        self.assertIsNotNone(claim_broadcast(broadcast.id))
+        self.assertEqual(broadcast.deliveries.filter(status=BroadcastDelivery.STATUS_PENDING).count(), 2)
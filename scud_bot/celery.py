@@ -19,6 +19,36 @@ app.conf.beat_schedule = {
         'schedule': crontab(hour=11, minute=32),
         'args': (),
     },
+    'rebuild-directory-hourly': {
+        'task': 'scud_bot.apps.bot.tasks.rebuild_directory',
+        'schedule': crontab(minute=0),
+        'args': (),
+    },
+    'close-stale-visits-hourly': {
+        'task': 'scud_bot.apps.bot.tasks.close_stale_visits',
+        'schedule': crontab(minute=15),
+        'args': (),
+    },
+    'refresh-occupancy-10min': {
+        'task': 'scud_bot.apps.bot.tasks.refresh_occupancy_buckets',
+        'schedule': crontab(minute='*/10'),
+        'args': (),
+    },
+    'daily-digests-2100': {
+        'task': 'scud_bot.apps.bot.tasks.send_daily_digests',
+        'schedule': crontab(hour=21, minute=0),
+        'args': (),
+    },
+    'resume-broadcasts-5min': {
+        'task': 'scud_bot.apps.bot.tasks.resume_broadcasts',
+        'schedule': crontab(minute='*/5'),
+        'args': (),
+    },
+    'cleanup-reports-nightly': {
+        'task': 'scud_bot.apps.bot.tasks.cleanup_reports',
+        'schedule': crontab(hour=3, minute=30),
+        'args': (),
+    },
 }
 
 app.conf.timezone = 'Europe/Moscow'
@@ -128,16 +128,140 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Файлы отчетов (общий том media_volume у web и celery_worker)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', '/app/media')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 # настройки для СКУД системы
+# BASE_URL и SESSION_COOKIE - начальные значения основного сервера, остальные серверы
+# СКУД (площадки) заводятся в админке (модель SkudSource)
 SKUD_CONFIG = {
-    'BASE_URL': 'http://188.92.110.218',
+    'BASE_URL': os.getenv('SKUD_BASE_URL', 'http://188.92.110.218'),  # Для тестов - адрес run_fake_skud
     'SESSION_COOKIE': os.getenv('SESSION_COOKIE'),
+    'DEFAULT_SOURCE': 'main',  # Код основного сервера
     'POLL_INTERVAL': 3,  # Интервал опроса в секундах
     'PAGE_SIZE': 100,
+    'CAPTURE_PATH': os.getenv('SKUD_CAPTURE_PATH'),  # Журнал ответов СКУД для replay_monitor (.jsonl.gz)
+    'CATCHUP_PAGES': 20,  # Сколько страниц дочитывать, если с прошлого опроса записей больше страницы
+    'MAX_BACKOFF': 60,  # Предельная пауза (сек) между опросами недоступного сервера
+    'SOURCES_REFRESH': 30,  # Как часто (сек) монитор перечитывает список серверов
+}
+
+# выбор лидера среди реплик монитора (аренда в Redis)
+LEADER_CONFIG = {
+    'ENABLED': os.getenv('LEADER_ELECTION', 'True') == 'True',
+    'TTL': 6,  # Через сколько секунд без продления аренду забирает резервная реплика
+    'STANDBY_INTERVAL': 1,  # Как часто резерв проверяет аренду (сек)
+}
+
+# кэш сотрудников и терминалов в процессах (монитор и др.)
+LOOKUP_CACHE_CONFIG = {
+    'NEGATIVE_TTL': 60,  # Сколько секунд помнить, что сотрудника с таким кодом нет
+    'CHANNEL': 'scud:cache:invalidate',  # Канал Redis для сброса кэша при изменениях
+    'LOCAL_SIZE': 10000,  # Сколько сотрудников держать в локальной копии процесса
+    'VERSION_CHECK_INTERVAL': 1,  # Как часто (сек) сверяться с версией общего справочника
+}
+
+# метрики (/metrics в формате Prometheus)
+METRICS_CONFIG = {
+    'FLUSH_INTERVAL': 10,  # Как часто долгоживущие процессы сбрасывают метрики в Redis (сек); задачи Celery - в конце каждой
+    'TOKEN': os.getenv('METRICS_TOKEN'),  # Если задан - нужен ?token= или Bearer-заголовок
+}
+
+# доступ к /api/presence/ и /api/occupancy/ (данные о сотрудниках)
+API_CONFIG = {
+    'TOKEN': os.getenv('API_TOKEN'),  # ?token= или Bearer-заголовок; без токена - только вход в админку
+}
+
+# трассировка отметок от опроса СКУД до доставки в Telegram
+TRACING_CONFIG = {
+    'ENABLED': True,
+    'MAX_ROWS': 10000,  # Сколько последних трассировок хранить в БД (кольцевой буфер)
+}
+
+# визиты (пары вход-выход) для табеля
+VISITS_CONFIG = {
+    'DUPLICATE_GAP': 120,  # Повторная отметка в пределах стольких секунд - повторное прикладывание
+    'MAX_VISIT_HOURS': 16,  # Визит длиннее - считается без выхода (смена через полночь короче)
+    'BATCH_SIZE': 5000,  # Размер пачки при пакетной сборке
+}
+
+# загруженность терминалов и зон по интервалам (OccupancyBucket)
+OCCUPANCY_CONFIG = {
+    'RECOMPUTE_MINUTES': 120,  # Сколько последних минут пересчитывает периодическая задача
+    'FINE_KEEP_DAYS': 14,  # Сколько дней хранить пятиминутные интервалы (дальше - только часовые)
+    'MAX_POINTS': 2000,  # Больше точек в одном ответе API не отдаем
+}
+
+# уведомления сотрудникам о проходах
+NOTIFICATIONS_CONFIG = {
+    'COALESCE_SECONDS': 30,  # Первая отметка - сразу, следующие за ней в течение столько секунд - одним сообщением (0 - каждую сразу)
+    'FEED_INTERVAL': 15,  # Лента руководителя: проходы за столько секунд - одним сообщением (не чаще)
+    'FEED_MAX_LINES': 40,  # Больше строк в сообщении ленты - остальные только числом
+    'FEED_REFRESH': 30,  # Как часто (сек) монитор перечитывает подписки на ленты
+}
+
+# правила аномалий при приеме отметок (services/anomalies.py)
+ANOMALY_CONFIG = {
+    'ENABLED': True,
+    'RULES': ['double_entry', 'exit_without_entry', 'two_terminals', 'failed_verify'],  # Включенные правила
+    'HISTORY': 8,  # Сколько последних отметок сотрудника помнить
+    'MAX_EMPLOYEES': 20000,  # Сколько сотрудников держать в памяти (давно не отмечавшиеся вытесняются)
+    'TWO_TERMINALS_SECONDS': 60,  # Отметки на разных пунктах ближе по времени - подозрительно
+    'FAILED_VERIFY_TYPES': [0],  # Способы авторизации "в обход" биометрии (0 - пароль)
+    'FAILED_VERIFY_COUNT': 3,  # Сколько таких отметок подряд
+    'FAILED_VERIFY_MINUTES': 30,  # ...за сколько минут
+    'ALERT_CHAT_ID': os.getenv('ANOMALY_ALERT_CHAT_ID'),  # Чат руководителя для оповещений (пусто - без них)
+}
+
+# поток отметок в Redis Streams для других систем (services/punch_stream.py)
+PUNCH_STREAM_CONFIG = {
+    'ENABLED': os.getenv('PUNCH_STREAM', 'True') == 'True',
+    'KEY': 'scud:punches',
+    'MAXLEN': 200000,  # Сколько последних событий хранить в потоке (примерно)
+    'BATCH_SIZE': 500,  # Событий в одном pipeline
+}
+
+# доставка событий отметок во внешние системы (WebhookSubscription, run_webhooks)
+WEBHOOK_CONFIG = {
+    'TIMEOUT': 10,  # Таймаут запроса к получателю (сек)
+    'MAX_ATTEMPTS': 8,  # Попыток до переноса пачки в недоставленные
+    'RETRY_BASE': 2,  # Пауза перед повтором: RETRY_BASE * 2^попытка сек...
+    'RETRY_MAX': 300,  # ...но не больше
+    'BLOCK_MS': 2000,  # Сколько ждать новых событий в потоке за одно чтение (меньше таймаута Redis)
+    'REFRESH': 30,  # Как часто (сек) перечитывать список подписок
+}
+
+# команда бота /onsite для руководителей
+ONSITE_CONFIG = {
+    'CACHE_SECONDS': 30,  # Сколько живет снимок "кто на пунктах" в Redis (общий для бота и админки)
+    'STALE_SECONDS': 300,  # Устаревший снимок отдаем, пока другой процесс считает новый, - не старше этого
+    'LOCK_SECONDS': 10,  # Блокировка пересчета снимка (одним процессом); столько же ждем, если снимка нет совсем
+    'PAGE_SIZE': 25,  # Людей на одной странице списка пункта
+}
+
+# рассылки сотрудникам (Broadcast): лимит Telegram - около 30 сообщений в секунду на бота
+BROADCAST_CONFIG = {
+    'RATE': 25,  # Сообщений в секунду на всю рассылку (с запасом до лимита Telegram)
+    'CONCURRENCY': 8,  # Одновременных запросов к Telegram
+    'MAX_ATTEMPTS': 3,  # Попыток на получателя при сетевых ошибках и 5xx (429 попыткой не считается)
+    'MAX_THROTTLES': 10,  # Ответов 429 на получателя - дальше он помечается ошибкой
+    'CHUNK': 50,  # Получателей в пачке: после пачки статусы пишутся в БД (после падения повторно уйдет не больше)
+    'STALE_SECONDS': 120,  # "Отправляется" без обновлений дольше - рассылка упала, ее можно продолжить
+                           # (живая рассылка обновляется каждую треть этого времени, даже на паузе 429)
+}
+
+# фоновые отчеты (ReportJob): строятся в Celery, файлы - в MEDIA_ROOT/reports
+REPORTS_CONFIG = {
+    'FRESH_TTL': 600,  # Сколько секунд отдавать готовый отчет за период, который еще не закончился
+    'STALE_AFTER': 3600,  # Через сколько секунд незавершенное построение считается упавшим
+    'RETRY_FAILED_AFTER': 60,  # Сколько секунд отдавать ошибку построения, прежде чем пробовать снова
+    'KEEP_DAYS': 7,  # Сколько дней хранить отчеты и их файлы
+    'DOWNLOAD_WAIT': 25,  # Сколько секунд /api/download_backup/ ждет построения, прежде чем ответить 202 (меньше таймаута gunicorn)
 }
 
 # настройки для бота
@@ -202,4 +326,15 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'celery.beat:PersistentScheduler'
-CELERY_TASK_DEFAULT_QUEUE = 'scud_default'
\ No newline at end of file
+CELERY_TASK_DEFAULT_QUEUE = 'scud_default'
+# Долгие задачи - в отдельной очереди со своим воркером (celery_heavy), чтобы выгрузка
+# или рассылка не занимали слоты уведомлений о проходах
+CELERY_HEAVY_QUEUE = 'scud_heavy'
+CELERY_TASK_ROUTES = {
+    'scud_bot.apps.bot.tasks.build_report': {'queue': CELERY_HEAVY_QUEUE},
+    'scud_bot.apps.bot.tasks.cleanup_reports': {'queue': CELERY_HEAVY_QUEUE},
+    'scud_bot.apps.bot.tasks.send_broadcast': {'queue': CELERY_HEAVY_QUEUE},
+}
+
+# Redis для кэшей и блокировок (по умолчанию тот же, что и брокер Celery)
+REDIS_URL = os.getenv('REDIS_URL', CELERY_BROKER_URL)
\ No newline at end of file
@@ -16,10 +16,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from scud_bot.apps.bot.api import json_report, download_backup
+from scud_bot.apps.bot.api import json_report, download_backup, metrics_view, occupancy, presence
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/json_report/', json_report, name='json_report'),
     path('api/download_backup/', download_backup, name='download_backup'),
+    path('api/presence/', presence, name='presence'),
+    path('api/occupancy/', occupancy, name='occupancy'),
+    path('metrics', metrics_view, name='metrics'),
 ]